@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import json
+import time
+import argparse
+import tempfile
+import metadata_magic.config as mm_config
+import metadata_magic.file_tools as mm_file_tools
+from os.path import abspath, join
+
+def write_sidecar(file:str, size:int):
+    """
+    Writes a generated JSON sidecar with a large unused section, as left by some gallery-dl extractors.
+
+    :param file: Path of the JSON file to write
+    :type file: str, required
+    :param size: Approximate size of the file in bytes
+    :type size: int, required
+    """
+    comments = []
+    while len(comments) * 160 < size:
+        i = len(comments)
+        comments.append({"id":i, "user":{"name":f"User {i}", "id":i}, "text":"Some \"comment\" text. " * 4})
+    sidecar = {"comments":comments, "title":"Title", "date":"2020-01-02", "category":"deviantart",
+            "description":"Some description text.", "tags":["a", "b", "c"], "author":{"username":"Artist"}}
+    with open(file, "w", encoding="UTF-8") as out_file:
+        out_file.write(json.dumps(sidecar))
+
+def main():
+    """
+    Times reading a large JSON sidecar in full against reading only the keys metadata-magic uses.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            "-s",
+            "--size",
+            help="Approximate size of the sidecar in megabytes.",
+            type=int,
+            default=32)
+    parser.add_argument(
+            "-r",
+            "--repeat",
+            help="Number of times to read the sidecar.",
+            type=int,
+            default=3)
+    args = parser.parse_args()
+    projection = mm_config.get_config([])["json_reader"]["projection"]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file = abspath(join(temp_dir, "sidecar.json"))
+        write_sidecar(file, args.size * 1024 * 1024)
+        for name, function in [("full", lambda: mm_file_tools.read_json_file(file)),
+                ("projected", lambda: mm_file_tools.read_json_keys(file, projection))]:
+            times = []
+            for i in range(0, args.repeat):
+                start = time.perf_counter()
+                function()
+                times.append(time.perf_counter() - start)
+            print(f"{name:10} best {min(times) * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import os
+import gc
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import metadata_magic.config as mm_config
+import metadata_magic.meta_reader as mm_meta_reader
+from os.path import abspath, join
+from typing import List
+
+def write_sidecars(directory:str, count:int) -> List[str]:
+    """
+    Writes generated JSON sidecar files, similar in size to those from gallery-dl.
+
+    :param directory: Directory to write the files to
+    :type directory: str, required
+    :param count: Number of files to write
+    :type count: int, required
+    :return: Paths of the written files
+    :rtype: List[str]
+    """
+    files = []
+    for i in range(0, count):
+        sidecar = {"id":i, "title":f"Title {i}", "date":"2020-01-02", "category":"deviantart",
+                "description":"Some description text. " * 8, "tags":[f"tag{j}" for j in range(0, 12)],
+                "author":{"username":f"Artist{i % 500}", "id":i % 500}, "url":f"https://www.example.com/{i}",
+                "width":1200, "height":1600, "extension":"png", "filename":f"file{i}"}
+        file = abspath(join(directory, f"{i}.json"))
+        with open(file, "w", encoding="UTF-8") as out_file:
+            out_file.write(json.dumps(sidecar))
+        files.append(file)
+    return files
+
+def measure_scan(files:List[str], config:dict, keep_original:bool, as_dict:bool=False) -> dict:
+    """
+    Loads the metadata of every file and measures the memory used to hold it all.
+
+    :param files: JSON files to load
+    :type files: List[str], required
+    :param config: Dictionary of a metadata-magic config file
+    :type config: dict, required
+    :param keep_original: Whether to keep the original JSON in memory
+    :type keep_original: bool, required
+    :param as_dict: Whether to hold the metadata as plain dictionaries, as before JsonMetadata, defaults to False
+    :type as_dict: bool, optional
+    :return: Info with "current" and "peak" memory in bytes and "time" in seconds
+    :rtype: dict
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    metadata = [mm_meta_reader.load_metadata(file, config, "a.png", keep_original) for file in files]
+    if as_dict:
+        metadata = [dict(record) for record in metadata]
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del metadata
+    return {"current":current, "peak":peak, "time":elapsed}
+
+def main():
+    """
+    Compares the memory held by a large scan of JSON metadata with and without the original JSON.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            "-c",
+            "--count",
+            help="Number of JSON files to scan.",
+            type=int,
+            default=100000)
+    args = parser.parse_args()
+    config = mm_config.get_config([])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        files = write_sidecars(temp_dir, args.count)
+        modes = [("dict", True, True), ("record", True, False), ("record, dropped", False, False)]
+        for label, keep_original, as_dict in modes:
+            result = measure_scan(files, config, keep_original, as_dict)
+            print(f"{label:18} held {result['current'] / 1048576:8.1f} MiB  "
+                    + f"peak {result['peak'] / 1048576:8.1f} MiB  {result['time']:6.2f} s")
+
+if __name__ == "__main__":
+    main()
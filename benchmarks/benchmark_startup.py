@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import List
+
+SCRIPTS = [
+    ("mm-archive", "metadata_magic.archive"),
+    ("mm-bulk-archive", "metadata_magic.archive.bulk_archive"),
+    ("mm-update", "metadata_magic.archive.update"),
+    ("mm-error", "metadata_magic.error"),
+    ("mm-rename", "metadata_magic.rename"),
+    ("mm-query", "metadata_magic.query"),
+    ("mm-series", "metadata_magic.archive.series"),
+    ("mm-thumbs", "metadata_magic.archive.thumbnails")]
+
+HEAVY_MODULES = ["PIL", "html5lib", "ffmpeg", "cover_generator"]
+
+def get_import_time(code:str, repeat:int) -> float:
+    """
+    Returns the fastest time to start a new interpreter and run the given code.
+
+    :param code: Python code to run
+    :type code: str, required
+    :param repeat: Number of times to run the code
+    :type repeat: int, required
+    :return: Fastest time in seconds
+    :rtype: float
+    """
+    times = []
+    for i in range(0, repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def get_heavy_modules(module:str) -> List[str]:
+    """
+    Returns the heavy dependencies loaded when importing a given module.
+
+    :param module: Module to import
+    :type module: str, required
+    :return: Names of the heavy modules that were loaded
+    :rtype: List[str]
+    """
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    loaded = json.loads(result.stdout)
+    return [heavy for heavy in HEAVY_MODULES if heavy in loaded]
+
+def main():
+    """
+    Times how long each console script takes to import, not counting interpreter startup.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            "-r",
+            "--repeat",
+            help="Number of times to start each script.",
+            type=int,
+            default=10)
+    args = parser.parse_args()
+    interpreter = get_import_time("pass", args.repeat)
+    print(f"{'interpreter':16} best {interpreter * 1000:7.1f} ms")
+    for script, module in SCRIPTS:
+        best = get_import_time(f"import {module}", args.repeat) - interpreter
+        heavy = ", ".join(get_heavy_modules(module))
+        print(f"{script:16} best {best * 1000:7.1f} ms  heavy: {heavy if heavy else 'none'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import time
+import argparse
+import metadata_magic.archive.xhtml_formatting as mm_xhtml
+
+def get_chapter_html(size:int) -> str:
+    """
+    Returns generated chapter HTML of roughly the given size in bytes.
+
+    :param size: Approximate size of the HTML in bytes
+    :type size: int, required
+    :return: Generated HTML text
+    :rtype: str
+    """
+    paragraphs = []
+    paragraph = "<p>  Some \"quoted\" <i>text</i> &amp; <b>more</b> words in a paragraph.  </p>"
+    paragraph = f"{paragraph}<p> </p><div>Another &nbsp;block of text.</div>"
+    length = 0
+    i = 0
+    while length < size:
+        html = paragraph
+        if i % 50 == 0:
+            html = f"{html}<p> * * * </p>"
+        paragraphs.append(html)
+        length += len(html)
+        i += 1
+    return "\n".join(paragraphs)
+
+def main():
+    """
+    Times formatting generated chapters of a few megabytes into XHTML.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            "-s",
+            "--sizes",
+            help="Chapter sizes to test in megabytes.",
+            nargs="+",
+            type=float,
+            default=[1, 2, 4])
+    parser.add_argument(
+            "-r",
+            "--repeat",
+            help="Number of times to format each chapter.",
+            type=int,
+            default=3)
+    args = parser.parse_args()
+    for size in args.sizes:
+        html = get_chapter_html(int(size * 1024 * 1024))
+        times = []
+        for i in range(0, args.repeat):
+            start = time.perf_counter()
+            mm_xhtml.format_xhtml(html, "Benchmark")
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        megabytes = len(html) / (1024 * 1024)
+        print(f"{megabytes:6.2f} MB  best {best:7.3f}s  {megabytes / best:6.2f} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import time
+import zipfile
+import argparse
+import tempfile
+import metadata_magic.zip_tools as mm_zip_tools
+from os.path import abspath, join
+from typing import List
+
+def write_archives(directory:str, count:int, pages:int) -> List[str]:
+    """
+    Writes generated CBZ files with a ComicInfo.xml and the given number of pages.
+
+    :param directory: Directory to write the files to
+    :type directory: str, required
+    :param count: Number of files to write
+    :type count: int, required
+    :param pages: Number of pages in each file
+    :type pages: int, required
+    :return: Paths of the written files
+    :rtype: List[str]
+    """
+    files = []
+    for i in range(0, count):
+        file = abspath(join(directory, f"{i}.cbz"))
+        with zipfile.ZipFile(file, "w") as out_file:
+            out_file.writestr("ComicInfo.xml", "<ComicInfo><Title>Title</Title></ComicInfo>")
+            for page in range(0, pages):
+                out_file.writestr(f"Title/Title-{page:03}.jpg", bytes(2048))
+        files.append(file)
+    return files
+
+def list_with_zipfile(files:List[str]) -> int:
+    """
+    Counts the pages of every file by opening it with zipfile.
+
+    :param files: Paths of the CBZ files
+    :type files: List[str], required
+    :return: Total number of pages
+    :rtype: int
+    """
+    total = 0
+    for file in files:
+        with zipfile.ZipFile(file) as in_file:
+            total += len([info for info in in_file.infolist() if info.filename.endswith(".jpg")])
+    return total
+
+def main():
+    """
+    Times counting the pages of many CBZ files with zipfile against bulk central directory listings.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            "-c",
+            "--count",
+            help="Number of archives to list.",
+            type=int,
+            default=2000)
+    parser.add_argument(
+            "-p",
+            "--pages",
+            help="Number of pages in each archive.",
+            type=int,
+            default=40)
+    parser.add_argument(
+            "-w",
+            "--workers",
+            help="Number of threads to read listings with.",
+            type=int,
+            default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        files = write_archives(temp_dir, args.count, args.pages)
+        start = time.perf_counter()
+        total = list_with_zipfile(files)
+        print(f"{'zipfile':10} {time.perf_counter() - start:7.3f} s  {total} pages")
+        start = time.perf_counter()
+        listings = mm_zip_tools.read_zip_listings(files, args.workers)
+        total = sum([len(mm_zip_tools.get_listing_files(listing, [".jpg"])) for listing in listings])
+        print(f"{'listings':10} {time.perf_counter() - start:7.3f} s  {total} pages")
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,36 @@
 
 import os
 import re
+import csv
+import time
+import atexit
 import shutil
 import argparse
-import cover_generator
+import tempfile
+import threading
+import concurrent.futures
 import html_string_tools
 import python_print_tools
 import metadata_magic.config as mm_config
+import metadata_magic.pipeline as mm_pipeline
 import metadata_magic.file_tools as mm_file_tools
 import metadata_magic.meta_finder as mm_meta_finder
 import metadata_magic.meta_reader as mm_meta_reader
-import metadata_magic.archive.epub as mm_epub
-import metadata_magic.archive.mkv as mm_mkv
-import metadata_magic.archive.comic_archive as mm_comic_archive
-from os.path import abspath, isdir, exists
+import metadata_magic.archive.cover_cache as mm_cover_cache
+from os.path import abspath, isdir, exists, join
 from typing import List
 
 ARCHIVE_EXTENSIONS = [".cbz", ".epub", ".mkv"]
 SUPPORTED_IMAGES = [".gif", ".png", ".jpeg", ".jpg"]
 SUPPORTED_TEXT = [".txt", ".html", ".htm"]
 SUPPORTED_VIDEO = [".mkv", ".webm", ".mp4", ".m4v", ".avi"]
+COVER_POOL = None
+COVER_DIRECTORY = None
+COVER_PID = None
+PENDING_COVERS = dict()
+COVER_LOCK = threading.Lock()
+MANIFEST_LISTS = ["writers", "artists", "cover_artists", "tags", "chapters", "labels"]
+MANIFEST_FLAGS = ["cover", "remove_files", "standalone"]
 
 def get_directory_archive_type(directory:str) -> str:
     """
@@ -84,10 +95,24 @@ def get_info_from_jsons(path:str, config:dict) -> dict:
     """
     # Get all the JSON pairs
     pairs = mm_meta_finder.get_pairs(path, print_info=False)
+    return get_info_from_pairs(pairs, config)
+
+def get_info_from_pairs(pairs:List[dict], config:dict) -> dict:
+    """
+    Extracts the data to be put into archive metadata from a list of JSON-media pairs.
+    Most metadata is taken from the first pair, with the age rating being the highest of all pairs.
+    
+    :param pairs: List of JSON-media pairs as returned by meta_finder's get_pairs function
+    :type pairs: List[dict], required
+    :param config: Dictionary of a metadata-magic config file
+    :type config: dict, required
+    :return: Dictionary containing the metadata info
+    :rtype: dict
+    """
     # Read all JSON metadata
     json_metas = []
     for pair in pairs:
-        json_metas.append(mm_meta_reader.load_metadata(pair["json"], config, pair["media"]))
+        json_metas.append(mm_meta_reader.load_metadata(pair["json"], config, pair["media"], keep_original=False))
     # Get first instance of JSON metadata
     try:
         main_meta = json_metas[0]
@@ -132,25 +157,40 @@ def get_info_from_jsons(path:str, config:dict) -> dict:
     # Return metadata
     return metadata
 
-def get_info_from_archive(file:str) -> dict:
+def get_info_from_archive(file:str, listing:dict=None) -> dict:
     """
     Attempts to get metadata information from any of the supported media archive formats.
     Currently supports EPUB and CBZ.
+    Archive format modules are imported when first needed, so importing this module stays fast.
+    The member listing of ZIP based archives is read once and used to pick which formats to try.
     
     :param file: Path to media archive file
     :type file: str, required
+    :param listing: Member listing of the file if already read, as returned by mm_zip_tools.read_zip_listing, defaults to None
+    :type listing: dict, optional
     :return: Dictionary containing metadata as formatted in get_empty_metadata function
     :rtype: dict
     """
-    # Try getting info from a CBZ file
-    metadata = mm_comic_archive.get_info_from_cbz(file)
-    if not metadata == get_empty_metadata():
-        return metadata
-    # Try getting info from an EPUB file
-    metadata = mm_epub.get_info_from_epub(file)
-    if not metadata == get_empty_metadata():
-        return metadata
+    import metadata_magic.zip_tools as mm_zip_tools
+    if listing is None:
+        listing = mm_zip_tools.read_zip_listing(file)
+    if listing is not None:
+        # Try getting info from a CBZ file
+        if mm_zip_tools.find_zip_member(listing, "ComicInfo.xml", True) is not None:
+            import metadata_magic.archive.comic_archive as mm_comic_archive
+            metadata = mm_comic_archive.get_info_from_cbz(file, listing=listing)
+            if not metadata == get_empty_metadata():
+                return metadata
+        # Try getting info from an EPUB file
+        if mm_zip_tools.find_zip_member(listing, "content.opf", True) is not None:
+            import metadata_magic.archive.epub as mm_epub
+            metadata = mm_epub.get_info_from_epub(file, listing=listing)
+            if not metadata == get_empty_metadata():
+                return metadata
+        # ZIP files can't hold MKV metadata
+        return get_empty_metadata()
     # Try getting info from an MKV file
+    import metadata_magic.archive.mkv as mm_mkv
     metadata = mm_mkv.get_info_from_mkv(file)["metadata"]
     if not metadata == get_empty_metadata():
         return metadata
@@ -191,7 +231,7 @@ def format_title(text:str) -> dict:
     return text
 
 def update_archive_info(archive_file:str, metadata:dict,
-            update_cover:bool=False, always_overwrite:bool=False):
+            update_cover:bool=False, always_overwrite:bool=False, staging_directory:str=None):
     """
     Replaces the metadata in a given archive file with the given metadata.
     Supports CBZ and EPUB files.
@@ -204,19 +244,216 @@ def update_archive_info(archive_file:str, metadata:dict,
     :type update_cover: bool, optional
     :param always_overwrite: Whether to overwrite files even if metadata is unchanged, defaults to False
     :type always_overwrite: bool, optional
+    :param staging_directory: Directory to stage the new file in, defaults to the one from mm_file_tools.get_staging_directory
+    :type staging_directory: str, optional
     """
     extension = html_string_tools.get_extension(archive_file).lower()
     if extension == ".epub":
-        mm_epub.update_epub_info(archive_file, metadata,
-                update_cover=update_cover, always_overwrite=always_overwrite)
+        import metadata_magic.archive.epub as mm_epub
+        mm_epub.update_epub_info(archive_file, metadata, update_cover=update_cover,
+                always_overwrite=always_overwrite, staging_directory=staging_directory)
     if extension == ".cbz":
-        mm_comic_archive.update_cbz_info(archive_file, metadata, always_overwrite=always_overwrite)
+        import metadata_magic.archive.comic_archive as mm_comic_archive
+        mm_comic_archive.update_cbz_info(archive_file, metadata,
+                always_overwrite=always_overwrite, staging_directory=staging_directory)
     if extension == ".mkv":
-        mm_mkv.update_mkv_info(archive_file, metadata)
+        import metadata_magic.archive.mkv as mm_mkv
+        mm_mkv.update_mkv_info(archive_file, metadata, staging_directory=staging_directory)
+
+def get_cover_text(title:str, authors:List[str]) -> (str, str):
+    """
+    Returns the title and author text to write on a generated cover image.
+
+    :param title: Title to use for the cover image
+    :type title: str, required
+    :param authors: Author(s) to use for the cover image
+    :type authors: List[str], required
+    :return: Title text and author text
+    :rtype: (str, str)
+    """
+    title_text = str(title)
+    author_text = authors
+    if author_text is None:
+        author_text = ["None"]
+    author_text = ", ".join(author_text)
+    author_text = re.sub(r"\s*,\s*(?=[^,]*$)", " & ", author_text)
+    return (title_text, author_text)
+
+def start_cover_worker():
+    """
+    Prepares a cover rendering worker process by rendering a throwaway cover.
+    This loads the fonts and rendering libraries once, so later covers render faster.
+    """
+    import cover_generator
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            cover_generator.generate_cover("Title", "Author", abspath(join(temp_dir, "warm.jpg")), width=900)
+        except Exception: pass
+
+def render_cover(title_text:str, author_text:str, path:str, key:str=None) -> bool:
+    """
+    Renders a cover image with the given text, for use in a cover rendering worker process.
+    The rendered cover is added to the cover cache, so other processes can use it as well.
+
+    :param title_text: Title text to write on the cover
+    :type title_text: str, required
+    :param author_text: Author text to write on the cover
+    :type author_text: str, required
+    :param path: Path of the image file to create
+    :type path: str, required
+    :param key: Cache filename of the cover, not cached if None, defaults to None
+    :type key: str, optional
+    :return: Whether the cover image creation was successful
+    :rtype: bool
+    """
+    import cover_generator
+    success = cover_generator.generate_cover(title_text, author_text, path, width=900)
+    if success and key is not None and mm_cover_cache.get_cache_size() > 0 and exists(path):
+        mm_cover_cache.add_cover_to_cache(key, path)
+    return success
+
+def get_pending_covers() -> dict:
+    """
+    Returns the covers submitted to the cover worker pool, keyed by cache filename.
+    A process forked from the one running the pool can't use it, so the pool is forgotten there.
+
+    :return: Future and rendered file path for each submitted cover
+    :rtype: dict
+    """
+    global COVER_POOL, COVER_DIRECTORY, COVER_PID
+    if COVER_PID is not None and not COVER_PID == os.getpid():
+        COVER_POOL = None
+        COVER_DIRECTORY = None
+        COVER_PID = None
+        PENDING_COVERS.clear()
+    return PENDING_COVERS
+
+def get_cover_pool(workers:int=None) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Returns the pool of cover rendering worker processes, starting it if it isn't already running.
+    The pool stays running so later batches of covers don't need to start new workers.
+    All the workers are started at once, so start the pool before running threads that start subprocesses.
+
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :type workers: int, optional
+    :return: Pool of cover rendering workers
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    global COVER_POOL, COVER_DIRECTORY, COVER_PID
+    get_pending_covers()
+    if COVER_POOL is None:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        COVER_POOL = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=start_cover_worker)
+        mm_pipeline.start_processes(COVER_POOL, workers)
+        COVER_DIRECTORY = tempfile.mkdtemp(prefix="mm-covers-")
+        COVER_PID = os.getpid()
+        atexit.register(shutdown_cover_pool)
+    return COVER_POOL
+
+def shutdown_cover_pool():
+    """
+    Stops the cover rendering worker processes and removes any covers they rendered.
+    """
+    global COVER_POOL, COVER_DIRECTORY
+    pending_covers = get_pending_covers()
+    if COVER_POOL is not None:
+        # Cancel covers that haven't started rendering
+        for future, rendered_file in pending_covers.values():
+            future.cancel()
+        COVER_POOL.shutdown(wait=True)
+        COVER_POOL = None
+    if COVER_DIRECTORY is not None:
+        shutil.rmtree(COVER_DIRECTORY, ignore_errors=True)
+        COVER_DIRECTORY = None
+    PENDING_COVERS.clear()
+
+def submit_cover_images(covers:List[dict], workers:int=None, extension:str=".jpg"):
+    """
+    Starts rendering the given cover images in the cover worker pool without waiting for them to finish.
+    Calls to generate_cover_image for the same title and authors will then use the rendered covers.
+    Covers that are already cached or already submitted are skipped.
+    Safe to call from several threads at once.
+
+    :param covers: Covers to render, each with "title" and "authors" keys
+    :type covers: List[dict], required
+    :param workers: Number of worker processes if the pool isn't running, defaults to the number of CPUs
+    :type workers: int, optional
+    :param extension: File extension of the cover images that will be needed, defaults to ".jpg"
+    :type extension: str, optional
+    """
+    cache_directory = mm_cover_cache.get_cache_directory()
+    use_cache = mm_cover_cache.get_cache_size() > 0
+    with COVER_LOCK:
+        pending_covers = get_pending_covers()
+        for cover in covers:
+            title_text, author_text = get_cover_text(cover["title"], cover["authors"])
+            key = mm_cover_cache.get_cover_key(title_text, author_text, 900, extension)
+            if key in pending_covers or (use_cache and exists(abspath(join(cache_directory, key)))):
+                continue
+            pool = get_cover_pool(workers)
+            rendered_file = abspath(join(COVER_DIRECTORY, key))
+            future = pool.submit(render_cover, title_text, author_text, rendered_file, key)
+            pending_covers[key] = (future, rendered_file)
+
+def wait_for_cover_image(title:str, authors:List[str], extension:str=".jpg") -> bool:
+    """
+    Waits for a cover submitted with submit_cover_images to finish rendering.
+    Once finished, the cover is in the cover cache for any process to use.
+
+    :param title: Title used for the cover image
+    :type title: str, required
+    :param authors: Author(s) used for the cover image
+    :type authors: List[str], required
+    :param extension: File extension of the cover image, defaults to ".jpg"
+    :type extension: str, optional
+    :return: Whether a submitted cover was rendered successfully
+    :rtype: bool
+    """
+    title_text, author_text = get_cover_text(title, authors)
+    key = mm_cover_cache.get_cover_key(title_text, author_text, 900, extension)
+    try:
+        return get_pending_covers()[key][0].result()
+    except Exception: return False
+
+def generate_cover_images(covers:List[dict], workers:int=None) -> List[bool]:
+    """
+    Creates many cover images at once, rendering them concurrently in the cover worker pool.
+
+    :param covers: Covers to create, each with "title", "authors", and "path" keys
+    :type covers: List[dict], required
+    :param workers: Number of worker processes if the pool isn't running, defaults to the number of CPUs
+    :type workers: int, optional
+    :return: Whether each cover image creation was successful, in the same order as the given covers
+    :rtype: List[bool]
+    """
+    for extension in set([html_string_tools.get_extension(cover["path"]) for cover in covers]):
+        extension_covers = [cover for cover in covers if html_string_tools.get_extension(cover["path"]) == extension]
+        submit_cover_images(extension_covers, workers, extension)
+    return [generate_cover_image(cover["title"], cover["authors"], cover["path"]) for cover in covers]
+
+def get_pending_cover(key:str, path:str) -> bool:
+    """
+    Places a cover rendered by the cover worker pool at the given path, waiting for it to finish if necessary.
+
+    :param key: Cache filename of the cover, as returned by cover_cache.get_cover_key
+    :type key: str, required
+    :param path: Path to place the cover image at
+    :type path: str, required
+    :return: Whether a rendered cover was available
+    :rtype: bool
+    """
+    try:
+        future, rendered_file = PENDING_COVERS[key]
+        assert future.result()
+        return exists(rendered_file) and mm_cover_cache.link_file(rendered_file, path)
+    except Exception: return False
 
-def generate_cover_image(title:str, authors:List[str], path:str) -> bool:
+def generate_cover_image(title:str, authors:List[str], path:str, use_cache:bool=True) -> bool:
     """
     Creates and returns a cover image based on a given title and author.
+    Rendered covers are kept in a disk cache so identical covers are only rendered once.
+    Covers already started with submit_cover_images are collected from the cover worker pool.
     
     :param title: Title to use for the cover image
     :type title: str, required
@@ -224,18 +461,37 @@ def generate_cover_image(title:str, authors:List[str], path:str) -> bool:
     :type authors: List[str], required
     :param path: Path to the image file to create
     :type path: str, required
+    :param use_cache: Whether to use the cover image cache, defaults to True
+    :type use_cache: bool, optional
     :return: Whether the cover image creation was successful
     :rtype: PIL.Image
     """
     # Format the author and title text
-    title_text = str(title)
-    author_text = authors
-    if author_text is None:
-        author_text = ["None"]
-    author_text = ", ".join(author_text)
-    author_text = re.sub(r"\s*,\s*(?=[^,]*$)", " & ", author_text)
-    # Generate the cover
-    return cover_generator.generate_cover(title_text, author_text, abspath(path), width=900)
+    title_text, author_text = get_cover_text(title, authors)
+    # Use the cached cover if available
+    full_path = abspath(path)
+    use_cache = use_cache and mm_cover_cache.get_cache_size() > 0
+    extension = html_string_tools.get_extension(full_path)
+    key = mm_cover_cache.get_cover_key(title_text, author_text, 900, extension)
+    if use_cache and mm_cover_cache.get_cached_cover(key, full_path):
+        return True
+    # Use the cover from the worker pool if one was submitted
+    pending_covers = get_pending_covers()
+    if key in pending_covers and get_pending_cover(key, full_path):
+        if use_cache:
+            # The worker cached the cover, so the rendered file is no longer needed
+            try:
+                os.remove(pending_covers.pop(key)[1])
+            except OSError: pass
+        return True
+    # Generate the cover, making sure not to write into a linked cached cover
+    if exists(full_path):
+        os.remove(full_path)
+    import cover_generator
+    success = cover_generator.generate_cover(title_text, author_text, full_path, width=900)
+    if success and use_cache and exists(full_path):
+        mm_cover_cache.add_cover_to_cache(key, full_path)
+    return success
 
 def get_string_from_user(value_type:str, default_value:str=None) -> str:
     """
@@ -277,15 +533,27 @@ def get_list_from_user(value_type:str, default_value:List[str]=None) -> List[str
     # Return list if applicable
     if not isinstance(value, str):
         return value
-    # Remove unnecessary whitespace
-    value = re.sub(r"(?:\s*,\s*)+", ",", value)
-    value = re.sub(r"^[\s,]+|[\s,]+$", "", value)
     # Split value by comma
-    value_list = value.split(",")
+    value_list = get_list_from_string(value)
     if value_list == []:
         return default_value
     return value_list
 
+def get_list_from_string(value:str) -> List[str]:
+    """
+    Splits a comma separated string into a list, removing unnecessary whitespace.
+
+    :param value: Comma separated string
+    :type value: str, required
+    :return: List of values in the string
+    :rtype: List[str]
+    """
+    # Remove unnecessary whitespace
+    value = re.sub(r"(?:\s*,\s*)+", ",", value)
+    value = re.sub(r"^[\s,]+|[\s,]+$", "", value)
+    # Split value by comma
+    return value.split(",")
+
 def user_string_default(value_type:str, default_value:str) -> str:
     """
     Gets a string from the user with prompt generated from given value type.
@@ -372,10 +640,249 @@ def get_metadata_from_user(metadata:dict, get_score:bool) -> dict:
     # Return the user metadata
     return user_metadata
 
+def read_manifest(manifest_file:str) -> List[dict]:
+    """
+    Reads the entries of a manifest for running archive commands without user input.
+    JSON manifests contain a list of entries, each a dictionary with a "directory" key and any fields to set.
+    CSV manifests have a "directory" column and a column for each field, with lists separated by commas.
+    Relative directories are treated as relative to the manifest file.
+    Raises ValueError if the manifest can't be read as a list of entries, or an entry has no directory.
+
+    :param manifest_file: Path of the JSON or CSV manifest file
+    :type manifest_file: str, required
+    :return: Entries of the manifest, each with the full path of its directory
+    :rtype: List[dict]
+    """
+    # Read the entries from the manifest
+    full_file = abspath(manifest_file)
+    if html_string_tools.get_extension(full_file).lower() == ".csv":
+        entries = []
+        with open(full_file, "r", encoding="UTF-8", newline="") as in_file:
+            for row in csv.DictReader(in_file):
+                entry = dict()
+                for key in row:
+                    if key is None or row[key] is None or row[key].strip() == "":
+                        continue
+                    value = row[key].strip()
+                    if key in MANIFEST_LISTS:
+                        value = get_list_from_string(value)
+                    elif key in MANIFEST_FLAGS:
+                        value = value.lower() in ["1", "y", "yes", "true"]
+                    entry[key] = value
+                entries.append(entry)
+    else:
+        # Invalid JSON is read as an empty dictionary, so it is caught along with missing entries
+        entries = mm_file_tools.read_json_file(full_file)
+        if isinstance(entries, dict):
+            if not isinstance(entries.get("entries"), list):
+                raise ValueError("Manifest is not a list of entries or an object with an \"entries\" list.")
+            entries = entries["entries"]
+        if not isinstance(entries, list):
+            raise ValueError("Manifest is not a list of entries or an object with an \"entries\" list.")
+    # Get the full path of each directory
+    parent = abspath(join(full_file, os.pardir))
+    for entry in entries:
+        if not isinstance(entry, dict) or not "directory" in entry:
+            raise ValueError(f"Manifest entry has no directory: {entry}")
+        entry["directory"] = abspath(join(parent, entry["directory"]))
+    return entries
+
+def get_metadata_from_entry(metadata:dict, entry:dict) -> dict:
+    """
+    Fills in metadata with the fields given in a manifest entry, in place of asking the user.
+    Fields left out of the entry keep their existing values, with the same defaults and checks as get_metadata_from_user.
+
+    :param metadata: Existing metadata, as returned by get_info_from_jsons
+    :type metadata: dict, required
+    :param entry: Manifest entry, as returned by read_manifest
+    :type entry: dict, required
+    :return: Metadata with the fields from the manifest entry
+    :rtype: dict
+    """
+    entry_metadata = metadata
+    for key in get_empty_metadata():
+        if key in entry:
+            entry_metadata[key] = entry[key]
+    # Set the default title
+    if "title" not in entry:
+        entry_metadata["title"] = format_title(entry_metadata["title"])
+    if entry_metadata["title"] is None or entry_metadata["title"] == "":
+        entry_metadata["title"] = basename(entry["directory"])
+    # Check the date
+    regex = "(19[7-9][0-9]|2[0-1][0-9]{2})\\-(0[1-9]|1[0-2])\\-(0[1-9]|[1-2][0-9]|3[0-1])"
+    if entry_metadata["date"] is None or len(re.findall(regex, entry_metadata["date"])) == 0:
+        entry_metadata["date"] = None
+    # Use the artists as the default for other creators
+    if entry_metadata["cover_artists"] is None:
+        entry_metadata["cover_artists"] = entry_metadata["artists"]
+    if entry_metadata["writers"] is None:
+        entry_metadata["writers"] = entry_metadata["artists"]
+    # Check the score
+    if entry_metadata["score"] is not None:
+        try:
+            score = int(entry_metadata["score"])
+            assert score > -1 and score < 6
+            entry_metadata["score"] = str(score)
+        except (AssertionError, TypeError, ValueError): entry_metadata["score"] = None
+    return entry_metadata
+
+def get_chapters_from_entry(directory:str, metadata:dict, entry:dict) -> List[dict]:
+    """
+    Returns the chapter info for an EPUB file from a manifest entry, in place of asking the user.
+    The entry's "chapters" can be a list of titles for the default chapters, in order.
+    They can also be a list of dictionaries with a "title", the "files" in the chapter, and whether to "include" it in the contents.
+    A cover image is added if the entry's "cover" is True.
+
+    :param directory: Directory of files to use for chapters in an EPUB file
+    :type directory: str, required
+    :param metadata: Metadata dict as returned by get_empty_metadata
+    :type metadata: dict, required
+    :param entry: Manifest entry, as returned by read_manifest
+    :type entry: dict, required
+    :return: List of info for each chapter
+    :rtype: List[dict]
+    """
+    import metadata_magic.archive.epub as mm_epub
+    chapters = mm_epub.get_default_chapters(directory, metadata["title"])
+    if "chapters" in entry:
+        if all([isinstance(chapter, str) for chapter in entry["chapters"]]):
+            # Set the titles of the default chapters
+            for i in range(0, min(len(chapters), len(entry["chapters"]))):
+                chapters[i]["title"] = entry["chapters"][i]
+        else:
+            # Build the chapters from the given files
+            chapters = []
+            item_num = 0
+            for chapter in entry["chapters"]:
+                files = []
+                for file in chapter["files"]:
+                    files.append({"id":f"item{item_num}", "file":abspath(join(directory, file))})
+                    item_num += 1
+                chapters.append({"include":chapter.get("include", True), "title":chapter["title"], "files":files})
+    if entry.get("cover", False):
+        chapters = mm_epub.add_cover_to_chapters(chapters, metadata, abspath(directory))
+    return chapters
+
+def create_archive_from_entry(entry:dict, config:dict, remove_files:bool=False,
+            optimize:str=None, quality:int=None, workers:int=1) -> dict:
+    """
+    Creates a media archive for the directory of a manifest entry, as mm-archive does without user input.
+
+    :param entry: Manifest entry, as returned by read_manifest
+    :type entry: dict, required
+    :param config: Dictionary of a metadata-magic config file
+    :type config: dict, required
+    :param remove_files: Whether to delete the original media if the entry doesn't say, defaults to False
+    :type remove_files: bool, optional
+    :param optimize: Type of optimization for CBZ images, one of "lossless", "webp", or "jpeg", defaults to None for none
+    :type optimize: str, optional
+    :param quality: Quality of lossy image optimizations from 0 to 100, defaults to None for image_tools.DEFAULT_QUALITY
+    :type quality: int, optional
+    :param workers: Number of processes to convert ebook chapters or optimize images with, None for the number of CPUs, defaults to 1
+    :type workers: int, optional
+    :return: Result with the "directory", the created "archive", and any image "optimization" stats
+    :rtype: dict
+    """
+    # Discover the type of archive to create
+    path = entry["directory"]
+    if not exists(path) or not isdir(path):
+        raise ValueError("Invalid directory.")
+    archive_type = get_directory_archive_type(path)
+    if archive_type is None:
+        raise ValueError("Unsupported media.")
+    # Get the metadata
+    metadata = get_metadata_from_entry(get_info_from_jsons(path, config), entry)
+    remove_files = entry.get("remove_files", remove_files)
+    # Create the archive
+    archive = None
+    result = {"directory":path}
+    if archive_type == "cbz":
+        import metadata_magic.archive.comic_archive as mm_comic_archive
+        import metadata_magic.archive.image_tools as mm_image_tools
+        if quality is None:
+            quality = mm_image_tools.DEFAULT_QUALITY
+        stats = None
+        if optimize is not None:
+            stats = mm_image_tools.get_empty_optimization_stats()
+            result["optimization"] = stats
+        archive = mm_comic_archive.create_cbz(path, metadata["title"], metadata, remove_files=remove_files,
+                optimize=optimize, quality=quality, workers=workers, stats=stats)
+    if archive_type == "epub":
+        import metadata_magic.archive.epub as mm_epub
+        chapters = get_chapters_from_entry(path, metadata, entry)
+        archive = mm_epub.create_epub(chapters, metadata, path, smart_quotes=False,
+                copy_back_cover=False, workers=workers)
+    if archive_type == "mkv":
+        import metadata_magic.archive.mkv as mm_mkv
+        archive = mm_mkv.create_mkv(path, metadata["title"], metadata, remove_files=remove_files)
+    if archive is None:
+        raise ValueError(f"Failed to create {archive_type.upper()} archive.")
+    result["archive"] = archive
+    return result
+
+def run_manifest(entries:List[dict], function, workers:int=None) -> List[dict]:
+    """
+    Runs a function on many manifest entries at once, printing the result of each entry in order.
+    Errors are reported as the result of their entry instead of stopping the other entries.
+
+    :param entries: Manifest entries, as returned by read_manifest
+    :type entries: List[dict], required
+    :param function: Function taking a manifest entry and returning its result as a dictionary
+    :type function: Callable, required
+    :param workers: Number of entries to work on at once, defaults to 4
+    :type workers: int, optional
+    :return: Result of each entry, with its "directory" and the "error" message if it failed
+    :rtype: List[dict]
+    """
+    import metadata_magic.pipeline as mm_pipeline
+    results = []
+    def report(entry:dict, result):
+        if isinstance(result, Exception):
+            result = {"directory":entry["directory"], "error":str(result) or type(result).__name__}
+            python_print_tools.color_print(f"FAILED {entry['directory']}: {result['error']}", "red")
+        else:
+            result["error"] = None
+            print(f"OK {entry['directory']}")
+        results.append(result)
+    stages = [mm_pipeline.get_stage(function)]
+    mm_pipeline.run_pipeline(entries, stages, report, io_workers=workers)
+    return results
+
+def archive_manifest(manifest_file:str, config:dict, remove_files:bool=False, workers:int=None,
+            optimize:str=None, quality:int=None, processes:int=1) -> List[dict]:
+    """
+    Creates a media archive for every directory in a manifest, several at a time and without user input.
+
+    :param manifest_file: Path of the JSON or CSV manifest file, as read by read_manifest
+    :type manifest_file: str, required
+    :param config: Dictionary of a metadata-magic config file
+    :type config: dict, required
+    :param remove_files: Whether to delete the original media if an entry doesn't say, defaults to False
+    :type remove_files: bool, optional
+    :param workers: Number of archives to create at once, defaults to 4
+    :type workers: int, optional
+    :param optimize: Type of optimization for CBZ images, one of "lossless", "webp", or "jpeg", defaults to None for none
+    :type optimize: str, optional
+    :param quality: Quality of lossy image optimizations from 0 to 100, defaults to None for image_tools.DEFAULT_QUALITY
+    :type quality: int, optional
+    :param processes: Number of processes each archive uses to convert ebook chapters or optimize images, defaults to 1
+    :type processes: int, optional
+    :return: Result of each entry, as returned by run_manifest
+    :rtype: List[dict]
+    """
+    entries = read_manifest(manifest_file)
+    def create(entry:dict) -> dict:
+        return create_archive_from_entry(entry, config, remove_files, optimize, quality, processes)
+    return run_manifest(entries, create, workers)
+
 def main():
     """
     Sets up the parser for creating a media archive.
     """
+    import metadata_magic.archive.epub as mm_epub
+    import metadata_magic.archive.mkv as mm_mkv
+    import metadata_magic.archive.comic_archive as mm_comic_archive
+    import metadata_magic.archive.image_tools as mm_image_tools
     # Set up argument parser
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -429,10 +936,65 @@ def main():
             "--xxxxx",
             help="Deletes the original media after creating the archive.",
             action="store_true")
+    parser.add_argument(
+            "-w",
+            "--workers",
+            help="Number of processes to use when converting ebook chapters or optimizing images, all CPUs if no number is given.",
+            nargs="?",
+            type=int,
+            const=None,
+            default=1)
+    parser.add_argument(
+            "-o",
+            "--optimize",
+            help="Re-encode CBZ images to save space, keeping originals that are smaller.",
+            choices=list(mm_image_tools.OPTIMIZE_FORMATS),
+            default=None)
+    parser.add_argument(
+            "-q",
+            "--quality",
+            help="Quality of lossy image optimization from 0 to 100.",
+            type=int,
+            default=mm_image_tools.DEFAULT_QUALITY)
+    parser.add_argument(
+            "-m",
+            "--manifest",
+            help="JSON or CSV manifest of directories and metadata to archive without user input.",
+            type=str,
+            default=None)
+    parser.add_argument(
+            "-j",
+            "--jobs",
+            help="Number of manifest entries to archive at once.",
+            type=int,
+            default=4)
     args = parser.parse_args()
-    # Check that directory is valid
+    # Archive the directories in the manifest, if given
     path = abspath(args.directory)
-    if not exists(path) or not isdir(path):
+    if args.manifest is not None:
+        if not exists(abspath(args.manifest)):
+            python_print_tools.color_print("Invalid manifest.", "red")
+            return
+        config = mm_config.get_config(mm_config.get_default_config_paths())
+        start = time.perf_counter()
+        try:
+            results = archive_manifest(args.manifest, config, remove_files=args.xxxxx, workers=args.jobs,
+                    optimize=args.optimize, quality=args.quality, processes=args.workers)
+        except ValueError as error:
+            python_print_tools.color_print(str(error), "red")
+            return
+        failed = len([result for result in results if result["error"] is not None])
+        print(f"Archived {len(results) - failed} of {len(results)} directories.")
+        # Report the image optimization across every archive, timed over the whole run since archives overlap
+        stats = mm_image_tools.get_empty_optimization_stats()
+        for result in results:
+            if result.get("optimization") is not None:
+                mm_image_tools.add_optimization_stats(stats, result["optimization"])
+        stats["time"] = time.perf_counter() - start
+        if stats["images"] > 0:
+            print(mm_image_tools.get_optimization_summary(stats))
+    # Check that directory is valid
+    elif not exists(path) or not isdir(path):
         python_print_tools.printer.color_print("Invalid directory.", "red")
     else:
         # Discover the type of archive to create
@@ -469,10 +1031,15 @@ def main():
             metadata = get_metadata_from_user(metadata, args.grade)
             # Create the archive        
             if archive_type == "cbz":
-                mm_comic_archive.create_cbz(path, metadata["title"], metadata, remove_files=args.xxxxx)
+                stats = mm_image_tools.get_empty_optimization_stats()
+                mm_comic_archive.create_cbz(path, metadata["title"], metadata, remove_files=args.xxxxx,
+                        optimize=args.optimize, quality=args.quality, workers=args.workers, stats=stats)
+                if stats["images"] > 0:
+                    print(mm_image_tools.get_optimization_summary(stats))
             if archive_type == "epub":
                 chapters = mm_epub.get_chapters_from_user(path, metadata)
-                mm_epub.create_epub(chapters, metadata, path, smart_quotes=False, copy_back_cover=False)
+                mm_epub.create_epub(chapters, metadata, path, smart_quotes=False,
+                        copy_back_cover=False, workers=args.workers)
             if archive_type == "mkv":
                 success = mm_mkv.create_mkv(path, metadata["title"], metadata, remove_files=args.xxxxx)
                 if not success:
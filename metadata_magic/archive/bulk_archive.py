@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
 import os
-import re
+import time
 import tqdm
+import functools
 import shutil
 import argparse
 import tempfile
@@ -11,6 +12,8 @@ import html_string_tools
 import python_print_tools
 import metadata_magic.config as mm_config
 import metadata_magic.error as mm_error
+import metadata_magic.journal as mm_journal
+import metadata_magic.pipeline as mm_pipeline
 import metadata_magic.rename as mm_rename
 import metadata_magic.file_tools as mm_file_tools
 import metadata_magic.meta_finder as mm_meta_finder
@@ -18,14 +21,248 @@ import metadata_magic.archive as mm_archive
 import metadata_magic.archive.epub as mm_epub
 import metadata_magic.archive.mkv as mm_mkv
 import metadata_magic.archive.comic_archive as mm_comic_archive
-from os.path import abspath, basename, exists, isdir, join
+import metadata_magic.archive.comic_xml as mm_comic_xml
+import metadata_magic.archive.image_tools as mm_image_tools
+from os.path import abspath, basename, exists, join
 
-def archive_all_media(directory:str, config:dict,
-            format_title:bool=False, description_length:int=1000) -> bool:
+def get_pair_metadata(pair:dict, config:dict, format_title:bool=False) -> dict:
+    """
+    Returns the metadata for archiving a JSON-media pair.
+
+    :param pair: JSON-media pair to get metadata for
+    :type pair: dict, required
+    :param config: Dictionary of a metadata-magic config file
+    :type config: dict, required
+    :param format_title: Whether to format the media title, defaults to False
+    :type format_title: bool, optional
+    :return: Metadata for the pair
+    :rtype: dict
+    """
+    metadata = mm_archive.get_info_from_pairs([pair], config)
+    if format_title:
+        metadata["title"] = mm_archive.format_title(metadata["title"])
+    return metadata
+
+def prepare_archive(pair:dict, config:dict, format_title:bool, description_length:int,
+            used_files:dict, journal:dict=None) -> dict:
+    """
+    Gets everything needed to archive a JSON-media pair, reserving the name of the new archive.
+    Text and long description media are copied into a temporary directory to build an EPUB from, staged on the same device as the archive.
+    The pair is recorded as started in the journal, along with the files needed to roll it back.
+
+    :param pair: JSON-media pair to archive
+    :type pair: dict, required
+    :param config: Dictionary of a metadata-magic config file
+    :type config: dict, required
+    :param format_title: Whether to format the media title
+    :type format_title: bool, required
+    :param description_length: Length that a description can be before being used as an ebook
+    :type description_length: int, required
+    :param used_files: Lowercase filenames already taken, keyed by directory, filled in as needed
+    :type used_files: dict, required
+    :param journal: Journal to record progress in, as returned by mm_journal.open_journal, defaults to None
+    :type journal: dict, optional
+    :return: Archiving job for build_archive, None if the media isn't supported
+    :rtype: dict
+    """
+    # Ignore if the extension is not supported
+    extension = html_string_tools.get_extension(pair["media"]).lower()
+    if extension not in mm_archive.SUPPORTED_IMAGES and extension not in mm_archive.SUPPORTED_TEXT:
+        return None
+    # Get metadata from the JSON
+    metadata = get_pair_metadata(pair, config, format_title)
+    title = mm_rename.get_file_friendly_text(metadata["title"], ascii_only=True)
+    job = {"pair":pair, "metadata":metadata, "temp_dir":None, "journal_position":None}
+    # Reserve the name of the archive in the original directory
+    parent = abspath(join(pair["json"], os.pardir))
+    if parent not in used_files:
+        used_files[parent] = set([file.lower() for file in os.listdir(parent)])
+    filename = basename(pair["json"])
+    filename = filename[:len(filename) - 5]
+    archive_extension = ".epub"
+    if (extension in mm_archive.SUPPORTED_IMAGES
+            and (metadata["description"] is None or len(metadata["description"]) < description_length)):
+        archive_extension = ".cbz"
+    filename = mm_rename.get_unused_filename([f"a{archive_extension}"], filename, used_files[parent])
+    used_files[parent].add(f"{filename}{archive_extension}".lower())
+    job["archive"] = abspath(join(parent, f"{filename}{archive_extension}"))
+    if archive_extension == ".cbz":
+        # Write the CBZ straight from the original files
+        json_extension = html_string_tools.get_extension(pair["json"])
+        media_extension = html_string_tools.get_extension(pair["media"])
+        job["entries"] = [(pair["json"], f"{title}/{title}{json_extension}")]
+        job["entries"].append((pair["media"], f"{title}/{title}{media_extension}"))
+        return record_archive(job, journal)
+    # Copy JSON and media into a staged temp directory, renamed to fit the title
+    staging_directory = mm_file_tools.get_staging_directory(job["archive"])
+    job["temp_dir"] = tempfile.mkdtemp(prefix=".mm-", dir=staging_directory)
+    try:
+        temp_dir = abspath(join(job["temp_dir"], "files"))
+        os.mkdir(temp_dir)
+        job["directory"] = temp_dir
+        new_json = abspath(join(temp_dir, basename(pair["json"])))
+        new_media = abspath(join(temp_dir, basename(pair["media"])))
+        shutil.copy(pair["json"], new_json)
+        shutil.copy(pair["media"], new_media)
+        job["json"] = mm_rename.rename_file(new_json, title)
+        job["media"] = mm_rename.rename_file(new_media, title)
+        if extension in mm_archive.SUPPORTED_TEXT:
+            # Add the cover, using the covers already rendering in the background
+            image_dir = abspath(join(job["temp_dir"], "cover"))
+            os.mkdir(image_dir)
+            chapters = mm_epub.get_default_chapters(temp_dir, title=title)
+            job["chapters"] = mm_epub.add_cover_to_chapters(chapters, metadata, image_dir)
+    except:
+        shutil.rmtree(job["temp_dir"], ignore_errors=True)
+        raise
+    return record_archive(job, journal)
+
+def record_archive(job:dict, journal:dict=None) -> dict:
+    """
+    Records an archiving job as started in the journal, without waiting for the entry to reach the disk.
+
+    :param job: Archiving job, as returned by prepare_archive
+    :type job: dict, required
+    :param journal: Journal to record progress in, defaults to None
+    :type journal: dict, optional
+    :return: The archiving job, with the position of its journal entry
+    :rtype: dict
+    """
+    if journal is not None:
+        info = {"json":job["pair"]["json"], "archive":job["archive"], "temp_dir":job["temp_dir"]}
+        job["journal_position"] = mm_journal.write_journal_entry(journal, job["pair"]["media"], "started", info)
+    return job
+
+def commit_archive(job:dict, journal:dict=None) -> dict:
+    """
+    Makes sure an archiving job is recorded on disk before its archive is written.
+    Jobs prepared while earlier jobs were committing share a single sync.
+
+    :param job: Archiving job, as returned by prepare_archive
+    :type job: dict, required
+    :param journal: Journal to record progress in, defaults to None
+    :type journal: dict, optional
+    :return: The archiving job
+    :rtype: dict
+    """
+    if job is not None and journal is not None:
+        mm_journal.sync_journal(journal, job["journal_position"])
+    return job
+
+def build_archive(job:dict, config:dict, optimize:str=None, quality:int=mm_image_tools.DEFAULT_QUALITY) -> dict:
+    """
+    Builds the archive for a job from prepare_archive.
+    CBZ files are staged and moved to their final path, while EPUB files are built in the job's temporary directory.
+    The temporary directory is removed if building fails.
+
+    :param job: Archiving job, as returned by prepare_archive
+    :type job: dict, required
+    :param config: Dictionary of a metadata-magic config file
+    :type config: dict, required
+    :param optimize: Type of optimization for CBZ images, one of "lossless", "webp", or "jpeg", defaults to None for none
+    :type optimize: str, optional
+    :param quality: Quality of lossy image optimizations from 0 to 100, defaults to mm_image_tools.DEFAULT_QUALITY
+    :type quality: int, optional
+    :return: The archiving job, with the path of the built archive under "built" and any optimization stats under "optimization"
+    :rtype: dict
+    """
+    if job is None:
+        return None
+    try:
+        metadata = job["metadata"]
+        if "entries" in job:
+            with tempfile.TemporaryDirectory(prefix="mm-optimize-") as optimize_dir:
+                # Optimize the images in this process, since each job already runs in its own process
+                entries = job["entries"]
+                metadata["page_count"] = str(mm_comic_archive.get_page_count(entries))
+                if optimize is not None:
+                    job["optimization"] = mm_image_tools.get_empty_optimization_stats()
+                    entries = mm_comic_archive.optimize_cbz_entries(entries, optimize_dir, optimize,
+                            quality, workers=1, stats=job["optimization"])
+                comic_xml = mm_comic_xml.get_comic_xml(metadata, indent=False)
+                job["built"] = mm_comic_archive.write_cbz(entries, job["archive"], comic_xml)
+        elif "chapters" in job:
+            job["built"] = mm_epub.create_epub(job["chapters"], metadata, job["directory"],
+                    smart_quotes=True, copy_back_cover=False)
+        else:
+            # Create an epub if the description is too long
+            job["built"] = mm_epub.create_epub_from_description(job["json"], job["media"],
+                    metadata, job["directory"], config)
+        assert job["built"] is not None and exists(job["built"])
+    except:
+        if job["temp_dir"] is not None:
+            shutil.rmtree(job["temp_dir"], ignore_errors=True)
+        raise
+    return job
+
+def finish_archive(job:dict, journal:dict=None) -> dict:
+    """
+    Moves a built archive into place, then removes the original files and the job's temporary directory.
+    The pair is recorded as done in the journal once the originals are removed.
+
+    :param job: Archiving job, as returned by build_archive
+    :type job: dict, required
+    :param journal: Journal to record progress in, defaults to None
+    :type journal: dict, optional
+    :return: The finished archiving job
+    :rtype: dict
+    """
+    if job is None:
+        return None
+    try:
+        if not job["built"] == job["archive"]:
+            assert mm_file_tools.replace_file(job["built"], job["archive"])
+        assert exists(job["archive"])
+    finally:
+        if job["temp_dir"] is not None:
+            shutil.rmtree(job["temp_dir"], ignore_errors=True)
+    # Delete the original files
+    os.remove(job["pair"]["json"])
+    os.remove(job["pair"]["media"])
+    if journal is not None:
+        mm_journal.write_journal_entry(journal, job["pair"]["media"], "done")
+    return job
+
+def recover_archives(journal:dict):
+    """
+    Cleans up after pairs that were started but not finished in an earlier run.
+    If the original files are all still there, any partly written archive is removed so the pair can be archived again.
+    If some originals were already removed, the archive was moved into place, so the remaining originals are removed.
+
+    :param journal: Journal of the earlier run, as returned by mm_journal.open_journal
+    :type journal: dict, required
+    """
+    for media, entry in journal["items"].items():
+        if not entry["state"] == "started":
+            continue
+        if entry["temp_dir"] is not None:
+            shutil.rmtree(entry["temp_dir"], ignore_errors=True)
+        originals = [entry["json"], media]
+        if all([exists(original) for original in originals]):
+            # Roll back the unfinished archive
+            if exists(entry["archive"]):
+                os.remove(entry["archive"])
+            entry["state"] = "rolled_back"
+        elif exists(entry["archive"]):
+            # Finish removing the originals
+            for original in originals:
+                if exists(original):
+                    os.remove(original)
+            entry["state"] = "done"
+        else:
+            continue
+        mm_journal.write_journal_entry(journal, media, entry["state"])
+
+def archive_all_media(directory:str, config:dict, format_title:bool=False,
+            description_length:int=1000, workers:int=None, resume:bool=False,
+            optimize:str=None, quality:int=mm_image_tools.DEFAULT_QUALITY, stats:dict=None) -> bool:
     """
     Takes all supported JSON-media pairs and archives them into their appropriate media archives.
     Text files are archived into EPUB files.
     Image files are archived into CBZ files.
+    Archives are built in a pool of processes while the next pairs are prepared and finished archives are moved into place.
+    Progress is recorded in a journal, so an interrupted run can be resumed.
+    When resuming, pairs finished in the earlier run are skipped and unfinished ones are rolled back and redone.
     
     :param directory: Directory in which to search for JSON-media pairs and archive files
     :type directory: str, required
@@ -35,73 +272,114 @@ def archive_all_media(directory:str, config:dict,
     :type format_title: bool, optional
     :param description_length: Length that a description can be before being used as an ebook, defaults to 1000
     :type description_length: int, optional
+    :param workers: Number of processes to build archives with, defaults to the number of CPUs
+    :type workers: int, optional
+    :param resume: Whether to resume an interrupted run, using its options, defaults to False
+    :type resume: bool, optional
+    :param optimize: Type of optimization for CBZ images, one of "lossless", "webp", or "jpeg", defaults to None for none
+    :type optimize: str, optional
+    :param quality: Quality of lossy image optimizations from 0 to 100, defaults to mm_image_tools.DEFAULT_QUALITY
+    :type quality: int, optional
+    :param stats: Optimization stats to add to, as returned by mm_image_tools.get_empty_optimization_stats, defaults to None
+    :type stats: dict, optional
     :return: Whether archiving files was successful
     :rtype: bool
     """
-    # Get all JSON-media pairs in the directory
+    # Open the journal, cleaning up after the earlier run if resuming
     full_directory = abspath(directory)
+    journal_file = mm_journal.get_journal_file("bulk-archive", full_directory)
+    run = {"format_title":format_title, "description_length":description_length, "optimize":optimize, "quality":quality}
+    journal = mm_journal.open_journal(journal_file, run, resume)
+    format_title = journal["run"]["format_title"]
+    description_length = journal["run"]["description_length"]
+    optimize = journal["run"].get("optimize")
+    quality = journal["run"].get("quality", quality)
+    recover_archives(journal)
+    # Get all JSON-media pairs in the directory, leaving out ones already done
     pairs = mm_meta_finder.get_pairs(full_directory, print_info=False)
-    # Run through each pair
-    media_extensions = []
-    media_extensions.extend(mm_archive.SUPPORTED_IMAGES)
-    media_extensions.extend(mm_archive.SUPPORTED_TEXT)
-    for pair in tqdm.tqdm(pairs):
-        try:
-            # Ignore if the extension is not supported
-            extension = html_string_tools.get_extension(pair["media"]).lower()
-            if extension not in media_extensions:
-                continue
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Copy JSON and media into temp directory
-                new_json = abspath(join(temp_dir, basename(pair["json"])))
-                new_media = abspath(join(temp_dir, basename(pair["media"])))
-                shutil.copy(pair["json"], new_json)
-                shutil.copy(pair["media"], new_media)
-                # Get metadata from the JSON
-                metadata = mm_archive.get_info_from_jsons(temp_dir, config)
-                # Format the title if specified
-                if format_title:
-                    metadata["title"] = mm_archive.format_title(metadata["title"])
-                # Rename files to fit the title
-                title = mm_rename.get_file_friendly_text(metadata["title"], ascii_only=True)
-                mm_rename.rename_file(new_json, title)
-                mm_rename.rename_file(new_media, title)
-                # Create the archive file
-                archive_file = None
-                if extension in mm_archive.SUPPORTED_IMAGES:
-                    # Create an epub if the description is too long
-                    if metadata["description"] is None or len(metadata["description"]) < description_length:
-                        archive_file = mm_comic_archive.create_cbz(temp_dir, name=title, metadata=metadata)
-                    else:
-                        new_pair = mm_meta_finder.get_pairs(temp_dir, print_info=False)[0]
-                        new_media = new_pair["media"]
-                        new_json = new_pair["json"]
-                        archive_file = mm_epub.create_epub_from_description(new_json, new_media, metadata, temp_dir, config)
-                elif extension in mm_archive.SUPPORTED_TEXT:
-                    with tempfile.TemporaryDirectory() as image_dir:
-                        chapters = mm_epub.get_default_chapters(temp_dir, title=title)
-                        chapters = mm_epub.add_cover_to_chapters(chapters, metadata, image_dir)
-                        archive_file = mm_epub.create_epub(chapters, metadata, temp_dir,
-                                smart_quotes=True, copy_back_cover=False)
-                assert exists(archive_file)
-                # Copy archive to the original directory
-                parent = abspath(join(pair["json"], os.pardir))
-                filename = basename(pair["json"])
-                filename = filename[:len(filename) - 5]
-                filename = mm_rename.get_available_filename([archive_file], filename, parent)
-                extension = html_string_tools.get_extension(archive_file).lower()
-                new_archive = join(parent, f"{filename}{extension}")
-                shutil.copy(archive_file, new_archive)
-                assert exists(new_archive)
-                # Delete the original files
-                os.remove(pair["json"])
-                os.remove(pair["media"])
-        except:
+    pairs = [pair for pair in pairs if not journal["items"].get(pair["media"], {"state":None})["state"] == "done"]
+    # Start rendering the covers for text files in the background
+    covers = []
+    for pair in pairs:
+        if html_string_tools.get_extension(pair["media"]).lower() in mm_archive.SUPPORTED_TEXT:
+            try:
+                metadata = get_pair_metadata(pair, config, format_title)
+                covers.append({"title":metadata["title"], "authors":metadata["writers"]})
+            except Exception: pass
+    mm_archive.submit_cover_images(covers)
+    # Prepare and finish one pair at a time so names are reserved in order
+    used_files = dict()
+    prepare = functools.partial(prepare_archive, config=config, format_title=format_title,
+            description_length=description_length, used_files=used_files, journal=journal)
+    stages = [mm_pipeline.get_stage(prepare, workers=1)]
+    stages.append(mm_pipeline.get_stage(functools.partial(commit_archive, journal=journal), workers=1))
+    build = functools.partial(build_archive, config=config, optimize=optimize, quality=quality)
+    stages.append(mm_pipeline.get_stage(build, use_processes=True))
+    stages.append(mm_pipeline.get_stage(functools.partial(finish_archive, journal=journal), workers=1))
+    progress = tqdm.tqdm(total=len(pairs))
+    success = [True]
+    optimization = mm_image_tools.get_empty_optimization_stats()
+    def callback(pair:dict, result) -> bool:
+        progress.update(1)
+        if isinstance(result, Exception):
             # Archiving failed
-            traceback.print_exc()
+            traceback.print_exception(type(result), result, result.__traceback__)
             python_print_tools.color_print(f"Failed Archiving \"{pair['media']}\"", "red")
+            success[0] = False
             return False
-    return True
+        if result is not None and "optimization" in result:
+            mm_image_tools.add_optimization_stats(optimization, result["optimization"])
+        return True
+    start = time.perf_counter()
+    try:
+        mm_pipeline.run_pipeline(pairs, stages, callback, cpu_workers=workers)
+    finally:
+        progress.close()
+        mm_journal.close_journal(journal, finished=success[0])
+    # Report throughput over the whole run, since images are optimized in parallel
+    optimization["time"] = time.perf_counter() - start
+    if stats is not None:
+        mm_image_tools.add_optimization_stats(stats, optimization)
+    return success[0]
+
+def get_archive_extraction(archive_file:str, output_directory:str, create_folder:bool=True,
+            remove_structure:bool=False, used_files:dict=None, archive_type:str=None) -> dict:
+    """
+    Works out how to extract the contents of a CBZ or EPUB file, without extracting anything.
+
+    :param archive_file: Path to CBZ or EPUB file to extract
+    :type archive_file: str, required
+    :param output_directory: Directory to extract the archive file to
+    :type output_directory: str, required
+    :param create_folder: Whether to create a subfolder to contain the contents of the archive, defaults to True
+    :type create_folder: bool, optional
+    :param remove_structure: Whether to remove the archive structure and metadata leaving only original files, defaults to False
+    :type remove_structure: bool, optional
+    :param used_files: Lowercase filenames already taken, keyed by directory, filled in as needed, defaults to None
+    :type used_files: dict, optional
+    :param archive_type: Extension of the archive format, defaults to the extension of the archive file
+    :type archive_type: str, optional
+    :return: Extraction plan for mm_file_tools.extract_zip_members, None if extraction isn't possible
+    :rtype: dict
+    """
+    full_directory = abspath(output_directory)
+    extension = archive_type
+    if extension is None:
+        extension = html_string_tools.get_extension(archive_file).lower()
+    if extension == ".cbz":
+        include = None
+        if remove_structure:
+            include = lambda path: not path.lower() == "comicinfo.xml"
+        return mm_file_tools.get_zip_extraction(archive_file, full_directory, create_folder=create_folder,
+                remove_internal=remove_structure, include=include, used_files=used_files)
+    if extension == ".epub":
+        # Only read the original files from the epub if removing structure
+        prefix = None
+        if remove_structure:
+            prefix = "EPUB/original"
+        return mm_file_tools.get_zip_extraction(archive_file, full_directory, create_folder=create_folder,
+                prefix=prefix, used_files=used_files)
+    return None
 
 def extract_cbz(cbz_file:str, output_directory:str,
             create_folder:bool=True, remove_structure:bool=False) -> bool:
@@ -119,12 +397,8 @@ def extract_cbz(cbz_file:str, output_directory:str,
     :return: Whether extracting files was successful
     :rtype: bool
     """
-    remove_list = []
-    if remove_structure:
-        remove_list = ["ComicInfo.xml", "comicinfo.xml"]
-    full_directory = abspath(output_directory)
-    return mm_file_tools.extract_zip(cbz_file, full_directory, create_folder=create_folder,
-            remove_internal=remove_structure, delete_files=remove_list)
+    plan = get_archive_extraction(cbz_file, output_directory, create_folder, remove_structure, archive_type=".cbz")
+    return plan is not None and mm_file_tools.extract_zip_members(plan)
 
 def extract_epub(epub_file:str, output_directory:str,
             create_folder:bool=True, remove_structure:bool=False) -> bool:
@@ -142,38 +416,8 @@ def extract_epub(epub_file:str, output_directory:str,
     :return: Whether extracting files was successful
     :rtype: bool
     """
-    # Extract with structure intact if specified
-    full_directory = abspath(output_directory)
-    if not remove_structure:
-        return mm_file_tools.extract_zip(epub_file, full_directory, create_folder=create_folder)
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Extract epub to temp folder
-        mm_file_tools.extract_zip(epub_file, temp_dir)
-        # Get the folder containing the original files
-        original_dir = abspath(join(temp_dir, "EPUB"))
-        original_dir = abspath(join(original_dir, "original"))
-        if not exists(original_dir):
-            return False
-        # Create directory to copy files into, if specified
-        copy_dir = full_directory
-        if create_folder:
-            folder_name = re.sub(r"\..{1,6}$", "", basename(epub_file))
-            folder_name = mm_rename.get_available_filename(["AAAAAAAA"], folder_name, full_directory)
-            copy_dir = abspath(join(full_directory, folder_name))
-            os.mkdir(copy_dir)
-        # Copy files from epub
-        for original_file in sorted(os.listdir(original_dir)):
-            full_file = abspath(join(original_dir, original_file))
-            filename = re.sub(r"\..{1,6}$", "", original_file)
-            filename = mm_rename.get_available_filename([original_file], filename, copy_dir)
-            filename = filename + html_string_tools.get_extension(full_file)
-            new_file = abspath(join(copy_dir, filename))
-            if isdir(full_file):
-                shutil.copytree(full_file, new_file)
-            else:
-                shutil.copy(full_file, new_file)
-            assert exists(new_file)
-    return True
+    plan = get_archive_extraction(epub_file, output_directory, create_folder, remove_structure, archive_type=".epub")
+    return plan is not None and mm_file_tools.extract_zip_members(plan)
 
 def extract_mkv(mkv_file:str, output_directory:str) -> bool:
     """
@@ -198,10 +442,49 @@ def extract_mkv(mkv_file:str, output_directory:str) -> bool:
         mm_mkv.remove_all_mkv_metadata(mkv_file)
     return True
 
-def extract_all_archives(directory:str, create_folders:bool=True, remove_structure:bool=False) -> bool:
+def plan_extraction(archive:str, create_folders:bool, remove_structure:bool, used_files:dict) -> dict:
+    """
+    Gets the extraction plan for an archive in extract_all_archives.
+    MKV files are handled completely here, since only their embedded JSON is extracted.
+
+    :param archive: Path of the archive file to extract
+    :type archive: str, required
+    :param create_folders: Whether to create a subfolder to contain the contents of the archive
+    :type create_folders: bool, required
+    :param remove_structure: Whether to remove the archive structure and metadata leaving only original files
+    :type remove_structure: bool, required
+    :param used_files: Lowercase filenames already taken, keyed by directory, filled in as needed
+    :type used_files: dict, required
+    :return: Extraction plan, None for MKV files
+    :rtype: dict
+    """
+    parent_dir = abspath(join(archive, os.pardir))
+    if html_string_tools.get_extension(archive).lower() == ".mkv":
+        assert extract_mkv(archive, parent_dir)
+        return None
+    plan = get_archive_extraction(archive, parent_dir, create_folder=create_folders,
+            remove_structure=remove_structure, used_files=used_files)
+    assert plan is not None
+    return plan
+
+def extract_planned_archive(plan:dict) -> dict:
+    """
+    Extracts an archive using a plan from plan_extraction.
+
+    :param plan: Extraction plan, None for archives with nothing left to extract
+    :type plan: dict, required
+    :return: The extraction plan
+    :rtype: dict
+    """
+    if plan is not None:
+        assert mm_file_tools.extract_zip_members(plan)
+    return plan
+
+def extract_all_archives(directory:str, create_folders:bool=True, remove_structure:bool=False, workers:int=None) -> bool:
     """
     Extracts the contents of all media archive files in the given directory.
     Supports .epub and .cbz files.
+    Archives are decompressed in a pool of processes while later archives are planned and extracted archives are removed.
     
     :param directory: Directory to containing archives and to extract archive contents into
     :type directory: str
@@ -209,37 +492,34 @@ def extract_all_archives(directory:str, create_folders:bool=True, remove_structu
     :type create_folders: bool, optional
     :param remove_structure: Whether to remove the archive structure and metadata leaving only original files, defaults to False
     :type remove_structure: bool, optional
+    :param workers: Number of processes to extract archives with, defaults to the number of CPUs
+    :type workers: int, optional
     :return: Whether extracting files was successful
     :rtype: bool
     """
     # Get a list of all archive files
     archives = mm_file_tools.find_files_of_type(directory, mm_archive.ARCHIVE_EXTENSIONS)
-    # Extract each archive
-    for archive in tqdm.tqdm(archives):
-        try:
-            # Extract archives
-            remove_archive = True
-            parent_dir = abspath(join(archive, os.pardir))
-            extension = html_string_tools.get_extension(archive).lower()
-            if extension == ".cbz":
-                assert extract_cbz(archive, parent_dir, create_folder=create_folders,
-                        remove_structure=remove_structure)
-            elif extension == ".epub":
-                assert extract_epub(archive, parent_dir, create_folder=create_folders,
-                        remove_structure=remove_structure)
-            elif extension == ".mkv":
-                remove_archive = False
-                assert extract_mkv(archive, parent_dir)
-            else:
-                assert False
-        except AssertionError:
+    # Plan one archive at a time so names are reserved in order
+    used_files = dict()
+    plan = functools.partial(plan_extraction, create_folders=create_folders,
+            remove_structure=remove_structure, used_files=used_files)
+    stages = [mm_pipeline.get_stage(plan, workers=1)]
+    stages.append(mm_pipeline.get_stage(extract_planned_archive, use_processes=True))
+    # Remove each archive once extracted
+    stages.append(mm_pipeline.get_stage(lambda plan: plan is None or os.remove(plan["zip"])))
+    progress = tqdm.tqdm(total=len(archives))
+    success = [True]
+    def callback(archive:str, result) -> bool:
+        progress.update(1)
+        if isinstance(result, Exception):
             # Extracting archive failed
             python_print_tools.color_print(f"Failed Extracting \"{archive}\"", "red")
+            success[0] = False
             return False
-        # Remove the existing archive
-        if remove_archive:
-            os.remove(archive)
-    return True
+        return True
+    mm_pipeline.run_pipeline(archives, stages, callback, cpu_workers=workers)
+    progress.close()
+    return success[0]
 
 def main():
     """
@@ -270,6 +550,30 @@ def main():
             "--format-titles",
             help="Formats titles when archiving media",
             action="store_true")
+    parser.add_argument(
+            "-w",
+            "--workers",
+            help="Number of processes to use when building archives",
+            nargs="?",
+            type=int,
+            default=None)
+    parser.add_argument(
+            "-r",
+            "--resume",
+            help="Resume an interrupted archiving run",
+            action="store_true")
+    parser.add_argument(
+            "-o",
+            "--optimize",
+            help="Re-encode CBZ images to save space, keeping originals that are smaller",
+            choices=list(mm_image_tools.OPTIMIZE_FORMATS),
+            default=None)
+    parser.add_argument(
+            "-q",
+            "--quality",
+            help="Quality of lossy image optimization from 0 to 100",
+            type=int,
+            default=mm_image_tools.DEFAULT_QUALITY)
     args = parser.parse_args()
     # Check that directory is valid
     directory = abspath(args.directory)
@@ -288,4 +592,8 @@ def main():
             print("Archiving media files...")
             config_paths = mm_config.get_default_config_paths()
             config = mm_config.get_config(config_paths)
-            archive_all_media(directory, config, args.format_titles, args.description_length)
+            stats = mm_image_tools.get_empty_optimization_stats()
+            archive_all_media(directory, config, args.format_titles, args.description_length, args.workers,
+                    args.resume, args.optimize, args.quality, stats)
+            if stats["images"] > 0:
+                print(mm_image_tools.get_optimization_summary(stats))
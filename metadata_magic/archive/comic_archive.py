@@ -2,19 +2,167 @@
 
 import os
 import copy
+import time
 import shutil
 import tempfile
+import zipfile
+import concurrent.futures
 import html_string_tools
 import metadata_magic.sort as mm_sort
 import metadata_magic.rename as mm_rename
 import metadata_magic.archive as mm_archive
 import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.zip_tools as mm_zip_tools
 import metadata_magic.archive.comic_xml as mm_comic_xml
-from os.path import abspath, basename, exists, isdir, join
+import metadata_magic.archive.image_tools as mm_image_tools
+from os.path import abspath, basename, exists, isdir, join, relpath
+from typing import List
 
-def create_cbz(directory:str, name:str=None, metadata:dict=None, remove_files:bool=False) -> str:
+def get_page_count(entries:List[tuple]) -> int:
+    """
+    Returns the number of image pages in a list of CBZ entries.
+
+    :param entries: List of (source path, archive name) tuples as used by write_cbz
+    :type entries: List[tuple], required
+    :return: Number of image files among the entries
+    :rtype: int
+    """
+    pages = 0
+    for entry in entries:
+        if html_string_tools.get_extension(entry[1]).lower() in mm_archive.SUPPORTED_IMAGES:
+            pages += 1
+    return pages
+
+def get_cbz_entries(directory:str, folder_name:str=None) -> List[tuple]:
+    """
+    Returns the list of entries for writing the contents of a directory into a CBZ file.
+    Dotfiles and top level ComicInfo.xml files are skipped.
+
+    :param directory: Directory with files to archive
+    :type directory: str, required
+    :param folder_name: Name of an internal folder to hold the files in the archive, defaults to None
+    :type folder_name: str, optional
+    :return: List of (source path, archive name) tuples, sorted alphanumerically
+    :rtype: List[tuple]
+    """
+    entries = []
+    full_directory = abspath(directory)
+    directories = [full_directory]
+    while len(directories) > 0:
+        for filename in mm_sort.sort_alphanum(os.listdir(directories[0])):
+            # Skip dotfiles and existing metadata
+            full_file = abspath(join(directories[0], filename))
+            if filename.startswith(".") or (directories[0] == full_directory and filename == "ComicInfo.xml"):
+                continue
+            # Get the name of the file within the archive
+            arcname = relpath(full_file, full_directory).replace(os.sep, "/")
+            if folder_name is not None:
+                arcname = f"{folder_name}/{arcname}"
+            entries.append((full_file, arcname))
+            # Add subdirectories to be searched
+            if isdir(full_file):
+                directories.append(full_file)
+        del directories[0]
+    return entries
+
+def optimize_cbz_entries(entries:List[tuple], directory:str, optimize:str,
+            quality:int=mm_image_tools.DEFAULT_QUALITY, workers:int=None, stats:dict=None) -> List[tuple]:
+    """
+    Returns CBZ entries with the image pages replaced by smaller re-encoded versions where possible.
+    Images are optimized in a pool of processes, and original images are kept wherever they are smaller.
+    Pages that change format are renamed to match, unless the new name is already used in the archive.
+
+    :param entries: List of (source path, archive name) tuples as used by write_cbz
+    :type entries: List[tuple], required
+    :param directory: Directory to write the optimized images to
+    :type directory: str, required
+    :param optimize: Type of optimization, one of "lossless", "webp", or "jpeg"
+    :type optimize: str, required
+    :param quality: Quality of lossy optimizations from 0 to 100, defaults to mm_image_tools.DEFAULT_QUALITY
+    :type quality: int, optional
+    :param workers: Number of processes to optimize images with, optimizing in this process if 1, defaults to None
+    :type workers: int, optional
+    :param stats: Optimization stats to add to, as returned by mm_image_tools.get_empty_optimization_stats, defaults to None
+    :type stats: dict, optional
+    :return: List of (source path, archive name) tuples with the optimized images
+    :rtype: List[tuple]
+    """
+    start = time.perf_counter()
+    jobs = []
+    indexes = []
+    for i in range(0, len(entries)):
+        if mm_image_tools.can_optimize(entries[i][1], optimize) and not isdir(entries[i][0]):
+            new_file = abspath(join(directory, str(i)))
+            jobs.append({"file":entries[i][0], "new_file":new_file, "optimize":optimize, "quality":quality})
+            indexes.append(i)
+    # Optimize the images
+    if workers == 1 or len(jobs) < 2:
+        results = [mm_image_tools.optimize_image(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(mm_image_tools.optimize_image, jobs))
+    # Replace the entries of images that were made smaller
+    optimized_entries = list(entries)
+    used = set([entry[1].lower() for entry in entries])
+    new_stats = mm_image_tools.get_empty_optimization_stats()
+    new_stats["images"] = len(jobs)
+    for i, result in zip(indexes, results):
+        new_stats["size"] += result["size"]
+        if result["file"] == entries[i][0]:
+            new_stats["new_size"] += result["size"]
+            continue
+        arcname = entries[i][1]
+        extension = html_string_tools.get_extension(result["file"])
+        new_arcname = f"{os.path.splitext(arcname)[0]}{extension}"
+        if not new_arcname.lower() == arcname.lower() and new_arcname.lower() in used:
+            new_stats["new_size"] += result["size"]
+            continue
+        used.add(new_arcname.lower())
+        optimized_entries[i] = (result["file"], new_arcname)
+        new_stats["optimized"] += 1
+        new_stats["new_size"] += result["new_size"]
+    new_stats["time"] = time.perf_counter() - start
+    if stats is not None:
+        mm_image_tools.add_optimization_stats(stats, new_stats)
+    return optimized_entries
+
+def write_cbz(entries:List[tuple], cbz_file:str, comic_xml:str=None, compress_level:int=9) -> str:
+    """
+    Writes a CBZ file by streaming the given source files straight into the archive.
+    The archive is staged on the same device and moved into place once complete, so no partial CBZ is left behind.
+
+    :param entries: List of (source path, archive name) tuples for the files to include
+    :type entries: List[tuple], required
+    :param cbz_file: Path of the CBZ file to create
+    :type cbz_file: str, required
+    :param comic_xml: Text of the ComicInfo.xml file to include, defaults to None
+    :type comic_xml: str, optional
+    :param compress_level: Level of compression from min 0 to max 9, defaults to 9
+    :type compress_level: int, optional
+    :return: Path of the newly created CBZ file, None if writing the CBZ failed
+    :rtype: str
+    """
+    full_cbz_file = abspath(cbz_file)
+    try:
+        # Write the cbz to a staged file, which is removed along with its directory on failure
+        staging_directory = mm_file_tools.get_staging_directory(full_cbz_file)
+        with tempfile.TemporaryDirectory(prefix=".mm-", dir=staging_directory) as temp_dir:
+            new_cbz = abspath(join(temp_dir, basename(full_cbz_file)))
+            with zipfile.ZipFile(new_cbz, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compress_level) as out_file:
+                if comic_xml is not None:
+                    out_file.writestr("ComicInfo.xml", comic_xml)
+                for entry in entries:
+                    out_file.write(entry[0], entry[1])
+            # Move the finished cbz into place
+            assert mm_file_tools.replace_file(new_cbz, full_cbz_file)
+    except (AssertionError, FileNotFoundError, OSError): return None
+    return full_cbz_file
+
+def create_cbz(directory:str, name:str=None, metadata:dict=None, remove_files:bool=False,
+            optimize:str=None, quality:int=mm_image_tools.DEFAULT_QUALITY, workers:int=None, stats:dict=None) -> str:
     """
     Creates a cbz archive containing the files of a given directory.
+    Image pages can be optimized as they are archived, leaving the original files untouched.
     
     :param directory: Directory with files to archive
     :type directory: str, required
@@ -24,6 +172,14 @@ def create_cbz(directory:str, name:str=None, metadata:dict=None, remove_files:bo
     :type metadata: dict, optional
     :param remove_files: Whether to delete the files now in the archive once the CBZ is completed, defaults to False
     :type remove_files: bool, optional
+    :param optimize: Type of image optimization, one of "lossless", "webp", or "jpeg", defaults to None for none
+    :type optimize: str, optional
+    :param quality: Quality of lossy optimizations from 0 to 100, defaults to mm_image_tools.DEFAULT_QUALITY
+    :type quality: int, optional
+    :param workers: Number of processes to optimize images with, defaults to None
+    :type workers: int, optional
+    :param stats: Optimization stats to add to, as returned by mm_image_tools.get_empty_optimization_stats, defaults to None
+    :type stats: dict, optional
     :return: Path of the newly created CBZ file
     :rtype: str
     """
@@ -41,14 +197,14 @@ def create_cbz(directory:str, name:str=None, metadata:dict=None, remove_files:bo
         filename = mm_rename.get_available_filename(["a.cbz"], name, full_directory)
     cbz_file = abspath(join(full_directory, f"{filename}.cbz"))
     # Check if there are existing directories
-    move_files = True
+    folder_name = None
+    has_directories = False
     for file in files:
         if isdir(abspath(join(full_directory, file))):
-            move_files = False
+            has_directories = True
             break
-    # Move files if required
-    if move_files:
-        # Create new folder to contain files
+    # Get the name of the internal folder if there are no existing directories
+    if not has_directories:
         folder_name = name
         if folder_name is None:
             try:
@@ -57,26 +213,25 @@ def create_cbz(directory:str, name:str=None, metadata:dict=None, remove_files:bo
             except (AssertionError, KeyError, TypeError):
                 folder_name = files[0][:len(files[0]) - len(html_string_tools.get_extension(files[0]))]
         folder_name = mm_rename.get_file_friendly_text(folder_name)
-        folder_name = mm_rename.get_available_filename(["AAAAAAAAAA"], folder_name, full_directory)
-        new_folder = abspath(join(full_directory, folder_name))
-        os.mkdir(new_folder)
-        # Move existing files to the new folder
-        for file in files:
-            if not file == "ComicInfo.xml":
-                current_file = abspath(join(full_directory, file))
-                new_file = abspath(join(new_folder, file))
-                shutil.move(current_file, new_file)
-    # Create metadata file, if specified
-    meta_file = abspath(join(full_directory, "ComicInfo.xml"))
-    if metadata is not None:
-        # Set the page count
-        new_metadata = copy.deepcopy(metadata)
-        images = mm_file_tools.find_files_of_type(full_directory, mm_archive.SUPPORTED_IMAGES)
-        new_metadata["page_count"] = str(len(images))
-        # Write the metadata file
-        mm_file_tools.write_text_file(meta_file, mm_comic_xml.get_comic_xml(new_metadata))
-    # Create cbz file
-    assert mm_file_tools.create_zip(full_directory, cbz_file)
+    # Get the files to include in the archive
+    entries = get_cbz_entries(full_directory, folder_name)
+    page_count = get_page_count(entries)
+    with tempfile.TemporaryDirectory(prefix="mm-optimize-") as optimize_dir:
+        # Optimize the image pages, if specified
+        if optimize is not None:
+            entries = optimize_cbz_entries(entries, optimize_dir, optimize, quality, workers, stats)
+        # Get the metadata file text, if specified
+        comic_xml = None
+        meta_file = abspath(join(full_directory, "ComicInfo.xml"))
+        if metadata is None and exists(meta_file):
+            entries.insert(0, (meta_file, "ComicInfo.xml"))
+        if metadata is not None:
+            # Set the page count from the original pages
+            new_metadata = copy.deepcopy(metadata)
+            new_metadata["page_count"] = str(page_count)
+            comic_xml = mm_comic_xml.get_comic_xml(new_metadata)
+        # Create cbz file
+        assert write_cbz(entries, cbz_file, comic_xml) is not None
     # Remove all old files besides the CBZ, if specified.
     if remove_files:
         files = os.listdir(full_directory)
@@ -86,13 +241,10 @@ def create_cbz(directory:str, name:str=None, metadata:dict=None, remove_files:bo
                 shutil.rmtree(full_file)
             elif not full_file == cbz_file:
                 os.remove(full_file)
-    # Remove ComicInfo.xml file, if exists
-    if exists(meta_file):
-        os.remove(meta_file)
     # Return CBZ file
     return cbz_file
 
-def get_info_from_cbz(cbz_file:str, check_subdirectories:bool=True) -> dict:
+def get_info_from_cbz(cbz_file:str, check_subdirectories:bool=True, listing:dict=None) -> dict:
     """
     Extracts ComicInfo.xml from a given .cbz file and returns the metadata as a dict.
     
@@ -100,33 +252,37 @@ def get_info_from_cbz(cbz_file:str, check_subdirectories:bool=True) -> dict:
     :type cbz_file: str, required
     :param check_subdirectories: Whether to check subdirectories for metadata file, defaults to True
     :type check_subdirectories: bool, optional
+    :param listing: Member listing of the .cbz file if already read, as returned by mm_zip_tools.read_zip_listing, defaults to None
+    :type listing: dict, optional
     :return: Dictionary containing metadata from the .cbz file
     :rtype: dict
     """
+    # Get the members of the cbz file
+    if listing is None:
+        listing = mm_zip_tools.read_zip_listing(cbz_file)
+    if listing is None:
+        return mm_archive.get_empty_metadata()
+    member = mm_zip_tools.find_zip_member(listing, "ComicInfo.xml", check_subdirectories)
+    if member is None:
+        return mm_archive.get_empty_metadata()
     with tempfile.TemporaryDirectory() as extract_dir:
-        # Create temporary directory
-        file = abspath(cbz_file)
-        assert exists(extract_dir)
         # Extract ComicInfo.xml from given file
-        xml_file = mm_file_tools.extract_file_from_zip(cbz_file, extract_dir, "ComicInfo.xml", check_subdirectories)
+        xml_file = mm_zip_tools.extract_zip_member(listing, member, extract_dir)
         if xml_file is None or not exists(xml_file):
             return mm_archive.get_empty_metadata()
         # Read XML file
         metadata = mm_comic_xml.read_comic_info(xml_file)
-        # Get page count if not present
-        try:
-            assert metadata["page_count"] is not None and int(metadata["page_count"]) > 0
-        except (AssertionError, ValueError):
-            extract_dir = abspath(join(extract_dir, "images"))
-            os.mkdir(extract_dir)
-            mm_file_tools.extract_zip(cbz_file, extract_dir)
-            images = mm_file_tools.find_files_of_type(extract_dir, mm_archive.SUPPORTED_IMAGES)
-            metadata["page_count"] = str(len(images))
-            # Update the cbz file
-            update_cbz_info(cbz_file, metadata)
+    # Get page count from the listing if not present
+    try:
+        assert metadata["page_count"] is not None and int(metadata["page_count"]) > 0
+    except (AssertionError, ValueError):
+        images = mm_zip_tools.get_listing_files(listing, mm_archive.SUPPORTED_IMAGES)
+        metadata["page_count"] = str(len(images))
+        # Update the cbz file
+        update_cbz_info(cbz_file, metadata)
     return metadata
 
-def update_cbz_info(cbz_file:str, metadata:dict, always_overwrite:bool=False):
+def update_cbz_info(cbz_file:str, metadata:dict, always_overwrite:bool=False, staging_directory:str=None):
     """
     Replaces the ComicInfo.xml file in a given .cbz file to reflect the given metadata
     If the metadata is already correct, file is not overwritten unless specified
@@ -137,10 +293,15 @@ def update_cbz_info(cbz_file:str, metadata:dict, always_overwrite:bool=False):
     :type metadata: dict
     :param always_overwrite: Whether to overwrite file even if metadata is identical, defaults to False
     :type always_overwrite: bool, optional
+    :param staging_directory: Directory to stage the new file in, defaults to the one from mm_file_tools.get_staging_directory
+    :type staging_directory: str, optional
     """
-    with tempfile.TemporaryDirectory() as temp_dir:
+    # Stage the new cbz on the same device as the original
+    full_cbz_file = abspath(cbz_file)
+    if staging_directory is None:
+        staging_directory = mm_file_tools.get_staging_directory(full_cbz_file)
+    with tempfile.TemporaryDirectory(prefix=".mm-", dir=staging_directory) as temp_dir:
         # Extract cbz into temp file
-        full_cbz_file = abspath(cbz_file)
         if mm_file_tools.extract_zip(full_cbz_file, temp_dir):
             # Delete existing ComicInfo.xml files, and get existing metadata
             old_metadata = None
@@ -153,5 +314,4 @@ def update_cbz_info(cbz_file:str, metadata:dict, always_overwrite:bool=False):
             if always_overwrite or not old_metadata == metadata:
                 new_cbz = create_cbz(temp_dir, name=metadata["title"], metadata=metadata)
                 # Replace the old cbz file
-                os.remove(full_cbz_file)
-                shutil.copy(new_cbz, full_cbz_file)
+                mm_file_tools.replace_file(new_cbz, full_cbz_file)
@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 
 import re
-import html_string_tools
 import metadata_magic.archive as mm_archive
 import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.archive.xml_tools as mm_xml_tools
 from os.path import abspath
 from xml.etree import ElementTree
 
@@ -115,9 +115,10 @@ def get_comic_xml(metadata:dict, indent:bool=True) -> str:
     if metadata["age_rating"] is not None:
         age_rating.text = metadata["age_rating"]
     # Set indents to make the XML more readable
-    xml = ElementTree.tostring(base).decode("UTF-8").strip()
+    indent_string = None
     if indent:
-        xml = html_string_tools.make_human_readable(xml, "  ")
+        indent_string = "  "
+    xml = mm_xml_tools.get_xml_string(base, indent_string)
     xml = f"<?xml version=\"1.0\"?>\n{xml}"
     # Return XML
     return xml
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import html_string_tools
+from os.path import abspath, exists, expandvars, isdir, join
+
+DEFAULT_CACHE_SIZE = 256
+GENERATOR_VERSION = None
+
+def get_cache_directory() -> str:
+    """
+    Returns the directory in which rendered cover images are cached.
+    Uses the METADATA_MAGIC_COVER_CACHE environment variable if set, otherwise the user's cache directory.
+
+    :return: Path of the cover cache directory
+    :rtype: str
+    """
+    directory = os.environ.get("METADATA_MAGIC_COVER_CACHE")
+    if directory is not None and not directory == "":
+        return abspath(expandvars(directory))
+    if os.name == "nt":
+        return abspath(expandvars(r"%LOCALAPPDATA%\metadata-magic\covers"))
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home is None or cache_home == "":
+        cache_home = expandvars(r"${HOME}/.cache")
+    return abspath(join(cache_home, "metadata-magic", "covers"))
+
+def get_cache_size() -> int:
+    """
+    Returns the maximum size of the cover cache in bytes.
+    Uses the METADATA_MAGIC_COVER_CACHE_SIZE environment variable in megabytes if set.
+    A size of 0 turns off cover caching.
+
+    :return: Maximum size of the cover cache in bytes
+    :rtype: int
+    """
+    try:
+        megabytes = float(os.environ.get("METADATA_MAGIC_COVER_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+    except ValueError: megabytes = DEFAULT_CACHE_SIZE
+    return int(max(megabytes, 0) * 1024 * 1024)
+
+def get_generator_version() -> str:
+    """
+    Returns the version of the installed cover generator, so covers are re-rendered when it changes.
+
+    :return: Version of the CoverGenerator package
+    :rtype: str
+    """
+    global GENERATOR_VERSION
+    if GENERATOR_VERSION is None:
+        try:
+            import importlib.metadata as importlib_metadata
+        except ImportError: importlib_metadata = None
+        try:
+            if importlib_metadata is not None:
+                GENERATOR_VERSION = importlib_metadata.version("CoverGenerator")
+            else:
+                # Fall back to pkg_resources before Python 3.8
+                import pkg_resources
+                GENERATOR_VERSION = pkg_resources.get_distribution("CoverGenerator").version
+        except Exception: GENERATOR_VERSION = "unknown"
+    return GENERATOR_VERSION
+
+def get_cover_key(title:str, author:str, width:int, extension:str) -> str:
+    """
+    Returns the cache filename for a cover with the given text and size.
+
+    :param title: Title text on the cover
+    :type title: str, required
+    :param author: Author text on the cover
+    :type author: str, required
+    :param width: Width of the cover image in pixels
+    :type width: int, required
+    :param extension: File extension of the cover image
+    :type extension: str, required
+    :return: Filename of the cached cover
+    :rtype: str
+    """
+    contents = json.dumps([title, author, width, get_generator_version()])
+    digest = hashlib.sha256(contents.encode("UTF-8")).hexdigest()
+    return f"{digest}{extension.lower()}"
+
+def link_file(file:str, new_file:str) -> bool:
+    """
+    Hard links a file to a new path, copying it instead if linking isn't possible.
+
+    :param file: Path of the existing file
+    :type file: str, required
+    :param new_file: Path to link the file to
+    :type new_file: str, required
+    :return: Whether the file was successfully linked or copied
+    :rtype: bool
+    """
+    try:
+        if exists(new_file):
+            os.remove(new_file)
+        os.link(file, new_file)
+        return True
+    except OSError: pass
+    try:
+        shutil.copy(file, new_file)
+        return True
+    except OSError: return False
+
+def get_cached_cover(key:str, path:str, cache_directory:str=None) -> bool:
+    """
+    Places a cached cover at the given path if it exists in the cache.
+
+    :param key: Cache filename, as returned by get_cover_key
+    :type key: str, required
+    :param path: Path to place the cover image at
+    :type path: str, required
+    :param cache_directory: Directory of the cover cache, defaults to None
+    :type cache_directory: str, optional
+    :return: Whether the cover was found in the cache
+    :rtype: bool
+    """
+    if cache_directory is None:
+        cache_directory = get_cache_directory()
+    cached_file = abspath(join(cache_directory, key))
+    if not exists(cached_file) or not link_file(cached_file, abspath(path)):
+        return False
+    # Mark the cover as recently used
+    try:
+        os.utime(cached_file)
+    except OSError: pass
+    return True
+
+def add_cover_to_cache(key:str, path:str, cache_directory:str=None, max_size:int=None):
+    """
+    Adds a rendered cover image to the cache, removing the least recently used covers if the cache is too large.
+
+    :param key: Cache filename, as returned by get_cover_key
+    :type key: str, required
+    :param path: Path of the rendered cover image
+    :type path: str, required
+    :param cache_directory: Directory of the cover cache, defaults to None
+    :type cache_directory: str, optional
+    :param max_size: Maximum size of the cache in bytes, defaults to None
+    :type max_size: int, optional
+    """
+    if cache_directory is None:
+        cache_directory = get_cache_directory()
+    if max_size is None:
+        max_size = get_cache_size()
+    try:
+        if max_size == 0 or os.stat(path).st_size > max_size:
+            return
+        os.makedirs(cache_directory, exist_ok=True)
+        # Stage the cover in the cache directory so it appears in one step
+        extension = html_string_tools.get_extension(key)
+        file_handle, staged_file = tempfile.mkstemp(suffix=extension, prefix=".mm-", dir=cache_directory)
+        os.close(file_handle)
+        if not link_file(abspath(path), staged_file):
+            os.remove(staged_file)
+            return
+        os.replace(staged_file, abspath(join(cache_directory, key)))
+    except OSError: return
+    trim_cache(cache_directory, max_size)
+
+def trim_cache(cache_directory:str, max_size:int):
+    """
+    Removes the least recently used covers from the cache until it is no larger than the given size.
+
+    :param cache_directory: Directory of the cover cache
+    :type cache_directory: str, required
+    :param max_size: Maximum size of the cache in bytes
+    :type max_size: int, required
+    """
+    if not isdir(cache_directory):
+        return
+    # Get the size and last use of every cached cover
+    covers = []
+    total_size = 0
+    for entry in os.scandir(cache_directory):
+        try:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            stat = entry.stat()
+        except OSError: continue
+        covers.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_size += stat.st_size
+    # Remove the oldest covers first
+    covers.sort()
+    for modified, size, path in covers:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+        except OSError: pass
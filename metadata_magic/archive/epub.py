@@ -4,6 +4,7 @@ import os
 import re
 import copy
 import math
+import concurrent.futures
 import shutil
 import tempfile
 import html_string_tools
@@ -11,12 +12,17 @@ import python_print_tools
 import metadata_magic.sort as mm_sort
 import metadata_magic.rename as mm_rename
 import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.zip_tools as mm_zip_tools
 import metadata_magic.meta_reader as mm_meta_reader
 import metadata_magic.archive as mm_archive
+import metadata_magic.archive.image_tools as mm_image_tools
 import metadata_magic.archive.xhtml_formatting as mm_xhtml
+import metadata_magic.archive.xml_tools as mm_xml_tools
 from xml.etree import ElementTree
 from os.path import abspath, basename, exists, isdir, join
-from typing import List
+from typing import Iterator, List
+
+MAX_CHAPTER_SIZE = 262144
 
 def get_default_chapters(directory:str, title:str=None) -> List[dict]:
     """
@@ -262,11 +268,125 @@ def get_chapters_from_user(directory:str, metadata:dict) -> List[dict]:
     # Return the chapters
     return chapters
 
+def get_chapter_pieces(files:List[dict], smart_quotes:bool=True, encoding:str="utf-8") -> Iterator[str]:
+    """
+    Returns the HTML for the files of a single chapter in pieces.
+    Text files are read and converted one paragraph at a time, so they are never held in memory all at once.
+    HTML files are cleaned up as a whole, then returned one paragraph at a time so large files can still be split.
+    Image files are expected to already have their XHTML in an "xml" key.
+    Raises UnicodeDecodeError if a text file can't be decoded with the given encoding.
+
+    :param files: List of file info for the chapter, each with a "file" key
+    :type files: List[dict], required
+    :param smart_quotes: Whether to format the internal HTML to use smart quotes, defaults to True
+    :type smart_quotes: bool, optional
+    :param encoding: Text encoding of text files, defaults to "utf-8"
+    :type encoding: str, optional
+    :return: Pieces of HTML for the chapter, in order
+    :rtype: Iterator[str]
+    """
+    for file in files:
+        # Convert based on the appropriate format
+        extension = html_string_tools.get_extension(file["file"]).lower()
+        if extension == ".txt":
+            yield from mm_xhtml.get_text_paragraphs(file["file"], smart_quotes, encoding)
+        elif extension == ".html" or extension == ".htm":
+            yield from mm_xhtml.get_html_paragraphs(file["file"], smart_quotes)
+        else:
+            yield file["xml"]
+
+def get_chapter_xhtml(files:List[dict], title:str, smart_quotes:bool=True) -> str:
+    """
+    Converts the files of a single chapter into a finished XHTML document.
+    Image files are expected to already have their XHTML in an "xml" key.
+
+    :param files: List of file info for the chapter, each with a "file" key
+    :type files: List[dict], required
+    :param title: Title of the chapter
+    :type title: str, required
+    :param smart_quotes: Whether to format the internal HTML to use smart quotes, defaults to True
+    :type smart_quotes: bool, optional
+    :return: XHTML text for the chapter
+    :rtype: str
+    """
+    chapter_xml = ""
+    for encoding in mm_file_tools.TEXT_ENCODINGS:
+        try:
+            chapter_xml = "".join(get_chapter_pieces(files, smart_quotes, encoding))
+            break
+        except UnicodeDecodeError: pass
+    # Return with proper XHTML formatting
+    return mm_xhtml.format_xhtml(chapter_xml, title)
+
+def get_part_file(xhtml_file:str, part:int) -> str:
+    """
+    Returns the path of one part of a chapter that was split into multiple XHTML files.
+    The first part uses the chapter's own XHTML file.
+
+    :param xhtml_file: Path of the chapter's XHTML file
+    :type xhtml_file: str, required
+    :param part: Number of the part, starting from 1
+    :type part: int, required
+    :return: Path of the XHTML file for the part
+    :rtype: str
+    """
+    if part == 1:
+        return xhtml_file
+    return f"{xhtml_file[:len(xhtml_file) - 6]}-part{part}.xhtml"
+
+def write_chapter_xhtml(files:List[dict], title:str, xhtml_file:str,
+            smart_quotes:bool=True, max_size:int=MAX_CHAPTER_SIZE) -> int:
+    """
+    Converts the files of a single chapter into XHTML files, splitting the chapter if it is too large.
+    Only one part of the chapter is held in memory at a time.
+    Parts after the first are written to files named by get_part_file.
+    Called once per chapter by create_content_files, possibly in a worker process.
+
+    :param files: List of file info for the chapter, each with a "file" key
+    :type files: List[dict], required
+    :param title: Title of the chapter
+    :type title: str, required
+    :param xhtml_file: Path of the XHTML file to write
+    :type xhtml_file: str, required
+    :param smart_quotes: Whether to format the internal HTML to use smart quotes, defaults to True
+    :type smart_quotes: bool, optional
+    :param max_size: Approximate maximum length of the HTML in each part, or None to never split, defaults to MAX_CHAPTER_SIZE
+    :type max_size: int, optional
+    :return: Number of XHTML files written for the chapter
+    :rtype: int
+    """
+    for encoding in mm_file_tools.TEXT_ENCODINGS:
+        part = 0
+        try:
+            part_xml = []
+            part_size = 0
+            for piece in get_chapter_pieces(files, smart_quotes, encoding):
+                # Write the current part if adding the piece would make it too large
+                if max_size is not None and part_size > 0 and part_size + len(piece) > max_size:
+                    part += 1
+                    xml = mm_xhtml.format_xhtml("".join(part_xml), title)
+                    mm_file_tools.write_text_file(get_part_file(xhtml_file, part), xml)
+                    part_xml = []
+                    part_size = 0
+                part_xml.append(piece)
+                part_size += len(piece)
+            # Write the final part
+            part += 1
+            xml = mm_xhtml.format_xhtml("".join(part_xml), title)
+            mm_file_tools.write_text_file(get_part_file(xhtml_file, part), xml)
+            return part
+        except UnicodeDecodeError:
+            # Remove parts written before the encoding failed
+            for i in range(1, part + 1):
+                os.remove(get_part_file(xhtml_file, i))
+    return 0
+
 def create_content_files(chapters:List[dict], output_directory:str,
-            smart_quotes:bool=True) -> List[dict]:
+            smart_quotes:bool=True, workers:int=1, max_size:int=MAX_CHAPTER_SIZE) -> List[dict]:
     """
     Creates all the XHTML content files converted from the files provided by the given chapters list.
     Files will be created in a "content" subdirectory in the given output_directory.
+    Chapters larger than max_size are split into multiple files, added as extra chapters not included in the contents.
     
     :param chapters: Chapter files and info, as returned by get_default_chapters
     :type chapters: List[dict], required
@@ -274,6 +394,10 @@ def create_content_files(chapters:List[dict], output_directory:str,
     :type output_directory: str, required
     :param smart_quotes: Whether to format the internal HTML to use smart quotes, defaults to True
     :type smart_quotes: bool, optional
+    :param workers: Number of processes to use for converting chapters, None for the number of CPUs, defaults to 1
+    :type workers: int, optional
+    :param max_size: Approximate maximum length of the HTML in each content file, or None to never split, defaults to MAX_CHAPTER_SIZE
+    :type max_size: int, optional
     :return: List with chapter file info, now with "file" fields pointing to the new XHTML files
     :rtype: List[dict]
     """
@@ -282,49 +406,72 @@ def create_content_files(chapters:List[dict], output_directory:str,
     image_dir = abspath(join(output_directory, "images"))
     os.mkdir(content_dir)
     os.mkdir(image_dir)
-    # Convert files to XHTML
-    updated_chapters = []
-    updated_chapters.extend(chapters)
+    # Get the sizes of all the images in one batch
+    image_files = []
+    for chapter in chapters:
+        for file in chapter["files"]:
+            extension = html_string_tools.get_extension(file["file"]).lower()
+            if extension not in [".txt", ".html", ".htm"]:
+                image_files.append(file["file"])
+    image_sizes = dict(zip(image_files, mm_image_tools.get_image_sizes(image_files)))
+    # Copy images and get the files to convert for each chapter
+    titles = []
+    xhtml_files = []
+    chapter_files = []
     image_num = 1
-    for i in range(0, len(updated_chapters)):
+    for i in range(0, len(chapters)):
         # Get the filename for the XHTML file
         title = chapters[i]["title"]
         filename = basename(chapters[i]["files"][0]["file"])
         filename = filename[:len(filename) - len(html_string_tools.get_extension(filename))]
-        xhtml_file = abspath(join(content_dir, f"{filename}.xhtml"))
-        # Convert all the files for the chapter into XML
-        chapter_xml = ""
+        xhtml_files.append(abspath(join(content_dir, f"{filename}.xhtml")))
+        titles.append(title)
+        files = []
         for file in chapters[i]["files"]:
-            # Get the file extension
+            file_info = {"file":file["file"]}
             extension = html_string_tools.get_extension(file["file"]).lower()
-            # Convert based on the appropriate format
-            if extension == ".txt":
-                text_contents = mm_file_tools.read_text_file(file["file"])
-                xml = html_string_tools.text_to_paragraphs(text_contents, contains_html=False)
-                if smart_quotes:
-                    xml = html_string_tools.add_smart_quotes_to_paragraphs(xml)
-            elif extension == ".html" or extension == ".htm":
-                xml = mm_xhtml.clean_html(file["file"], smart_quotes)
-            else:
+            if extension not in [".txt", ".html", ".htm"]:
                 # Copy image to the image folder with new name
                 extension = html_string_tools.get_extension(file["file"])
                 new_image = abspath(join(image_dir, f"image{image_num}{extension}"))
                 shutil.copy(file["file"], new_image)
                 image_num += 1
-                # Get the image xml file
+                # Get the image xml
                 image_alt = title
                 if len(chapters[i]["files"]) > 1:
                     image_alt = mm_xhtml.get_title_from_file(file["file"])
-                xml = mm_xhtml.image_to_xhtml(new_image, image_alt)
-            # Append to the chapter xml
-            chapter_xml = f"{chapter_xml}{xml}"
-        # Write with proper XHTML formatting
-        chapter_xml = mm_xhtml.format_xhtml(chapter_xml, title)
-        mm_file_tools.write_text_file(xhtml_file, chapter_xml)
-        # Update info for the chapter
-        updated_chapters[i]["id"] = updated_chapters[i]["files"][0]["id"]
-        updated_chapters[i]["file"] = f"content/{filename}.xhtml"
-        updated_chapters[i].pop("files")
+                image_size = image_sizes[file["file"]]
+                file_info["xml"] = ""
+                if image_size is not None:
+                    file_info["xml"] = mm_xhtml.image_to_xhtml(new_image, image_alt, image_size)
+            files.append(file_info)
+        chapter_files.append(files)
+    # Convert chapters to XHTML, in parallel if specified
+    quotes = [smart_quotes] * len(chapters)
+    sizes = [max_size] * len(chapters)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(chapters) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(chapters) // (workers * 4))
+            part_counts = list(executor.map(write_chapter_xhtml,
+                        chapter_files, titles, xhtml_files, quotes, sizes, chunksize=chunksize))
+    else:
+        part_counts = list(map(write_chapter_xhtml, chapter_files, titles, xhtml_files, quotes, sizes))
+    # Update info for the chapters
+    updated_chapters = []
+    for i in range(0, len(chapters)):
+        chapter = chapters[i]
+        chapter["id"] = chapter["files"][0]["id"]
+        chapter["file"] = f"content/{basename(xhtml_files[i])}"
+        chapter.pop("files")
+        updated_chapters.append(chapter)
+        # Add split parts to the spine, leaving them out of the table of contents
+        for part in range(2, part_counts[i] + 1):
+            part_chapter = {"include":False, "title":chapter["title"]}
+            part_chapter["id"] = f"{chapter['id']}-part{part}"
+            part_chapter["file"] = f"content/{basename(get_part_file(xhtml_files[i], part))}"
+            updated_chapters.append(part_chapter)
     return updated_chapters
 
 def copy_original_files(input_directory:str, output_directory:str):
@@ -431,8 +578,7 @@ def create_nav_file(chapters:List[dict], title:str, output_directory:str):
             a.attrib = {"href": chapter["file"]}
             a.text = chapter["title"]
     # Set indents to make the XML more readable
-    xml = ElementTree.tostring(base).decode("UTF-8")
-    xml = html_string_tools.make_human_readable(xml, "    ").strip()
+    xml = mm_xml_tools.get_xml_string(base, "    ")
     xml = f"<?xml version=\"1.0\" encoding=\"utf-8\"?>\n{xml}"
     # Write the nav file
     nav_file = abspath(join(output_directory, "nav.xhtml"))
@@ -489,8 +635,7 @@ def create_ncx_file(chapters:List[dict], title:str, uid:str, output_directory:st
             nav_link = ElementTree.SubElement(nav_point, "content")
             nav_link.attrib = {"src":chapter["file"]}
     # Set indents to make the XML more readable
-    xml = ElementTree.tostring(base).decode("UTF-8")
-    xml = html_string_tools.make_human_readable(xml, "    ").strip()
+    xml = mm_xml_tools.get_xml_string(base, "    ")
     xml = f"<?xml version=\"1.0\" encoding=\"utf-8\"?>\n{xml}"
     # Write the ncx file
     nav_file = abspath(join(output_directory, "toc.ncx"))
@@ -631,8 +776,7 @@ def get_metadata_xml(metadata:dict, cover_id:str=None) -> str:
         cover_tag = ElementTree.SubElement(base, "meta")
         cover_tag.attrib = {"name":"cover", "content":cover_id}
     # Set indents to make the XML more readable
-    xml = ElementTree.tostring(base).decode("UTF-8")
-    xml = html_string_tools.make_human_readable(xml, "    ").strip()
+    xml = mm_xml_tools.get_xml_string(base, "    ")
     return xml
 
 def get_manifest_xml(chapters:List[dict], output_directory:str) -> str:
@@ -687,8 +831,7 @@ def get_manifest_xml(chapters:List[dict], output_directory:str) -> str:
     ncx_item = ElementTree.SubElement(base, "item")
     ncx_item.attrib = {"href":"toc.ncx", "id":"ncx", "media-type":"application/x-dtbncx+xml"}
     # Set indents to make the XML more readable
-    xml = ElementTree.tostring(base).decode("UTF-8")
-    xml = html_string_tools.make_human_readable(xml, "    ").strip()
+    xml = mm_xml_tools.get_xml_string(base, "    ")
     return xml
 
 def create_content_opf(chapters:List[dict], metadata:dict, output_directory:str):
@@ -735,15 +878,15 @@ def create_content_opf(chapters:List[dict], metadata:dict, output_directory:str)
         itemref = ElementTree.SubElement(spine_element, "itemref")
         itemref.attrib = {"idref":chapter["id"]}
     # Set indents to make the XML more readable
-    xml = ElementTree.tostring(base).decode("UTF-8")
-    xml = html_string_tools.make_human_readable(xml, "    ").strip()
+    xml = mm_xml_tools.get_xml_string(base, "    ")
     xml = f"<?xml version=\"1.0\" encoding=\"utf-8\"?>\n{xml}"
     # Write the opf file
     opf_file = abspath(join(output_directory, "content.opf"))
     mm_file_tools.write_text_file(opf_file, xml)
 
 def create_epub(chapters:List[dict], metadata:dict, directory:str,
-            smart_quotes:bool, copy_back_cover:bool=False) -> str:
+            smart_quotes:bool, copy_back_cover:bool=False, workers:int=1,
+            max_size:int=MAX_CHAPTER_SIZE) -> str:
     """
     Creates an EPUB file from the files in a directory and a list of given chapters.
     
@@ -757,6 +900,10 @@ def create_epub(chapters:List[dict], metadata:dict, directory:str,
     :type bool: bool, optional
     :param smart_quotes: Whether to format the internal HTML to use smart quotes, defaults to True
     :type smart_quotes: bool, optional
+    :param workers: Number of processes to use for converting chapters, None for the number of CPUs, defaults to 1
+    :type workers: int, optional
+    :param max_size: Approximate maximum length of the HTML in each content file, or None to never split, defaults to MAX_CHAPTER_SIZE
+    :type max_size: int, optional
     :return: The path of the created EPUB file
     :rtype: str
     """
@@ -772,8 +919,7 @@ def create_epub(chapters:List[dict], metadata:dict, directory:str,
         rootfiles = ElementTree.SubElement(base, "rootfiles")
         rootfile = ElementTree.SubElement(rootfiles, "rootfile")
         rootfile.attrib = {"media-type":"application/oebps-package+xml", "full-path":"EPUB/content.opf"}
-        xml = ElementTree.tostring(base).decode("UTF-8")
-        xml = html_string_tools.make_human_readable(xml, "    ").strip()
+        xml = mm_xml_tools.get_xml_string(base, "    ")
         xml = f"<?xml version=\"1.0\" encoding=\"utf-8\"?>\n{xml}"
         container_file = abspath(join(meta_directory, "container.xml"))
         mm_file_tools.write_text_file(container_file, xml)
@@ -782,7 +928,7 @@ def create_epub(chapters:List[dict], metadata:dict, directory:str,
         # Copy the original to the EPUB directory
         copy_original_files(directory, epub_directory)
         # Create the content files
-        updated_chapters = create_content_files(chapters, epub_directory, smart_quotes)
+        updated_chapters = create_content_files(chapters, epub_directory, smart_quotes, workers, max_size)
         # Copy the cover to the back cover, if specified
         if copy_back_cover:
             # Create the back cover chapter item
@@ -842,7 +988,7 @@ def create_epub_from_description(json_file:str, image_file:str, metadata:dict, d
         cover_image = abspath(join(temp_dir, f"cover_image{extension}"))
         shutil.copy(image_file, cover_image)
         # Create the html from the json description
-        html = mm_meta_reader.load_metadata(json_file, config, image_file)["description"]
+        html = mm_meta_reader.load_metadata(json_file, config, image_file, keep_original=False)["description"]
         html_file = abspath(join(temp_dir, json_name[:len(json_name) - 5] + ".html"))
         mm_file_tools.write_text_file(html_file, html)
         # Create the chapters list
@@ -858,18 +1004,28 @@ def create_epub_from_description(json_file:str, image_file:str, metadata:dict, d
         shutil.copy(generated_epub, epub_file)
         return epub_file
 
-def get_info_from_epub(epub_file:str) -> dict:
+def get_info_from_epub(epub_file:str, listing:dict=None) -> dict:
     """
     Extracts content.opf from a given .epub file and returns the metadata as a dict.
     
     :param epub_file: Path to a .epub file
     :type epub_file: str, required
+    :param listing: Member listing of the .epub file if already read, as returned by mm_zip_tools.read_zip_listing, defaults to None
+    :type listing: dict, optional
     :return: Dictionary containing metadata from the .epub file
     :rtype: dict
     """
+    # Get the members of the epub file
+    if listing is None:
+        listing = mm_zip_tools.read_zip_listing(epub_file)
+    if listing is None:
+        return mm_archive.get_empty_metadata()
+    member = mm_zip_tools.find_zip_member(listing, "content.opf", True)
+    if member is None:
+        return mm_archive.get_empty_metadata()
     with tempfile.TemporaryDirectory() as extract_dir:
         # Extract content.opf from given file
-        xml_file = mm_file_tools.extract_file_from_zip(epub_file, extract_dir, "content.opf", True)
+        xml_file = mm_zip_tools.extract_zip_member(listing, member, extract_dir)
         if xml_file is None or not exists(xml_file):
             return mm_archive.get_empty_metadata()
         # Read XML file
@@ -962,7 +1118,10 @@ def get_info_from_epub(epub_file:str) -> dict:
         content_files = re.findall("(?<=href=['\"]).+\\.xhtml(?=['\"])", xml_text)
         for content_file in content_files:
             filename = re.sub(r".+\/", "", content_file)
-            extracted = mm_file_tools.extract_file_from_zip(epub_file, extract_dir, filename, True)
+            member = mm_zip_tools.find_zip_member(listing, filename, True)
+            if member is None:
+                continue
+            extracted = mm_zip_tools.extract_zip_member(listing, member, extract_dir)
             if extracted is not None and exists(extracted):
                 word_count += mm_xhtml.get_word_count_from_html(extracted)
         metadata["page_count"] = str(math.ceil(word_count/300))
@@ -970,7 +1129,7 @@ def get_info_from_epub(epub_file:str) -> dict:
         return metadata
 
 def update_epub_info(epub_file:str, metadata:dict,
-            update_cover:bool=False, always_overwrite:bool=False):
+            update_cover:bool=False, always_overwrite:bool=False, staging_directory:str=None):
     """
     Replaces the content.opf file in a given .epub file to reflect the given metadata.
     
@@ -982,6 +1141,8 @@ def update_epub_info(epub_file:str, metadata:dict,
     :type update_cover: bool, optional
     :param always_overwrite: Whether to overwrite file even if metadata is unchanged, defaults to False
     :type always_overwrite: bool, optional
+    :param staging_directory: Directory to stage the new file in, defaults to the one from mm_file_tools.get_staging_directory
+    :type staging_directory: str, optional
     """
     try:
         # Check if the metadata is identical
@@ -990,7 +1151,10 @@ def update_epub_info(epub_file:str, metadata:dict,
         new_metadata = copy.deepcopy(metadata)
         new_metadata["page_count"] = None
         assert always_overwrite or not new_metadata == existing_metadata
-        with tempfile.TemporaryDirectory() as temp_dir:
+        # Stage the new epub on the same device as the original
+        if staging_directory is None:
+            staging_directory = mm_file_tools.get_staging_directory(epub_file)
+        with tempfile.TemporaryDirectory(prefix=".mm-", dir=staging_directory) as temp_dir:
             # Extract epub into temp file
             mm_file_tools.extract_zip(abspath(epub_file), temp_dir)
             # Get the opf content file
@@ -1006,8 +1170,7 @@ def update_epub_info(epub_file:str, metadata:dict,
             ns = {"0": re.findall("(?<=^{)[^}]+(?=}[^{}]+$)", str(base.tag))[0]}
             ElementTree.register_namespace("", ns["0"])
             # Write the opf
-            xml = ElementTree.tostring(base).decode("UTF-8")
-            xml = html_string_tools.make_human_readable(xml, "    ").strip()
+            xml = mm_xml_tools.get_xml_string(base, "    ")
             xml = f"<?xml version=\"1.0\" encoding=\"utf-8\"?>\n{xml}"
             mm_file_tools.write_text_file(opf_file, xml)
             # Remove the mimetype
@@ -1033,7 +1196,5 @@ def update_epub_info(epub_file:str, metadata:dict,
             new_epub_file = abspath(join(temp_dir, "AAAA.epub"))
             assert mm_file_tools.create_zip(temp_dir, new_epub_file, 8, "application/epub+zip")
             # Replace the old epub file
-            os.remove(abspath(epub_file))
-            shutil.copy(new_epub_file, abspath(epub_file))
-            os.remove(new_epub_file)
+            assert mm_file_tools.replace_file(new_epub_file, epub_file)
     except (AssertionError, IndexError): pass
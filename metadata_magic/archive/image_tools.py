@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+from os.path import abspath
+from typing import List
+
+IMAGE_SIZE_CACHE = dict()
+IMAGE_SIZE_CACHE_SIZE = 4096
+OPTIMIZE_FORMATS = {"lossless":".png", "webp":".webp", "jpeg":".jpg"}
+OPTIMIZE_EXTENSIONS = [".png", ".bmp", ".tif", ".tiff", ".jpg", ".jpeg", ".webp"]
+LOSSY_EXTENSIONS = [".jpg", ".jpeg", ".webp"]
+DEFAULT_QUALITY = 85
+
+def get_png_size(header:bytes) -> (int, int):
+    """
+    Returns the width and height from the header bytes of a PNG file.
+
+    :param header: Bytes from the start of the image file
+    :type header: bytes, required
+    :return: Width and height of the image, None if the header isn't a valid PNG header
+    :rtype: (int, int)
+    """
+    if len(header) < 24 or not header.startswith(b"\x89PNG\r\n\x1a\n") or not header[12:16] == b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+def get_gif_size(header:bytes) -> (int, int):
+    """
+    Returns the width and height from the header bytes of a GIF file.
+
+    :param header: Bytes from the start of the image file
+    :type header: bytes, required
+    :return: Width and height of the image, None if the header isn't a valid GIF header
+    :rtype: (int, int)
+    """
+    if len(header) < 10 or header[:6] not in [b"GIF87a", b"GIF89a"]:
+        return None
+    return struct.unpack("<HH", header[6:10])
+
+def get_bmp_size(header:bytes) -> (int, int):
+    """
+    Returns the width and height from the header bytes of a BMP file.
+
+    :param header: Bytes from the start of the image file
+    :type header: bytes, required
+    :return: Width and height of the image, None if the header isn't a valid BMP header
+    :rtype: (int, int)
+    """
+    if len(header) < 26 or not header.startswith(b"BM"):
+        return None
+    # Older OS/2 headers store the size as unsigned shorts
+    if struct.unpack("<I", header[14:18])[0] == 12:
+        return struct.unpack("<HH", header[18:22])
+    # Height is negative for top-down bitmaps
+    width, height = struct.unpack("<ii", header[18:26])
+    return (abs(width), abs(height))
+
+def get_jpeg_size(file) -> (int, int):
+    """
+    Returns the width and height of a JPEG file by reading through its markers to the frame header.
+
+    :param file: Open binary file handle positioned at the start of the image
+    :type file: file, required
+    :return: Width and height of the image, None if the file isn't a valid JPEG
+    :rtype: (int, int)
+    """
+    if not file.read(2) == b"\xff\xd8":
+        return None
+    frame_markers = [0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf]
+    while True:
+        # Find the next marker, skipping fill bytes
+        byte = file.read(1)
+        while byte == b"\xff":
+            byte = file.read(1)
+        if byte == b"":
+            return None
+        marker = byte[0]
+        # Skip markers with no segment data
+        if marker == 0x01 or (marker >= 0xd0 and marker <= 0xd8):
+            continue
+        if marker == 0xd9:
+            return None
+        # Read the segment length
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        # Read the size from the frame header
+        if marker in frame_markers:
+            frame = file.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            return (width, height)
+        file.seek(length - 2, os.SEEK_CUR)
+
+def get_tiff_size(file) -> (int, int):
+    """
+    Returns the width and height of a TIFF file from the tags of its first image directory.
+
+    :param file: Open binary file handle positioned at the start of the image
+    :type file: file, required
+    :return: Width and height of the image, None if the file isn't a valid TIFF
+    :rtype: (int, int)
+    """
+    # Get the byte order
+    header = file.read(8)
+    if header[:4] == b"II*\x00":
+        order = "<"
+    elif header[:4] == b"MM\x00*":
+        order = ">"
+    else:
+        return None
+    # Read the entries of the first image directory
+    file.seek(struct.unpack(f"{order}I", header[4:8])[0])
+    count_bytes = file.read(2)
+    if len(count_bytes) < 2:
+        return None
+    width = None
+    height = None
+    for i in range(0, struct.unpack(f"{order}H", count_bytes)[0]):
+        entry = file.read(12)
+        if len(entry) < 12:
+            return None
+        tag, value_type = struct.unpack(f"{order}HH", entry[:4])
+        if not tag == 256 and not tag == 257:
+            continue
+        # Values are either shorts or longs
+        if value_type == 3:
+            value = struct.unpack(f"{order}H", entry[8:10])[0]
+        elif value_type == 4:
+            value = struct.unpack(f"{order}I", entry[8:12])[0]
+        else:
+            return None
+        if tag == 256:
+            width = value
+        else:
+            height = value
+        if width is not None and height is not None:
+            return (width, height)
+    return None
+
+def get_image_size(image_file:str) -> (int, int):
+    """
+    Returns the width and height of a given image file.
+    PNG, JPEG, GIF, BMP, and TIFF sizes are read directly from the file headers.
+    Other formats fall back to being read by PIL.
+
+    :param image_file: Path of the image file
+    :type image_file: str, required
+    :return: Width and height of the image, None if the size couldn't be determined
+    :rtype: (int, int)
+    """
+    full_file = abspath(image_file)
+    try:
+        with open(full_file, "rb") as file:
+            # Try reading the size from the file header
+            header = file.read(26)
+            for size_function in [get_png_size, get_gif_size, get_bmp_size]:
+                size = size_function(header)
+                if size is not None:
+                    return (int(size[0]), int(size[1]))
+            for size_function in [get_jpeg_size, get_tiff_size]:
+                file.seek(0)
+                size = size_function(file)
+                if size is not None:
+                    return (int(size[0]), int(size[1]))
+    except struct.error: pass
+    except (FileNotFoundError, OSError): return None
+    # Fall back to reading the size with PIL
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(full_file) as image:
+            return image.size
+    except (FileNotFoundError, OSError, UnidentifiedImageError): return None
+
+def get_image_sizes(image_files:List[str]) -> List[tuple]:
+    """
+    Returns the width and height of each of the given image files.
+    Sizes are cached by file path, file size, and modification time, so unchanged images are only read once.
+    The cache holds at most IMAGE_SIZE_CACHE_SIZE sizes, dropping the oldest first.
+
+    :param image_files: Paths of the image files
+    :type image_files: List[str], required
+    :return: List of (width, height) tuples in the same order as the files, None where the size couldn't be determined
+    :rtype: List[tuple]
+    """
+    sizes = []
+    for image_file in image_files:
+        # Get the cache key for the file
+        full_file = abspath(image_file)
+        try:
+            stat = os.stat(full_file)
+            key = (full_file, stat.st_size, stat.st_mtime_ns)
+        except (FileNotFoundError, OSError):
+            sizes.append(None)
+            continue
+        # Read the size if not already cached
+        try:
+            sizes.append(IMAGE_SIZE_CACHE[key])
+        except KeyError:
+            size = get_image_size(full_file)
+            if size is not None:
+                # Remove the oldest sizes if the cache is full
+                while len(IMAGE_SIZE_CACHE) >= IMAGE_SIZE_CACHE_SIZE:
+                    del IMAGE_SIZE_CACHE[next(iter(IMAGE_SIZE_CACHE))]
+                IMAGE_SIZE_CACHE[key] = size
+            sizes.append(size)
+    return sizes
+
+def is_grayscale(image) -> bool:
+    """
+    Returns whether every pixel of an RGB or RGBA image is a shade of gray.
+
+    :param image: Image to check
+    :type image: PIL.Image, required
+    :return: Whether the image could be stored as grayscale without losing anything
+    :rtype: bool
+    """
+    from PIL import ImageChops
+    if image.mode not in ["RGB", "RGBA"]:
+        return False
+    bands = image.split()
+    if not ImageChops.difference(bands[0], bands[1]).getbbox() is None:
+        return False
+    return ImageChops.difference(bands[1], bands[2]).getbbox() is None
+
+def can_optimize(image_file:str, optimize:str) -> bool:
+    """
+    Returns whether an image file is worth trying to optimize.
+    Images already in a lossy format are only re-encoded by the lossy optimizations.
+
+    :param image_file: Path or name of the image file
+    :type image_file: str, required
+    :param optimize: Type of optimization, one of the keys of OPTIMIZE_FORMATS
+    :type optimize: str, required
+    :return: Whether to try optimizing the image
+    :rtype: bool
+    """
+    extension = os.path.splitext(image_file)[1].lower()
+    if extension not in OPTIMIZE_EXTENSIONS:
+        return False
+    return not (optimize == "lossless" and extension in LOSSY_EXTENSIONS)
+
+def optimize_image(job:dict) -> dict:
+    """
+    Re-encodes an image to make it smaller, keeping the original if the new image isn't smaller.
+    Lossless optimization writes an optimized PNG, storing images with only gray pixels as grayscale.
+    Lossy optimization writes a WebP or JPEG at the given quality, though images with transparency are kept lossless.
+    Meant to be run in a separate process, so only takes and returns picklable values.
+
+    :param job: Job with "file" for the image, "new_file" for the path without extension to write to, "optimize", and "quality"
+    :type job: dict, required
+    :return: Result with "file" for the image to use, and "size" and "new_size" in bytes
+    :rtype: dict
+    """
+    from PIL import Image, UnidentifiedImageError
+    result = {"file":job["file"], "size":os.stat(job["file"]).st_size}
+    result["new_size"] = result["size"]
+    try:
+        with Image.open(job["file"]) as image:
+            # Leave animated images as they are
+            if getattr(image, "n_frames", 1) > 1:
+                return result
+            image.load()
+            # Store gray images as grayscale
+            if is_grayscale(image):
+                image = image.convert("LA" if image.mode == "RGBA" else "L")
+            elif image.mode not in ["1", "L", "LA", "P", "RGB", "RGBA"]:
+                # Modes such as 16 bit or CMYK can't be converted without losing something
+                if job["optimize"] == "lossless":
+                    return result
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            # Drop alpha channels that are fully opaque
+            if image.mode in ["LA", "RGBA"] and image.getchannel("A").getextrema() == (255, 255):
+                image = image.convert(image.mode[:-1])
+            optimize = job["optimize"]
+            transparent = image.mode in ["LA", "RGBA"] or (image.mode == "P" and "transparency" in image.info)
+            if optimize == "jpeg" and transparent:
+                optimize = "lossless"
+            new_file = f"{job['new_file']}{OPTIMIZE_FORMATS[optimize]}"
+            # Write the optimized image
+            if optimize == "webp":
+                image.save(new_file, format="WEBP", quality=job["quality"], method=6)
+            elif optimize == "jpeg":
+                if image.mode not in ["L", "RGB"]:
+                    image = image.convert("RGB")
+                image.save(new_file, format="JPEG", quality=job["quality"], optimize=True, progressive=True)
+            else:
+                image.save(new_file, format="PNG", optimize=True)
+    except (OSError, ValueError, UnidentifiedImageError, Image.DecompressionBombError): return result
+    # Keep the original if it is smaller
+    new_size = os.stat(new_file).st_size
+    if new_size >= result["size"]:
+        os.remove(new_file)
+        return result
+    result["file"] = new_file
+    result["new_size"] = new_size
+    return result
+
+def get_empty_optimization_stats() -> dict:
+    """
+    Returns optimization stats for no images, to be added to as images are optimized.
+
+    :return: Stats with "images", "optimized", "size", "new_size", and "time" keys
+    :rtype: dict
+    """
+    return {"images":0, "optimized":0, "size":0, "new_size":0, "time":0.0}
+
+def add_optimization_stats(total:dict, stats:dict):
+    """
+    Adds one set of optimization stats to a running total.
+
+    :param total: Stats to add to, as returned by get_empty_optimization_stats
+    :type total: dict, required
+    :param stats: Stats to add
+    :type stats: dict, required
+    """
+    for key in total:
+        total[key] += stats[key]
+
+def get_optimization_summary(stats:dict) -> str:
+    """
+    Returns a description of how much was saved by optimizing images.
+
+    :param stats: Optimization stats with "images", "optimized", "size", "new_size", and "time" keys
+    :type stats: dict, required
+    :return: Summary of the space saved and the rate images were optimized at
+    :rtype: str
+    """
+    megabytes = stats["size"] / 1048576
+    new_megabytes = stats["new_size"] / 1048576
+    saved = 0 if stats["size"] == 0 else (1 - (stats["new_size"] / stats["size"])) * 100
+    rate = 0 if stats["time"] == 0 else stats["images"] / stats["time"]
+    throughput = 0 if stats["time"] == 0 else megabytes / stats["time"]
+    return (f"Optimized {stats['optimized']} of {stats['images']} images: {megabytes:.1f} MB to {new_megabytes:.1f} MB"
+            + f" ({saved:.1f}% saved) at {rate:.1f} images/s ({throughput:.1f} MB/s)")
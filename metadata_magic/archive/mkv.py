@@ -10,8 +10,6 @@ import metadata_magic.file_tools as mm_file_tools
 import metadata_magic.archive as mm_archive
 import metadata_magic.rename as mm_rename
 import metadata_magic.archive.comic_xml as mm_comic_xml
-from ffmpeg import FFmpeg
-from ffmpeg.errors import FFmpegError
 from os.path import abspath, basename, exists, join
 
 def create_mkv(directory:str, name:str=None, metadata:dict=None, remove_files:bool=False) -> str:
@@ -30,6 +28,8 @@ def create_mkv(directory:str, name:str=None, metadata:dict=None, remove_files:bo
     :return: Full path of the created MKV file, None if creating the file failed
     :rtype: str
     """
+    from ffmpeg import FFmpeg
+    from ffmpeg.errors import FFmpegError
     # Find the video file in the given directory
     videos = mm_file_tools.find_files_of_type(abspath(directory), mm_archive.SUPPORTED_VIDEO, False)
     if not len(videos) == 1: return None
@@ -94,6 +94,8 @@ def get_info_from_mkv(mkv_file:str) -> dict:
     :return: Dictionary containing video metadata and original JSON metadata
     :rtype: dict
     """
+    from ffmpeg import FFmpeg
+    from ffmpeg.errors import FFmpegError
     # Create the temporary space to extract metadata
     with tempfile.TemporaryDirectory() as extract_dir:
         attachment_dir = abspath(join(extract_dir, "attachements"))
@@ -129,7 +131,7 @@ def get_info_from_mkv(mkv_file:str) -> dict:
     # Return the metadata
     return {"original":json_metadata, "metadata":video_metadata}
 
-def update_mkv_info(mkv_file, metadata:dict):
+def update_mkv_info(mkv_file, metadata:dict, staging_directory:str=None):
     """
     Updates a given MKV file to contain the new given metadata.
     Original JSON metadata will not be affected.
@@ -138,11 +140,18 @@ def update_mkv_info(mkv_file, metadata:dict):
     :type mkv_file: str, required
     :param metadata: Metadata dict to use for new metadata
     :type metadata: dict, required
+    :param staging_directory: Directory to stage the new file in, defaults to the one from mm_file_tools.get_staging_directory
+    :type staging_directory: str, optional
     """
-    # Copy the mkv file to a temporary directory
-    with tempfile.TemporaryDirectory() as temp_dir:
+    # Link the mkv file into a staging directory on the same device
+    if staging_directory is None:
+        staging_directory = mm_file_tools.get_staging_directory(mkv_file)
+    with tempfile.TemporaryDirectory(prefix=".mm-", dir=staging_directory) as temp_dir:
         base_mkv = abspath(join(temp_dir, "AAA.mkv"))
-        shutil.copy(abspath(mkv_file), base_mkv)
+        try:
+            os.link(abspath(mkv_file), base_mkv)
+        except OSError:
+            shutil.copy(abspath(mkv_file), base_mkv)
         # Recreate the original JSON, if present in the file
         original_metadata = get_info_from_mkv(base_mkv)
         if not original_metadata["original"] == {}:
@@ -152,8 +161,7 @@ def update_mkv_info(mkv_file, metadata:dict):
         new_mkv = create_mkv(abspath(temp_dir), "BBB", metadata)
         # Delete the old mkv and replace with the new one, if available
         if new_mkv is not None:
-            os.remove(abspath(mkv_file))
-            shutil.move(new_mkv, abspath(mkv_file))
+            mm_file_tools.replace_file(new_mkv, mkv_file)
 
 def remove_all_mkv_metadata(mkv_file:str):
     """
@@ -162,16 +170,18 @@ def remove_all_mkv_metadata(mkv_file:str):
     :param mkv_file: Path to the MKV file to remove metadata from.
     :type mkv_file: str, required
     """
+    from ffmpeg import FFmpeg
+    from ffmpeg.errors import FFmpegError
     try:
         assert html_string_tools.get_extension(mkv_file).lower() == ".mkv"
-        # Create a temporary directory for creating the MKV with stripped metadata
-        with tempfile.TemporaryDirectory() as temp_dir:
+        # Create a staging directory for creating the MKV with stripped metadata
+        staging_directory = mm_file_tools.get_staging_directory(mkv_file)
+        with tempfile.TemporaryDirectory(prefix=".mm-", dir=staging_directory) as temp_dir:
             # Create new MKV file with attachments stripped
             new_mkv = abspath(join(temp_dir, "new.mkv"))
             main = FFmpeg().input(abspath(mkv_file)).output(new_mkv, map=["0", "-0:t"], c="copy")
             main.execute()
             # Replace the original MKV if creating the MKV file was successful
             assert exists(new_mkv)
-            os.remove(abspath(mkv_file))
-            shutil.copy(new_mkv, abspath(mkv_file))
+            mm_file_tools.replace_file(new_mkv, mkv_file)
     except (AssertionError, FFmpegError): pass
@@ -2,25 +2,52 @@
 
 import os
 import re
+import copy
 import math
 import tqdm
 import argparse
+import html_string_tools
 import python_print_tools
 import metadata_magic.sort as mm_sort
+import metadata_magic.pipeline as mm_pipeline
 import metadata_magic.archive as mm_archive
 import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.zip_tools as mm_zip_tools
 from os.path import abspath, basename, exists
 from typing import List
 
-def get_default_labels(directory:str) -> List[dict]:
+def read_series_metadata(archive_files:List[str], workers:int=None) -> List[dict]:
+    """
+    Reads the metadata of many archive files at once.
+    The member listings of all the archives are read first, so each archive's central directory is only read once.
+
+    :param archive_files: Paths of the archive files to read
+    :type archive_files: List[str], required
+    :param workers: Number of archives to read at once, defaults to 4
+    :type workers: int, optional
+    :return: Metadata of each archive, in the same order as the given files
+    :rtype: List[dict]
+    """
+    listings = mm_zip_tools.read_zip_listings(archive_files, workers)
+    stages = [mm_pipeline.get_stage(lambda pair: mm_archive.get_info_from_archive(pair[0], pair[1]))]
+    results = mm_pipeline.run_pipeline(list(zip(archive_files, listings)), stages, io_workers=workers)
+    for i in range(0, len(results)):
+        if isinstance(results[i], Exception):
+            raise results[i]
+    return results
+
+def get_default_labels(directory:str, workers:int=None) -> List[dict]:
     """
     Returns a list of archive files in the given directory with labels indicating their number in a series.
     Each entry in the returned list contains "file" key for the file path, and "label" key for the number label.
+    The metadata read from each archive is kept under the "metadata" key, so it doesn't need to be read again when writing.
     If the archives already contain metadata for their place in a series, that series number will be used as the label.
     Otherwise, the series order will be determined alphabetically by filename, starting with "1.0"
     
     :param directory: Directory in which to search for media archive files
     :type directory: str, required
+    :param workers: Number of archives to read at once, defaults to 4
+    :type workers: int, optional
     :return: List of dictionaries containing file paths to archives and labels for their number in a series
     :rtype: List[dict]
     """
@@ -28,19 +55,20 @@ def get_default_labels(directory:str) -> List[dict]:
     archive_files = mm_file_tools.find_files_of_type(directory,
             mm_archive.ARCHIVE_EXTENSIONS, include_subdirectories=False)
     archive_files = mm_sort.sort_alphanum(archive_files)
+    metadatas = read_series_metadata(archive_files, workers)
     # Set labels based on the current sequence information
     base_label = 100000
     label_num = base_label
     labeled_files = []
-    for archive_file in archive_files:
+    for i in range(0, len(archive_files)):
         # Get the series number
-        label = mm_archive.get_info_from_archive(archive_file)["series_number"]
+        label = metadatas[i]["series_number"]
         # Add the label num if there is no series number
         if label is None:
             label = f"{label_num}.0"
             label_num += 1
         # Add file and label to the list of files
-        labeled_files.append({"file":archive_file, "label":label})
+        labeled_files.append({"file":archive_files[i], "label":label, "metadata":metadatas[i]})
     # Sort the files by label
     labeled_files = mm_sort.sort_dictionaries_alphanum(labeled_files, "label")
     # Relabel the files if there was no sequence info found
@@ -49,6 +77,20 @@ def get_default_labels(directory:str) -> List[dict]:
     # Return the files with default labels
     return labeled_files
 
+def format_label(label:str) -> str:
+    """
+    Formats a series number label as a decimal number without extra zeros.
+
+    :param label: Series number label
+    :type label: str, required
+    :return: Formatted label
+    :rtype: str
+    """
+    formatted = label
+    if not "." in formatted:
+        formatted = f"{label}.0"
+    return re.sub(r"^0+(?=[0-9])|(?<=[0-9])0+$", "", formatted)
+
 def label_files(files:List[dict], index:int, label:str) -> List[dict]:
     """
     Labels a list of files with series numbers.
@@ -74,10 +116,7 @@ def label_files(files:List[dict], index:int, label:str) -> List[dict]:
     # Get the next integer
     next_int = math.floor(label_value) + 1
     # Get the first label
-    first_label = label
-    if not "." in first_label:
-        first_label = f"{label}.0"
-    first_label = re.sub(r"^0+(?=[0-9])|(?<=[0-9])0+$", "", first_label)
+    first_label = format_label(label)
     # Add Labels
     new_files = []
     new_files.extend(files)
@@ -88,45 +127,148 @@ def label_files(files:List[dict], index:int, label:str) -> List[dict]:
     # Return the new file list
     return new_files
 
-def write_series(files:List[dict], series_title:str):
+def is_series_unchanged(archive_file:str, metadata:dict, series_title:str, series_number:str, series_total:str) -> bool:
+    """
+    Returns whether an archive already has the given series info, so it doesn't need to be rewritten.
+    EPUB files don't store the series total, so it isn't compared for them.
+
+    :param archive_file: Path of the archive file
+    :type archive_file: str, required
+    :param metadata: Existing metadata of the archive
+    :type metadata: dict, required
+    :param series_title: Title of the series
+    :type series_title: str, required
+    :param series_number: Number of the archive in the series
+    :type series_number: str, required
+    :param series_total: Total number of entries in the series
+    :type series_total: str, required
+    :return: Whether the archive's series info is unchanged
+    :rtype: bool
+    """
+    if not metadata["series"] == series_title or not metadata["series_number"] == series_number:
+        return False
+    if html_string_tools.get_extension(archive_file).lower() == ".epub":
+        return True
+    return metadata["series_total"] == series_total
+
+def write_series_metadata(job:dict) -> str:
+    """
+    Rewrites an archive with new series info, for use in a pipeline stage.
+    The metadata was already compared against the archive, so the archive is always rewritten.
+
+    :param job: Info with the archive "file" and its new "metadata"
+    :type job: dict, required
+    :return: Path of the rewritten archive
+    :rtype: str
+    """
+    mm_archive.update_archive_info(job["file"], job["metadata"], always_overwrite=True)
+    return job["file"]
+
+def write_series_jobs(jobs:List[dict], workers:int=None) -> List[str]:
+    """
+    Rewrites many archives with new series info at once, showing progress.
+
+    :param jobs: Archives to rewrite, each with the archive "file" and its new "metadata"
+    :type jobs: List[dict], required
+    :param workers: Number of archives to rewrite at once, defaults to 4
+    :type workers: int, optional
+    :return: Paths of the rewritten archives
+    :rtype: List[str]
+    """
+    progress = tqdm.tqdm(total=len(jobs))
+    stages = [mm_pipeline.get_stage(write_series_metadata)]
+    results = mm_pipeline.run_pipeline(jobs, stages, lambda job, result: progress.update(1), io_workers=workers)
+    progress.close()
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+def write_series(files:List[dict], series_title:str, workers:int=None) -> List[str]:
     """
     Updates the given archives to include the given series info in their metadata.
+    Metadata already read by get_default_labels is reused, and archives that already have the series info are skipped.
     
     :param files: Files with their corresponding series number labels, as returned by get_default_labels.
     :type files: List[dict], required
     :param series_title: Title of the series
     :type series_title: str, required
+    :param workers: Number of archives to read and rewrite at once, defaults to 4
+    :type workers: int, optional
+    :return: Paths of the archives that were rewritten
+    :rtype: List[str]
     """
     # Get the series total
     series_total = str(math.ceil(float(files[len(files)-1]["label"])))
-    # Run through all given files in the series
-    for file in tqdm.tqdm(files):
-        # Read Metadata from the archive
-        metadata = mm_archive.get_info_from_archive(file["file"])
-        # Set the series metadata
+    # Read metadata for any files that weren't already read
+    unread = [file for file in files if file.get("metadata") is None]
+    for file, metadata in zip(unread, read_series_metadata([file["file"] for file in unread], workers)):
+        file["metadata"] = metadata
+    # Set the series metadata for any changed archives
+    changed = []
+    for file in files:
+        if is_series_unchanged(file["file"], file["metadata"], series_title, file["label"], series_total):
+            continue
+        metadata = copy.deepcopy(file["metadata"])
         metadata["series"] = series_title
         metadata["series_number"] = file["label"]
         metadata["series_total"] = series_total
-        # Update the metadata
-        mm_archive.update_archive_info(file["file"], metadata)
+        changed.append((file, metadata))
+    # Update the metadata, keeping the new metadata for the rest of the session
+    written = write_series_jobs([{"file":file["file"], "metadata":metadata} for file, metadata in changed], workers)
+    for file, metadata in changed:
+        file["metadata"] = metadata
+    return written
 
-def write_series_single(archive_file:str):
+def write_series_single(archive_file:str, metadata:dict=None) -> bool:
     """
     Updates a given archive's metadata to include series information as a standalone work.
     The series title will be the same as the archive title, and the series will be set as 1 of 1.
     
     :param archive_file: Path to the archive file to be updated
     :type archive_file: str, required
+    :param metadata: Existing metadata of the archive, read from the archive if None, defaults to None
+    :type metadata: dict, optional
+    :return: Whether the archive was rewritten
+    :rtype: bool
     """
     # Read metadata from the archive file
     full_file = abspath(archive_file)
-    metadata = mm_archive.get_info_from_archive(full_file)
+    if metadata is None:
+        metadata = mm_archive.get_info_from_archive(full_file)
+    # Skip the archive if it already has the series info
+    if is_series_unchanged(full_file, metadata, metadata["title"], "1.0", "1"):
+        return False
     # Set the series info
+    metadata = copy.deepcopy(metadata)
     metadata["series"] = metadata["title"]
     metadata["series_number"] = "1.0"
     metadata["series_total"] = "1"
     # Update the metadata
-    mm_archive.update_archive_info(full_file, metadata)
+    mm_archive.update_archive_info(full_file, metadata, always_overwrite=True)
+    return True
+
+def write_series_singles(archive_files:List[str], workers:int=None) -> List[str]:
+    """
+    Updates many archives to include series information as standalone works, as write_series_single does.
+    Each archive's metadata is read once, and archives that already have the series info are skipped.
+
+    :param archive_files: Paths of the archive files to update
+    :type archive_files: List[str], required
+    :param workers: Number of archives to read and rewrite at once, defaults to 4
+    :type workers: int, optional
+    :return: Paths of the archives that were rewritten
+    :rtype: List[str]
+    """
+    jobs = []
+    for archive_file, metadata in zip(archive_files, read_series_metadata(archive_files, workers)):
+        if is_series_unchanged(archive_file, metadata, metadata["title"], "1.0", "1"):
+            continue
+        metadata["series"] = metadata["title"]
+        metadata["series_number"] = "1.0"
+        metadata["series_total"] = "1"
+        jobs.append({"file":abspath(archive_file), "metadata":metadata})
+    return write_series_jobs(jobs, workers)
 
 def get_series_string(files:List[dict]) -> str:
     """
@@ -162,17 +304,19 @@ def get_series_string(files:List[dict]) -> str:
     # Return the series string
     return series_string
 
-def set_series_from_user(directory:str):
+def set_series_from_user(directory:str, workers:int=None):
     """
     Asks the user for information about series info, then updates metadata of archives in the given directory.
     
     :param directory: Directory containing media archives to update with series information.
     :type directory: str, required
+    :param workers: Number of archives to read and rewrite at once, defaults to 4
+    :type workers: int, optional
     """
     # Get the title for the series
     series_title = input("Series Title: ")
     # Get the list of archive files and their default labels
-    labeled_files = get_default_labels(directory)
+    labeled_files = get_default_labels(directory, workers)
     # Relabel the files if the user requests
     while len(labeled_files) > 0:
         # Clear the terminal
@@ -205,11 +349,69 @@ def set_series_from_user(directory:str):
             labeled_files = mm_sort.sort_dictionaries_alphanum(labeled_files, "file")
             labeled_files = label_files(labeled_files, 0, "1")
         elif response == "w": 
-            write_series(labeled_files, series_title)
+            write_series(labeled_files, series_title, workers)
             break
         elif response == "q":
             break
 
+def write_series_from_entry(entry:dict) -> dict:
+    """
+    Writes series info to the archives in the directory of a manifest entry, as mm-series does without user input.
+    If the entry's "standalone" is True, every archive is marked as a standalone work.
+    Otherwise the entry's "series" is used as the series title, with the default labels from get_default_labels.
+    The entry's "labels" can replace the default labels, either as a list in the default order or keyed by filename.
+
+    :param entry: Manifest entry, as returned by archive.read_manifest
+    :type entry: dict, required
+    :return: Result with the "directory" and the updated archive "files"
+    :rtype: dict
+    """
+    directory = entry["directory"]
+    if not exists(directory):
+        raise ValueError("Invalid directory.")
+    # Mark each archive as standalone, if specified
+    if entry.get("standalone", False):
+        archive_files = mm_file_tools.find_files_of_type(directory, mm_archive.ARCHIVE_EXTENSIONS)
+        write_series_singles(archive_files)
+        return {"directory":directory, "files":archive_files}
+    if entry.get("series") is None:
+        raise ValueError("No series title.")
+    # Get the labels for each archive
+    labeled_files = get_default_labels(directory)
+    if len(labeled_files) == 0:
+        raise ValueError("No archives found.")
+    labels = entry.get("labels")
+    if isinstance(labels, list):
+        for i in range(0, min(len(labels), len(labeled_files))):
+            labeled_files[i]["label"] = str(labels[i])
+    elif isinstance(labels, dict):
+        for labeled_file in labeled_files:
+            if basename(labeled_file["file"]) in labels:
+                labeled_file["label"] = str(labels[basename(labeled_file["file"])])
+    for labeled_file in labeled_files:
+        try:
+            float(labeled_file["label"])
+        except ValueError: raise ValueError(f"Invalid label: {labeled_file['label']}")
+        labeled_file["label"] = format_label(labeled_file["label"])
+    # Write the series info
+    labeled_files = mm_sort.sort_dictionaries_alphanum(labeled_files, "label")
+    write_series(labeled_files, entry["series"])
+    return {"directory":directory, "files":[labeled_file["file"] for labeled_file in labeled_files]}
+
+def write_series_manifest(manifest_file:str, workers:int=None) -> List[dict]:
+    """
+    Writes series info for every directory in a manifest, several at a time and without user input.
+
+    :param manifest_file: Path of the JSON or CSV manifest file, as read by archive.read_manifest
+    :type manifest_file: str, required
+    :param workers: Number of directories to update at once, defaults to 4
+    :type workers: int, optional
+    :return: Result of each entry, as returned by archive.run_manifest
+    :rtype: List[dict]
+    """
+    entries = mm_archive.read_manifest(manifest_file)
+    return mm_archive.run_manifest(entries, write_series_from_entry, workers)
+
 def main():
     """
     Sets up the parser for adding series info to archives.
@@ -227,17 +429,46 @@ def main():
             "--standalone",
             help="Set media series as being one of one",
             action="store_true")
+    parser.add_argument(
+            "-w",
+            "--workers",
+            help="Number of archives to read and rewrite at once.",
+            type=int,
+            default=None)
+    parser.add_argument(
+            "-m",
+            "--manifest",
+            help="JSON or CSV manifest of directories and series info to write without user input.",
+            type=str,
+            default=None)
+    parser.add_argument(
+            "-j",
+            "--jobs",
+            help="Number of manifest entries to update at once.",
+            type=int,
+            default=4)
     args = parser.parse_args()
-    # Check that directory is valid
+    # Write series info for the directories in the manifest, if given
     directory = abspath(args.directory)
-    if not exists(directory):
+    if args.manifest is not None:
+        if not exists(abspath(args.manifest)):
+            python_print_tools.color_print("Invalid manifest.", "red")
+            return
+        try:
+            results = write_series_manifest(args.manifest, workers=args.jobs)
+        except ValueError as error:
+            python_print_tools.color_print(str(error), "red")
+            return
+        failed = len([result for result in results if result["error"] is not None])
+        print(f"Updated {len(results) - failed} of {len(results)} directories.")
+    # Check that directory is valid
+    elif not exists(directory):
         python_print_tools.color_print("Invalid directory.", "red")
     else:
         # Check whether to add as full series or as one-shots
         if not args.standalone:
-            set_series_from_user(directory)
+            set_series_from_user(directory, workers=args.workers)
         elif input("Mark all archives in this directory as standalone entries? (Y/[N]): ").lower() == "y":
             archive_files = mm_file_tools.find_files_of_type(directory, mm_archive.ARCHIVE_EXTENSIONS)
-            for archive_file in tqdm.tqdm(archive_files):
-                write_series_single(archive_file)
+            write_series_singles(archive_files, workers=args.workers)
         
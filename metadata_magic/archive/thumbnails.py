@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import posixpath
+import urllib.parse
+import python_print_tools
+import metadata_magic.sort as mm_sort
+import metadata_magic.pipeline as mm_pipeline
+import metadata_magic.zip_tools as mm_zip_tools
+import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.archive.cover_cache as mm_cover_cache
+from xml.etree import ElementTree
+from os.path import abspath, exists, expandvars, join, relpath
+from typing import List
+
+THUMBNAIL_SIZE = 320
+THUMBNAIL_QUALITY = 85
+DEFAULT_CACHE_SIZE = 512
+THUMBNAIL_EXTENSIONS = [".cbz", ".epub"]
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"]
+
+def get_cache_directory() -> str:
+    """
+    Returns the directory in which archive thumbnails are cached.
+    Uses the METADATA_MAGIC_THUMBNAIL_CACHE environment variable if set, otherwise the user's cache directory.
+
+    :return: Path of the thumbnail cache directory
+    :rtype: str
+    """
+    directory = os.environ.get("METADATA_MAGIC_THUMBNAIL_CACHE")
+    if directory is not None and not directory == "":
+        return abspath(expandvars(directory))
+    if os.name == "nt":
+        return abspath(expandvars(r"%LOCALAPPDATA%\metadata-magic\thumbnails"))
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home is None or cache_home == "":
+        cache_home = expandvars(r"${HOME}/.cache")
+    return abspath(join(cache_home, "metadata-magic", "thumbnails"))
+
+def get_cache_size() -> int:
+    """
+    Returns the maximum size of the thumbnail cache in bytes.
+    Uses the METADATA_MAGIC_THUMBNAIL_CACHE_SIZE environment variable in megabytes if set.
+
+    :return: Maximum size of the thumbnail cache in bytes
+    :rtype: int
+    """
+    try:
+        megabytes = float(os.environ.get("METADATA_MAGIC_THUMBNAIL_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+    except ValueError: megabytes = DEFAULT_CACHE_SIZE
+    return int(max(megabytes, 0) * 1024 * 1024)
+
+def get_thumbnail_key(archive_file:str, size:int=THUMBNAIL_SIZE) -> str:
+    """
+    Returns the cache filename for the thumbnail of an archive.
+    The key changes whenever the archive's path, size, or modified time changes.
+
+    :param archive_file: Path of the archive
+    :type archive_file: str, required
+    :param size: Largest width or height of the thumbnail in pixels, defaults to THUMBNAIL_SIZE
+    :type size: int, optional
+    :return: Filename of the cached thumbnail, None if the archive can't be read
+    :rtype: str
+    """
+    full_path = abspath(archive_file)
+    try:
+        stat = os.stat(full_path)
+    except OSError: return None
+    contents = json.dumps([full_path, stat.st_size, stat.st_mtime_ns, size, THUMBNAIL_QUALITY])
+    digest = hashlib.sha256(contents.encode("UTF-8")).hexdigest()
+    return f"{digest}.jpg"
+
+def get_first_image(listing:dict) -> mm_zip_tools.ZipMember:
+    """
+    Returns the first image in a ZIP listing when sorted by name, as a comic reader would show it.
+
+    :param listing: ZIP listing, as returned by mm_zip_tools.read_zip_listing
+    :type listing: dict, required
+    :return: First image member, None if there are no images
+    :rtype: ZipMember
+    """
+    images = dict()
+    for member in mm_zip_tools.get_listing_files(listing, IMAGE_EXTENSIONS):
+        images[member.name] = member
+    if len(images) == 0:
+        return None
+    return images[mm_sort.sort_alphanum(list(images))[0]]
+
+def get_epub_cover(listing:dict) -> mm_zip_tools.ZipMember:
+    """
+    Returns the cover image of an EPUB from its listing.
+    The cover is found through the cover ID in content.opf, the same one read by mm_epub.get_info_from_epub.
+
+    :param listing: ZIP listing of the EPUB file, as returned by mm_zip_tools.read_zip_listing
+    :type listing: dict, required
+    :return: Cover image member, None if the EPUB has no cover
+    :rtype: ZipMember
+    """
+    member = mm_zip_tools.find_zip_member(listing, "content.opf", True)
+    if member is None:
+        return None
+    data = mm_zip_tools.read_zip_member(listing, member)
+    try:
+        base = ElementTree.fromstring(data)
+    except (TypeError, ElementTree.ParseError): return None
+    # Get the cover ID and the manifest items
+    cover_id = None
+    items = dict()
+    for element in base.iter():
+        tag = str(element.tag).split("}")[-1]
+        if tag == "meta" and element.attrib.get("name") == "cover":
+            cover_id = element.attrib.get("content")
+        elif tag == "item" and "href" in element.attrib:
+            items[element.attrib.get("id")] = element.attrib["href"]
+            if "cover-image" in element.attrib.get("properties", "").split() and cover_id is None:
+                cover_id = element.attrib.get("id")
+    if cover_id not in items:
+        return None
+    # Find the cover's member, with its path relative to content.opf
+    href = urllib.parse.unquote(items[cover_id])
+    path = posixpath.normpath(posixpath.join(posixpath.dirname(member.name), href))
+    cover = mm_zip_tools.find_zip_member(listing, path)
+    if cover is None:
+        cover = mm_zip_tools.find_zip_member(listing, posixpath.basename(path), True)
+    return cover
+
+def get_cover_data(archive_file:str) -> bytes:
+    """
+    Returns the encoded cover image of an archive, read straight from the archive without extracting it.
+    The cover of a CBZ is its first page, and the cover of an EPUB is the image given by its cover ID.
+    EPUBs without a cover ID fall back to their first image.
+
+    :param archive_file: Path of the CBZ or EPUB file
+    :type archive_file: str, required
+    :return: Encoded cover image, None if there is no cover
+    :rtype: bytes
+    """
+    listing = mm_zip_tools.read_zip_listing(archive_file)
+    if listing is None:
+        return None
+    member = None
+    if mm_zip_tools.find_zip_member(listing, "content.opf", True) is not None:
+        member = get_epub_cover(listing)
+    if member is None:
+        member = get_first_image(listing)
+    if member is None:
+        return None
+    return mm_zip_tools.read_zip_member(listing, member)
+
+def write_thumbnail(job:dict) -> bool:
+    """
+    Scales down an encoded cover image and writes it as a JPEG thumbnail.
+    JPEG images are decoded at a reduced scale with draft mode, and other images are reduced before resampling.
+    Meant to be run in a separate process, so only takes and returns picklable values.
+
+    :param job: Job with "data" for the encoded image, "file" for the thumbnail path, and "size" for its largest dimension
+    :type job: dict, required
+    :return: Whether the thumbnail was written
+    :rtype: bool
+    """
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(io.BytesIO(job["data"])) as image:
+            image.draft("RGB", (job["size"], job["size"]))
+            image.thumbnail((job["size"], job["size"]), reducing_gap=2.0)
+            # Flatten any transparency onto white
+            if image.mode in ["RGBA", "LA", "P"]:
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif not image.mode == "RGB":
+                image = image.convert("RGB")
+            # Stage the thumbnail so it appears in one step
+            directory = abspath(join(job["file"], os.pardir))
+            os.makedirs(directory, exist_ok=True)
+            file_handle, staged_file = tempfile.mkstemp(suffix=".jpg", prefix=".mm-", dir=directory)
+            try:
+                with os.fdopen(file_handle, "wb") as out_file:
+                    image.save(out_file, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+                os.replace(staged_file, job["file"])
+            except OSError:
+                os.remove(staged_file)
+                raise
+    except (OSError, ValueError, UnidentifiedImageError, Image.DecompressionBombError): return False
+    return True
+
+def get_thumbnail_job(archive_file:str, size:int, cache_directory:str) -> dict:
+    """
+    Returns the job for creating the thumbnail of an archive, reading its cover unless the thumbnail is already cached.
+    Cached thumbnails are marked as recently used.
+
+    :param archive_file: Path of the archive
+    :type archive_file: str, required
+    :param size: Largest width or height of the thumbnail in pixels
+    :type size: int, required
+    :param cache_directory: Directory of the thumbnail cache
+    :type cache_directory: str, required
+    :return: Job for write_thumbnail with "cached" set if no thumbnail needs writing, "file" None if there is no thumbnail
+    :rtype: dict
+    """
+    key = get_thumbnail_key(archive_file, size)
+    if key is None:
+        return {"file":None, "cached":True}
+    job = {"file":abspath(join(cache_directory, key)), "size":size, "cached":False}
+    if exists(job["file"]):
+        job["cached"] = True
+        try:
+            os.utime(job["file"])
+        except OSError: pass
+        return job
+    job["data"] = get_cover_data(archive_file)
+    if job["data"] is None:
+        return {"file":None, "cached":True}
+    return job
+
+def finish_thumbnail_job(job:dict) -> str:
+    """
+    Writes the thumbnail for a job from get_thumbnail_job, if it isn't already cached.
+
+    :param job: Job, as returned by get_thumbnail_job
+    :type job: dict, required
+    :return: Path of the thumbnail, None if no thumbnail could be made
+    :rtype: str
+    """
+    if job["cached"] or write_thumbnail(job):
+        return job["file"]
+    return None
+
+def generate_thumbnails(archive_files:List[str], size:int=THUMBNAIL_SIZE, workers:int=None,
+            cache_directory:str=None, max_size:int=None) -> dict:
+    """
+    Returns the cached thumbnail of each archive, creating any thumbnails that are missing or out of date.
+    Covers are read from the archives in threads while thumbnails are scaled in a pool of processes.
+    Afterwards the least recently used thumbnails are removed if the cache is too large.
+
+    :param archive_files: Paths of the CBZ and EPUB files
+    :type archive_files: List[str], required
+    :param size: Largest width or height of the thumbnails in pixels, defaults to THUMBNAIL_SIZE
+    :type size: int, optional
+    :param workers: Number of processes to scale thumbnails with, defaults to the number of CPUs
+    :type workers: int, optional
+    :param cache_directory: Directory of the thumbnail cache, defaults to None
+    :type cache_directory: str, optional
+    :param max_size: Maximum size of the cache in bytes, defaults to None
+    :type max_size: int, optional
+    :return: Path of each archive's thumbnail, None for archives without a cover, keyed by archive path
+    :rtype: dict
+    """
+    if cache_directory is None:
+        cache_directory = get_cache_directory()
+    if max_size is None:
+        max_size = get_cache_size()
+    # Only scale the images that aren't already cached in worker processes
+    stages = [mm_pipeline.get_stage(lambda file: get_thumbnail_job(file, size, cache_directory))]
+    stages.append(mm_pipeline.get_stage(finish_thumbnail_job, use_processes=True))
+    results = mm_pipeline.run_pipeline(archive_files, stages, cpu_workers=workers)
+    thumbnails = dict()
+    for i in range(0, len(archive_files)):
+        thumbnails[archive_files[i]] = None if isinstance(results[i], Exception) else results[i]
+    mm_cover_cache.trim_cache(cache_directory, max_size)
+    return thumbnails
+
+def main():
+    """
+    Sets up the parser for creating archive thumbnails.
+    """
+    # Set up argument parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            "directory",
+            help="Directory of CBZ and EPUB files to create thumbnails for.",
+            nargs="?",
+            type=str,
+            default=str(os.getcwd()))
+    parser.add_argument(
+            "-s",
+            "--size",
+            help="Largest width or height of the thumbnails in pixels.",
+            type=int,
+            default=THUMBNAIL_SIZE)
+    parser.add_argument(
+            "-o",
+            "--output",
+            help="Directory to place the thumbnails in, mirroring the archive directory.",
+            type=str,
+            default=None)
+    parser.add_argument(
+            "-w",
+            "--workers",
+            help="Number of processes to scale thumbnails with.",
+            type=int,
+            default=None)
+    args = parser.parse_args()
+    # Check that directory is valid
+    directory = abspath(args.directory)
+    if not exists(directory):
+        python_print_tools.color_print("Invalid directory.", "red")
+        return
+    # Create the thumbnails
+    archive_files = mm_sort.sort_alphanum(mm_file_tools.find_files_of_type(directory, THUMBNAIL_EXTENSIONS))
+    start = time.perf_counter()
+    thumbnails = generate_thumbnails(archive_files, args.size, args.workers)
+    elapsed = time.perf_counter() - start
+    # Place the thumbnails in the output directory
+    if args.output is not None:
+        output = abspath(args.output)
+        for archive_file, thumbnail in thumbnails.items():
+            if thumbnail is None:
+                continue
+            new_file = abspath(join(output, f"{relpath(archive_file, directory)}.jpg"))
+            os.makedirs(abspath(join(new_file, os.pardir)), exist_ok=True)
+            mm_cover_cache.link_file(thumbnail, new_file)
+    # Print the archives without thumbnails
+    missing = [archive_file for archive_file, thumbnail in thumbnails.items() if thumbnail is None]
+    if len(missing) > 0:
+        python_print_tools.color_print(f"{len(missing)} archives without covers:", "red")
+        python_print_tools.print_files(directory, missing)
+    created = len(thumbnails) - len(missing)
+    python_print_tools.color_print(f"{created} thumbnails ready in {elapsed:.1f} s.", "green")
+
+if __name__ == "__main__":
+    main()
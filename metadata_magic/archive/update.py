@@ -2,11 +2,18 @@
 
 import os
 import tqdm
+import shutil
 import argparse
+import tempfile
+import functools
+import traceback
+import html_string_tools
 import python_print_tools
 import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.journal as mm_journal
+import metadata_magic.pipeline as mm_pipeline
 import metadata_magic.archive as mm_archive
-from os.path import abspath, isdir, exists
+from os.path import abspath, isdir, exists, join
 
 def update_fields(existing_metadata:dict, updating_metadata:dict) -> dict:
     """
@@ -31,12 +38,90 @@ def update_fields(existing_metadata:dict, updating_metadata:dict) -> dict:
             return_metadata[item[0]] = item[1]
     return return_metadata
 
-def mass_update_archives(directory:str, metadata:dict,
-            update_covers:bool=False, always_overwrite:bool=False):
+def read_update(archive_file:str, metadata:dict, update_covers:bool, always_overwrite:bool, journal:dict=None) -> dict:
+    """
+    Reads the existing metadata of an archive file and gets the metadata it will be updated with.
+    If the archive's cover will be regenerated, it starts rendering in the background as soon as the metadata is read.
+    When journaled, a staging folder is made for the archive and recorded as started in the journal with it,
+    so an interrupted run only has to clean up the folders it made itself.
+
+    :param archive_file: Archive file to update
+    :type archive_file: str, required
+    :param metadata: Metadata to update the archive file with
+    :type metadata: dict, required
+    :param update_covers: Whether to regenerate cover images
+    :type update_covers: bool, required
+    :param always_overwrite: Whether to overwrite files even if metadata is unchanged
+    :type always_overwrite: bool, required
+    :param journal: Journal to record progress in, as returned by mm_journal.open_journal, defaults to None
+    :type journal: dict, optional
+    :return: Update with "file", "metadata", "update_cover", "always_overwrite", and "temp_dir" keys
+    :rtype: dict
+    """
+    existing_metadata = mm_archive.get_info_from_archive(archive_file)
+    new_metadata = update_fields(existing_metadata, metadata)
+    if update_covers and html_string_tools.get_extension(archive_file).lower() == ".epub":
+        # Start rendering the cover if the archive will be rewritten
+        if always_overwrite or not {**new_metadata, "page_count":None} == {**existing_metadata, "page_count":None}:
+            mm_archive.submit_cover_images([{"title":new_metadata["title"], "authors":new_metadata["writers"]}])
+    temp_dir = None
+    if journal is not None:
+        staging_directory = mm_file_tools.get_staging_directory(archive_file)
+        temp_dir = tempfile.mkdtemp(prefix=".mm-", dir=staging_directory)
+        mm_journal.write_journal_entry(journal, archive_file, "started", {"temp_dir":temp_dir})
+    return {"file":archive_file, "metadata":new_metadata, "update_cover":update_covers,
+            "always_overwrite":always_overwrite, "temp_dir":temp_dir}
+
+def wait_for_update_cover(update:dict) -> dict:
+    """
+    Waits for the new cover of an update from read_update to finish rendering, so the update can use the cached cover.
+
+    :param update: Update to wait for, as returned by read_update
+    :type update: dict, required
+    :return: The same update
+    :rtype: dict
+    """
+    if update["update_cover"] and html_string_tools.get_extension(update["file"]).lower() == ".epub":
+        mm_archive.wait_for_cover_image(update["metadata"]["title"], update["metadata"]["writers"])
+    return update
+
+def write_update(update:dict):
+    """
+    Updates an archive file using an update from read_update.
+    The new archive is staged in the update's staging folder, which is removed afterwards.
+
+    :param update: Update to write, as returned by read_update
+    :type update: dict, required
+    """
+    try:
+        mm_archive.update_archive_info(update["file"], update["metadata"], update_cover=update["update_cover"],
+                always_overwrite=update["always_overwrite"], staging_directory=update.get("temp_dir"))
+    finally:
+        if update.get("temp_dir") is not None:
+            shutil.rmtree(update["temp_dir"], ignore_errors=True)
+
+def recover_updates(journal:dict):
+    """
+    Cleans up after archives that were started but not finished in an earlier run.
+    Archives are replaced in a single step, so unfinished archives are left as they were and only need to be updated again.
+    The staging folders recorded for the interrupted updates are removed, leaving any other folders alone.
+
+    :param journal: Journal of the earlier run, as returned by mm_journal.open_journal
+    :type journal: dict, required
+    """
+    for archive_file, entry in journal["items"].items():
+        if entry["state"] == "started" and entry.get("temp_dir") is not None:
+            shutil.rmtree(entry["temp_dir"], ignore_errors=True)
+
+def mass_update_archives(directory:str, metadata:dict, update_covers:bool=False,
+            always_overwrite:bool=False, workers:int=None, resume:bool=False):
     """
     Updates all the media archive files in a given directory to use new metadata.
     Any metadata fields with a value of None will be unaltered from the orignal archive file.
     Currently supports CBZ and EPUB files.
+    Archives are rewritten in a pool of processes while the metadata of later archives is read.
+    Progress is recorded in a journal, so an interrupted run can be resumed.
+    When resuming, the metadata and options of the earlier run are used, and archives it finished are skipped.
     
     :param directory: Directory in which to look for archivefiles, including subdirectories
     :type directory: str, required
@@ -46,15 +131,48 @@ def mass_update_archives(directory:str, metadata:dict,
     :type update_covers: bool, optional
     :param always_overwrite: Whether to overwrite files even if metadata is unchanged, defaults to False
     :type always_overwrite: bool, optional
+    :param workers: Number of processes to rewrite archives with, defaults to the number of CPUs
+    :type workers: int, optional
+    :param resume: Whether to resume an interrupted run, defaults to False
+    :type resume: bool, optional
     """
-    # Get list of archive files in the directory
+    # Open the journal, cleaning up after the earlier run if resuming
+    journal_file = mm_journal.get_journal_file("update", abspath(directory))
+    run = {"metadata":metadata, "update_covers":update_covers, "always_overwrite":always_overwrite}
+    journal = mm_journal.open_journal(journal_file, run, resume)
+    metadata = journal["run"]["metadata"]
+    update_covers = journal["run"]["update_covers"]
+    always_overwrite = journal["run"]["always_overwrite"]
+    recover_updates(journal)
+    # Get list of archive files in the directory, leaving out ones already done
     archive_files = mm_file_tools.find_files_of_type(directory, mm_archive.ARCHIVE_EXTENSIONS)
-    # Run through archive files
-    for archive_file in tqdm.tqdm(archive_files):
-        # Update the archive file with the metadata
-        new_metadata = update_fields(mm_archive.get_info_from_archive(archive_file), metadata)
-        mm_archive.update_archive_info(archive_file, new_metadata,
-                update_cover=update_covers, always_overwrite=always_overwrite)
+    archive_files = [file for file in archive_files
+            if not journal["items"].get(file, {"state":None})["state"] == "done"]
+    # Read metadata in threads, starting new covers as it is read, and rewrite archives in processes
+    read = functools.partial(read_update, metadata=metadata,
+            update_covers=update_covers, always_overwrite=always_overwrite, journal=journal)
+    stages = [mm_pipeline.get_stage(read)]
+    if update_covers:
+        # Start the cover workers now, since forking them while reading threads run subprocesses can hang
+        mm_archive.get_cover_pool()
+        # Wait for covers in a single thread, leaving the rest free for reading
+        stages.append(mm_pipeline.get_stage(wait_for_update_cover, workers=1))
+    stages.append(mm_pipeline.get_stage(write_update, use_processes=True))
+    progress = tqdm.tqdm(total=len(archive_files))
+    success = [True]
+    def callback(archive_file:str, result):
+        progress.update(1)
+        if isinstance(result, Exception):
+            traceback.print_exception(type(result), result, result.__traceback__)
+            python_print_tools.color_print(f"Failed Updating \"{archive_file}\"", "red")
+            success[0] = False
+        else:
+            mm_journal.write_journal_entry(journal, archive_file, "done")
+    try:
+        mm_pipeline.run_pipeline(archive_files, stages, callback, cpu_workers=workers)
+    finally:
+        progress.close()
+        mm_journal.close_journal(journal, finished=success[0])
 
 def user_update_file(file:str, update_cover:bool, always_overwrite:bool=False):
     """
@@ -77,9 +195,10 @@ def user_update_file(file:str, update_cover:bool, always_overwrite:bool=False):
     mm_archive.update_archive_info(full_file, updating_metadata,
             update_cover=update_cover, always_overwrite=always_overwrite)
 
-def user_mass_update(directory:str, update_covers:bool, always_overwrite:bool=False):
+def user_mass_update(directory:str, update_covers:bool, always_overwrite:bool=False, resume:bool=False):
     """
     Mass update all the CBZ and EPUB files in a given directory with user provided metadata.
+    When resuming an interrupted run, the metadata from that run is used instead of asking the user again.
     
     :param directory: Directory containing archive files to update
     :type directory: str, required
@@ -87,12 +206,21 @@ def user_mass_update(directory:str, update_covers:bool, always_overwrite:bool=Fa
     :type update_covers: bool, required
     :param always_overwrite: Whether to overwrite files even if metadata is unchanged, defaults to False
     :type always_overwrite: bool, optional
+    :param resume: Whether to resume an interrupted run, defaults to False
+    :type resume: bool, optional
     """
-    # Get metadata to update
-    updating_metadata = mm_archive.get_metadata_from_user(mm_archive.get_empty_metadata(), True)
+    # Get metadata to update, unless resuming a run that has it
+    updating_metadata = None
+    if resume:
+        journal_file = mm_journal.get_journal_file("update", abspath(directory))
+        run = mm_journal.read_journal(journal_file)["run"]
+        if run is not None:
+            updating_metadata = run["metadata"]
+    if updating_metadata is None:
+        updating_metadata = mm_archive.get_metadata_from_user(mm_archive.get_empty_metadata(), True)
     # Mass update cbz and epub files
     mass_update_archives(abspath(directory), updating_metadata,
-            update_covers=update_covers, always_overwrite=always_overwrite)
+            update_covers=update_covers, always_overwrite=always_overwrite, resume=resume)
 
 def main():
     """
@@ -116,12 +244,17 @@ def main():
             "--overwrite",
             help="Overwrites files, regardless of if metadata has changed",
             action="store_true")
+    parser.add_argument(
+            "-r",
+            "--resume",
+            help="Resume an interrupted update of a directory",
+            action="store_true")
     args = parser.parse_args()
     # Check that directory is valid
     path = abspath(args.path)
     if not exists(path):
         python_print_tools.color_print("Invalid path.", "red")
     elif isdir(path):
-        user_mass_update(path, args.cover, args.overwrite)
+        user_mass_update(path, args.cover, args.overwrite, args.resume)
     else:
         user_update_file(path, args.cover, args.overwrite)
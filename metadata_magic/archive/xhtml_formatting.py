@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
 import re
-import html5lib
 import html_string_tools
 import metadata_magic.file_tools as mm_file_tools
-from PIL import Image, UnidentifiedImageError
+import metadata_magic.archive.image_tools as mm_image_tools
+import metadata_magic.archive.xml_tools as mm_xml_tools
 from os.path import abspath, basename
 from xml.etree import ElementTree
+from typing import Iterator
+
+UNPRINTABLE_REGEX = re.compile(r"[\x00-\x1F\x7F]")
+SPACE_TABLE = {ord(c):" " for c in "\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000"}
+PAGE_BREAK_REGEX = re.compile(r"\s*[*\-][*\-\s]*")
+PARAGRAPH_BREAK_REGEX = re.compile(r"\n\s{3,}|(?:\n\s*){2,}|\n\s*(?=[\"“”″＂])|(?<=[\"“”″＂])\s*\n")
+XML_NAME_REGEX = re.compile(r"[A-Za-z_\u00C0-\uFFFF][A-Za-z0-9_.\-\u00B7\u00C0-\uFFFF]*(?::[A-Za-z_\u00C0-\uFFFF][A-Za-z0-9_.\-\u00B7\u00C0-\uFFFF]*)?")
 
 def get_title_from_file(file:str) -> str:
     """
@@ -22,9 +29,167 @@ def get_title_from_file(file:str) -> str:
     title = re.sub(r"^\[[^\]]+\]\s*|^\([^\)]+\)\s*", "", title)
     return title
         
+def normalize_text(element:ElementTree.Element):
+    """
+    Removes unprintable characters and replaces nonstandard spaces in the text and attributes of an element tree.
+
+    :param element: Element to normalize, including all its descendants
+    :type element: ElementTree.Element, required
+    """
+    for sub_element in element.iter():
+        if sub_element.text is not None:
+            sub_element.text = UNPRINTABLE_REGEX.sub("", sub_element.text).translate(SPACE_TABLE)
+        if sub_element.tail is not None:
+            sub_element.tail = UNPRINTABLE_REGEX.sub("", sub_element.tail).translate(SPACE_TABLE)
+        for key in sub_element.attrib:
+            sub_element.attrib[key] = UNPRINTABLE_REGEX.sub("", sub_element.attrib[key]).translate(SPACE_TABLE)
+
+def strip_element_whitespace(element:ElementTree.Element):
+    """
+    Removes whitespace from the start and end of the contents of a given element.
+
+    :param element: Element to strip whitespace from
+    :type element: ElementTree.Element, required
+    """
+    if element.text is not None:
+        element.text = element.text.lstrip()
+    if len(element) == 0:
+        if element.text is not None:
+            element.text = element.text.rstrip()
+    elif element[-1].tail is not None:
+        element[-1].tail = element[-1].tail.rstrip()
+
+def remove_element(parent:ElementTree.Element, index:int):
+    """
+    Removes the child element at a given index while keeping the text that follows it.
+
+    :param parent: Parent element of the element to remove
+    :type parent: ElementTree.Element, required
+    :param index: Index of the child element to remove
+    :type index: int, required
+    """
+    tail = parent[index].tail
+    if tail is not None:
+        if index == 0:
+            parent.text = f"{parent.text or ''}{tail}"
+        else:
+            parent[index-1].tail = f"{parent[index-1].tail or ''}{tail}"
+    del parent[index]
+
+def clean_paragraphs(parent:ElementTree.Element):
+    """
+    Removes leading and trailing whitespace from paragraph and div elements, removing them entirely if empty.
+
+    :param parent: Element whose descendants will be cleaned
+    :type parent: ElementTree.Element, required
+    """
+    for i in range(len(parent)-1, -1, -1):
+        element = parent[i]
+        clean_paragraphs(element)
+        if element.tag not in ["p", "div"]:
+            continue
+        strip_element_whitespace(element)
+        if len(element) == 0 and (element.text is None or element.text == ""):
+            remove_element(parent, i)
+
+def center_page_breaks(parent:ElementTree.Element):
+    """
+    Wraps text ending an element that consists only of hyphens and asterisks in a center element.
+    Such lines are typically used as page breaks.
+
+    :param parent: Element whose descendants will be checked for page breaks
+    :type parent: ElementTree.Element, required
+    """
+    for element in parent:
+        if len(element) == 0:
+            # Center the text of an element with no children
+            if element.text is not None and PAGE_BREAK_REGEX.fullmatch(element.text):
+                center = ElementTree.SubElement(element, "center")
+                center.text = element.text.strip()
+                element.text = None
+            continue
+        center_page_breaks(element)
+        # Center text after the last child element
+        tail = element[-1].tail
+        if tail is not None and PAGE_BREAK_REGEX.fullmatch(tail):
+            element[-1].tail = None
+            center = ElementTree.SubElement(element, "center")
+            center.text = tail.strip()
+
+def wrap_single_image(body:ElementTree.Element) -> bool:
+    """
+    Converts the image in a given body to a full page SVG element if it is the only content present.
+    The image must be an img element with width and height contained alone in a div element.
+
+    :param body: Body element to check for a single image
+    :type body: ElementTree.Element, required
+    :return: Whether the image was converted to an SVG element
+    :rtype: bool
+    """
+    # Find divs containing only a single sized image, and check for divs with other content
+    image_divs = []
+    for element in body.iter():
+        if element.tag == "p":
+            return False
+        if not element.tag == "div" or element is body:
+            continue
+        images = list(element.iter("img"))
+        if len(images) == 0:
+            if len(element) > 0 or (element.text is not None and not element.text == ""):
+                return False
+        elif (len(element.attrib) == 0 and len(element) == 1 and element[0].tag == "img"
+                and (element.text is None or element.text.strip() == "")
+                and (element[0].tail is None or element[0].tail.strip() == "")
+                and "width" in element[0].attrib and "height" in element[0].attrib
+                and element[0].attrib["width"].isdigit() and element[0].attrib["height"].isdigit()):
+            image_divs.append(element)
+    if not len(image_divs) == 1:
+        return False
+    # Create the svg wrapper
+    div = image_divs[0]
+    image = div[0]
+    width = image.attrib["width"]
+    height = image.attrib["height"]
+    svg = ElementTree.Element("{http://www.w3.org/2000/svg}svg")
+    svg.attrib = {"width":"100%", "height":"100%", "viewBox":f"0 0 {width} {height}",
+            "preserveAspectRatio":"xMidYMid meet", "version":"1.1"}
+    svg_title = ElementTree.SubElement(svg, "{http://www.w3.org/2000/svg}title")
+    svg_title.text = image.attrib.get("alt", "")
+    # Create the svg image element with the same attributes as the img
+    svg_image = ElementTree.SubElement(svg, "{http://www.w3.org/2000/svg}image")
+    for key in image.attrib:
+        if key == "src":
+            svg_image.attrib["{http://www.w3.org/1999/xlink}href"] = image.attrib[key]
+        elif not key == "alt":
+            svg_image.attrib[key] = image.attrib[key]
+    # Replace the contents of the div
+    div.clear()
+    div.attrib = {"id":"full-image-container"}
+    div.append(svg)
+    div.tail = image.tail if div.tail is None else div.tail
+    return True
+
+def is_valid_xml(element:ElementTree.Element) -> bool:
+    """
+    Returns whether all the tag and attribute names in a given element tree are valid XML names.
+
+    :param element: Element to check
+    :type element: ElementTree.Element, required
+    :return: Whether the element tree can be serialized as valid XML
+    :rtype: bool
+    """
+    for sub_element in element.iter():
+        names = [sub_element.tag]
+        names.extend(sub_element.attrib.keys())
+        for name in names:
+            if not isinstance(name, str) or XML_NAME_REGEX.fullmatch(re.sub(r"^{[^}]*}", "", name)) is None:
+                return False
+    return True
+
 def format_xhtml(html:str, title:str) -> str:
     """
     Formats XML text into XHTML text ready to be included in an EPUB file.
+    The text is parsed once, cleaned up as an element tree, and serialized once.
     
     :param html: HTML text to format
     :type html: str, required
@@ -42,91 +207,63 @@ def format_xhtml(html:str, title:str) -> str:
     title_element.text = title
     meta = ElementTree.SubElement(head, "meta")
     meta.attrib = {"charset":"utf-8"}
-    # Remove all unnecessary HTML escape entities
-    formatted_html = html_string_tools.replace_reserved_in_html(html)
-    # Remove all unprintable unicode characters
-    formatted_html = re.sub(r"[\x00-\x1F\x7F]", "", formatted_html)
-    # Remove newlines and nonstandard spaces
-    formatted_html = formatted_html.replace("\n", "").strip()
-    formatted_html = re.sub(r"\s", " ", formatted_html)
-    # Remove whitespace before closing paragraph and div elenments
-    formatted_html = re.sub(r"\s+<\s*\/\s*p\s*>", "</p>", formatted_html)
-    formatted_html = re.sub(r"\s+<\s*\/\s*div\s*>", "</div>", formatted_html)
-    # Remove whitespace after opening paragraph and div elenments
-    formatted_html = "".join(reversed(formatted_html))
-    formatted_html = re.sub(r"\s+(?=>[^<]*p\s*<)|\s+(?=>[^<]*vid\s*<)", "", formatted_html)
-    formatted_html = "".join(reversed(formatted_html))
-    # Remove paragraph and div elements containing nothing
-    formatted_html = re.sub(r"<\s*p[^>]*>\s*<\s*\/\s*p\s*>", "", formatted_html)
-    formatted_html = re.sub(r"<\s*div[^>]*>\s*<\s*\/\s*div\s*>", "", formatted_html)
-    formatted_html = re.sub(r"<\s*p[^>]*\/\s*>|<\s*div[^>]*\/\s*>", "", formatted_html)
-    formatted_html = formatted_html.strip()
-    # Add paragraph elements if necessary
-    if not formatted_html.startswith("<") and not formatted_html.endswith(">"):
-        formatted_html = f"<p>{formatted_html}</p>"
-    # Use html5lib to clean up tags
-    ElementTree.register_namespace("", "http://www.w3.org/1999/xhtml")
-    root = html5lib.parse(f"<html><body>{formatted_html}</body></html>")
-    formatted_html = ElementTree.tostring(root).decode("UTF-8")
-    formatted_html = re.sub(r".*\<body[^\>]*\>|<\/body[^\>]*\>.*", "", formatted_html)
+    # Remove self-closing paragraph and div tags, which the parser would read as opening tags
+    formatted_html = re.sub(r"<\s*(?:p|div)(?:\s[^>]*)?\/\s*>", "", html)
+    # Fix closing paragraph and div tags containing whitespace
+    formatted_html = re.sub(r"<\s*\/\s*(p|div)\s*>", "</\\1>", formatted_html)
+    # Parse the HTML into an element tree
+    import html5lib
+    root = html5lib.parse(f"<html><body>{formatted_html.strip()}</body></html>", namespaceHTMLElements=False)
+    parsed_body = root.find("body")
+    body = ElementTree.Element("body")
+    body.text = parsed_body.text
+    body.extend(list(parsed_body))
+    # Remove all unprintable unicode characters and nonstandard spaces
+    normalize_text(body)
+    # Remove empty paragraph and div elements and strip whitespace from their contents
+    clean_paragraphs(body)
+    strip_element_whitespace(body)
+    # Add paragraph element if the body neither starts nor ends with an element
+    if ((len(body) == 0 or (body.text is not None and not body.text == ""))
+            and (len(body) == 0 or (body[-1].tail is not None and not body[-1].tail == ""))):
+        paragraph = ElementTree.Element("p")
+        paragraph.text = body.text
+        paragraph.extend(list(body))
+        body.clear()
+        body.append(paragraph)
     # Add centering element to page break lines
-    add_center = lambda match: "<center>" + str(match.group(0)).strip() + "</center>"
-    formatted_html = re.sub(r"(?<=>)\s*[*\-][*\-\s]*\s*(?=<\/)", add_center, formatted_html)
+    center_page_breaks(body)
     # Convert image to full page SVG element if there is a single image present
-    regex = "<div>\\s*<img[^>]+width=\"[0-9]+\"[^>]+height=\"[0-9]+\"[^>]*>\\s*<\\/div>|"
-    regex = f"{regex}<div>\\s*<img[^>]+height=\"[0-9]+\"[^>]+width=\"[0-9]+\"[^>]*>\\s*<\\/div>"
-    images = re.findall(regex, formatted_html)
-    contains_text = len(re.findall(r"<div[^\>]*>(?!.*<img).+<\/div>|<p>|<p\s[^\>]*>", formatted_html)) == 0
-    if len(images) == 1 and contains_text:
-        # Get the image size
-        width = re.findall("(?<=width=\")[0-9]+(?=\")", images[0])[0]
-        height = re.findall("(?<=height=\")[0-9]+(?=\")", images[0])[0]
-        # Get the image alt tag
-        alt = re.findall("(?<=alt=\")[^\"]*(?=\")", images[0])[0]
-        # Add the image-page id
-        modified_image_tag = re.sub(r"^<div>|</div>$", "", images[0])
-        modified_image_tag = re.sub(r"^<img\s+", "<image ", modified_image_tag)
-        modified_image_tag = re.sub(r"src=", "xlink:href=", modified_image_tag)
-        modified_image_tag = re.sub("\\s*alt=\"[^\"]*\"\\s*", " ", modified_image_tag)
-        # Create the svg wrapper
-        svg = "<svg xmlns=\"http://www.w3.org/2000/svg\" xmlns:xlink=\"http://www.w3.org/1999/xlink\" "
-        svg = f"{svg}width=\"100%\" height=\"100%\" viewBox=\"0 0 {width} {height}\" "
-        svg = f"{svg}preserveAspectRatio=\"xMidYMid meet\" version=\"1.1\">"
-        modified_image_tag = f"{svg}<title>{alt}</title>{modified_image_tag}</svg>"
-        # Create the div wrapper
-        modified_image_tag = f"<div id=\"full-image-container\">{modified_image_tag}</div>"
-        formatted_html = formatted_html.replace(images[0], modified_image_tag)
-        # Register the namespaces
+    if wrap_single_image(body):
         ElementTree.register_namespace("svgns", "http://www.w3.org/2000/svg")
         ElementTree.register_namespace("xlink", "http://www.w3.org/1999/xlink")
     # Add the CSS stylesheet to the head
     link = ElementTree.SubElement(head, "link")
     link.attrib = {"rel":"stylesheet", "href":"../style/epubstyle.css", "type":"text/css"}
     # Add as body to the main XML tree
-    try:
-        formatted_html = f"<body>{formatted_html}</body>"
-        body = ElementTree.fromstring(formatted_html)
-        base.append(body)
-    except ElementTree.ParseError as parse_error:
-        # XHTML is too malformed to read
-        position = parse_error.position[1]
-        start_position = position - 10
-        end_position = position + 10
-        if start_position < 0:
-            start_position = 0
-        if end_position > (len(formatted_html)):
-            end_position = len(formatted_html)
-        section = formatted_html[start_position:end_position]
-        section = html_string_tools.replace_reserved_characters(section)
-        char_num = ord(formatted_html[position])
-        formatted_html = "<body><p>HTML could not be parsed!</p>"
-        formatted_html = f"{formatted_html}<p>XML Parse Error: Character Value Decimal {char_num}</p>"
-        formatted_html = f"{formatted_html}<p>String Error Section: {section}</p></body>"
-        body = ElementTree.fromstring(formatted_html)
-        base.append(body)
+    if not is_valid_xml(body):
+        try:
+            body_text = ElementTree.tostring(body).decode("UTF-8")
+            body = ElementTree.fromstring(body_text)
+        except ElementTree.ParseError as parse_error:
+            # XHTML is too malformed to read
+            position = parse_error.position[1]
+            start_position = position - 10
+            end_position = position + 10
+            if start_position < 0:
+                start_position = 0
+            if end_position > (len(body_text)):
+                end_position = len(body_text)
+            section = body_text[start_position:end_position]
+            section = html_string_tools.replace_reserved_characters(section)
+            char_num = ord(body_text[position])
+            formatted_html = "<body><p>HTML could not be parsed!</p>"
+            formatted_html = f"{formatted_html}<p>XML Parse Error: Character Value Decimal {char_num}</p>"
+            formatted_html = f"{formatted_html}<p>String Error Section: {section}</p></body>"
+            body = ElementTree.fromstring(formatted_html)
+    base.append(body)
     # Set indents to make the XML more readable
-    xml = ElementTree.tostring(base).decode("UTF-8")
-    xml = html_string_tools.make_human_readable(xml, "    ").strip()
+    xml = mm_xml_tools.get_xml_string(base, "    ")
     xml = f"<?xml version=\"1.0\" encoding=\"utf-8\"?>\n{xml}"
     return xml
 
@@ -147,6 +284,7 @@ def clean_html(html_file:str, add_smart_quotes:bool) -> str:
     original_html = mm_file_tools.read_text_file(html_file)
     # Get the root element from the body
     ElementTree.register_namespace("", "http://www.w3.org/1999/xhtml")
+    import html5lib
     root = html5lib.parse(original_html)
     try:
         root = root.findall(".//{http://www.w3.org/1999/xhtml}body")[0]
@@ -169,7 +307,86 @@ def clean_html(html_file:str, add_smart_quotes:bool) -> str:
     # Return the cleaned HTML
     return html_text
 
-def image_to_xhtml(image_file:str, alt_string:str=None) -> str:
+def get_html_paragraphs(html_file:str, add_smart_quotes:bool=True) -> Iterator[str]:
+    """
+    Returns a cleaned up version of an HTML file, as with clean_html, cut into its paragraph elements.
+    This lets large HTML files be split between multiple XHTML files.
+
+    :param html_file: Path of the HTML file to clean up
+    :type html_file: str, required
+    :param add_smart_quotes: Whether to automatically add smart quotes, defaults to True
+    :type add_smart_quotes: bool, optional
+    :return: HTML paragraph elements
+    :rtype: Iterator[str]
+    """
+    html_text = clean_html(html_file, add_smart_quotes)
+    # Paragraphs from text_to_paragraphs follow each other directly
+    start = 0
+    while True:
+        end = html_text.find("</p><p", start)
+        if end == -1:
+            break
+        yield html_text[start:end + 4]
+        start = end + 4
+    yield html_text[start:]
+
+def get_text_paragraphs(text_file:str, add_smart_quotes:bool=True,
+            encoding:str="utf-8", block_size:int=1048576) -> Iterator[str]:
+    """
+    Converts a plain text file into HTML paragraph elements one block at a time.
+    The file is decoded as it is read and cut at any paragraph break text_to_paragraphs recognizes, so only about one block is held in memory.
+    Joining the paragraphs gives the same HTML as converting the whole stripped text at once.
+    Raises UnicodeDecodeError if the file can't be decoded with the given encoding.
+
+    :param text_file: Path of the text file to convert
+    :type text_file: str, required
+    :param add_smart_quotes: Whether to automatically add smart quotes, defaults to True
+    :type add_smart_quotes: bool, optional
+    :param encoding: Text encoding of the file, defaults to "utf-8"
+    :type encoding: str, optional
+    :param block_size: Number of bytes to read at a time, defaults to 1048576
+    :type block_size: int, optional
+    :return: HTML paragraph elements
+    :rtype: Iterator[str]
+    """
+    def convert(text:str) -> Iterator[str]:
+        html_text = html_string_tools.text_to_paragraphs(text, contains_html=False)
+        if add_smart_quotes:
+            html_text = html_string_tools.add_smart_quotes_to_paragraphs(html_text)
+        # Reserved characters are escaped, so paragraph ends are the only closing tags
+        for paragraph in html_text.split("</p>")[:-1]:
+            yield f"{paragraph}</p>"
+    remainder = ""
+    scan_position = 0
+    empty = True
+    for block in mm_file_tools.read_text_blocks(text_file, encoding, block_size):
+        # Replace tabs the same way text_to_paragraphs does, so indented breaks are found
+        block = block.replace("\t", "    ")
+        remainder = f"{remainder}{block}"
+        if empty:
+            remainder = remainder.lstrip()
+            if remainder == "":
+                continue
+        # Find the last break that can't change as more text is read, only scanning the newly read text
+        # Breaks only match whitespace, so one followed by other text is final
+        last_break = None
+        for match in PARAGRAPH_BREAK_REGEX.finditer(remainder, scan_position):
+            if match.end() < len(remainder) and not remainder[match.end()].isspace():
+                last_break = match
+        # Scanning resumes at the trailing whitespace, where the only breaks that can still change are
+        scan_position = len(remainder.rstrip())
+        if last_break is None:
+            continue
+        yield from convert(remainder[:last_break.start()])
+        remainder = remainder[last_break.end():]
+        scan_position = max(scan_position - last_break.end(), 0)
+        empty = False
+    # Convert the remaining text
+    remainder = remainder.rstrip()
+    if empty or not remainder == "":
+        yield from convert(remainder)
+
+def image_to_xhtml(image_file:str, alt_string:str=None, size:tuple=None) -> str:
     """
     Creates an XHTML svg and img container to reference a given image for use in an EPUB file.
     
@@ -177,6 +394,8 @@ def image_to_xhtml(image_file:str, alt_string:str=None) -> str:
     :type image_file: str, required
     :param alt_string: Text to use for the alt value for the image tag, defaults to None
     :type alt_string:, str, optional
+    :param size: Known (width, height) of the image, read from the file if None, defaults to None
+    :type size: tuple, optional
     :return: XML formatted text
     :rtype: str
     """
@@ -188,11 +407,11 @@ def image_to_xhtml(image_file:str, alt_string:str=None) -> str:
     if alt_string is None:
         title = get_title_from_file(image_file)
     # Get the size of the image
-    try:
-        image = Image.open(image_file)
-        width, height = image.size
-    except UnidentifiedImageError:
+    if size is None:
+        size = mm_image_tools.get_image_size(image_file)
+    if size is None:
         return ""
+    width, height = size
     # Construct the xml
     return f"<div><img src=\"{image_path}\" alt=\"{title}\" width=\"{width}\" height=\"{height}\" /></div>"
 
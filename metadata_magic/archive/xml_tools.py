@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+import html_string_tools
+from xml.etree import ElementTree
+
+def escape_text(text:str) -> str:
+    """
+    Escapes the reserved characters in XML element text.
+
+    :param text: Text to escape
+    :type text: str, required
+    :return: Escaped text
+    :rtype: str
+    """
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+def escape_attribute(value:str) -> str:
+    """
+    Escapes the reserved characters in an XML attribute value.
+
+    :param value: Attribute value to escape
+    :type value: str, required
+    :return: Escaped attribute value
+    :rtype: str
+    """
+    value = escape_text(value)
+    if "\"" in value:
+        value = value.replace("\"", "&quot;")
+    if "\r" in value:
+        value = value.replace("\r", "&#13;")
+    if "\n" in value:
+        value = value.replace("\n", "&#10;")
+    if "\t" in value:
+        value = value.replace("\t", "&#09;")
+    return value
+
+def get_ascii(xml:str) -> str:
+    """
+    Replaces all non-ASCII characters in XML text with character references.
+
+    :param xml: XML text
+    :type xml: str, required
+    :return: XML text containing only ASCII characters
+    :rtype: str
+    """
+    if xml.isascii():
+        return xml
+    return xml.encode("ascii", "xmlcharrefreplace").decode("ascii")
+
+def get_namespaces(element:ElementTree.Element) -> (dict, dict):
+    """
+    Returns the qualified names and namespace declarations that ElementTree.tostring uses for an element tree.
+    This relies on a private ElementTree function, so None is returned if it is missing or has changed.
+
+    :param element: Root element of the tree
+    :type element: ElementTree.Element, required
+    :return: Qualified names for all tags and attributes, and namespace declarations for the root element
+    :rtype: (dict, dict)
+    """
+    try:
+        qnames, namespaces = ElementTree._namespaces(element)
+        assert isinstance(qnames, dict) and isinstance(namespaces, dict)
+        return (qnames, namespaces)
+    except (AssertionError, AttributeError, TypeError, ValueError): return None
+
+def get_start_tag(element:ElementTree.Element, qnames:dict, namespaces:dict=None) -> str:
+    """
+    Returns the start of the opening tag for an element, without the closing bracket.
+
+    :param element: Element to get the tag for
+    :type element: ElementTree.Element, required
+    :param qnames: Qualified names for all tags and attributes, as returned by get_namespaces
+    :type qnames: dict, required
+    :param namespaces: Namespace declarations to add to the tag, defaults to None
+    :type namespaces: dict, optional
+    :return: Start of the opening tag
+    :rtype: str
+    """
+    tag = element.tag
+    if isinstance(tag, ElementTree.QName):
+        tag = tag.text
+    parts = [f"<{qnames[tag]}"]
+    # Add namespace declarations, sorted by prefix as ElementTree does
+    if namespaces:
+        for uri, prefix in sorted(namespaces.items(), key=lambda item: item[1]):
+            if prefix:
+                prefix = f":{prefix}"
+            parts.append(f" xmlns{prefix}=\"{escape_attribute(uri)}\"")
+    # Add the attributes
+    for key, value in element.items():
+        if isinstance(key, ElementTree.QName):
+            key = key.text
+        if isinstance(value, ElementTree.QName):
+            value = qnames[value.text]
+        else:
+            value = escape_attribute(value)
+        parts.append(f" {qnames[key]}=\"{value}\"")
+    return "".join(parts)
+
+def write_compact(element:ElementTree.Element, qnames:dict, parts:list, namespaces:dict=None):
+    """
+    Appends the compact XML text for an element and its descendants to a list of strings.
+    Output is the same as ElementTree.tostring, not including the tail of the given element.
+
+    :param element: Element to write
+    :type element: ElementTree.Element, required
+    :param qnames: Qualified names for all tags and attributes, as returned by get_namespaces
+    :type qnames: dict, required
+    :param parts: List to append XML strings to
+    :type parts: list, required
+    :param namespaces: Namespace declarations to add to the element, defaults to None
+    :type namespaces: dict, optional
+    """
+    if element.tag is ElementTree.Comment:
+        parts.append(f"<!--{element.text}-->")
+    elif element.tag is ElementTree.ProcessingInstruction:
+        parts.append(f"<?{element.text}?>")
+    else:
+        parts.append(get_start_tag(element, qnames, namespaces))
+        if element.text or len(element) > 0:
+            parts.append(">")
+            if element.text:
+                parts.append(escape_text(element.text))
+            for child in element:
+                write_compact(child, qnames, parts)
+                if child.tail:
+                    parts.append(escape_text(child.tail))
+            tag = element.tag
+            if isinstance(tag, ElementTree.QName):
+                tag = tag.text
+            parts.append(f"</{qnames[tag]}>")
+        else:
+            parts.append(" />")
+
+def get_xml_pieces(element:ElementTree.Element, qnames:dict, pieces:list, namespaces:dict=None):
+    """
+    Appends the pieces of XML for an element and its descendants to a list.
+    Each piece is a tuple of the XML text, whether it opens an element, and whether it closes an element.
+    Text pieces neither open nor close an element, and whitespace-only text is left out.
+
+    :param element: Element to get pieces for
+    :type element: ElementTree.Element, required
+    :param qnames: Qualified names for all tags and attributes, as returned by get_namespaces
+    :type qnames: dict, required
+    :param pieces: List to append pieces to
+    :type pieces: list, required
+    :param namespaces: Namespace declarations to add to the element, defaults to None
+    :type namespaces: dict, optional
+    """
+    tag = element.tag
+    if isinstance(tag, ElementTree.QName):
+        tag = tag.text
+    if (tag is ElementTree.Comment or tag is ElementTree.ProcessingInstruction
+            or qnames[tag] == "p" or (not element.text and len(element) == 0)):
+        # Keep paragraphs and elements without contents whole
+        parts = []
+        write_compact(element, qnames, parts, namespaces)
+        pieces.append(("".join(parts), True, True))
+        return
+    pieces.append((get_start_tag(element, qnames, namespaces) + ">", True, False))
+    if element.text and not element.text.strip() == "":
+        pieces.append((escape_text(element.text), False, False))
+    for child in element:
+        get_xml_pieces(child, qnames, pieces)
+        if child.tail and not child.tail.strip() == "":
+            pieces.append((escape_text(child.tail), False, False))
+    pieces.append((f"</{qnames[tag]}>", False, True))
+
+def get_xml_string(element:ElementTree.Element, indent:str="    ") -> str:
+    """
+    Returns XML text for an element tree, written straight from the tree.
+    Non-ASCII characters are written as character references, the same as ElementTree.tostring.
+    Each element starts on a new line with the given indent unless it shares a line with text.
+    Paragraph elements are kept whole on a single line.
+    If indent is None, the XML is written compactly, the same as ElementTree.tostring.
+
+    :param element: Root element of the tree to write
+    :type element: ElementTree.Element, required
+    :param indent: String to use as a single indent, or None for compact XML, defaults to "    "
+    :type indent: str, optional
+    :return: XML text
+    :rtype: str
+    """
+    # Get the qualified names and namespace declarations the same way as ElementTree.tostring
+    names = get_namespaces(element)
+    if names is None:
+        # Fall back to formatting the output of ElementTree.tostring
+        xml = ElementTree.tostring(element).decode("UTF-8")
+        if indent is None:
+            return xml
+        return html_string_tools.make_human_readable(xml, indent).strip()
+    qnames, namespaces = names
+    if indent is None:
+        parts = []
+        write_compact(element, qnames, parts, namespaces)
+        return get_ascii("".join(parts))
+    # Split pieces into lines wherever two tags aren't separated by text
+    pieces = []
+    get_xml_pieces(element, qnames, pieces, namespaces)
+    lines = []
+    level = 0
+    line = [pieces[0][0]]
+    line_opens, line_closes = pieces[0][1], pieces[0][2]
+    previous_tag = line_opens or line_closes
+    for text, opens, closes in pieces[1:]:
+        is_tag = opens or closes
+        if is_tag and previous_tag:
+            # Indent the finished line based on whether it opens and/or closes elements
+            if line_closes and not line_opens:
+                level -= 1
+            lines.append(indent * level + "".join(line))
+            if line_opens and not line_closes:
+                level += 1
+            line = [text]
+            line_opens = opens
+        else:
+            line.append(text)
+        line_closes = closes
+        previous_tag = is_tag
+    if line_closes and not line_opens:
+        level -= 1
+    lines.append(indent * level + "".join(line))
+    return get_ascii("\n".join(lines))
@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import copy
 import json
+import python_print_tools
 import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.meta_reader as mm_meta_reader
 from os.path import abspath, expandvars, join
 from typing import List
 
 CONFIG_DIRECTORY = abspath(join(abspath(join(abspath(__file__), os.pardir)), "config_files"))
 DEFAULT_CONFIG_FILE = abspath(join(CONFIG_DIRECTORY, "config.json"))
+KEYLIST_SECTIONS = ["id", "title", "artists", "writers", "date", "description", "tags", "publisher", "url", "age_rating", "num"]
+CONFIG_CACHE = dict()
 
 def get_default_config_paths() -> List[str]:
     """
@@ -37,19 +43,156 @@ def get_default_config_paths() -> List[str]:
     # Return the config paths
     return config_paths
 
+def get_keylist_errors(keylist, name:str) -> List[str]:
+    """
+    Returns the problems with a list of keypaths in a config file.
+    Each keypath is a list of dictionary keys or list indexes to follow in order.
+
+    :param keylist: List of keypaths to check
+    :type keylist: any, required
+    :param name: Name of the config entry, used in the error messages
+    :type name: str, required
+    :return: Descriptions of any problems found
+    :rtype: List[str]
+    """
+    if not isinstance(keylist, list):
+        return [f"{name} must be a list of keypaths"]
+    for keys in keylist:
+        if (not isinstance(keys, list) or len(keys) == 0
+                or not all([isinstance(key, (str, int)) and not isinstance(key, bool) for key in keys])):
+            return [f"{name} must only contain non-empty lists of keys, found {json.dumps(keys)}"]
+    return []
+
+def get_mapping_errors(mapping, name:str) -> List[str]:
+    """
+    Returns the problems with a config entry that should map strings to strings.
+
+    :param mapping: Config entry to check
+    :type mapping: any, required
+    :param name: Name of the config entry, used in the error messages
+    :type name: str, required
+    :return: Descriptions of any problems found
+    :rtype: List[str]
+    """
+    if not isinstance(mapping, dict) or not all([isinstance(value, str) for value in mapping.values()]):
+        return [f"{name} must map strings to strings"]
+    return []
+
+def validate_config(config:dict) -> List[str]:
+    """
+    Checks that a config has every entry needed to read metadata, in the right form.
+
+    :param config: Contents of a config file
+    :type config: dict, required
+    :return: Descriptions of any problems found, empty if the config is valid
+    :rtype: List[str]
+    """
+    try:
+        reader = config["json_reader"]
+        assert isinstance(reader, dict)
+    except (AssertionError, KeyError, TypeError): return ["json_reader is missing"]
+    errors = []
+    for section in KEYLIST_SECTIONS:
+        try:
+            errors.extend(get_keylist_errors(reader[section]["keys"], f"json_reader.{section}.keys"))
+        except (KeyError, TypeError): errors.append(f"json_reader.{section}.keys is missing")
+    try:
+        errors.extend(get_keylist_errors(reader["tags"]["internal_keys"], "json_reader.tags.internal_keys"))
+    except (KeyError, TypeError): errors.append("json_reader.tags.internal_keys is missing")
+    # Check that publisher matches are valid regular expressions
+    try:
+        assert isinstance(reader["publisher"]["match"], list)
+        for comparison in reader["publisher"]["match"]:
+            try:
+                assert isinstance(comparison["publisher"], str)
+                re.compile(comparison["match"])
+            except (AssertionError, KeyError, TypeError):
+                errors.append("json_reader.publisher.match entries need \"match\" and \"publisher\" strings")
+            except re.error as error:
+                errors.append(f"json_reader.publisher.match has an invalid pattern {json.dumps(comparison['match'])}: {error}")
+    except (AssertionError, KeyError, TypeError): errors.append("json_reader.publisher.match must be a list")
+    try:
+        errors.extend(get_mapping_errors(reader["url"]["patterns"], "json_reader.url.patterns"))
+    except (KeyError, TypeError): errors.append("json_reader.url.patterns is missing")
+    # Check the age rating entries
+    try:
+        age_rating = reader["age_rating"]
+        if not isinstance(age_rating["allowed"], list):
+            errors.append("json_reader.age_rating.allowed must be a list")
+        errors.extend(get_mapping_errors(age_rating["match"], "json_reader.age_rating.match"))
+        for publisher, specialized in age_rating.get("specialized", dict()).items():
+            name = f"json_reader.age_rating.specialized.{publisher}"
+            errors.extend(get_keylist_errors(specialized["keys"], f"{name}.keys"))
+            errors.extend(get_mapping_errors(specialized["match"], f"{name}.match"))
+    except (AttributeError, KeyError, TypeError): errors.append("json_reader.age_rating is incomplete")
+    return errors
+
+def compile_config(config:dict) -> dict:
+    """
+    Returns a copy of a valid config with its regular expressions compiled.
+    Publisher matches get their compiled pattern under "regex", used instead of compiling the pattern on every match.
+    The projection of JSON keys needed to load metadata is added to the json_reader under "projection".
+    The compiled config can be pickled, so it can be handed to worker processes as is.
+
+    :param config: Contents of a valid config file
+    :type config: dict, required
+    :return: Compiled config
+    :rtype: dict
+    """
+    compiled = copy.deepcopy(config)
+    for comparison in compiled["json_reader"]["publisher"]["match"]:
+        comparison["regex"] = re.compile(comparison["match"], flags=re.IGNORECASE)
+    compiled["json_reader"]["projection"] = mm_meta_reader.get_json_projection(compiled)
+    return compiled
+
+def read_config_file(file:str) -> dict:
+    """
+    Returns the compiled contents of a config file, validating the file the first time it is read.
+    Files are cached in memory by path, size, and modification time.
+    Problems with a config file are reported once, and the file is treated as unusable.
+
+    :param file: Path of the config file
+    :type file: str, required
+    :return: Compiled config, None if the file is missing, empty, or invalid
+    :rtype: dict
+    """
+    full_file = abspath(file)
+    try:
+        stat = os.stat(full_file)
+    except OSError: return None
+    key = f"{full_file}:{stat.st_size}:{stat.st_mtime_ns}"
+    try:
+        return CONFIG_CACHE[key]
+    except KeyError: pass
+    # Read and validate the config file
+    config = mm_file_tools.read_json_file(full_file)
+    CONFIG_CACHE[key] = None
+    if config is None or config == {}:
+        return None
+    errors = validate_config(config)
+    if not errors == []:
+        python_print_tools.color_print(f"Invalid config file \"{full_file}\":", "red")
+        for error in errors:
+            python_print_tools.color_print(f"    {error}", "red")
+        return None
+    CONFIG_CACHE[key] = compile_config(config)
+    return CONFIG_CACHE[key]
+
 def get_config(paths:List[str]) -> dict:
     """
-    Returns a dict for the first valid JSON file in the given path list.
+    Returns the compiled config for the first valid JSON file in the given path list.
+    Invalid config files are reported and skipped.
+    The returned config is shared between calls, so it shouldn't be modified.
 
     :param paths: List of potential paths to JSON config files.
     :type paths: List[str], required
-    :return: Contents of the configuration file
+    :return: Compiled contents of the configuration file
     :rtype: dict
     """
     # Try to read any of the config files
     for file in paths:
-        config = mm_file_tools.read_json_file(abspath(file))
-        if config is not None and not config == {}:
+        config = read_config_file(file)
+        if config is not None:
             return config
-    # Return an empty dictionary if the config file couldn't be read
-    return mm_file_tools.read_json_file(DEFAULT_CONFIG_FILE)
+    # Return the default config if no config file could be read
+    return read_config_file(DEFAULT_CONFIG_FILE)
@@ -3,73 +3,122 @@
 import os
 import tqdm
 import argparse
-import tempfile
+import concurrent.futures
+import html_string_tools
 import python_print_tools
 import metadata_magic.sort as mm_sort
 import metadata_magic.config as mm_config
+import metadata_magic.hash_tools as mm_hash_tools
 import metadata_magic.file_tools as mm_file_tools
 import metadata_magic.meta_finder as mm_meta_finder
 import metadata_magic.meta_reader as mm_meta_reader
+import metadata_magic.zip_tools as mm_zip_tools
 import metadata_magic.archive as mm_archive
 from os.path import abspath, basename, exists, join
 from typing import List
 
 LONG_DESCRIPTION = 1000
 
-def find_missing_media(path:str) -> List[str]:
+def get_directory_scan(path:str) -> dict:
+    """
+    Walks a directory once and gathers the file information shared by all the error checks.
+    Archive metadata is read lazily and cached in the scan through get_archive_metadata.
+
+    :param path: Directory in which to search
+    :type path: str, required
+    :return: Dictionary with "jsons", "media", "pairs", "archives", "json_directories", and "archive_metadata" keys
+    :rtype: dict
+    """
+    # Separate JSON and media files and get proper metadata pairs
+    jsons, media = mm_meta_finder.separate_files(abspath(path))
+    pairs = mm_meta_finder.get_pairs_from_lists(jsons, media, print_info=False)
+    # Get the archive files from the list of media
+    archives = []
+    for media_file in media:
+        if html_string_tools.get_extension(media_file).lower() in mm_archive.ARCHIVE_EXTENSIONS:
+            archives.append(media_file)
+    # Get the directories that directly contain JSON files
+    json_directories = set()
+    for json_file in jsons:
+        json_directories.add(abspath(join(json_file, os.pardir)))
+    # Return the scan info
+    scan = {"jsons":jsons, "media":media, "pairs":pairs, "archives":archives}
+    scan["json_directories"] = json_directories
+    scan["archive_metadata"] = dict()
+    return scan
+
+def get_archive_metadata(scan:dict, archive_file:str) -> dict:
+    """
+    Returns the metadata for an archive file in a directory scan, reading it from the archive only once.
+
+    :param scan: Directory scan as returned by get_directory_scan
+    :type scan: dict, required
+    :param archive_file: Path of the archive file to get metadata from
+    :type archive_file: str, required
+    :return: Dictionary containing metadata as formatted in get_empty_metadata function
+    :rtype: dict
+    """
+    try:
+        return scan["archive_metadata"][archive_file]
+    except KeyError:
+        metadata = mm_archive.get_info_from_archive(archive_file)
+        scan["archive_metadata"][archive_file] = metadata
+        return metadata
+
+def find_missing_media(path:str, scan:dict=None) -> List[str]:
     """
     Returns a list of JSON metadata files without corresponding media.
 
     :param path: Directory in which to search
     :type path: str, required
+    :param scan: Existing directory scan as returned by get_directory_scan, defaults to None
+    :type scan: dict, optional
     :return: List of JSON files with missing media
     :rtype: list[str]
     """
-    # Separate JSON and media files and get proper metadata pairs
-    jsons, media = mm_meta_finder.separate_files(path)
-    pairs = mm_meta_finder.get_pairs_from_lists(jsons, media)
-    # Remove paired JSON files
-    print("Finding JSONs with missing media:")
-    for pair in tqdm.tqdm(pairs):
-        try:
-            index = jsons.index(pair["json"])
-            del jsons[index]
-        except ValueError: pass
+    # Get the JSON files and media pairs
+    if scan is None:
+        scan = get_directory_scan(path)
+    paired = set()
+    for pair in scan["pairs"]:
+        paired.add(pair["json"])
     # Return list of JSON files without media
-    return jsons
+    print("Finding JSONs with missing media...")
+    missing = []
+    for json_file in scan["jsons"]:
+        if json_file not in paired:
+            missing.append(json_file)
+    return missing
 
-def find_missing_metadata(path:str) -> List[str]:
+def find_missing_metadata(path:str, scan:dict=None) -> List[str]:
     """
     Returns a list of media files without corresponding JSON metadata.
 
     :param path: Directory in which to search
     :type path: str, required
+    :param scan: Existing directory scan as returned by get_directory_scan, defaults to None
+    :type scan: dict, optional
     :return: List of media files with missing metadata
     :rtype: list[str]
     """
-    # Separate JSON and media files and get proper metadata pairs
-    jsons, media = mm_meta_finder.separate_files(path)
-    pairs = mm_meta_finder.get_pairs_from_lists(jsons, media)
-    # Remove paired JSON files
-    print("Finding media with missing metadata:")
-    for pair in tqdm.tqdm(pairs):
-        try:
-            index = media.index(pair["media"])
-            del media[index]
-        except ValueError: pass
-    # Remove dotfiles and media in directories with no JSON files
-    for media_num in range(len(media) - 1, -1, -1):
-        if basename(media[media_num]).startswith("."):
-            del media[media_num]
+    # Get the media files and media pairs
+    if scan is None:
+        scan = get_directory_scan(path)
+    paired = set()
+    for pair in scan["pairs"]:
+        paired.add(pair["media"])
+    # Get unpaired media, ignoring dotfiles and media in directories with no JSON files
+    print("Finding media with missing metadata...")
+    missing = []
+    for media_file in scan["media"]:
+        if media_file in paired or basename(media_file).startswith("."):
             continue
-        # Check if parent dir contains JSON files
-        parent_dir = abspath(join(media[media_num], os.pardir))
-        if not mm_file_tools.directory_contains(parent_dir, ".json", False):
-            del media[media_num]
+        if abspath(join(media_file, os.pardir)) in scan["json_directories"]:
+            missing.append(media_file)
     # Return list of media without metadata
-    return media
+    return missing
 
-def find_long_descriptions(path:str, config:dict, length:int=LONG_DESCRIPTION) -> List[str]:
+def find_long_descriptions(path:str, config:dict, length:int=LONG_DESCRIPTION, scan:dict=None) -> List[str]:
     """
     Returns a list of archives and metadata files with overly long descriptions.
     
@@ -79,31 +128,30 @@ def find_long_descriptions(path:str, config:dict, length:int=LONG_DESCRIPTION) -
     :type config: dict, required
     :param length: Number of characters for a description to be considered long, defaults to LONG_DESCRIPTION value
     :type length: int, optional
+    :param scan: Existing directory scan as returned by get_directory_scan, defaults to None
+    :type scan: dict, optional
     :return: List of archives and metadata files with overly long titles
     :rtype: List[str]
     """
-    # Get a list of all archive files
-    print("Searching archives with long descriptions...")
-    full_path = abspath(path)
-    archive_files = mm_file_tools.find_files_of_type(full_path, mm_archive.ARCHIVE_EXTENSIONS)
+    if scan is None:
+        scan = get_directory_scan(path)
     # Run through all archive files
+    print("Searching archives with long descriptions...")
     long = []
-    for archive_file in tqdm.tqdm(archive_files):
-        metadata = mm_archive.get_info_from_archive(archive_file)
+    for archive_file in tqdm.tqdm(scan["archives"]):
+        metadata = get_archive_metadata(scan, archive_file)
         if metadata["description"] is not None and len(metadata["description"]) > length:
             long.append(archive_file)
-    # Get a list of all json media pairs
-    print("Searching JSONs with long descriptions...")
-    pairs = mm_meta_finder.get_pairs(full_path)
     # Run throug all json files
-    for pair in pairs:
-        metadata = mm_meta_reader.load_metadata(pair["json"], config, pair["media"])
+    print("Searching JSONs with long descriptions...")
+    for pair in scan["pairs"]:
+        metadata = mm_meta_reader.load_metadata(pair["json"], config, pair["media"], keep_original=False)
         if metadata["description"] is not None and len(metadata["description"]) > length:
             long.append(pair["json"])
     # Return list of files with long descriptions
     return mm_sort.sort_alphanum(long)
 
-def find_missing_fields(path:str, fields:List[str]) -> List[str]:
+def find_missing_fields(path:str, fields:List[str], scan:dict=None) -> List[str]:
     """
     Finds archive files with certain missing fields in their metadata.
     Will include a file if all the fields given equal None.
@@ -112,17 +160,18 @@ def find_missing_fields(path:str, fields:List[str]) -> List[str]:
     :type path: str, required
     :param fields: List of metadata fields to check for
     :type fields: list[str], required
+    :param scan: Existing directory scan as returned by get_directory_scan, defaults to None
+    :type scan: dict, optional
     :return: List of archive files missing the given fields
     :rtype: list[str]
     """
-    # Get a list of all archive files
-    full_path = abspath(path)
-    archive_files = mm_file_tools.find_files_of_type(full_path, mm_archive.ARCHIVE_EXTENSIONS)
-    # Run through all files
+    if scan is None:
+        scan = get_directory_scan(path)
+    # Run through all archive files
     missing = []
-    for archive_file in tqdm.tqdm(archive_files):
+    for archive_file in tqdm.tqdm(scan["archives"]):
         # Get metadata from the archive file
-        metadata = mm_archive.get_info_from_archive(archive_file)
+        metadata = get_archive_metadata(scan, archive_file)
         # Run through each field
         missing.insert(0, archive_file)
         for field in fields:
@@ -135,39 +184,65 @@ def find_missing_fields(path:str, fields:List[str]) -> List[str]:
     # Return the list of missing files
     return mm_sort.sort_alphanum(missing)
 
-def find_invalid_jsons(path:str) -> List[str]:
+def find_invalid_jsons(path:str, scan:dict=None) -> List[str]:
     """
     Returns a improperly formatted JSON files.
 
     :param path: Directory in which to search
     :type path: str, required
+    :param scan: Existing directory scan as returned by get_directory_scan, defaults to None
+    :type scan: dict, optional
     :return: List of JSON files that are incorrectly formatted
     :rtype: list[str]
     """
+    if scan is None:
+        scan = get_directory_scan(path)
     invalid = []
-    json_files = mm_file_tools.find_files_of_type(path, ".json")
-    for json_file in tqdm.tqdm(json_files):
+    for json_file in tqdm.tqdm(scan["jsons"]):
         if mm_file_tools.read_json_file(json_file) == {}:
             invalid.append(json_file)
     return mm_sort.sort_alphanum(invalid)
 
-def find_invalid_archives(path:str) -> List[str]:
+def find_invalid_archives(path:str, scan:dict=None, workers:int=None) -> List[str]:
     """
     Returns a list of improperly formed archive files.
+    Archives are checked in parallel by reading each member straight from its central directory listing, without extracting anything.
 
     :param path: Directory in which to search
     :type path: str, required
+    :param scan: Existing directory scan as returned by get_directory_scan, defaults to None
+    :type scan: dict, optional
+    :param workers: Number of threads to check archives with, defaults to None
+    :type workers: int, optional
     :return: List of CBZ and EPUB files that are incorrectly formatted
     :rtype: list[str]
     """
-    invalid = []
-    archive_files = mm_file_tools.find_files_of_type(path, mm_archive.ARCHIVE_EXTENSIONS)
-    for archive_file in tqdm.tqdm(archive_files):
-        with tempfile.TemporaryDirectory() as tempdir:
-            if not mm_file_tools.extract_zip(archive_file, tempdir):
-                invalid.append(archive_file)
+    if scan is None:
+        scan = get_directory_scan(path)
+    listings = mm_zip_tools.read_zip_listings(scan["archives"], workers)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        valid = list(tqdm.tqdm(executor.map(mm_zip_tools.is_zip_valid, listings), total=len(listings)))
+    invalid = [scan["archives"][i] for i in range(0, len(valid)) if not valid[i]]
     return mm_sort.sort_alphanum(invalid)
 
+def find_duplicates(path:str, scan:dict=None, workers:int=None) -> List[List[str]]:
+    """
+    Returns groups of media files and archives with identical contents.
+
+    :param path: Directory in which to search
+    :type path: str, required
+    :param scan: Existing directory scan as returned by get_directory_scan, defaults to None
+    :type scan: dict, optional
+    :param workers: Number of threads to hash files with, defaults to None
+    :type workers: int, optional
+    :return: Groups of duplicate files
+    :rtype: List[List[str]]
+    """
+    if scan is None:
+        scan = get_directory_scan(path)
+    print("Finding duplicate media...")
+    return mm_hash_tools.find_duplicate_files(scan["media"], workers)
+
 def print_errors(error_files:List[str], root_directory:str, print_text:str):
     """
     Prints the files gotten from one of the error-finding functions.
@@ -227,31 +302,49 @@ def main():
             "--missing-fields",
             help="Find media archives with missing metadata fields",
             action="store_true")
+    parser.add_argument(
+            "-d",
+            "--duplicates",
+            help="Find media files and archives with identical contents",
+            action="store_true")
     args = parser.parse_args()
     # Check that directory is valid
     directory = abspath(args.directory)
     if not exists(directory):
         python_print_tools.color_print("Invalid directory.", "red")
     else:
+        # Walk the directory once for all the enabled checks
+        print("Searching directory...")
+        scan = get_directory_scan(directory)
         # Find corrupt files
         if args.corrupt:
-            invalid_files = find_invalid_jsons(directory)
-            invalid_files.extend(find_invalid_archives(directory))
+            invalid_files = find_invalid_jsons(directory, scan)
+            invalid_files.extend(find_invalid_archives(directory, scan))
             invalid_files = mm_sort.sort_alphanum(invalid_files)
             print_errors(invalid_files, directory, "Corrupted Files")
+        # Find duplicate media
+        if args.duplicates:
+            duplicates = find_duplicates(directory, scan)
+            if len(duplicates) > 0:
+                python_print_tools.color_print(f"{len(duplicates)} Groups of Duplicate Files:", "red")
+                for group in duplicates:
+                    python_print_tools.print_files(directory, group)
+                    print("")
+            else:
+                python_print_tools.color_print("No Duplicate Files.\n", "green")
         # Find missing media
         if args.missing_media:
-            missing = find_missing_media(directory)
+            missing = find_missing_media(directory, scan)
             print_errors(missing, directory, "JSONs With Missing Media")
         # Find long descriptions
         if args.long_description is not None:
             config_paths = mm_config.get_default_config_paths()
             config = mm_config.get_config(config_paths)
-            long = find_long_descriptions(directory, config, args.long_description)
+            long = find_long_descriptions(directory, config, args.long_description, scan)
             print_errors(long, directory, "Media With Long Descriptions")
         # Find missing metadata
         if args.missing_json:
-            missing = find_missing_metadata(directory)
+            missing = find_missing_metadata(directory, scan)
             print_errors(missing, directory, "Media With Missing JSON Metadata")
         # Find missing fields
         if args.missing_fields:
@@ -275,7 +368,7 @@ def main():
                         "l":{"key":["tags"], "label":"labels/tags"}, "c":{"key":["series"], "label":"series"}}
             try:
                 label = responses[response]["label"]
-                missing = find_missing_fields(directory, responses[response]["key"])
+                missing = find_missing_fields(directory, responses[response]["key"], scan)
                 print_errors(missing, directory, f"archives with missing {label} field")
             except KeyError:
                 python_print_tools.color_print("Invalid response.", "red")
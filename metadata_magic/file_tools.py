@@ -1,16 +1,46 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import json
+import mmap
+import codecs
 import shutil
 import tempfile
 import zipfile
 import html_string_tools
 import metadata_magic.sort as mm_sort
-import metadata_magic.rename as mm_rename
 import metadata_magic.meta_finder as mm_meta_finder
 from os.path import abspath, basename, exists, isdir, join, relpath
-from typing import List
+from typing import Callable, Iterator, List
+
+TEXT_ENCODINGS = ["utf-8", "ascii", "latin_1", "cp437", "cp500"]
+PROJECTION_SIZE = 65536
+JSON_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', flags=re.DOTALL)
+JSON_SCALAR = re.compile(rb"[^\s,\]}]+")
+JSON_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+JSON_STRUCTURE = re.compile(rb'("[^"\\]*(?:\\.[^"\\]*)*")|([\[{])|([\]}])', flags=re.DOTALL)
+JSON_CONTAINER_DEPTH = 8
+
+def get_container_pattern(depth:int) -> re.Pattern:
+    """
+    Returns a pattern matching a whole JSON object or array nested no deeper than the given depth.
+    This lets large containers be skipped in a single match rather than token by token.
+    Each repetition matches one plain character, a string, or a nested container, and each of these
+    starts with a different character, so a failed match can't backtrack through many ways of splitting the text.
+
+    :param depth: Deepest level of nesting to match
+    :type depth: int, required
+    :return: Compiled pattern
+    :rtype: re.Pattern
+    """
+    string = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+    pattern = rb'[\[{](?:[^"\[\]{}]|' + string + rb')*[\]}]'
+    for i in range(1, depth):
+        pattern = rb'[\[{](?:[^"\[\]{}]|' + string + rb'|' + pattern + rb')*[\]}]'
+    return re.compile(pattern, flags=re.DOTALL)
+
+JSON_CONTAINER = get_container_pattern(JSON_CONTAINER_DEPTH)
 
 def write_text_file(file:str, text:str):
     """
@@ -37,16 +67,41 @@ def read_text_file(file:str) -> str:
     :return: Text contained in the given file
     :rtype: str
     """
-    encodings = ["utf-8", "ascii", "latin_1", "cp437", "cp500"]
-    for encoding in encodings:
+    try:
+        with open(abspath(file), "rb") as in_file:
+            data = in_file.read()
+    except OSError: return None
+    for encoding in TEXT_ENCODINGS:
         try:
-            with open(abspath(file), "rb") as in_file:
-                data = in_file.read()
-                text = data.decode(encoding)
-                return text.strip()
-        except: pass
+            return data.decode(encoding).strip()
+        except UnicodeDecodeError: pass
     return None
 
+def read_text_blocks(file:str, encoding:str="utf-8", block_size:int=1048576) -> Iterator[str]:
+    """
+    Reads the content of a given text file in blocks, decoding each block as it is read.
+    Only one block of the file is held in memory at a time.
+    Raises UnicodeDecodeError if the file can't be decoded with the given encoding.
+
+    :param file: Path of the file to read
+    :type file: str, required
+    :param encoding: Text encoding of the file, defaults to "utf-8"
+    :type encoding: str, optional
+    :param block_size: Number of bytes to read at a time, defaults to 1048576
+    :type block_size: int, optional
+    :return: Blocks of decoded text
+    :rtype: Iterator[str]
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(abspath(file), "rb") as in_file:
+        while True:
+            data = in_file.read(block_size)
+            text = decoder.decode(data, final=(len(data) == 0))
+            if not text == "":
+                yield text
+            if len(data) == 0:
+                break
+
 def write_json_file(file:str, contents:dict):
     """
     Writes a JSON file containing the given dictionary as contents.
@@ -74,6 +129,180 @@ def read_json_file(file:str) -> dict:
         return json_dict
     except(TypeError, json.JSONDecodeError): return {}
 
+def project_json(contents:dict, projection:dict) -> dict:
+    """
+    Returns only the parts of already parsed JSON contents that are in a projection.
+
+    :param contents: Parsed JSON contents
+    :type contents: dict, required
+    :param projection: Keys to keep, each mapped to None to keep its whole value or to a projection of its own
+    :type projection: dict, required
+    :return: Contents with only the projected keys, values that aren't objects are always kept whole
+    :rtype: dict
+    """
+    if not isinstance(contents, dict):
+        return contents
+    projected = dict()
+    for key in projection:
+        if key not in contents:
+            continue
+        if projection[key] is not None and isinstance(contents[key], dict):
+            projected[key] = project_json(contents[key], projection[key])
+        else:
+            # Keep lists and other values whole, since they can still be indexed into
+            projected[key] = contents[key]
+    return projected
+
+def skip_json_value(data:bytes, position:int) -> int:
+    """
+    Returns the position just past the JSON value starting at the given position, without building the value.
+    Nested values are only checked for balanced brackets, not fully validated.
+
+    :param data: Encoded JSON text
+    :type data: bytes, required
+    :param position: Position of the first character of the value
+    :type position: int, required
+    :return: Position after the end of the value
+    :rtype: int
+    """
+    first = data[position:position + 1]
+    if first == b"\"":
+        match = JSON_STRING.match(data, position)
+    elif first == b"{" or first == b"[":
+        # Skip the container in one match if it isn't nested too deeply
+        match = JSON_CONTAINER.match(data, position)
+        if match is not None:
+            return match.end()
+        depth = 0
+        for match in JSON_STRUCTURE.finditer(data, position):
+            if match.lastindex == 2:
+                depth += 1
+            elif match.lastindex == 3:
+                depth -= 1
+                if depth == 0:
+                    return match.end()
+        match = None
+    else:
+        match = JSON_SCALAR.match(data, position)
+    if match is None:
+        raise ValueError(f"Invalid JSON value at {position}")
+    return match.end()
+
+def read_json_object(data:bytes, position:int, projection:dict) -> (dict, int):
+    """
+    Builds only the projected keys of the JSON object starting at the given position, skipping all other values.
+
+    :param data: Encoded JSON text
+    :type data: bytes, required
+    :param position: Position of the opening brace of the object
+    :type position: int, required
+    :param projection: Keys to keep, as used in project_json
+    :type projection: dict, required
+    :return: Projected object and the position after the end of the object
+    :rtype: (dict, int)
+    """
+    projected = dict()
+    position = JSON_WHITESPACE.match(data, position + 1).end()
+    if data[position:position + 1] == b"}":
+        return (projected, position + 1)
+    while True:
+        # Read the key
+        match = JSON_STRING.match(data, position)
+        if match is None:
+            raise ValueError(f"Invalid JSON key at {position}")
+        key = json.loads(match.group())
+        position = JSON_WHITESPACE.match(data, match.end()).end()
+        if not data[position:position + 1] == b":":
+            raise ValueError(f"Missing colon at {position}")
+        position = JSON_WHITESPACE.match(data, position + 1).end()
+        # Build the value only if it is in the projection
+        if key in projection and projection[key] is not None and data[position:position + 1] == b"{":
+            projected[key], position = read_json_object(data, position, projection[key])
+        else:
+            end = skip_json_value(data, position)
+            if key in projection:
+                projected[key] = json.loads(data[position:end])
+            position = end
+        # Move to the next key
+        position = JSON_WHITESPACE.match(data, position).end()
+        separator = data[position:position + 1]
+        if separator == b"}":
+            return (projected, position + 1)
+        if not separator == b",":
+            raise ValueError(f"Invalid JSON object at {position}")
+        position = JSON_WHITESPACE.match(data, position + 1).end()
+
+def read_json_keys(file:str, projection:dict, min_size:int=PROJECTION_SIZE) -> dict:
+    """
+    Returns only the projected keys from the contents of a given JSON file.
+    Large files are scanned in place, with values outside the projection skipped without being built.
+    Smaller files, and files that aren't UTF-8, are parsed in full and then projected.
+
+    :param file: JSON file to read
+    :type file: str, required
+    :param projection: Keys to keep, as used in project_json
+    :type projection: dict, required
+    :param min_size: Size in bytes below which the file is parsed in full, defaults to PROJECTION_SIZE
+    :type min_size: int, optional
+    :return: Projected contents of the JSON file, an empty dict if the file can't be read
+    :rtype: dict
+    """
+    try:
+        with open(abspath(file), "rb") as in_file:
+            if os.fstat(in_file.fileno()).st_size >= max(min_size, 1):
+                with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    position = 3 if data[:3] == codecs.BOM_UTF8 else 0
+                    position = JSON_WHITESPACE.match(data, position).end()
+                    if data[position:position + 1] == b"{":
+                        return read_json_object(data, position, projection)[0]
+    except (OSError, ValueError, UnicodeDecodeError): pass
+    return project_json(read_json_file(file), projection)
+
+def get_staging_directory(file:str, scratch_directory:str=None) -> str:
+    """
+    Returns a directory in which to build the replacement for a given file.
+    The scratch directory is used if it is on the same device as the file, otherwise the file's own directory is used.
+    If no scratch directory is given, the METADATA_MAGIC_SCRATCH environment variable is checked instead.
+
+    :param file: Path of the file that will be replaced
+    :type file: str, required
+    :param scratch_directory: Preferred directory for staging files, defaults to None
+    :type scratch_directory: str, optional
+    :return: Directory on the same device as the given file
+    :rtype: str
+    """
+    parent = abspath(join(abspath(file), os.pardir))
+    if scratch_directory is None:
+        scratch_directory = os.environ.get("METADATA_MAGIC_SCRATCH")
+    try:
+        # Use the scratch directory if it shares the same device
+        scratch_directory = abspath(scratch_directory)
+        if isdir(scratch_directory) and os.stat(scratch_directory).st_dev == os.stat(parent).st_dev:
+            return scratch_directory
+    except (OSError, TypeError): pass
+    return parent
+
+def replace_file(new_file:str, file:str) -> bool:
+    """
+    Replaces a file with a newly built file in a single atomic step when possible.
+    The new file should be staged in the directory returned by get_staging_directory.
+
+    :param new_file: Path of the new file to move into place
+    :type new_file: str, required
+    :param file: Path of the file to be replaced
+    :type file: str, required
+    :return: Whether the file was successfully replaced
+    :rtype: bool
+    """
+    try:
+        os.replace(abspath(new_file), abspath(file))
+    except OSError:
+        # Fall back to moving the file if it wasn't staged on the same device
+        try:
+            shutil.move(abspath(new_file), abspath(file))
+        except (FileNotFoundError, OSError): return False
+    return exists(file)
+
 def find_files_of_type(directory:str, extension:str,
             include_subdirectories:bool=True, inverted:bool=False) -> List[str]:
     """
@@ -202,10 +431,191 @@ def create_zip(directory:str, zip_path:str, compress_level:int=9, mimetype:str=N
     # Return if the zip file was successfully created
     return exists(zip_path)
 
+def get_member_path(name:str) -> str:
+    """
+    Returns a safe relative path for a member of a ZIP file, the same way zipfile does when extracting.
+    Drive letters, leading slashes, and "." or ".." components are removed so a member can't be written outside the extraction directory.
+
+    :param name: Name of the ZIP member
+    :type name: str, required
+    :return: Relative path with "/" separators, None if nothing is left of the name
+    :rtype: str
+    """
+    parts = []
+    for part in os.path.splitdrive(name.replace("\\", "/"))[1].split("/"):
+        if part not in ["", ".", ".."]:
+            parts.append(part)
+    if len(parts) == 0:
+        return None
+    return "/".join(parts)
+
+def get_zip_extraction(zip_path:str, extract_directory:str, create_folder:bool=False,
+                remove_internal:bool=False, delete_files:List[str]=[],
+                prefix:str=None, include:Callable[[str], bool]=None, used_files:dict=None) -> dict:
+    """
+    Works out where every member of a ZIP file will be extracted to, without extracting anything.
+    Only the central directory of the ZIP file is read.
+    If create_folder is True, the containing folder is created.
+    Names are reserved in used_files, so later extractions into the same directory won't use them even before the files are written.
+
+    :param zip_path: Path to ZIP file to extract
+    :type zip_path: str, required
+    :param extract_directory: Directory in which to extract ZIP contents
+    :type extract_directory: str, required
+    :param create_folder: Whether to create a folder within the given directory to hold contents, defaults to False
+    :type create_folder: bool, optional
+    :param remove_internal: Whether to remove redundant internal folder, defaults to False
+    :type remove_internal: bool, optional
+    :param delete_files: List of filenames to delete if desired, defaults to []
+    :type delete_files: list[str], optional
+    :param prefix: Folder within the ZIP file to extract the contents of, fails if not present, defaults to None
+    :type prefix: str, optional
+    :param include: Function taking a member's relative path and returning whether to extract it, defaults to None
+    :type include: Callable[[str], bool], optional
+    :param used_files: Lowercase filenames already taken, keyed by directory, filled in as needed, defaults to None
+    :type used_files: dict, optional
+    :return: Extraction plan for extract_zip_members, None if the ZIP file couldn't be read
+    :rtype: dict
+    """
+    # Imported here since mm_rename imports this module
+    import metadata_magic.rename as mm_rename
+    if used_files is None:
+        used_files = dict()
+    try:
+        with zipfile.ZipFile(zip_path, mode="r") as file:
+            infos = file.infolist()
+    except (FileNotFoundError, OSError, zipfile.BadZipFile): return None
+    # Get the safe path of every member, with later members replacing earlier ones
+    members = dict()
+    directories = set()
+    prefix_path = None
+    prefix_found = prefix is None
+    if prefix is not None:
+        prefix_path = f"{get_member_path(prefix)}/"
+    for info in infos:
+        path = get_member_path(info.filename)
+        # Only use members within the prefix folder, relative to the prefix
+        if path is not None and prefix_path is not None:
+            if not f"{path}/".startswith(prefix_path):
+                continue
+            prefix_found = True
+            path = get_member_path(path[len(prefix_path):])
+        if path is None or (include is not None and not info.is_dir() and not include(path)):
+            continue
+        parts = path.split("/")
+        for i in range(1, len(parts)):
+            directories.add("/".join(parts[:i]))
+        if info.is_dir():
+            directories.add(path)
+        else:
+            members[path] = info.filename
+    if not prefix_found:
+        return None
+    # Leave out listed files
+    for delete_file in delete_files:
+        members.pop(get_member_path(delete_file), None)
+    # Remove internal folder if specified
+    roots = set([path.split("/")[0] for path in list(members) + list(directories)])
+    if remove_internal and len(roots) == 1 and list(roots)[0] in directories:
+        internal = f"{list(roots)[0]}/"
+        members = {path[len(internal):]:name for path, name in members.items() if path.startswith(internal)}
+        directories = set([path[len(internal):] for path in directories if path.startswith(internal)])
+        roots = set([path.split("/")[0] for path in list(members) + list(directories)])
+    # Get the names already used in the extraction directory
+    new_dir = abspath(extract_directory)
+    try:
+        if new_dir not in used_files:
+            used_files[new_dir] = set([existing.lower() for existing in os.listdir(new_dir)])
+    except OSError: return None
+    # Create new extraction subfolder if specified
+    if create_folder:
+        filename = basename(zip_path)
+        extension = html_string_tools.get_extension(filename)
+        filename = filename[:len(filename) - len(extension)]
+        filename = mm_rename.get_unused_filename(["AAAAAAAAAA"], filename, used_files[new_dir])
+        used_files[new_dir].add(filename.lower())
+        new_dir = abspath(join(new_dir, filename))
+        try:
+            os.mkdir(new_dir)
+        except OSError: return None
+        used_files[new_dir] = set()
+    used = used_files[new_dir]
+    # Give JSON pairs at the top level matching names
+    new_roots = dict()
+    top_files = [abspath(join(new_dir, root)) for root in roots if root in members]
+    jsons = mm_sort.sort_alphanum([top_file for top_file in top_files
+            if html_string_tools.get_extension(top_file).lower() == ".json"])
+    media = mm_sort.sort_alphanum([top_file for top_file in top_files if top_file not in jsons])
+    for pair in mm_meta_finder.get_pairs_from_lists(jsons, media, False):
+        extension = html_string_tools.get_extension(pair["media"])
+        filename = basename(pair["json"])[:-5]
+        filename = mm_rename.get_unused_filename(["a.json", pair["media"]], filename, used)
+        new_roots[basename(pair["json"])] = f"{filename}.json"
+        new_roots[basename(pair["media"])] = f"{filename}{extension}"
+        used.update([f"{filename}.json".lower(), f"{filename}{extension}".lower()])
+    # Get available names for the remaining top level files and folders
+    for root in mm_sort.sort_alphanum(list(roots)):
+        if root in new_roots:
+            continue
+        extension = html_string_tools.get_extension(root)
+        filename = root[:len(root) - len(extension)]
+        filename = mm_rename.get_unused_filename([root], filename, used)
+        new_roots[root] = f"{filename}{extension}"
+        used.add(f"{filename}{extension}".lower())
+    # Get the paths to remove if extraction fails partway
+    written = [abspath(join(new_dir, new_root)) for new_root in new_roots.values()]
+    if create_folder:
+        written = [new_dir]
+    plan = {"zip":abspath(zip_path), "directory":new_dir, "members":members, "directories":directories}
+    plan["roots"] = new_roots
+    plan["written"] = written
+    return plan
+
+def extract_zip_members(plan:dict) -> bool:
+    """
+    Extracts the members of a ZIP file according to a plan from get_zip_extraction.
+    Each member is written straight to its final path, and members that would end up outside the extraction directory are skipped.
+    If extraction fails partway, everything already written is removed.
+
+    :param plan: Extraction plan, as returned by get_zip_extraction
+    :type plan: dict, required
+    :return: Whether the files were extracted successfully
+    :rtype: bool
+    """
+    directory = plan["directory"]
+    try:
+        with zipfile.ZipFile(plan["zip"], mode="r") as file:
+            # Create the folders
+            for folder in sorted(plan["directories"]):
+                parts = folder.split("/")
+                parts[0] = plan["roots"][parts[0]]
+                os.makedirs(abspath(join(directory, *parts)), exist_ok=True)
+            # Write each member straight to its final path
+            for path, name in plan["members"].items():
+                parts = path.split("/")
+                parts[0] = plan["roots"][parts[0]]
+                new_file = abspath(join(directory, *parts))
+                if not os.path.commonpath([directory, new_file]) == directory:
+                    continue
+                os.makedirs(abspath(join(new_file, os.pardir)), exist_ok=True)
+                with file.open(name) as in_file, open(new_file, "wb") as out_file:
+                    shutil.copyfileobj(in_file, out_file, 1048576)
+    except (OSError, zipfile.BadZipFile, KeyError):
+        for path in plan["written"]:
+            if isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif exists(path):
+                os.remove(path)
+        return False
+    return True
+
 def extract_zip(zip_path:str, extract_directory:str, create_folder:bool=False,
-                remove_internal:bool=False, delete_files:List[str]=[]) -> bool:
+                remove_internal:bool=False, delete_files:List[str]=[],
+                prefix:str=None, include:Callable[[str], bool]=None) -> bool:
     """
     Extracts a ZIP file into a given directory.
+    The final path of every member is worked out before extracting, so each member is written straight to its destination.
+    Only the members selected by prefix and include are read from the ZIP file.
     
     :param zip_path: Path to ZIP file to extract
     :type zip_path: str, required
@@ -217,59 +627,18 @@ def extract_zip(zip_path:str, extract_directory:str, create_folder:bool=False,
     :type remove_internal: bool, optional
     :param delete_files: List of filenames to delete if desired, defaults to []
     :type delete_files: list[str], optional
+    :param prefix: Folder within the ZIP file to extract the contents of, fails if not present, defaults to None
+    :type prefix: str, optional
+    :param include: Function taking a member's relative path and returning whether to extract it, defaults to None
+    :type include: Callable[[str], bool], optional
     :return: Whether the files were extracted successfully
     :rtype: bool
     """
-    # Get temporary directory
-    with tempfile.TemporaryDirectory() as unzip_dir:
-        # Unzip files into temp directory
-        try:
-            with zipfile.ZipFile(zip_path, mode="r") as file:
-                file.extractall(path=unzip_dir)
-        except (FileNotFoundError, OSError, zipfile.BadZipFile): return False
-        # Create new extraction subfolder if specified
-        main_dir = abspath(extract_directory)
-        new_dir = abspath(extract_directory)
-        if create_folder:
-            filename = basename(zip_path)
-            extension = html_string_tools.get_extension(filename)
-            filename = filename[:len(filename) - len(extension)]
-            filename = mm_rename.get_available_filename(["AAAAAAAAAA"], filename, main_dir)
-            new_dir = abspath(join(main_dir, filename))
-            os.mkdir(new_dir)
-        # Delete listed files
-        for file in delete_files:
-            full_file = abspath(join(unzip_dir, file))
-            if exists(full_file):
-                os.remove(full_file)
-        # Remove internal folder if specified
-        if remove_internal and len(os.listdir(unzip_dir)) == 1:
-            full_file = abspath(join(unzip_dir, os.listdir(unzip_dir)[0]))
-            if isdir(full_file):
-                unzip_dir = full_file
-        # Move JSON pairs to new directories
-        pairs = mm_meta_finder.get_pairs(unzip_dir, False)
-        for pair in pairs:
-            if abspath(join(pair["json"], os.pardir)) == unzip_dir:
-                extension = html_string_tools.get_extension(pair["media"])
-                filename = basename(pair["json"])
-                filename = filename[:-5]
-                filename = mm_rename.get_available_filename(["a.json", pair["media"]], filename, new_dir)
-                shutil.move(pair["json"], abspath(join(new_dir, f"{filename}.json")))
-                shutil.move(pair["media"], abspath(join(new_dir, f"{filename}{extension}")))
-        # Copy files to new directory
-        files = os.listdir(unzip_dir)
-        for file in files:
-            extension = html_string_tools.get_extension(file)
-            filename = file[:len(file) - len(extension)]
-            filename = mm_rename.get_available_filename([file], filename, new_dir)
-            current_file = abspath(join(unzip_dir, file))
-            new_file = abspath(join(new_dir, f"{filename}{extension}"))
-            if isdir(current_file):
-                shutil.copytree(current_file, new_file)
-            else:
-                shutil.copy(current_file, new_file)
-    return True
+    plan = get_zip_extraction(zip_path, extract_directory, create_folder=create_folder,
+            remove_internal=remove_internal, delete_files=delete_files, prefix=prefix, include=include)
+    if plan is None:
+        return False
+    return extract_zip_members(plan)
 
 def extract_file_from_zip(zip_path:str, extract_directory:str, extract_file:str, check_subdirectories:bool=False) -> str:
     """
@@ -302,6 +671,7 @@ def extract_file_from_zip(zip_path:str, extract_directory:str, extract_file:str,
                 new_file = abspath(join(extract_directory, extract_file))
                 # Update file if it already exists
                 if exists(new_file):
+                    import metadata_magic.rename as mm_rename
                     extension = html_string_tools.get_extension(extract_file)
                     filename = extract_file[:len(extract_file) - len(extension)]
                     filename = mm_rename.get_available_filename([extracted], filename, extract_directory)
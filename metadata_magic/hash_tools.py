@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import mmap
+import hashlib
+import tempfile
+import concurrent.futures
+import metadata_magic.sort as mm_sort
+from os.path import abspath, expandvars, join
+from typing import List
+
+BLOCK_SIZE = 65536
+CACHE_VERSION = 1
+
+def get_cache_file() -> str:
+    """
+    Returns the path of the file in which file hashes are cached.
+    Uses the METADATA_MAGIC_HASH_CACHE environment variable if set, otherwise the user's cache directory.
+
+    :return: Path of the hash cache file
+    :rtype: str
+    """
+    cache_file = os.environ.get("METADATA_MAGIC_HASH_CACHE")
+    if cache_file is not None and not cache_file == "":
+        return abspath(expandvars(cache_file))
+    if os.name == "nt":
+        return abspath(expandvars(r"%LOCALAPPDATA%\metadata-magic\hashes.json"))
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home is None or cache_home == "":
+        cache_home = expandvars(r"${HOME}/.cache")
+    return abspath(join(cache_home, "metadata-magic", "hashes.json"))
+
+def read_hash_cache(cache_file:str=None) -> dict:
+    """
+    Returns the cached file hashes, keyed by the file keys returned by get_file_key.
+    Returns an empty cache if the cache file is missing, invalid, or from a different version.
+
+    :param cache_file: Path of the hash cache file, defaults to None
+    :type cache_file: str, optional
+    :return: Cached hashes, each with "partial" and possibly "full" keys
+    :rtype: dict
+    """
+    if cache_file is None:
+        cache_file = get_cache_file()
+    try:
+        with open(cache_file, "r", encoding="UTF-8") as in_file:
+            contents = json.load(in_file)
+        assert contents["version"] == CACHE_VERSION and contents["block_size"] == BLOCK_SIZE
+        assert isinstance(contents["hashes"], dict)
+        return contents["hashes"]
+    except (OSError, ValueError, KeyError, TypeError, AssertionError): return dict()
+
+def write_hash_cache(hashes:dict, cache_file:str=None):
+    """
+    Writes file hashes to the hash cache file, replacing the old cache in one step.
+
+    :param hashes: Hashes to cache, as returned by read_hash_cache
+    :type hashes: dict, required
+    :param cache_file: Path of the hash cache file, defaults to None
+    :type cache_file: str, optional
+    """
+    if cache_file is None:
+        cache_file = get_cache_file()
+    try:
+        cache_directory = abspath(join(cache_file, os.pardir))
+        os.makedirs(cache_directory, exist_ok=True)
+        contents = {"version":CACHE_VERSION, "block_size":BLOCK_SIZE, "hashes":hashes}
+        file_handle, staged_file = tempfile.mkstemp(suffix=".json", prefix=".mm-", dir=cache_directory)
+        with os.fdopen(file_handle, "w", encoding="UTF-8") as out_file:
+            json.dump(contents, out_file, separators=(",", ":"))
+        os.replace(staged_file, cache_file)
+    except OSError: pass
+
+def get_file_key(stat:os.stat_result) -> str:
+    """
+    Returns the key used to cache the hashes of a file.
+    Files with the same inode, size, and modification time are assumed to be unchanged.
+
+    :param stat: Stat result of the file
+    :type stat: os.stat_result, required
+    :return: Cache key for the file
+    :rtype: str
+    """
+    return f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def get_partial_hash(file:str, size:int) -> str:
+    """
+    Returns a hash of the first and last blocks of a file.
+    Files no larger than two blocks are hashed in full.
+
+    :param file: Path of the file to hash
+    :type file: str, required
+    :param size: Size of the file in bytes
+    :type size: int, required
+    :return: Hexadecimal BLAKE2 hash
+    :rtype: str
+    """
+    blake = hashlib.blake2b(digest_size=32)
+    with open(abspath(file), "rb") as in_file:
+        if size <= BLOCK_SIZE * 2:
+            blake.update(in_file.read())
+        else:
+            blake.update(in_file.read(BLOCK_SIZE))
+            in_file.seek(size - BLOCK_SIZE)
+            blake.update(in_file.read(BLOCK_SIZE))
+    return blake.hexdigest()
+
+def get_full_hash(file:str) -> str:
+    """
+    Returns a hash of the full contents of a file, read through a memory map.
+
+    :param file: Path of the file to hash
+    :type file: str, required
+    :return: Hexadecimal BLAKE2 hash
+    :rtype: str
+    """
+    blake = hashlib.blake2b(digest_size=32)
+    with open(abspath(file), "rb") as in_file:
+        if os.fstat(in_file.fileno()).st_size > 0:
+            with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                blake.update(mapped)
+    return blake.hexdigest()
+
+def get_hashes(files:List[str], hash_type:str, sizes:dict, keys:dict, cache:dict, workers:int=None) -> dict:
+    """
+    Returns the hashes of the given files, using cached hashes where available.
+    Hashes are calculated in parallel threads, and new hashes are added to the cache.
+
+    :param files: Paths of the files to hash
+    :type files: List[str], required
+    :param hash_type: Type of hash to get, either "partial" or "full"
+    :type hash_type: str, required
+    :param sizes: Size of each file in bytes, keyed by path
+    :type sizes: dict, required
+    :param keys: Cache key of each file, keyed by path
+    :type keys: dict, required
+    :param cache: Cached hashes, as returned by read_hash_cache
+    :type cache: dict, required
+    :param workers: Number of threads to hash files with, defaults to None
+    :type workers: int, optional
+    :return: Hash of each file, keyed by path, leaving out files that couldn't be read
+    :rtype: dict
+    """
+    hashes = dict()
+    uncached = []
+    for file in files:
+        try:
+            hashes[file] = cache[keys[file]][hash_type]
+        except KeyError: uncached.append(file)
+    # Hash the uncached files in parallel
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        if hash_type == "partial":
+            futures = [executor.submit(get_partial_hash, file, sizes[file]) for file in uncached]
+        else:
+            futures = [executor.submit(get_full_hash, file) for file in uncached]
+        for file, future in zip(uncached, futures):
+            try:
+                hashes[file] = future.result()
+            except (OSError, ValueError): continue
+            entry = cache.setdefault(keys[file], dict())
+            entry[hash_type] = hashes[file]
+            # Small files are hashed in full by the partial hash
+            if hash_type == "partial" and sizes[file] <= BLOCK_SIZE * 2:
+                entry["full"] = hashes[file]
+    return hashes
+
+def get_matching_groups(files:List[str], values:dict) -> List[List[str]]:
+    """
+    Returns groups of files sharing the same value, leaving out files with no matches.
+
+    :param files: Paths of the files to group
+    :type files: List[str], required
+    :param values: Value for each file, keyed by path
+    :type values: dict, required
+    :return: Groups of two or more files with the same value
+    :rtype: List[List[str]]
+    """
+    groups = dict()
+    for file in files:
+        if file in values:
+            groups.setdefault(values[file], []).append(file)
+    return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicate_files(files:List[str], workers:int=None, use_cache:bool=True) -> List[List[str]]:
+    """
+    Returns groups of files with identical contents.
+    Files are first grouped by size, then by a hash of their first and last blocks.
+    Only files still matching after that have their full contents hashed.
+    Empty files are ignored.
+
+    :param files: Paths of the files to check
+    :type files: List[str], required
+    :param workers: Number of threads to hash files with, defaults to None
+    :type workers: int, optional
+    :param use_cache: Whether to use and update the hash cache, defaults to True
+    :type use_cache: bool, optional
+    :return: Groups of duplicate files, each sorted alphanumerically
+    :rtype: List[List[str]]
+    """
+    # Get the size and cache key of every file
+    sizes = dict()
+    keys = dict()
+    for file in files:
+        try:
+            stat = os.stat(abspath(file))
+        except OSError: continue
+        if stat.st_size > 0:
+            sizes[file] = stat.st_size
+            keys[file] = get_file_key(stat)
+    cache = dict()
+    if use_cache:
+        cache = read_hash_cache()
+    # Group by size, then by partial hash, then by full hash
+    candidates = get_matching_groups(list(sizes), sizes)
+    candidates = [file for group in candidates for file in group]
+    partial_hashes = get_hashes(candidates, "partial", sizes, keys, cache, workers)
+    values = {file:(sizes[file], partial_hashes[file]) for file in partial_hashes}
+    candidates = [file for group in get_matching_groups(candidates, values) for file in group]
+    full_hashes = get_hashes(candidates, "full", sizes, keys, cache, workers)
+    values = {file:(sizes[file], full_hashes[file]) for file in full_hashes}
+    duplicates = dict()
+    for group in get_matching_groups(candidates, values):
+        group = mm_sort.sort_alphanum(group)
+        duplicates[group[0]] = group
+    if use_cache:
+        write_hash_cache(cache)
+    return [duplicates[first] for first in mm_sort.sort_alphanum(list(duplicates))]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import hashlib
+import threading
+from os.path import abspath, exists, expandvars, join
+
+BATCH_SIZE = 64
+SYNC_INTERVAL = 2.0
+
+def get_journal_directory() -> str:
+    """
+    Returns the directory in which run journals are kept.
+    Uses the METADATA_MAGIC_JOURNAL environment variable if set, otherwise the user's cache directory.
+
+    :return: Path of the journal directory
+    :rtype: str
+    """
+    directory = os.environ.get("METADATA_MAGIC_JOURNAL")
+    if directory is not None and not directory == "":
+        return abspath(expandvars(directory))
+    if os.name == "nt":
+        return abspath(expandvars(r"%LOCALAPPDATA%\metadata-magic\journals"))
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home is None or cache_home == "":
+        cache_home = expandvars(r"${HOME}/.cache")
+    return abspath(join(cache_home, "metadata-magic", "journals"))
+
+def get_journal_file(command:str, directory:str) -> str:
+    """
+    Returns the path of the journal for running a command on a given directory.
+
+    :param command: Name of the command being run
+    :type command: str, required
+    :param directory: Directory the command is run on
+    :type directory: str, required
+    :return: Path of the journal file
+    :rtype: str
+    """
+    digest = hashlib.sha256(f"{command}:{abspath(directory)}".encode("UTF-8")).hexdigest()
+    return abspath(join(get_journal_directory(), f"{command}-{digest[:32]}.jsonl"))
+
+def read_journal(journal_file:str) -> dict:
+    """
+    Reads the run info and the latest state of every item from a journal.
+    A partly written last line, left by a run that was killed, is ignored.
+
+    :param journal_file: Path of the journal file
+    :type journal_file: str, required
+    :return: Journal contents with "run" and "items" keys, items keyed by item with all their entry info merged
+    :rtype: dict
+    """
+    contents = {"run":None, "items":dict()}
+    try:
+        with open(journal_file, "r", encoding="UTF-8") as in_file:
+            for line in in_file:
+                try:
+                    entry = json.loads(line)
+                    if "run" in entry:
+                        contents["run"] = entry["run"]
+                    else:
+                        contents["items"].setdefault(entry["item"], dict()).update(entry)
+                except (ValueError, KeyError, TypeError): continue
+    except OSError: pass
+    return contents
+
+def open_journal(journal_file:str, run:dict, resume:bool=False) -> dict:
+    """
+    Opens a journal for recording the progress of a run.
+    When resuming, the existing journal is read and added to, keeping its run info.
+    Otherwise any existing journal is replaced with a new one for the given run.
+    Items the replaced journal left as started are carried over, so the new run can still roll them back.
+
+    :param journal_file: Path of the journal file
+    :type journal_file: str, required
+    :param run: Info needed to repeat the run, such as its options
+    :type run: dict, required
+    :param resume: Whether to continue an existing journal, defaults to False
+    :type resume: bool, optional
+    :return: Open journal, with the "run" and "items" of the existing journal if resuming
+    :rtype: dict
+    """
+    contents = read_journal(journal_file)
+    carried = []
+    if not resume:
+        # Keep only the unfinished items of the journal being replaced
+        carried = [entry for entry in contents["items"].values() if entry.get("state") == "started"]
+        contents = {"run":None, "items":dict([(entry["item"], entry) for entry in carried])}
+    os.makedirs(abspath(join(journal_file, os.pardir)), exist_ok=True)
+    journal = {"path":journal_file, "items":contents["items"], "lock":threading.Lock()}
+    journal["file"] = open(journal_file, "a" if resume else "w", encoding="UTF-8")
+    # End any partly written line so new entries start on their own line
+    if resume and journal["file"].tell() > 0:
+        with open(journal_file, "rb") as in_file:
+            in_file.seek(-1, os.SEEK_END)
+            if not in_file.read(1) == b"\n":
+                journal["file"].write("\n")
+    journal["unsynced"] = 0
+    journal["last_sync"] = time.monotonic()
+    journal["synced"] = 0
+    if contents["run"] is None:
+        contents["run"] = run
+        journal["file"].write(json.dumps({"run":run}) + "\n")
+        for entry in carried:
+            journal["file"].write(json.dumps(entry) + "\n")
+        sync_journal(journal)
+    journal["run"] = contents["run"]
+    return journal
+
+def write_journal_entry(journal:dict, item:str, state:str, info:dict=None) -> int:
+    """
+    Appends an entry for an item to a journal.
+    Entries are flushed to disk in batches, so the entry may not survive a crash until the journal is synced.
+
+    :param journal: Journal, as returned by open_journal
+    :type journal: dict, required
+    :param item: Item the entry is for, such as a file path
+    :type item: str, required
+    :param state: State of the item, such as "started" or "done"
+    :type state: str, required
+    :param info: Extra info needed to roll back or finish the item, defaults to None
+    :type info: dict, optional
+    :return: Position in the journal after the entry, for use with sync_journal
+    :rtype: int
+    """
+    entry = {"item":item, "state":state}
+    if info is not None:
+        entry.update(info)
+    with journal["lock"]:
+        journal["file"].write(json.dumps(entry) + "\n")
+        position = journal["file"].tell()
+        journal["unsynced"] += 1
+        if journal["unsynced"] >= BATCH_SIZE or time.monotonic() - journal["last_sync"] >= SYNC_INTERVAL:
+            sync_journal(journal, locked=True)
+    return position
+
+def sync_journal(journal:dict, position:int=None, locked:bool=False):
+    """
+    Makes sure journal entries are on disk.
+    If a position is given, nothing is done if the journal has already been synced past that point.
+    This lets one sync cover every entry written since the last.
+
+    :param journal: Journal, as returned by open_journal
+    :type journal: dict, required
+    :param position: Position the journal needs to be synced up to, defaults to None
+    :type position: int, optional
+    :param locked: Whether the journal lock is already held, defaults to False
+    :type locked: bool, optional
+    """
+    if not locked:
+        with journal["lock"]:
+            sync_journal(journal, position, locked=True)
+        return
+    if position is not None and journal["synced"] >= position:
+        return
+    journal["file"].flush()
+    os.fsync(journal["file"].fileno())
+    journal["synced"] = journal["file"].tell()
+    journal["unsynced"] = 0
+    journal["last_sync"] = time.monotonic()
+
+def close_journal(journal:dict, finished:bool=False):
+    """
+    Syncs and closes a journal.
+    The journal is deleted if the run finished, so the next run starts fresh.
+
+    :param journal: Journal, as returned by open_journal
+    :type journal: dict, required
+    :param finished: Whether every item in the run finished successfully, defaults to False
+    :type finished: bool, optional
+    """
+    sync_journal(journal)
+    journal["file"].close()
+    if finished and exists(journal["path"]):
+        os.remove(journal["path"])
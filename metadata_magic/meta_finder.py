@@ -2,11 +2,9 @@
 
 import os
 import re
-import copy
 import tqdm
 import html_string_tools
 import metadata_magic.sort as mm_sort
-import metadata_magic.archive as mm_archive
 from os.path import abspath, basename, isdir, join
 from typing import List
 
@@ -66,33 +64,29 @@ def get_pairs_from_lists(jsons:List[str], media:List[str], print_info:bool=True)
     if print_info:
         print("Finding JSON metadata:")
         iterator = tqdm.tqdm(media)
-    # Create a new list of json basenames set to lowercase
-    jsons_modified = []
-    for json in jsons:
-        base = basename(abspath(json))[:-5].lower()
-        jsons_modified.append(abspath(join(abspath(join(json, os.pardir)), base)))
+    # Map lowercase json basenames to the indexes of their JSON files
+    json_indexes = dict()
+    for i in range(0, len(jsons)):
+        base = basename(abspath(jsons[i]))[:-5].lower()
+        base = abspath(join(abspath(join(jsons[i], os.pardir)), base))
+        json_indexes.setdefault(base, []).append(i)
     # Run through the list of media, finding matching JSON files
     pairs = []
-    reference_jsons = copy.deepcopy(jsons)
     for media_file in iterator:
         # Get the file with the altered extension
         base = basename(abspath(media_file)).lower()
         base = abspath(join(abspath(join(media_file, os.pardir)), base))
         # Check if the JSON exists with the same basename
-        try:
-            index = jsons_modified.index(base)
-        except ValueError:
-            try:
-                # Remove the media extension and check again
-                base = re.sub(r"\.[0-9A-Za-z]{1,5}$", "", base)
-                index = jsons_modified.index(base)
-            except ValueError: continue
+        indexes = json_indexes.get(base)
+        if not indexes:
+            # Remove the media extension and check again
+            base = re.sub(r"\.[0-9A-Za-z]{1,5}$", "", base)
+            indexes = json_indexes.get(base)
+            if not indexes:
+                continue
         # Create a pair, then add to the list of pairs
-        pair = {"json":reference_jsons[index], "media":media_file}
+        pair = {"json":jsons[indexes.pop(0)], "media":media_file}
         pairs.append(pair)
-        # Delete the items from the json list and the basename list
-        del jsons_modified[index]
-        del reference_jsons[index]
     # Return the JSON-media pairs
     return pairs
 
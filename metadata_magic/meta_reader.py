@@ -3,9 +3,116 @@
 import re
 import html_string_tools
 import metadata_magic.file_tools as mm_file_tools
+from collections.abc import MutableMapping
 from os.path import abspath
 from typing import List
 
+DESCRIPTION_KEYS = [["description"], ["caption"], ["content"], ["info", "description"],
+            ["chapter_description"], ["post_content"], ["webtoon_summary"]]
+METADATA_KEYS = ["json_path", "id", "title", "num", "date", "description", "publisher",
+            "tags", "age_rating", "artists", "writers", "url"]
+
+class JsonMetadata(MutableMapping):
+    """
+    Compact record of the standardized metadata loaded from a JSON file, as returned by load_metadata.
+    Acts as a dictionary with the METADATA_KEYS keys plus "original", the full contents of the JSON.
+    Once dropped with drop_original, the original JSON is read again from json_path whenever record["original"] is asked for.
+    A dropped original is left out when iterating, so comparing or copying the record doesn't read the JSON again.
+    Keys outside of METADATA_KEYS can still be set, and are kept in a separate dictionary.
+    """
+    __slots__ = METADATA_KEYS + ["_original", "_projected", "_extra"]
+
+    def __init__(self, json_path:str, original:dict=None):
+        for key in METADATA_KEYS:
+            object.__setattr__(self, key, None)
+        self.json_path = json_path
+        self._original = original
+        self._projected = None
+        self._extra = None
+
+    def drop_original(self, keep_projected:bool=False):
+        """
+        Stops holding the original JSON in memory, leaving it to be read again from json_path if needed.
+
+        :param keep_projected: Whether to keep the held JSON for get_original_value, for when it only holds projected keys, defaults to False
+        :type keep_projected: bool, optional
+        """
+        self._projected = self._original if keep_projected else None
+        self._original = None
+
+    def get_original_value(self, key:str):
+        """
+        Returns a top level value of the original JSON, using the projected keys if they hold it.
+
+        :param key: Key of the value in the original JSON
+        :type key: str, required
+        :return: Value of the key in the original JSON, raises KeyError if the key isn't there
+        :rtype: any
+        """
+        if self._original is None and self._projected is not None and key in self._projected:
+            return self._projected[key]
+        return self["original"][key]
+
+    def __getitem__(self, key:str):
+        if key == "original":
+            if self._original is None:
+                return mm_file_tools.read_json_file(self.json_path)
+            return self._original
+        if key in METADATA_KEYS:
+            return getattr(self, key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key:str, value):
+        if key == "original":
+            self._original = value
+        elif key in METADATA_KEYS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = dict()
+            self._extra[key] = value
+
+    def __delitem__(self, key:str):
+        if key in METADATA_KEYS or key == "original" or self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+        if len(self._extra) == 0:
+            self._extra = None
+
+    def __contains__(self, key) -> bool:
+        if key == "original" or key in METADATA_KEYS:
+            return True
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        yield "json_path"
+        if self._original is not None:
+            yield "original"
+        yield from METADATA_KEYS[1:]
+        if self._extra is not None:
+            yield from list(self._extra)
+
+    def __len__(self) -> int:
+        length = len(METADATA_KEYS) + (0 if self._extra is None else len(self._extra))
+        return length if self._original is None else length + 1
+
+    def __repr__(self) -> str:
+        return f"JsonMetadata({dict(self)!r})"
+
+    def __getstate__(self) -> dict:
+        state = {key:getattr(self, key) for key in METADATA_KEYS}
+        state["_original"] = self._original
+        state["_projected"] = self._projected
+        state["_extra"] = self._extra
+        return state
+
+    def __setstate__(self, state:dict):
+        object.__setattr__(self, "_projected", None)
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
+
 def get_value_from_keylist(dictionary:dict, keylist:List[List[str]], type_obj):
     """
     Returns the value for the first valid given key in a dictionary.
@@ -35,6 +142,69 @@ def get_value_from_keylist(dictionary:dict, keylist:List[List[str]], type_obj):
             continue
     return None
 
+def get_template_keys(template:str) -> List[str]:
+    """
+    Returns the metadata keys used in a string template, without any padding options.
+
+    :param template: Metadata string template, as used in get_string_from_metadata
+    :type template: str, required
+    :return: Keys used in the template
+    :rtype: List[str]
+    """
+    return [re.sub(r"!.*", "", key) for key in re.findall(r"(?<={)[^}]+(?=})", template)]
+
+def get_json_projection(config:dict, template_keys:List[str]=None) -> dict:
+    """
+    Returns the projection of the JSON keys needed to load metadata, for use with file_tools.read_json_keys.
+    This covers every keylist in the config's json_reader, the description keys, and the keys used in URL patterns.
+    Template keys that aren't standardized metadata keys are read from the top level of the original JSON.
+
+    :param config: Dictionary of a metadata-magic config file
+    :type config: dict, required
+    :param template_keys: Extra keys used in string templates, defaults to None
+    :type template_keys: List[str], optional
+    :return: Projection of the needed keys
+    :rtype: dict
+    """
+    # Get every keylist used when reading the JSON
+    reader = config["json_reader"]
+    keylists = []
+    keylists.extend(DESCRIPTION_KEYS)
+    for section in reader:
+        if section == "projection":
+            continue
+        if isinstance(reader[section], dict) and isinstance(reader[section].get("keys"), list):
+            keylists.extend(reader[section]["keys"])
+    for specialized in reader["age_rating"].get("specialized", dict()).values():
+        keylists.extend(specialized["keys"])
+    # Get the keys used in templates
+    keys = []
+    for pattern in reader["url"].get("patterns", dict()).values():
+        keys.extend(get_template_keys(pattern))
+    if template_keys is not None:
+        keys.extend(template_keys)
+    for key in keys:
+        if key not in METADATA_KEYS and not key == "original":
+            keylists.append([key])
+    # Build the projection, keeping whole values for the shortest keylists
+    projection = dict()
+    for keys in keylists:
+        # Keep the whole value for any keylist that indexes into a list
+        for i in range(0, len(keys)):
+            if isinstance(keys[i], int):
+                keys = keys[:i]
+                break
+        if len(keys) == 0:
+            continue
+        node = projection
+        for key in keys[:-1]:
+            if key in node and node[key] is None:
+                break
+            node = node.setdefault(key, dict())
+        else:
+            node[keys[-1]] = None
+    return projection
+
 def get_string_from_metadata(metadata:dict, template:str) -> str:
     """
     Returns a text string based on given metadata and a string template.
@@ -58,7 +228,10 @@ def get_string_from_metadata(metadata:dict, template:str) -> str:
             value = metadata[base_key]
         except KeyError:
             try:
-                value = metadata["original"][base_key]
+                if isinstance(metadata, JsonMetadata):
+                    value = metadata.get_original_value(base_key)
+                else:
+                    value = metadata["original"][base_key]
             except KeyError: return None
         # Pad value, if appropriate
         try:
@@ -211,9 +384,7 @@ def get_description(json:dict, config:dict) -> str:
     :return: Extracted value for the description
     :rtype: str
     """
-    keylist = [["description"], ["caption"], ["content"], ["info", "description"],
-            ["chapter_description"], ["post_content"], ["webtoon_summary"]]
-    return get_value_from_keylist(json, keylist, str)
+    return get_value_from_keylist(json, DESCRIPTION_KEYS, str)
 
 def get_publisher(json:dict, config:dict) -> str:
     """
@@ -235,7 +406,10 @@ def get_publisher(json:dict, config:dict) -> str:
     # Find a publisher by matching to a value in the config file
     url = url.lower()
     for comparison in config["json_reader"]["publisher"]["match"]:
-        if re.fullmatch(comparison["match"], url, flags=re.IGNORECASE):
+        try:
+            regex = comparison["regex"]
+        except KeyError: regex = re.compile(comparison["match"], flags=re.IGNORECASE)
+        if regex.fullmatch(url):
             return comparison["publisher"]
     # Return None of no appropriate publisher can be found
     return None
@@ -330,9 +504,13 @@ def get_age_rating(json:dict, config:dict, publisher:str) -> str:
     except (AssertionError, AttributeError, KeyError):
         return "Unknown"
 
-def load_metadata(json_file:str, config:dict, media_file:str) -> dict:
+def load_metadata(json_file:str, config:dict, media_file:str, keep_original:bool=True,
+            template_keys:List[str]=None) -> JsonMetadata:
     """
     Loads metadata from a given JSON file.
+    For large scans, the original JSON can be left out of memory, in which case it is read again if needed.
+    If the original isn't kept or template keys are given, only the JSON keys needed for the metadata are read.
+    The original JSON is then read again in full whenever it is asked for, while template keys are kept for get_string_from_metadata.
     
     :param json_file: Path of the JSON file to read
     :type json_file: str, required
@@ -340,15 +518,25 @@ def load_metadata(json_file:str, config:dict, media_file:str) -> dict:
     :type config: dict, required
     :param media_file: Path of the associated media file of the JSON
     :type media_file: str, required
-    :return: Dictionary containing the JSON's metadata using standardized keys
-    :rtype: dict
+    :param keep_original: Whether to hold the original JSON contents in memory, defaults to True
+    :type keep_original: bool, optional
+    :param template_keys: Keys of the original JSON used in string templates, defaults to None
+    :type template_keys: List[str], optional
+    :return: Record acting as a dictionary containing the JSON's metadata using standardized keys
+    :rtype: JsonMetadata
     """
     # Load JSON into dictionary
-    json = mm_file_tools.read_json_file(json_file)
+    if keep_original and template_keys is None:
+        json = mm_file_tools.read_json_file(json_file)
+    else:
+        if template_keys is None and "projection" in config["json_reader"]:
+            projection = config["json_reader"]["projection"]
+        else:
+            projection = get_json_projection(config, template_keys)
+        json = mm_file_tools.read_json_keys(json_file, projection)
     # Set the path of the JSON in the metadata
-    meta_dict = {"json_path":abspath(json_file)}
+    meta_dict = JsonMetadata(abspath(json_file), json)
     # Add internal metadata in standardized forms
-    meta_dict["original"] = json
     meta_dict["id"] = get_id(json, config)
     meta_dict["title"] = get_title(json, config)
     meta_dict["num"] = get_num(json, config)
@@ -360,5 +548,10 @@ def load_metadata(json_file:str, config:dict, media_file:str) -> dict:
     extension = html_string_tools.get_extension(media_file)
     meta_dict["artists"], meta_dict["writers"] = get_artists_and_writers(json, config, extension)
     meta_dict["url"] = get_url(meta_dict, config, meta_dict["publisher"])
-    # Return the dict with all metadata
+    # Leave the original JSON to be read again if it isn't being kept or only holds projected keys
+    if not keep_original:
+        meta_dict.drop_original()
+    elif template_keys is not None:
+        meta_dict.drop_original(keep_projected=True)
+    # Return the record with all metadata
     return meta_dict
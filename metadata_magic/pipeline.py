@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import os
+import asyncio
+import concurrent.futures
+from typing import Callable, List
+
+def get_stage(function:Callable, use_processes:bool=False, workers:int=None) -> dict:
+    """
+    Returns a stage to use in a pipeline run by run_pipeline.
+    Functions run in processes must be defined at the top level of a module, and take and return picklable values.
+
+    :param function: Function taking the value from the previous stage, or the item for the first stage, and returning the value for the next stage
+    :type function: Callable, required
+    :param use_processes: Whether to run the stage in the process pool instead of the I/O thread pool, defaults to False
+    :type use_processes: bool, optional
+    :param workers: Number of items the stage works on at once, defaults to the size of the stage's pool
+    :type workers: int, optional
+    :return: Stage info with "function", "use_processes", and "workers" keys
+    :rtype: dict
+    """
+    return {"function":function, "use_processes":use_processes, "workers":workers}
+
+def start_processes(executor:concurrent.futures.ProcessPoolExecutor, workers:int):
+    """
+    Starts the worker processes of a process pool, rather than waiting for work to be submitted.
+    Workers forked while another thread is starting a subprocess hold the subprocess's pipe open,
+    hanging that thread, so pools should be started before threads that start subprocesses are running.
+
+    :param executor: Process pool to start
+    :type executor: concurrent.futures.ProcessPoolExecutor, required
+    :param workers: Number of worker processes in the pool
+    :type workers: int, required
+    """
+    futures = [executor.submit(os.getpid) for i in range(0, workers)]
+    concurrent.futures.wait(futures)
+
+async def run_stage(stage:dict, executor:concurrent.futures.Executor, in_queue:asyncio.Queue, out_queue:asyncio.Queue):
+    """
+    Runs one stage of a pipeline, passing values from one queue to the next until it receives None.
+    Values that are exceptions from earlier stages are passed along without running the stage.
+
+    :param stage: Stage to run, as returned by get_stage
+    :type stage: dict, required
+    :param executor: Pool to run the stage's function in
+    :type executor: concurrent.futures.Executor, required
+    :param in_queue: Queue of (index, value) tuples to work on
+    :type in_queue: asyncio.Queue, required
+    :param out_queue: Queue to put (index, result) tuples in
+    :type out_queue: asyncio.Queue, required
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        entry = await in_queue.get()
+        if entry is None:
+            return
+        index, value = entry
+        if not isinstance(value, Exception):
+            try:
+                value = await loop.run_in_executor(executor, stage["function"], value)
+            except Exception as error: value = error
+        await out_queue.put((index, value))
+
+async def run_stages(items:List, stages:List[dict], callback:Callable, max_pending:int,
+            thread_executor:concurrent.futures.Executor, process_executor:concurrent.futures.Executor) -> List:
+    """
+    Runs items through the stages of a pipeline, as described in run_pipeline.
+
+    :param items: Items to run through the pipeline
+    :type items: List, required
+    :param stages: Stages to run each item through, as returned by get_stage
+    :type stages: List[dict], required
+    :param callback: Function called in order with each item and its result, defaults to None
+    :type callback: Callable, required
+    :param max_pending: Maximum number of items started but not yet passed to the callback
+    :type max_pending: int, required
+    :param thread_executor: Pool for I/O stages
+    :type thread_executor: concurrent.futures.Executor, required
+    :param process_executor: Pool for process stages
+    :type process_executor: concurrent.futures.Executor, required
+    :return: Result of each item, None for items that were never started
+    :rtype: List
+    """
+    # Create bounded queues between the stages
+    queues = [asyncio.Queue(maxsize=stage["workers"]) for stage in stages]
+    queues.append(asyncio.Queue())
+    pending = asyncio.Semaphore(max_pending)
+    stopped = False
+    async def feed():
+        for index in range(0, len(items)):
+            await pending.acquire()
+            if stopped:
+                break
+            await queues[0].put((index, items[index]))
+        for i in range(0, stages[0]["workers"]):
+            await queues[0].put(None)
+    async def run(stage_num:int):
+        stage = stages[stage_num]
+        executor = process_executor if stage["use_processes"] else thread_executor
+        workers = [run_stage(stage, executor, queues[stage_num], queues[stage_num + 1]) for i in range(0, stage["workers"])]
+        await asyncio.gather(*workers)
+        # Tell the next stage no more values are coming
+        count = 1
+        if stage_num + 1 < len(stages):
+            count = stages[stage_num + 1]["workers"]
+        for i in range(0, count):
+            await queues[stage_num + 1].put(None)
+    tasks = [asyncio.create_task(feed())]
+    tasks.extend([asyncio.create_task(run(i)) for i in range(0, len(stages))])
+    # Pass finished items to the callback in their original order
+    results = [None] * len(items)
+    finished = dict()
+    next_index = 0
+    while True:
+        entry = await queues[-1].get()
+        if entry is None:
+            break
+        finished[entry[0]] = entry[1]
+        while next_index in finished:
+            results[next_index] = finished.pop(next_index)
+            if not stopped and callback is not None and callback(items[next_index], results[next_index]) is False:
+                stopped = True
+            next_index += 1
+            pending.release()
+    await asyncio.gather(*tasks)
+    return results
+
+def run_pipeline(items:List, stages:List[dict], callback:Callable=None,
+            io_workers:int=None, cpu_workers:int=None, max_pending:int=None) -> List:
+    """
+    Runs items through a series of stages, with different items in different stages at the same time.
+    I/O stages run on a pool of threads, and CPU heavy stages run on a pool of processes.
+    Stages are joined by bounded queues, and no more than max_pending items are in progress at once.
+    If a stage raises an exception, the exception becomes the item's result and later stages are skipped.
+    The callback gets each item and its result in the original order of the items.
+    If the callback returns False, no new items are started, and items already started are finished.
+
+    :param items: Items to run through the pipeline
+    :type items: List, required
+    :param stages: Stages to run each item through, as returned by get_stage
+    :type stages: List[dict], required
+    :param callback: Function called in order with each item and its result, defaults to None
+    :type callback: Callable, optional
+    :param io_workers: Number of threads for I/O stages, defaults to 4
+    :type io_workers: int, optional
+    :param cpu_workers: Number of processes for process stages, defaults to the number of CPUs
+    :type cpu_workers: int, optional
+    :param max_pending: Maximum number of items in progress at once, defaults to four times the total stage workers
+    :type max_pending: int, optional
+    :return: Result of each item, None for items that were never started
+    :rtype: List
+    """
+    if len(items) == 0:
+        return []
+    if io_workers is None:
+        io_workers = 4
+    if cpu_workers is None:
+        cpu_workers = os.cpu_count() or 1
+    # Get the number of workers for each stage
+    stages = [dict(stage) for stage in stages]
+    for stage in stages:
+        if stage["workers"] is None:
+            stage["workers"] = cpu_workers if stage["use_processes"] else io_workers
+    if max_pending is None:
+        max_pending = sum([stage["workers"] for stage in stages]) * 4
+    # Run the pipeline, only starting processes if needed
+    use_processes = any([stage["use_processes"] for stage in stages])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=io_workers) as thread_executor:
+        if not use_processes:
+            return asyncio.run(run_stages(items, stages, callback, max_pending, thread_executor, None))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=cpu_workers) as process_executor:
+            # Start the worker processes before any threads are running
+            start_processes(process_executor, cpu_workers)
+            return asyncio.run(run_stages(items, stages, callback, max_pending, thread_executor, process_executor))
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import time
+import tqdm
+import bisect
+import hashlib
+import argparse
+import html_string_tools
+import python_print_tools
+import metadata_magic.sort as mm_sort
+import metadata_magic.pipeline as mm_pipeline
+import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.archive as mm_archive
+from os.path import abspath, exists, expandvars, join
+from typing import List
+
+INDEX_VERSION = 1
+INDEX_FIELDS = {"tag":["tags"], "artist":["artists", "cover_artists"], "writer":["writers"],
+            "publisher":["publisher"], "series":["series"], "rating":["age_rating"], "type":[]}
+DEFAULT_FIELDS = ["tag", "artist", "writer", "publisher", "series"]
+
+def get_index_directory() -> str:
+    """
+    Returns the directory in which query indexes are kept.
+    Uses the METADATA_MAGIC_INDEX environment variable if set, otherwise the user's cache directory.
+
+    :return: Path of the index directory
+    :rtype: str
+    """
+    directory = os.environ.get("METADATA_MAGIC_INDEX")
+    if directory is not None and not directory == "":
+        return abspath(expandvars(directory))
+    if os.name == "nt":
+        return abspath(expandvars(r"%LOCALAPPDATA%\metadata-magic\indexes"))
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home is None or cache_home == "":
+        cache_home = expandvars(r"${HOME}/.cache")
+    return abspath(join(cache_home, "metadata-magic", "indexes"))
+
+def get_index_file(directory:str) -> str:
+    """
+    Returns the path of the query index for the archives in a given directory.
+
+    :param directory: Directory the index is for
+    :type directory: str, required
+    :return: Path of the index file
+    :rtype: str
+    """
+    digest = hashlib.sha256(abspath(directory).encode("UTF-8")).hexdigest()
+    return abspath(join(get_index_directory(), f"index-{digest[:32]}.json"))
+
+def get_index_terms(archive_file:str, metadata:dict) -> dict:
+    """
+    Returns the terms to index for an archive, keyed by query field.
+    Terms are lowercase so queries aren't case sensitive.
+
+    :param archive_file: Path of the archive file
+    :type archive_file: str, required
+    :param metadata: Metadata of the archive, as returned by archive.get_info_from_archive
+    :type metadata: dict, required
+    :return: Sorted terms for each field in INDEX_FIELDS
+    :rtype: dict
+    """
+    terms = dict()
+    for field in INDEX_FIELDS:
+        values = set()
+        for key in INDEX_FIELDS[field]:
+            value = metadata[key]
+            if value is None:
+                continue
+            if not isinstance(value, list):
+                value = [value]
+            values.update([str(item).strip().lower() for item in value if not str(item).strip() == ""])
+        terms[field] = sorted(values)
+    terms["type"] = [html_string_tools.get_extension(archive_file).lower()[1:]]
+    return terms
+
+def get_empty_index(directory:str) -> dict:
+    """
+    Returns a new query index with no archives in it.
+    Each archive has an id, and the posting list for each term of each field is the set of ids of archives with that term.
+
+    :param directory: Directory the index is for
+    :type directory: str, required
+    :return: Index with "directory", "next_id", "files", "paths", "postings", "dates", and "terms" keys
+    :rtype: dict
+    """
+    index = {"directory":abspath(directory), "next_id":0, "files":dict(), "paths":dict()}
+    index["postings"] = {field:dict() for field in INDEX_FIELDS}
+    index["dates"] = []
+    index["terms"] = dict()
+    return index
+
+def read_index(index_file:str, directory:str) -> dict:
+    """
+    Reads a query index from disk.
+    A new index is returned if the file is missing, unreadable, or from a different version.
+
+    :param index_file: Path of the index file
+    :type index_file: str, required
+    :param directory: Directory the index is for
+    :type directory: str, required
+    :return: Index, as returned by get_empty_index
+    :rtype: dict
+    """
+    try:
+        with open(index_file, "r", encoding="UTF-8") as in_file:
+            contents = json.load(in_file)
+        assert contents["version"] == INDEX_VERSION
+        assert contents["directory"] == abspath(directory)
+        index = get_empty_index(directory)
+        index["next_id"] = contents["next_id"]
+        for path, entry in contents["files"].items():
+            index["files"][path] = {"id":entry[0], "size":entry[1], "mtime":entry[2], "date":entry[3]}
+            index["paths"][entry[0]] = path
+            if entry[3] is not None:
+                index["dates"].append((entry[3], entry[0]))
+        index["dates"].sort()
+        for field in INDEX_FIELDS:
+            for term, ids in contents["postings"][field].items():
+                index["postings"][field][term] = set(ids)
+        # The terms of each archive are only needed when archives change
+        index["terms"] = None
+        return index
+    except (OSError, ValueError, KeyError, TypeError, IndexError, AssertionError): return get_empty_index(directory)
+
+def write_index(index:dict, index_file:str):
+    """
+    Writes a query index to disk, replacing the old index only once the new one is complete.
+
+    :param index: Index to write, as returned by get_empty_index
+    :type index: dict, required
+    :param index_file: Path of the index file
+    :type index_file: str, required
+    """
+    contents = {"version":INDEX_VERSION, "directory":index["directory"], "next_id":index["next_id"]}
+    contents["files"] = dict()
+    for path, entry in index["files"].items():
+        contents["files"][path] = [entry["id"], entry["size"], entry["mtime"], entry["date"]]
+    contents["postings"] = dict()
+    for field in INDEX_FIELDS:
+        contents["postings"][field] = {term:sorted(ids) for term, ids in index["postings"][field].items()}
+    os.makedirs(abspath(join(index_file, os.pardir)), exist_ok=True)
+    temp_file = f"{index_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w", encoding="UTF-8") as out_file:
+        json.dump(contents, out_file, separators=(",", ":"))
+    os.replace(temp_file, index_file)
+
+def get_file_terms(index:dict) -> dict:
+    """
+    Returns the indexed terms of each archive, keyed by archive id.
+    The terms aren't saved with the index, so they are gathered from the posting lists the first time they are needed.
+
+    :param index: Index to get terms from, as returned by get_empty_index
+    :type index: dict, required
+    :return: Terms of each archive, keyed by field
+    :rtype: dict
+    """
+    if index["terms"] is None:
+        index["terms"] = dict()
+        for field in INDEX_FIELDS:
+            for term, ids in index["postings"][field].items():
+                for file_id in ids:
+                    index["terms"].setdefault(file_id, dict()).setdefault(field, []).append(term)
+    return index["terms"]
+
+def remove_from_index(index:dict, archive_file:str):
+    """
+    Removes an archive and its terms from a query index.
+
+    :param index: Index to remove the archive from
+    :type index: dict, required
+    :param archive_file: Path of the archive file
+    :type archive_file: str, required
+    """
+    entry = index["files"].pop(archive_file, None)
+    if entry is None:
+        return
+    index["paths"].pop(entry["id"], None)
+    terms = get_file_terms(index).pop(entry["id"], dict())
+    for field, field_terms in terms.items():
+        for term in field_terms:
+            ids = index["postings"][field].get(term)
+            if ids is None:
+                continue
+            ids.discard(entry["id"])
+            if len(ids) == 0:
+                del index["postings"][field][term]
+    if entry["date"] is not None:
+        position = bisect.bisect_left(index["dates"], (entry["date"], entry["id"]))
+        if position < len(index["dates"]) and index["dates"][position] == (entry["date"], entry["id"]):
+            del index["dates"][position]
+
+def add_to_index(index:dict, archive_file:str, metadata:dict, stat:os.stat_result):
+    """
+    Adds an archive and its terms to a query index, replacing any existing entry for the archive.
+
+    :param index: Index to add the archive to
+    :type index: dict, required
+    :param archive_file: Path of the archive file
+    :type archive_file: str, required
+    :param metadata: Metadata of the archive, as returned by archive.get_info_from_archive
+    :type metadata: dict, required
+    :param stat: Status of the archive file when its metadata was read
+    :type stat: os.stat_result, required
+    """
+    remove_from_index(index, archive_file)
+    file_id = index["next_id"]
+    index["next_id"] += 1
+    terms = get_index_terms(archive_file, metadata)
+    date = metadata["date"]
+    index["files"][archive_file] = {"id":file_id, "size":stat.st_size, "mtime":stat.st_mtime_ns, "date":date}
+    index["paths"][file_id] = archive_file
+    get_file_terms(index)[file_id] = terms
+    for field, field_terms in terms.items():
+        for term in field_terms:
+            index["postings"][field].setdefault(term, set()).add(file_id)
+    if date is not None:
+        bisect.insort(index["dates"], (date, file_id))
+
+def read_index_entry(archive_file:str) -> tuple:
+    """
+    Reads the status and metadata of an archive to add to a query index, for use in a pipeline stage.
+
+    :param archive_file: Path of the archive file
+    :type archive_file: str, required
+    :return: Status of the archive file and its metadata
+    :rtype: tuple
+    """
+    stat = os.stat(archive_file)
+    return (stat, mm_archive.get_info_from_archive(archive_file))
+
+def refresh_index(directory:str, index_file:str=None, rebuild:bool=False, workers:int=None) -> dict:
+    """
+    Brings the query index for a directory up to date and saves it.
+    Only archives that are new or whose size or modification time changed are read again.
+    Archives that no longer exist are removed from the index.
+
+    :param directory: Directory of archives to index
+    :type directory: str, required
+    :param index_file: Path of the index file, defaults to the file from get_index_file
+    :type index_file: str, optional
+    :param rebuild: Whether to read every archive again instead of only the changed ones, defaults to False
+    :type rebuild: bool, optional
+    :param workers: Number of archives to read at once, defaults to 4
+    :type workers: int, optional
+    :return: The refreshed index, as returned by get_empty_index
+    :rtype: dict
+    """
+    # Read the existing index
+    full_directory = abspath(directory)
+    if index_file is None:
+        index_file = get_index_file(full_directory)
+    index = get_empty_index(full_directory) if rebuild else read_index(index_file, full_directory)
+    # Find the archives that changed since the last refresh
+    archive_files = mm_file_tools.find_files_of_type(full_directory, mm_archive.ARCHIVE_EXTENSIONS)
+    archive_set = set(archive_files)
+    changed = []
+    for archive_file in archive_files:
+        entry = index["files"].get(archive_file)
+        try:
+            stat = os.stat(archive_file)
+            if entry is None or not entry["size"] == stat.st_size or not entry["mtime"] == stat.st_mtime_ns:
+                changed.append(archive_file)
+        except OSError: continue
+    removed = [archive_file for archive_file in index["files"] if archive_file not in archive_set]
+    if len(changed) == 0 and len(removed) == 0 and exists(index_file):
+        return index
+    # Remove archives that no longer exist
+    for archive_file in removed:
+        remove_from_index(index, archive_file)
+    # Read the metadata of the changed archives
+    progress = tqdm.tqdm(total=len(changed), disable=len(changed) == 0)
+    def add(archive_file:str, result):
+        progress.update(1)
+        if isinstance(result, Exception):
+            remove_from_index(index, archive_file)
+        else:
+            add_to_index(index, archive_file, result[1], result[0])
+    stages = [mm_pipeline.get_stage(read_index_entry)]
+    mm_pipeline.run_pipeline(changed, stages, add, io_workers=workers)
+    progress.close()
+    # Save the index
+    write_index(index, index_file)
+    return index
+
+def get_query_tokens(query:str) -> List[str]:
+    """
+    Splits a query into its terms, operators, and parentheses.
+
+    :param query: Query text
+    :type query: str, required
+    :return: Tokens of the query
+    :rtype: List[str]
+    """
+    regex = r"\(|\)|[^\s()\"]*\"[^\"]*\"|[^\s()]+"
+    return re.findall(regex, query)
+
+def parse_query(query:str) -> list:
+    """
+    Parses a boolean query into a tree of operations.
+    Terms are written as field:value, such as tag:sketch or artist:"Some Name".
+    Dates are compared with date<, date<=, date>, date>=, or date: and a full or partial YYYY-MM-DD date.
+    Terms are joined with AND, OR, and NOT and grouped with parentheses, and terms with no operator between them are joined with AND.
+    A value without a field matches any of the tag, artist, writer, publisher, and series fields.
+
+    :param query: Query text
+    :type query: str, required
+    :return: Tree with lists of the form ["and", a, b], ["or", a, b], ["not", a], ["term", field, value], or ["date", operator, value]
+    :rtype: list
+    """
+    tokens = get_query_tokens(query)
+    position = 0
+    def peek() -> str:
+        return tokens[position].upper() if position < len(tokens) else None
+    def parse_or() -> list:
+        nonlocal position
+        tree = parse_and()
+        while peek() == "OR":
+            position += 1
+            tree = ["or", tree, parse_and()]
+        return tree
+    def parse_and() -> list:
+        nonlocal position
+        tree = parse_not()
+        while peek() is not None and not peek() in ["OR", ")"]:
+            if peek() == "AND":
+                position += 1
+            tree = ["and", tree, parse_not()]
+        return tree
+    def parse_not() -> list:
+        nonlocal position
+        if peek() == "NOT":
+            position += 1
+            return ["not", parse_not()]
+        if peek() == "(":
+            position += 1
+            tree = parse_or()
+            if not peek() == ")":
+                raise ValueError("Missing closing parenthesis.")
+            position += 1
+            return tree
+        if peek() is None or peek() in ["AND", "OR", ")"]:
+            raise ValueError("Missing query term.")
+        token = tokens[position]
+        position += 1
+        return get_query_term(token)
+    tree = parse_or()
+    if position < len(tokens):
+        raise ValueError(f"Unexpected \"{tokens[position]}\" in query.")
+    return tree
+
+def get_query_term(token:str) -> list:
+    """
+    Returns the operation for a single term of a query.
+
+    :param token: Query term, such as tag:sketch or date>=2020
+    :type token: str, required
+    :return: Operation of the form ["term", field, value] or ["date", operator, value]
+    :rtype: list
+    """
+    match = re.match(r"^([a-z_]+)(<=|>=|<|>|=|:)(.*)$", token, flags=re.IGNORECASE)
+    if match is None:
+        return ["term", None, token.strip("\"").strip().lower()]
+    field = match.group(1).lower()
+    value = match.group(3).strip("\"").strip()
+    if field == "date":
+        if len(re.findall(r"^[0-9]{4}(?:-[0-9]{2}(?:-[0-9]{2})?)?$", value)) == 0:
+            raise ValueError(f"Invalid date \"{value}\", use YYYY, YYYY-MM, or YYYY-MM-DD.")
+        return ["date", match.group(2), value]
+    if field not in INDEX_FIELDS or not match.group(2) in [":", "="]:
+        raise ValueError(f"Invalid query term \"{token}\".")
+    return ["term", field, value.lower()]
+
+def get_date_ids(index:dict, operator:str, value:str) -> set:
+    """
+    Returns the ids of the archives with dates in the given range.
+    Partial dates cover the whole year or month, so date>2020 is after the end of 2020.
+
+    :param index: Index to search, as returned by get_empty_index
+    :type index: dict, required
+    :param operator: Comparison operator, one of <, <=, >, >=, =, or :
+    :type operator: str, required
+    :param value: Full or partial YYYY-MM-DD date
+    :type value: str, required
+    :return: Ids of the matching archives
+    :rtype: set
+    """
+    start = (value + "-00-00")[:10]
+    end = (value + "-99-99")[:10]
+    dates = index["dates"]
+    low, high = 0, len(dates)
+    if operator in ["<", "<=", "=", ":"]:
+        high = bisect.bisect_left(dates, (start if operator == "<" else end + "~",))
+    if operator in [">", ">=", "=", ":"]:
+        low = bisect.bisect_left(dates, (end + "~" if operator == ">" else start,))
+    return set([date[1] for date in dates[low:high]])
+
+def get_query_ids(index:dict, tree:list) -> set:
+    """
+    Returns the ids of the archives matching a parsed query, using the index's posting lists.
+
+    :param index: Index to search, as returned by get_empty_index
+    :type index: dict, required
+    :param tree: Parsed query, as returned by parse_query
+    :type tree: list, required
+    :return: Ids of the matching archives
+    :rtype: set
+    """
+    if tree[0] == "and":
+        left = get_query_ids(index, tree[1])
+        if len(left) == 0:
+            return left
+        return left.intersection(get_query_ids(index, tree[2]))
+    if tree[0] == "or":
+        return get_query_ids(index, tree[1]).union(get_query_ids(index, tree[2]))
+    if tree[0] == "not":
+        return set(index["paths"]).difference(get_query_ids(index, tree[1]))
+    if tree[0] == "date":
+        return get_date_ids(index, tree[1], tree[2])
+    fields = DEFAULT_FIELDS if tree[1] is None else [tree[1]]
+    ids = set()
+    for field in fields:
+        ids.update(index["postings"][field].get(tree[2], set()))
+    return ids
+
+def run_query(index:dict, query:str) -> List[str]:
+    """
+    Returns the archives in an index that match a boolean query, as described in parse_query.
+
+    :param index: Index to search, as returned by refresh_index
+    :type index: dict, required
+    :param query: Query text
+    :type query: str, required
+    :return: Paths of the matching archives, sorted alphanumerically
+    :rtype: List[str]
+    """
+    ids = get_query_ids(index, parse_query(query))
+    return mm_sort.sort_alphanum([index["paths"][file_id] for file_id in ids])
+
+def main():
+    """
+    Sets up the parser for searching archive metadata.
+    """
+    # Set up argument parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            "query",
+            help="Query such as 'rating:X18+ AND type:cbz AND artist:\"A\" AND tag:T AND date>2020'",
+            nargs="+",
+            type=str)
+    parser.add_argument(
+            "-d",
+            "--directory",
+            help="Directory of archives to search.",
+            type=str,
+            default=str(os.getcwd()))
+    parser.add_argument(
+            "-r",
+            "--rebuild",
+            help="Read every archive again instead of only the changed ones.",
+            action="store_true")
+    parser.add_argument(
+            "-n",
+            "--no-refresh",
+            help="Search the existing index without checking for changed archives.",
+            action="store_true")
+    parser.add_argument(
+            "-w",
+            "--workers",
+            help="Number of archives to read at once when refreshing the index.",
+            type=int,
+            default=None)
+    args = parser.parse_args()
+    # Check that directory is valid
+    directory = abspath(args.directory)
+    if not exists(directory):
+        python_print_tools.color_print("Invalid directory.", "red")
+        return
+    # Get the index
+    if args.no_refresh and not args.rebuild:
+        index = read_index(get_index_file(directory), directory)
+    else:
+        index = refresh_index(directory, rebuild=args.rebuild, workers=args.workers)
+    # Run the query
+    start = time.perf_counter()
+    try:
+        results = run_query(index, " ".join(args.query))
+    except ValueError as error:
+        python_print_tools.color_print(str(error), "red")
+        return
+    elapsed = time.perf_counter() - start
+    if len(results) > 0:
+        python_print_tools.print_files(directory, results)
+    python_print_tools.color_print(f"{len(results)} of {len(index['files'])} archives matched in {elapsed * 1000:.1f} ms.", "green")
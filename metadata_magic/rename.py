@@ -74,20 +74,20 @@ def get_file_friendly_text(string:str, ascii_only:bool=False) -> str:
     # Return the modified string
     return new_string
     
-def get_available_filename(source_files:List[str], filename:str, end_path:str, ascii_only:bool=False) -> str:
+def get_unused_filename(source_files:List[str], filename:str, used_files:set, ascii_only:bool=False) -> str:
     """
-    Returns a filename not already taken in a given directory.
+    Returns a filename not already in a given set of used filenames.
     The given disired filename will be slightly modified if already taken.
 
     :param source_files: File(s) with extensions to use when checking for existing files
     :type source_files: List[str]/str, required
     :param filename: The desired filename (without extension)
     :type filename: str, required
-    :param end_path: The path of the directory with files to check against
-    :type end_path: str, required
+    :param used_files: Lowercase filenames, with extensions, that are already taken
+    :type used_files: set, required
     :param ascii_only: Whether to only allow basic ASCII characters in the filename, defaults to False
     :type ascii_only:bool, optional
-    :return: Filename that is available to be used in the given directory
+    :return: Filename that isn't already used
     :rtype: str
     """
     # Get the file friendly version of the desired filename
@@ -99,25 +99,43 @@ def get_available_filename(source_files:List[str], filename:str, end_path:str, a
             extensions.append(html_string_tools.get_extension(source_file))
     else:
         extensions = [html_string_tools.get_extension(source_files)]
-    # Get a list of all the files in the end path
-    try:
-        files = []
-        for file in os.listdir(abspath(end_path)):
-            files.append(file.lower())
-    except FileNotFoundError:
-        return None
     # Get the new filename that is available
     base = new_filename
     append_num = 1
     while True:
         try:
             for extension in extensions:
-                assert not (f"{new_filename}{extension}").lower() in files
+                assert not (f"{new_filename}{extension}").lower() in used_files
             return new_filename
         except AssertionError:
             append_num += 1
             new_filename = f"{base}-{append_num}"
 
+def get_available_filename(source_files:List[str], filename:str, end_path:str, ascii_only:bool=False) -> str:
+    """
+    Returns a filename not already taken in a given directory.
+    The given disired filename will be slightly modified if already taken.
+
+    :param source_files: File(s) with extensions to use when checking for existing files
+    :type source_files: List[str]/str, required
+    :param filename: The desired filename (without extension)
+    :type filename: str, required
+    :param end_path: The path of the directory with files to check against
+    :type end_path: str, required
+    :param ascii_only: Whether to only allow basic ASCII characters in the filename, defaults to False
+    :type ascii_only:bool, optional
+    :return: Filename that is available to be used in the given directory
+    :rtype: str
+    """
+    # Get a list of all the files in the end path
+    try:
+        files = set()
+        for file in os.listdir(abspath(end_path)):
+            files.add(file.lower())
+    except FileNotFoundError:
+        return None
+    return get_unused_filename(source_files, filename, files, ascii_only)
+
 def rename_file(file:str, new_filename:str, ascii_only:bool=False) -> str:
     """
     Renames a given file to a given filename.
@@ -196,6 +214,7 @@ def rename_json_pairs(path:str, template:str, config:str, ascii_only:bool=False)
     """ 
     # Get all JSON pairs
     pairs = mm_meta_finder.get_pairs(path)
+    template_keys = mm_meta_reader.get_template_keys(template)
     # Run through each pair
     print("Renaming JSON and media files:")
     for pair in tqdm.tqdm(pairs):
@@ -203,7 +222,7 @@ def rename_json_pairs(path:str, template:str, config:str, ascii_only:bool=False)
         json = pair["json"]
         media = pair["media"]
         # Get the base filename
-        metadata = mm_meta_reader.load_metadata(json, config, media)
+        metadata = mm_meta_reader.load_metadata(json, config, media, template_keys=template_keys)
         filename = get_string_from_metadata(metadata, template)
         # Don't rename if the filename is already correct or metadata can't be found
         try:
@@ -1,18 +1,36 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import json
 import shutil
 import tempfile
+import subprocess
 import metadata_magic.test as mm_test
 import metadata_magic.config as mm_config
+import metadata_magic.meta_finder as mm_meta_finder
 import metadata_magic.file_tools as mm_file_tools
 import metadata_magic.archive as mm_archive
 import metadata_magic.archive.epub as mm_epub
 import metadata_magic.archive.mkv as mm_mkv
 import metadata_magic.archive.comic_archive as mm_comic_archive
-from os.path import abspath, join
+from os.path import abspath, exists, join
 from PIL import Image
 
+def test_lazy_imports():
+    """
+    Tests that heavy dependencies aren't loaded just by importing the command modules.
+    """
+    code = "import sys, json; before = set(sys.modules); "
+    code = code + "import metadata_magic.archive, metadata_magic.rename, metadata_magic.error; "
+    code = code + "print(json.dumps(sorted(set(sys.modules) - before)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    loaded = json.loads(result.stdout)
+    heavy = ["PIL", "html5lib", "ffmpeg", "cover_generator", "metadata_magic.archive.epub",
+            "metadata_magic.archive.mkv", "metadata_magic.archive.comic_archive"]
+    assert [module for module in loaded if module.split(".")[0] in heavy or module in heavy] == []
+    assert "metadata_magic.archive.archive" in loaded
+
 def test_get_directory_archive_type():
     """
     Tests the get_directory_archive_type function.
@@ -97,6 +115,21 @@ def test_get_info_from_jsons():
         assert metadata["age_rating"] == "Unknown"
         assert metadata["page_count"] is None
 
+def test_get_info_from_pairs():
+    """
+    Tests the get_info_from_pairs function.
+    """
+    # Test getting metadata from a single pair
+    config = mm_config.get_config([])
+    pairs = mm_meta_finder.get_pairs(mm_test.PAIR_TEXT_DIRECTORY, print_info=False)
+    metadata = mm_archive.get_info_from_pairs([pairs[0]], config)
+    assert metadata["title"] == "HTML"
+    assert metadata["writers"] == ["AAA"]
+    assert metadata["description"] == "Nothing special!"
+    assert metadata["age_rating"] == "Unknown"
+    # Test getting metadata from no pairs
+    assert mm_archive.get_info_from_pairs([], config) == mm_archive.get_empty_metadata()
+
 def test_get_info_from_archive():
     """
     Tests the get_info_from_archive function.
@@ -345,3 +378,118 @@ def test_generate_cover_image():
         assert os.listdir(temp_dir) == ["cover_image.jpg"]
         image = Image.open(image_file)
         assert image.size == (900, 1200)
+
+def test_generate_cover_images():
+    """
+    Tests the generate_cover_images function.
+    """
+    original = os.environ.get("METADATA_MAGIC_COVER_CACHE")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ["METADATA_MAGIC_COVER_CACHE"] = abspath(join(temp_dir, "cache"))
+            # Test rendering multiple covers in the worker pool
+            covers = []
+            covers.append({"title":"First", "authors":["Person"], "path":abspath(join(temp_dir, "first.jpg"))})
+            covers.append({"title":"Second", "authors":None, "path":abspath(join(temp_dir, "second.png"))})
+            covers.append({"title":"First", "authors":["Person"], "path":abspath(join(temp_dir, "third.jpg"))})
+            assert mm_archive.generate_cover_images(covers, workers=2) == [True, True, True]
+            for cover in covers:
+                image = Image.open(cover["path"])
+                assert image.size == (900, 1200)
+            assert len(os.listdir(abspath(join(temp_dir, "cache")))) == 2
+            # Test that submitted covers are used by generate_cover_image
+            mm_archive.submit_cover_images([{"title":"Submitted", "authors":["Person"]}])
+            image_file = abspath(join(temp_dir, "submitted.jpg"))
+            assert mm_archive.generate_cover_image("Submitted", ["Person"], image_file)
+            image = Image.open(image_file)
+            assert image.size == (900, 1200)
+            assert len(os.listdir(abspath(join(temp_dir, "cache")))) == 3
+            mm_archive.shutdown_cover_pool()
+    finally:
+        os.environ.pop("METADATA_MAGIC_COVER_CACHE")
+        if original is not None:
+            os.environ["METADATA_MAGIC_COVER_CACHE"] = original
+
+def test_read_manifest():
+    """
+    Tests the read_manifest function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test reading a JSON manifest
+        manifest_file = abspath(join(temp_dir, "manifest.json"))
+        entries = [{"directory":"first", "title":"First", "tags":["A", "B"]}, {"directory":"/other/second", "cover":True}]
+        mm_file_tools.write_text_file(manifest_file, json.dumps(entries))
+        entries = mm_archive.read_manifest(manifest_file)
+        assert entries == [{"directory":abspath(join(temp_dir, "first")), "title":"First", "tags":["A", "B"]},
+                {"directory":"/other/second", "cover":True}]
+        # Test reading a CSV manifest
+        manifest_file = abspath(join(temp_dir, "manifest.csv"))
+        text = "directory,title,tags,cover,score\nfirst,First,\"A, B ,C\",yes,\nsecond,,,no,4\n"
+        mm_file_tools.write_text_file(manifest_file, text)
+        entries = mm_archive.read_manifest(manifest_file)
+        assert entries == [{"directory":abspath(join(temp_dir, "first")), "title":"First", "tags":["A", "B", "C"], "cover":True},
+                {"directory":abspath(join(temp_dir, "second")), "cover":False, "score":"4"}]
+        # Test reading a manifest with a missing directory
+        mm_file_tools.write_text_file(manifest_file, "title\nFirst\n")
+        try:
+            mm_archive.read_manifest(manifest_file)
+            assert 1 == 0
+        except ValueError: pass
+        # Test reading JSON manifests without a list of entries
+        manifest_file = abspath(join(temp_dir, "manifest.json"))
+        mm_file_tools.write_text_file(manifest_file, json.dumps({"entries":[{"directory":"first"}]}))
+        assert mm_archive.read_manifest(manifest_file) == [{"directory":abspath(join(temp_dir, "first"))}]
+        for text in [json.dumps({"other":[]}), "[{\"directory\":", json.dumps("first")]:
+            mm_file_tools.write_text_file(manifest_file, text)
+            try:
+                mm_archive.read_manifest(manifest_file)
+                assert 1 == 0
+            except ValueError: pass
+
+def test_archive_manifest():
+    """
+    Tests the archive_manifest function.
+    """
+    config = mm_config.get_config([])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Create directories to archive
+        image_directory = abspath(join(temp_dir, "images"))
+        os.mkdir(image_directory)
+        shutil.copy(abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "bare.png")), image_directory)
+        shutil.copy(abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "bare.PNG.json")), image_directory)
+        text_directory = abspath(join(temp_dir, "text"))
+        shutil.copytree(mm_test.PAIR_TEXT_DIRECTORY, text_directory)
+        manifest = [{"directory":"images", "title":"Batch CBZ", "artists":["Person"], "score":"4", "remove_files":True},
+                {"directory":"text", "title":"Batch EPUB", "date":"2020-01-02", "chapters":["One", "Two"]},
+                {"directory":"missing"}]
+        manifest_file = abspath(join(temp_dir, "manifest.json"))
+        mm_file_tools.write_text_file(manifest_file, json.dumps(manifest))
+        # Test archiving every directory in the manifest
+        results = mm_archive.archive_manifest(manifest_file, config, workers=2)
+        assert len(results) == 3
+        assert results[0]["error"] is None
+        assert results[0]["archive"] == abspath(join(image_directory, "Batch CBZ.cbz"))
+        assert os.listdir(image_directory) == ["Batch CBZ.cbz"]
+        metadata = mm_archive.get_info_from_archive(results[0]["archive"])
+        assert metadata["title"] == "Batch CBZ"
+        assert metadata["artists"] == ["Person"]
+        assert metadata["writers"] == ["Person"]
+        assert metadata["score"] == "4"
+        assert results[1]["error"] is None
+        assert results[1]["archive"] == abspath(join(text_directory, "Batch EPUB.epub"))
+        metadata = mm_archive.get_info_from_archive(results[1]["archive"])
+        assert metadata["title"] == "Batch EPUB"
+        assert metadata["date"] == "2020-01-02"
+        assert exists(abspath(join(text_directory, "text 1.htm")))
+        # Test that failed entries are reported
+        assert results[2]["directory"] == abspath(join(temp_dir, "missing"))
+        assert results[2]["error"] == "Invalid directory."
+        # Test optimizing images when archiving
+        os.remove(results[0]["archive"])
+        shutil.copy(abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "bare.png")), image_directory)
+        shutil.copy(abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "bare.PNG.json")), image_directory)
+        mm_file_tools.write_text_file(manifest_file, json.dumps([manifest[0]]))
+        results = mm_archive.archive_manifest(manifest_file, config, optimize="lossless", processes=1)
+        assert results[0]["error"] is None
+        assert results[0]["optimization"]["images"] == 1
+        assert exists(results[0]["archive"])
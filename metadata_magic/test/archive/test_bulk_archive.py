@@ -5,6 +5,7 @@ import shutil
 import tempfile
 import metadata_magic.test as mm_test
 import metadata_magic.config as mm_config
+import metadata_magic.journal as mm_journal
 import metadata_magic.file_tools as mm_file_tools
 import metadata_magic.archive as mm_archive
 import metadata_magic.archive.epub as mm_epub
@@ -129,6 +130,63 @@ def test_archive_all_media():
         mm_bulk_archive.archive_all_media(image_directory, config, description_length=2000000)
         assert sorted(os.listdir(image_directory)) == [".empty", "aaa.json", "aaa.webp", "bare.PNG.cbz", "long.cbz"]
 
+def test_resume_archive_all_media():
+    """
+    Tests resuming the archive_all_media function after an interrupted run.
+    """
+    config = mm_config.get_config([])
+    old_journal = os.environ.get("METADATA_MAGIC_JOURNAL")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ["METADATA_MAGIC_JOURNAL"] = abspath(join(temp_dir, "journals"))
+            image_directory = abspath(join(temp_dir, "images"))
+            shutil.copytree(mm_test.PAIR_IMAGE_DIRECTORY, image_directory)
+            # Simulate a run that died while writing one archive and after finishing another
+            journal_file = mm_journal.get_journal_file("bulk-archive", image_directory)
+            run = {"format_title":False, "description_length":1000}
+            journal = mm_journal.open_journal(journal_file, run)
+            partial_file = abspath(join(image_directory, "bare.PNG.cbz"))
+            with open(partial_file, "w", encoding="UTF-8") as out_file:
+                out_file.write("Partial archive")
+            info = {"json":abspath(join(image_directory, "bare.PNG.json")), "archive":partial_file, "temp_dir":None}
+            mm_journal.write_journal_entry(journal, abspath(join(image_directory, "bare.png")), "started", info)
+            mm_journal.write_journal_entry(journal, abspath(join(image_directory, "long.JPG")), "done")
+            mm_journal.close_journal(journal)
+            # Test that the partial archive is rolled back and redone, and finished pairs are skipped
+            assert mm_bulk_archive.archive_all_media(image_directory, config, resume=True)
+            assert sorted(os.listdir(image_directory)) == [".empty", "aaa.json", "aaa.webp",
+                    "bare.PNG.cbz", "long.JPG", "long.JSON"]
+            assert mm_comic_archive.get_info_from_cbz(partial_file)["title"] == "Émpty"
+            # Test that the journal is removed once the run finishes
+            assert not os.path.exists(journal_file)
+            # Simulate a run that died while removing the originals of a finished archive
+            journal = mm_journal.open_journal(journal_file, run)
+            info = {"json":abspath(join(image_directory, "long.JSON")),
+                    "archive":abspath(join(image_directory, "long.epub")), "temp_dir":None}
+            shutil.copy(partial_file, info["archive"])
+            os.remove(info["json"])
+            mm_journal.write_journal_entry(journal, abspath(join(image_directory, "long.JPG")), "started", info)
+            mm_journal.close_journal(journal)
+            # Test that the remaining originals are removed
+            assert mm_bulk_archive.archive_all_media(image_directory, config, resume=True)
+            assert sorted(os.listdir(image_directory)) == [".empty", "aaa.json", "aaa.webp", "bare.PNG.cbz", "long.epub"]
+            # Test that starting over without resuming still rolls back an unfinished archive
+            shutil.copy(abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "long.JPG")), abspath(join(image_directory, "long.JPG")))
+            shutil.copy(abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "long.JSON")), abspath(join(image_directory, "long.JSON")))
+            journal = mm_journal.open_journal(journal_file, run)
+            info = {"json":abspath(join(image_directory, "long.JSON")),
+                    "archive":abspath(join(image_directory, "long.epub")), "temp_dir":None}
+            mm_journal.write_journal_entry(journal, abspath(join(image_directory, "long.JPG")), "started", info)
+            mm_journal.close_journal(journal)
+            assert mm_bulk_archive.archive_all_media(image_directory, config)
+            assert sorted(os.listdir(image_directory)) == [".empty", "aaa.json", "aaa.webp", "bare.PNG.cbz", "long.epub"]
+            assert mm_epub.get_info_from_epub(info["archive"])["title"] is not None
+    finally:
+        if old_journal is None:
+            os.environ.pop("METADATA_MAGIC_JOURNAL", None)
+        else:
+            os.environ["METADATA_MAGIC_JOURNAL"] = old_journal
+
 def test_extract_cbz():
     """
     Tests the extract_cbz function
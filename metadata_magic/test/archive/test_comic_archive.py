@@ -8,20 +8,116 @@ import metadata_magic.file_tools as mm_file_tools
 import metadata_magic.archive as mm_archive
 import metadata_magic.archive.comic_xml as mm_comic_xml
 import metadata_magic.archive.comic_archive as mm_comic_archive
+import metadata_magic.archive.image_tools as mm_image_tools
+import metadata_magic.zip_tools as mm_zip_tools
 from os.path import abspath, exists, join
+from PIL import Image
+
+def test_get_cbz_entries():
+    """
+    Tests the get_cbz_entries function.
+    """
+    # Test getting entries for files in the top directory, ignoring dotfiles
+    entries = mm_comic_archive.get_cbz_entries(mm_test.PAIR_IMAGE_DIRECTORY)
+    assert len(entries) == 6
+    assert entries[0] == (abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "aaa.json")), "aaa.json")
+    assert entries[5] == (abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "long.JSON")), "long.JSON")
+    # Test getting entries inside an internal folder
+    entries = mm_comic_archive.get_cbz_entries(mm_test.PAIR_IMAGE_DIRECTORY, "Folder")
+    assert entries[1] == (abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "aaa.webp")), "Folder/aaa.webp")
+    # Test getting entries from subdirectories, ignoring existing metadata
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sub_directory = abspath(join(temp_dir, "sub"))
+        shutil.copytree(mm_test.PAIR_IMAGE_DIRECTORY, sub_directory)
+        mm_file_tools.write_text_file(abspath(join(temp_dir, "ComicInfo.xml")), "AAA")
+        entries = mm_comic_archive.get_cbz_entries(temp_dir)
+        assert len(entries) == 7
+        assert entries[0] == (sub_directory, "sub")
+        assert entries[3] == (abspath(join(sub_directory, "bare.png")), "sub/bare.png")
+
+def test_get_page_count():
+    """
+    Tests the get_page_count function.
+    """
+    entries = mm_comic_archive.get_cbz_entries(mm_test.PAIR_IMAGE_DIRECTORY)
+    assert mm_comic_archive.get_page_count(entries) == 2
+    assert mm_comic_archive.get_page_count([("/a/b.gif", "c.txt"), ("/a/b.txt", "c.JPEG")]) == 1
+    assert mm_comic_archive.get_page_count([]) == 0
+
+def test_write_cbz():
+    """
+    Tests the write_cbz function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test writing a CBZ file straight from source files
+        extract_directory = abspath(join(temp_dir, "extract"))
+        os.mkdir(extract_directory)
+        entries = [(abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "bare.png")), "Title/Title.png")]
+        entries.append((abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "bare.PNG.json")), "Title/Title.json"))
+        metadata = mm_archive.get_empty_metadata()
+        metadata["title"] = "Written"
+        metadata["page_count"] = "1"
+        cbz_file = abspath(join(temp_dir, "written.cbz"))
+        xml = mm_comic_xml.get_comic_xml(metadata)
+        assert mm_comic_archive.write_cbz(entries, cbz_file, xml) == cbz_file
+        assert sorted(os.listdir(temp_dir)) == ["extract", "written.cbz"]
+        assert mm_file_tools.extract_zip(cbz_file, extract_directory)
+        assert sorted(os.listdir(extract_directory)) == ["ComicInfo.xml", "Title"]
+        files = sorted(os.listdir(abspath(join(extract_directory, "Title"))))
+        assert files == ["Title.json", "Title.png"]
+        read_meta = mm_comic_xml.read_comic_info(abspath(join(extract_directory, "ComicInfo.xml")))
+        assert read_meta["title"] == "Written"
+        assert read_meta["page_count"] == "1"
+        # Test writing a CBZ file with missing source files
+        entries = [(abspath(join(temp_dir, "non-existant.png")), "image.png")]
+        assert mm_comic_archive.write_cbz(entries, abspath(join(temp_dir, "fail.cbz"))) is None
+        assert sorted(os.listdir(temp_dir)) == ["extract", "written.cbz"]
+
+def test_optimize_cbz_entries():
+    """
+    Tests the optimize_cbz_entries function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_directory = abspath(join(temp_dir, "source"))
+        os.mkdir(source_directory)
+        optimize_directory = abspath(join(temp_dir, "optimize"))
+        os.mkdir(optimize_directory)
+        gray = Image.linear_gradient("L").convert("RGB")
+        for filename in ["01.bmp", "02.BMP", "03.png"]:
+            gray.save(abspath(join(source_directory, filename)))
+        mm_file_tools.write_text_file(abspath(join(source_directory, "02.png")), "Taken")
+        entries = [(abspath(join(source_directory, filename)), f"Comic/{filename}")
+                for filename in ["01.bmp", "02.BMP", "02.png", "03.png"]]
+        # Test optimizing the pages, keeping names that would conflict
+        stats = mm_image_tools.get_empty_optimization_stats()
+        optimized = mm_comic_archive.optimize_cbz_entries(entries, optimize_directory, "lossless", workers=2, stats=stats)
+        assert [entry[1] for entry in optimized] == ["Comic/01.png", "Comic/02.BMP", "Comic/02.png", "Comic/03.png"]
+        assert optimized[0][0] == abspath(join(optimize_directory, "0.png"))
+        assert optimized[1] == entries[1]
+        assert optimized[2] == entries[2]
+        assert optimized[3][0] == abspath(join(optimize_directory, "3.png"))
+        assert stats["images"] == 4
+        assert stats["optimized"] == 2
+        original_sizes = [os.stat(entry[0]).st_size for entry in entries]
+        assert stats["size"] == sum(original_sizes)
+        new_sizes = [os.stat(optimized[0][0]).st_size, original_sizes[1], original_sizes[2], os.stat(optimized[3][0]).st_size]
+        assert stats["new_size"] == sum(new_sizes)
+        # Test optimizing in the current process
+        optimized = mm_comic_archive.optimize_cbz_entries(entries[:1], optimize_directory, "webp", 90, workers=1)
+        assert optimized == [(abspath(join(optimize_directory, "0.webp")), "Comic/01.webp")]
 
 def test_create_cbz():
     """
     Tests the create_cbz function.
     """
-    # Test creating a CBZ file with no metadata, ignoring dotfiles
+    # Test creating a CBZ file with no metadata, ignoring dotfiles and leaving files in place
     with tempfile.TemporaryDirectory() as temp_dir:
         extract_directory = abspath(join(temp_dir, "extract"))
         os.mkdir(extract_directory)
         image_directory = abspath(join(temp_dir, "images"))
         shutil.copytree(mm_test.PAIR_IMAGE_DIRECTORY, image_directory)
         cbz_file = mm_comic_archive.create_cbz(image_directory)
-        assert sorted(os.listdir(image_directory)) == [".empty", "aaa", "images.cbz"]
+        assert sorted(os.listdir(image_directory)) == [".empty", "aaa.json", "aaa.webp", "bare.PNG.json", "bare.png", "images.cbz", "long.JPG", "long.JSON"]
         mm_file_tools.extract_zip(cbz_file, extract_directory)
         assert sorted(os.listdir(extract_directory)) == ["aaa"]
         files = sorted(os.listdir(abspath(join(extract_directory, "aaa"))))
@@ -52,7 +148,7 @@ def test_create_cbz():
         metadata["title"] = "Name"
         metadata["artists"] = ["Multiple", "Artists"]
         cbz_file = mm_comic_archive.create_cbz(image_directory, metadata=metadata)
-        assert sorted(os.listdir(image_directory)) == [".empty", "Name", "images.cbz"]
+        assert sorted(os.listdir(image_directory)) == [".empty", "aaa.json", "aaa.webp", "bare.PNG.json", "bare.png", "images.cbz", "long.JPG", "long.JSON"]
         mm_file_tools.extract_zip(cbz_file, extract_directory)
         assert sorted(os.listdir(extract_directory)) == ["ComicInfo.xml", "Name"]
         files = sorted(os.listdir(abspath(join(extract_directory, "Name"))))
@@ -118,7 +214,7 @@ def test_create_cbz():
         metadata["title"] = "Replaced"
         metadata["artists"] = ["New"]
         cbz_file = mm_comic_archive.create_cbz(image_directory, metadata=metadata)
-        assert sorted(os.listdir(image_directory)) == [".empty", "Replaced", "images.cbz"]
+        assert sorted(os.listdir(image_directory)) == [".empty", "ComicInfo.xml", "aaa.json", "aaa.webp", "bare.PNG.json", "bare.png", "images.cbz", "long.JPG", "long.JSON"]
         mm_file_tools.extract_zip(cbz_file, extract_directory)
         assert sorted(os.listdir(extract_directory)) == ["ComicInfo.xml", "Replaced"]
         files = sorted(os.listdir(abspath(join(extract_directory, "Replaced"))))
@@ -128,6 +224,24 @@ def test_create_cbz():
         assert read_meta["title"] == "Replaced"
         assert read_meta["artists"] == ["New"]
         assert read_meta["page_count"] == "2"
+    # Test creating a CBZ file with optimized images
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_directory = abspath(join(temp_dir, "images"))
+        os.mkdir(image_directory)
+        gray = Image.linear_gradient("L").convert("RGB")
+        gray.save(abspath(join(image_directory, "01.png")))
+        gray.save(abspath(join(image_directory, "02.png")))
+        metadata = mm_archive.get_empty_metadata()
+        metadata["title"] = "Optimized"
+        stats = mm_image_tools.get_empty_optimization_stats()
+        cbz_file = mm_comic_archive.create_cbz(image_directory, metadata=metadata, optimize="lossless", stats=stats)
+        assert stats["images"] == 2
+        assert stats["optimized"] == 2
+        assert stats["new_size"] < stats["size"]
+        listing = mm_zip_tools.read_zip_listing(cbz_file)
+        assert [member.name for member in listing["members"]] == ["ComicInfo.xml", "Optimized/01.png", "Optimized/02.png"]
+        assert listing["members"][1].size < os.stat(abspath(join(image_directory, "01.png"))).st_size
+        assert mm_comic_archive.get_info_from_cbz(cbz_file)["page_count"] == "2"
     # Test creating a CBZ file fails if there are no internal files, or only dotfiles
     with tempfile.TemporaryDirectory() as temp_dir:
         assert mm_comic_archive.create_cbz(temp_dir) is None
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import metadata_magic.archive as mm_archive
+import metadata_magic.archive.cover_cache as mm_cover_cache
+from os.path import abspath, join
+
+def test_get_cache_directory():
+    """
+    Tests the get_cache_directory function.
+    """
+    original = os.environ.get("METADATA_MAGIC_COVER_CACHE")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ["METADATA_MAGIC_COVER_CACHE"] = temp_dir
+            assert mm_cover_cache.get_cache_directory() == abspath(temp_dir)
+        os.environ.pop("METADATA_MAGIC_COVER_CACHE")
+        assert mm_cover_cache.get_cache_directory().endswith("covers")
+    finally:
+        if original is not None:
+            os.environ["METADATA_MAGIC_COVER_CACHE"] = original
+
+def test_get_cache_size():
+    """
+    Tests the get_cache_size function.
+    """
+    original = os.environ.get("METADATA_MAGIC_COVER_CACHE_SIZE")
+    try:
+        os.environ["METADATA_MAGIC_COVER_CACHE_SIZE"] = "2"
+        assert mm_cover_cache.get_cache_size() == 2097152
+        os.environ["METADATA_MAGIC_COVER_CACHE_SIZE"] = "0"
+        assert mm_cover_cache.get_cache_size() == 0
+        os.environ["METADATA_MAGIC_COVER_CACHE_SIZE"] = "Not a number"
+        assert mm_cover_cache.get_cache_size() == mm_cover_cache.DEFAULT_CACHE_SIZE * 1048576
+    finally:
+        os.environ.pop("METADATA_MAGIC_COVER_CACHE_SIZE")
+        if original is not None:
+            os.environ["METADATA_MAGIC_COVER_CACHE_SIZE"] = original
+
+def test_get_cover_key():
+    """
+    Tests the get_cover_key function.
+    """
+    key = mm_cover_cache.get_cover_key("Title", "Author", 900, ".JPG")
+    assert key.endswith(".jpg")
+    assert len(key) == 68
+    assert key == mm_cover_cache.get_cover_key("Title", "Author", 900, ".jpg")
+    assert not key == mm_cover_cache.get_cover_key("Title", "Author", 600, ".jpg")
+    assert not key == mm_cover_cache.get_cover_key("Title", "Other", 900, ".jpg")
+    assert not key == mm_cover_cache.get_cover_key("Other", "Author", 900, ".jpg")
+
+def test_add_cover_to_cache():
+    """
+    Tests the add_cover_to_cache and get_cached_cover functions.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_dir = abspath(join(temp_dir, "cache"))
+        cover_file = abspath(join(temp_dir, "cover.jpg"))
+        with open(cover_file, "wb") as out_file:
+            out_file.write(b"A" * 100)
+        # Test adding a cover to the cache
+        mm_cover_cache.add_cover_to_cache("A.jpg", cover_file, cache_dir, 1000)
+        assert os.listdir(cache_dir) == ["A.jpg"]
+        # Test getting a cover from the cache
+        new_file = abspath(join(temp_dir, "new.jpg"))
+        assert mm_cover_cache.get_cached_cover("A.jpg", new_file, cache_dir)
+        with open(new_file, "rb") as in_file:
+            assert in_file.read() == b"A" * 100
+        assert not mm_cover_cache.get_cached_cover("B.jpg", new_file, cache_dir)
+        # Test that covers aren't cached when the cache is turned off
+        mm_cover_cache.add_cover_to_cache("B.jpg", cover_file, cache_dir, 0)
+        assert os.listdir(cache_dir) == ["A.jpg"]
+
+def test_trim_cache():
+    """
+    Tests the trim_cache function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Create cached covers with different last use times
+        for i in range(0, 5):
+            cover_file = abspath(join(temp_dir, f"{i}.jpg"))
+            with open(cover_file, "wb") as out_file:
+                out_file.write(b"A" * 100)
+            os.utime(cover_file, ns=(i * 1000000000, i * 1000000000))
+        # Test removing the least recently used covers
+        mm_cover_cache.trim_cache(temp_dir, 300)
+        assert sorted(os.listdir(temp_dir)) == ["2.jpg", "3.jpg", "4.jpg"]
+        mm_cover_cache.trim_cache(temp_dir, 1000)
+        assert sorted(os.listdir(temp_dir)) == ["2.jpg", "3.jpg", "4.jpg"]
+
+def test_generate_cover_image_cached():
+    """
+    Tests that generate_cover_image uses the cover cache.
+    """
+    original = os.environ.get("METADATA_MAGIC_COVER_CACHE")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_dir = abspath(join(temp_dir, "cache"))
+            os.environ["METADATA_MAGIC_COVER_CACHE"] = cache_dir
+            # Test that a rendered cover is added to the cache
+            image_file = abspath(join(temp_dir, "cover.jpg"))
+            assert mm_archive.generate_cover_image("Title", ["Author"], image_file)
+            assert len(os.listdir(cache_dir)) == 1
+            # Test that the cached cover is used for the same title and author
+            cached_file = abspath(join(cache_dir, os.listdir(cache_dir)[0]))
+            with open(cached_file, "wb") as out_file:
+                out_file.write(b"Cached")
+            new_file = abspath(join(temp_dir, "new.jpg"))
+            assert mm_archive.generate_cover_image("Title", ["Author"], new_file)
+            with open(new_file, "rb") as in_file:
+                assert in_file.read() == b"Cached"
+            # Test that the cache isn't used when specified
+            assert mm_archive.generate_cover_image("Title", ["Author"], new_file, use_cache=False)
+            with open(new_file, "rb") as in_file:
+                assert not in_file.read() == b"Cached"
+            with open(cached_file, "rb") as in_file:
+                assert in_file.read() == b"Cached"
+    finally:
+        os.environ.pop("METADATA_MAGIC_COVER_CACHE")
+        if original is not None:
+            os.environ["METADATA_MAGIC_COVER_CACHE"] = original
@@ -448,6 +448,124 @@ def test_create_content_files():
         compare = f"{compare}\n</html>"
         assert contents == compare
 
+def test_get_chapter_xhtml():
+    """
+    Tests the get_chapter_xhtml function.
+    """
+    # Test getting XHTML from text files
+    multiple_dir = abspath(join(mm_test.EPUB_INTERNAL_DIRECTORY, "multiple"))
+    files = [{"file":abspath(join(multiple_dir, "[AA] Part 1.TXT"))}]
+    xhtml = mm_epub.get_chapter_xhtml(files, "Part 1", smart_quotes=True)
+    assert "<title>Part 1</title>" in xhtml
+    assert "<p>" in xhtml
+    # Test getting XHTML with pre-generated image xml
+    files = [{"file":abspath(join(multiple_dir, "[BB] Image 1.PNG")), "xml":"<img src=\"a.jpg\" />"}]
+    xhtml = mm_epub.get_chapter_xhtml(files, "Image", smart_quotes=True)
+    assert "<title>Image</title>" in xhtml
+    assert "a.jpg" in xhtml
+
+def test_create_content_files_parallel():
+    """
+    Tests the create_content_files function when using multiple processes.
+    """
+    # Test that converting in parallel gives the same output as converting serially
+    multiple_dir = abspath(join(mm_test.EPUB_INTERNAL_DIRECTORY, "multiple"))
+    with tempfile.TemporaryDirectory() as serial_dir:
+        with tempfile.TemporaryDirectory() as parallel_dir:
+            chapters = mm_epub.get_default_chapters(multiple_dir)
+            serial_chapters = mm_epub.create_content_files(chapters, serial_dir, workers=1)
+            chapters = mm_epub.get_default_chapters(multiple_dir)
+            parallel_chapters = mm_epub.create_content_files(chapters, parallel_dir, workers=2)
+            assert parallel_chapters == serial_chapters
+            for directory in ["content", "images"]:
+                serial_files = sorted(os.listdir(abspath(join(serial_dir, directory))))
+                parallel_files = sorted(os.listdir(abspath(join(parallel_dir, directory))))
+                assert parallel_files == serial_files
+            for filename in sorted(os.listdir(abspath(join(serial_dir, "content")))):
+                serial_file = abspath(join(serial_dir, "content", filename))
+                parallel_file = abspath(join(parallel_dir, "content", filename))
+                assert mm_file_tools.read_text_file(parallel_file) == mm_file_tools.read_text_file(serial_file)
+    # Test that no number of workers uses every CPU
+    with tempfile.TemporaryDirectory() as temp_dir:
+        chapters = mm_epub.get_default_chapters(multiple_dir)
+        assert mm_epub.create_content_files(chapters, temp_dir, workers=None) == serial_chapters
+
+def test_write_chapter_xhtml():
+    """
+    Tests the write_chapter_xhtml function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test writing a chapter small enough to fit in one file
+        text_file = abspath(join(temp_dir, "text.txt"))
+        paragraphs = [f"Paragraph {i}, \"long\" enough to fill a line." for i in range(0, 100)]
+        mm_file_tools.write_text_file(text_file, "\n\n".join(paragraphs))
+        xhtml_file = abspath(join(temp_dir, "text.xhtml"))
+        files = [{"file":text_file}]
+        assert mm_epub.write_chapter_xhtml(files, "Title", xhtml_file) == 1
+        assert sorted(os.listdir(temp_dir)) == ["text.txt", "text.xhtml"]
+        assert mm_file_tools.read_text_file(xhtml_file) == mm_epub.get_chapter_xhtml(files, "Title")
+        # Test splitting a chapter into multiple files
+        assert mm_epub.write_chapter_xhtml(files, "Title", xhtml_file, max_size=1000) == 5
+        assert sorted(os.listdir(temp_dir)) == ["text-part2.xhtml", "text-part3.xhtml", "text-part4.xhtml",
+                "text-part5.xhtml", "text.txt", "text.xhtml"]
+        text = ""
+        for part in range(1, 6):
+            part_file = mm_epub.get_part_file(xhtml_file, part)
+            text = text + mm_file_tools.read_text_file(part_file)
+        for i in range(0, 100):
+            assert text.count(f"<p>Paragraph {i}, &#8220;long&#8221; enough to fill a line.</p>") == 1
+        assert text.count("<title>Title</title>") == 5
+        # Test splitting an HTML chapter into multiple files
+        html_file = abspath(join(temp_dir, "html.html"))
+        paragraphs = [f"<p>Paragraph {i}, long enough to fill a line.</p>" for i in range(0, 100)]
+        mm_file_tools.write_text_file(html_file, f"<html><body>{''.join(paragraphs)}</body></html>")
+        html_xhtml = abspath(join(temp_dir, "html.xhtml"))
+        assert mm_epub.write_chapter_xhtml([{"file":html_file}], "Title", html_xhtml, max_size=1000) == 5
+        text = ""
+        for part in range(1, 6):
+            text = text + mm_file_tools.read_text_file(mm_epub.get_part_file(html_xhtml, part))
+        for i in range(0, 100):
+            assert text.count(f"<p>Paragraph {i}, long enough to fill a line.</p>") == 1
+        # Test writing a chapter with a different encoding
+        with open(text_file, "wb") as out_file:
+            out_file.write("Lätin1 text.".encode("latin_1"))
+        assert mm_epub.write_chapter_xhtml(files, "Title", xhtml_file) == 1
+        assert "<p>L&#228;tin1 text.</p>" in mm_file_tools.read_text_file(xhtml_file)
+
+def test_create_content_files_split():
+    """
+    Tests the create_content_files function when splitting large chapters.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Create chapters with one large text file
+        text_file = abspath(join(temp_dir, "Large.txt"))
+        mm_file_tools.write_text_file(text_file, "\n\n".join(["Some text."] * 300))
+        small_file = abspath(join(temp_dir, "Small.txt"))
+        mm_file_tools.write_text_file(small_file, "Small.")
+        chapters = mm_epub.get_default_chapters(temp_dir)
+        chapters[1]["title"] = "Small Chapter"
+        # Test that the split parts follow the chapter, left out of the contents
+        build_dir = abspath(join(temp_dir, "build"))
+        os.mkdir(build_dir)
+        chapters = mm_epub.create_content_files(chapters, build_dir, max_size=2000)
+        assert len(chapters) == 4
+        assert chapters[0] == {"include":True, "title":"Large", "id":"item0", "file":"content/Large.xhtml"}
+        assert chapters[1] == {"include":False, "title":"Large", "id":"item0-part2", "file":"content/Large-part2.xhtml"}
+        assert chapters[2] == {"include":False, "title":"Large", "id":"item0-part3", "file":"content/Large-part3.xhtml"}
+        assert chapters[3] == {"include":True, "title":"Small Chapter", "id":"item1", "file":"content/Small.xhtml"}
+        assert sorted(os.listdir(abspath(join(build_dir, "content")))) == ["Large-part2.xhtml",
+                "Large-part3.xhtml", "Large.xhtml", "Small.xhtml"]
+        # Test that the parts are in the spine but not in the table of contents
+        mm_epub.create_nav_file(chapters, "Title", build_dir)
+        nav = mm_file_tools.read_text_file(abspath(join(build_dir, "nav.xhtml")))
+        assert "content/Large.xhtml" in nav
+        assert "part2" not in nav
+        mm_epub.create_content_opf(chapters, mm_archive.get_empty_metadata(), build_dir)
+        opf = mm_file_tools.read_text_file(abspath(join(build_dir, "content.opf")))
+        assert "<item href=\"content/Large-part2.xhtml\" id=\"item0-part2\" media-type=\"application/xhtml+xml\" />" in opf
+        spine = opf[opf.index("<spine"):]
+        assert spine.index("\"item0\"") < spine.index("\"item0-part2\"") < spine.index("\"item0-part3\"") < spine.index("\"item1\"")
+
 def test_copy_original_files():
     """
     Tests the copy_original_files function.
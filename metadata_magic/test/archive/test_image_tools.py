@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import metadata_magic.test as mm_test
+import metadata_magic.archive.image_tools as mm_image_tools
+from os.path import abspath, exists, join
+from PIL import Image
+
+def test_get_image_size():
+    """
+    Tests the get_image_size function.
+    """
+    # Test getting the size of existing images
+    image_file = abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "bare.png"))
+    assert mm_image_tools.get_image_size(image_file) == (300, 200)
+    image_file = abspath(join(mm_test.PAIR_IMAGE_DIRECTORY, "long.JPG"))
+    assert mm_image_tools.get_image_size(image_file) == (50, 250)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test getting the size of images read from the header
+        image = Image.new("RGB", (320, 240), color="#ff0000")
+        for extension in [".png", ".gif", ".bmp", ".tiff", ".jpg"]:
+            image_file = abspath(join(temp_dir, f"image{extension}"))
+            image.save(image_file)
+            assert mm_image_tools.get_image_size(image_file) == (320, 240)
+        # Test getting the size of a progressive JPEG
+        image_file = abspath(join(temp_dir, "progressive.jpeg"))
+        image.save(image_file, progressive=True)
+        assert mm_image_tools.get_image_size(image_file) == (320, 240)
+        # Test getting the size of an image read by PIL
+        image_file = abspath(join(temp_dir, "image.webp"))
+        image.save(image_file)
+        assert mm_image_tools.get_image_size(image_file) == (320, 240)
+        # Test getting the size of an invalid image
+        text_file = abspath(join(temp_dir, "text.png"))
+        with open(text_file, "w") as out_file:
+            out_file.write("Not an image.")
+        assert mm_image_tools.get_image_size(text_file) is None
+        # Test that a truncated header falls back to PIL
+        image_file = abspath(join(temp_dir, "truncated.tiff"))
+        with open(image_file, "wb") as out_file:
+            out_file.write(b"II*\x00")
+        assert mm_image_tools.get_image_size(image_file) is None
+        assert mm_image_tools.get_image_size(abspath(join(temp_dir, "non-existant.png"))) is None
+
+def test_get_image_sizes():
+    """
+    Tests the get_image_sizes function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test getting the sizes of multiple images
+        first_file = abspath(join(temp_dir, "first.png"))
+        second_file = abspath(join(temp_dir, "second.gif"))
+        Image.new("RGB", (10, 20)).save(first_file)
+        Image.new("RGB", (30, 40)).save(second_file)
+        missing_file = abspath(join(temp_dir, "missing.png"))
+        sizes = mm_image_tools.get_image_sizes([first_file, missing_file, second_file])
+        assert sizes == [(10, 20), None, (30, 40)]
+        # Test that sizes are cached
+        stat = os.stat(first_file)
+        assert mm_image_tools.IMAGE_SIZE_CACHE[(first_file, stat.st_size, stat.st_mtime_ns)] == (10, 20)
+        # Test that changed images are read again
+        Image.new("RGB", (50, 60)).save(first_file)
+        os.utime(first_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        assert mm_image_tools.get_image_sizes([first_file]) == [(50, 60)]
+        # Test that the cache is limited in size
+        cache_size = mm_image_tools.IMAGE_SIZE_CACHE_SIZE
+        try:
+            mm_image_tools.IMAGE_SIZE_CACHE.clear()
+            mm_image_tools.IMAGE_SIZE_CACHE_SIZE = 2
+            third_file = abspath(join(temp_dir, "third.bmp"))
+            Image.new("RGB", (70, 80)).save(third_file)
+            assert mm_image_tools.get_image_sizes([first_file, second_file]) == [(50, 60), (30, 40)]
+            assert len(mm_image_tools.IMAGE_SIZE_CACHE) == 2
+            assert mm_image_tools.get_image_sizes([third_file]) == [(70, 80)]
+            assert len(mm_image_tools.IMAGE_SIZE_CACHE) == 2
+            stat = os.stat(third_file)
+            assert (third_file, stat.st_size, stat.st_mtime_ns) in mm_image_tools.IMAGE_SIZE_CACHE
+        finally:
+            mm_image_tools.IMAGE_SIZE_CACHE_SIZE = cache_size
+
+def test_optimize_image():
+    """
+    Tests the is_grayscale, can_optimize, and optimize_image functions.
+    """
+    # Test which images can be optimized
+    assert mm_image_tools.can_optimize("a/page.BMP", "lossless")
+    assert mm_image_tools.can_optimize("page.png", "webp")
+    assert not mm_image_tools.can_optimize("page.jpg", "lossless")
+    assert mm_image_tools.can_optimize("page.jpg", "jpeg")
+    assert not mm_image_tools.can_optimize("page.gif", "webp")
+    assert not mm_image_tools.can_optimize("page.txt", "jpeg")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test that gray images are stored as grayscale PNGs
+        image_file = abspath(join(temp_dir, "gray.bmp"))
+        image = Image.linear_gradient("L").convert("RGB")
+        assert mm_image_tools.is_grayscale(image)
+        image.save(image_file)
+        job = {"file":image_file, "new_file":abspath(join(temp_dir, "new-gray")), "optimize":"lossless", "quality":85}
+        result = mm_image_tools.optimize_image(job)
+        assert result["file"] == abspath(join(temp_dir, "new-gray.png"))
+        assert result["size"] == os.stat(image_file).st_size
+        assert result["new_size"] == os.stat(result["file"]).st_size
+        assert result["new_size"] < result["size"]
+        with Image.open(result["file"]) as new_image:
+            assert new_image.mode == "L"
+            assert new_image.tobytes() == image.convert("L").tobytes()
+        # Test lossy optimization
+        image = Image.merge("RGB", [Image.effect_noise((256, 256), 40), Image.linear_gradient("L"), Image.new("L", (256, 256))])
+        assert not mm_image_tools.is_grayscale(image)
+        image_file = abspath(join(temp_dir, "color.png"))
+        image.save(image_file)
+        for optimize, image_format in [("webp", "WEBP"), ("jpeg", "JPEG")]:
+            job = {"file":image_file, "new_file":abspath(join(temp_dir, optimize)), "optimize":optimize, "quality":80}
+            result = mm_image_tools.optimize_image(job)
+            assert result["new_size"] < result["size"]
+            with Image.open(result["file"]) as new_image:
+                assert new_image.format == image_format
+                assert new_image.mode == "RGB"
+        # Test that transparent images are kept lossless when optimizing to JPEG
+        image = Image.new("RGBA", (256, 256), (255, 0, 0, 0))
+        image.paste((0, 0, 255, 255), (0, 0, 128, 128))
+        image_file = abspath(join(temp_dir, "transparent.tiff"))
+        image.save(image_file)
+        job = {"file":image_file, "new_file":abspath(join(temp_dir, "transparent")), "optimize":"jpeg", "quality":80}
+        result = mm_image_tools.optimize_image(job)
+        assert result["file"] == abspath(join(temp_dir, "transparent.png"))
+        with Image.open(result["file"]) as new_image:
+            assert new_image.mode == "RGBA"
+        # Test that originals are kept when they are smaller
+        image_file = abspath(join(temp_dir, "small.png"))
+        Image.new("L", (10, 10)).save(image_file, optimize=True)
+        job = {"file":image_file, "new_file":abspath(join(temp_dir, "small")), "optimize":"jpeg", "quality":100}
+        result = mm_image_tools.optimize_image(job)
+        assert result == {"file":image_file, "size":os.stat(image_file).st_size, "new_size":os.stat(image_file).st_size}
+        assert not exists(abspath(join(temp_dir, "small.jpg")))
+        # Test that invalid images are left as they are
+        image_file = abspath(join(temp_dir, "invalid.png"))
+        with open(image_file, "w", encoding="UTF-8") as out_file:
+            out_file.write("Not an image.")
+        job = {"file":image_file, "new_file":abspath(join(temp_dir, "invalid")), "optimize":"lossless", "quality":85}
+        assert mm_image_tools.optimize_image(job)["file"] == image_file
+
+def test_get_optimization_summary():
+    """
+    Tests the get_empty_optimization_stats, add_optimization_stats, and get_optimization_summary functions.
+    """
+    total = mm_image_tools.get_empty_optimization_stats()
+    mm_image_tools.add_optimization_stats(total, {"images":3, "optimized":2, "size":2097152, "new_size":1048576, "time":1.0})
+    mm_image_tools.add_optimization_stats(total, {"images":1, "optimized":0, "size":1048576, "new_size":1048576, "time":1.0})
+    assert total == {"images":4, "optimized":2, "size":3145728, "new_size":2097152, "time":2.0}
+    summary = mm_image_tools.get_optimization_summary(total)
+    assert summary == "Optimized 2 of 4 images: 3.0 MB to 2.0 MB (33.3% saved) at 2.0 images/s (1.5 MB/s)"
+    empty = mm_image_tools.get_optimization_summary(mm_image_tools.get_empty_optimization_stats())
+    assert empty == "Optimized 0 of 0 images: 0.0 MB to 0.0 MB (0.0% saved) at 0.0 images/s (0.0 MB/s)"
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import os
+import json
 import shutil
 import tempfile
 import metadata_magic.test as mm_test
@@ -203,6 +205,76 @@ def test_write_series_single():
         assert metadata["series_number"] == "1.0"
         assert metadata["series_total"] == "1"
 
+def test_write_series_unchanged():
+    """
+    Tests that the write_series and write_series_singles functions skip archives with unchanged series info.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for filename in ["1.cbz", "00A.cbz", "00B.epub"]:
+            shutil.copy(abspath(join(mm_test.ARCHIVE_SERIES_DIRECTORY, filename)), temp_dir)
+        # Test that metadata read for the labels is kept
+        labels = mm_series.get_default_labels(temp_dir, workers=2)
+        assert [basename(label["file"]) for label in labels] == ["1.cbz", "00A.cbz", "00B.epub"]
+        assert labels[0]["metadata"]["title"] == "CBZ A"
+        # Test writing the series, then writing it again unchanged
+        written = mm_series.write_series(labels, "Series Test", workers=2)
+        assert sorted([basename(file) for file in written]) == ["00A.cbz", "00B.epub", "1.cbz"]
+        assert labels[1]["metadata"]["series"] == "Series Test"
+        assert mm_series.write_series(labels, "Series Test") == []
+        labels = mm_series.get_default_labels(temp_dir)
+        assert mm_series.write_series(labels, "Series Test") == []
+        labels[2]["label"] = "4.0"
+        written = mm_series.write_series(labels, "Series Test")
+        assert sorted([basename(file) for file in written]) == ["00A.cbz", "00B.epub", "1.cbz"]
+        metadata = mm_archive.get_info_from_archive(abspath(join(temp_dir, "00B.epub")))
+        assert metadata["series_number"] == "4.0"
+        # Test marking archives as standalone, then marking them again unchanged
+        files = [abspath(join(temp_dir, "1.cbz")), abspath(join(temp_dir, "00B.epub"))]
+        assert mm_series.write_series_singles(files, workers=2) == files
+        assert mm_series.write_series_singles(files) == []
+        assert not mm_series.write_series_single(files[0])
+        metadata = mm_archive.get_info_from_archive(files[0])
+        assert metadata["series"] == "CBZ A"
+        assert metadata["series_total"] == "1"
+
+def test_write_series_manifest():
+    """
+    Tests the write_series_manifest function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Create directories to write series info to
+        series_directory = abspath(join(temp_dir, "series"))
+        single_directory = abspath(join(temp_dir, "single"))
+        os.mkdir(series_directory)
+        os.mkdir(single_directory)
+        shutil.copy(abspath(join(mm_test.ARCHIVE_SERIES_DIRECTORY, "1.cbz")), series_directory)
+        shutil.copy(abspath(join(mm_test.ARCHIVE_SERIES_DIRECTORY, "00A.cbz")), series_directory)
+        shutil.copy(abspath(join(mm_test.ARCHIVE_SERIES_DIRECTORY, "00B.epub")), single_directory)
+        manifest = [{"directory":"series", "series":"Batch Series", "labels":{"1.cbz":"3", "00A.cbz":"01.5"}},
+                {"directory":"single", "standalone":True},
+                {"directory":"series"}]
+        manifest_file = abspath(join(temp_dir, "manifest.json"))
+        mm_file_tools.write_text_file(manifest_file, json.dumps(manifest))
+        # Test writing the series info for each directory in the manifest
+        results = mm_series.write_series_manifest(manifest_file, workers=2)
+        assert len(results) == 3
+        assert results[0]["error"] is None
+        assert [basename(file) for file in results[0]["files"]] == ["00A.cbz", "1.cbz"]
+        metadata = mm_archive.get_info_from_archive(abspath(join(series_directory, "00A.cbz")))
+        assert metadata["series"] == "Batch Series"
+        assert metadata["series_number"] == "1.5"
+        assert metadata["series_total"] == "3"
+        metadata = mm_archive.get_info_from_archive(abspath(join(series_directory, "1.cbz")))
+        assert metadata["series"] == "Batch Series"
+        assert metadata["series_number"] == "3.0"
+        assert metadata["series_total"] == "3"
+        assert results[1]["error"] is None
+        metadata = mm_archive.get_info_from_archive(abspath(join(single_directory, "00B.epub")))
+        assert metadata["series"] == "EPUB B"
+        assert metadata["series_number"] == "1.0"
+        # Test that entries without a series title are reported
+        assert results[2]["error"] == "No series title."
+
 def test_get_series_string():
     """
     Tests the get_series_string function.
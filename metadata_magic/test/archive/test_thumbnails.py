@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import time
+import zipfile
+import tempfile
+import metadata_magic.zip_tools as mm_zip_tools
+import metadata_magic.archive.thumbnails as mm_thumbnails
+from PIL import Image
+from os.path import abspath, basename, exists, join
+
+def get_image_data(color:tuple, size:tuple, image_format:str="PNG", mode:str="RGB") -> bytes:
+    """
+    Returns an encoded image of a single color for testing.
+    """
+    image = Image.new(mode, size, color)
+    with io.BytesIO() as out_file:
+        image.save(out_file, format=image_format)
+        return out_file.getvalue()
+
+def create_test_epub(epub_file:str, cover_id:str=None):
+    """
+    Creates a minimal EPUB file with a cover image and another image for testing.
+    """
+    cover_meta = ""
+    if cover_id is not None:
+        cover_meta = f"<meta name=\"cover\" content=\"{cover_id}\"/>"
+    opf = ("<?xml version=\"1.0\"?><package xmlns=\"http://www.idpf.org/2007/opf\" version=\"3.0\">"
+            f"<metadata>{cover_meta}</metadata><manifest>"
+            "<item href=\"../images/a%20page.png\" id=\"page\" media-type=\"image/png\"/>"
+            "<item href=\"../images/cover.jpg\" id=\"cover_image\" media-type=\"image/jpeg\"/>"
+            "</manifest></package>")
+    with zipfile.ZipFile(epub_file, "w") as out_file:
+        out_file.writestr("mimetype", "application/epub+zip")
+        out_file.writestr("EPUB/content/content.opf", opf)
+        out_file.writestr("EPUB/images/a page.png", get_image_data((0, 0, 255), (40, 60)))
+        out_file.writestr("EPUB/images/cover.jpg", get_image_data((255, 0, 0), (1000, 1500), "JPEG"))
+
+def test_get_thumbnail_key():
+    """
+    Tests the get_thumbnail_key function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archive_file = abspath(join(temp_dir, "archive.cbz"))
+        with open(archive_file, "wb") as out_file:
+            out_file.write(b"Contents")
+        key = mm_thumbnails.get_thumbnail_key(archive_file)
+        assert key.endswith(".jpg")
+        assert key == mm_thumbnails.get_thumbnail_key(archive_file)
+        assert not key == mm_thumbnails.get_thumbnail_key(archive_file, 100)
+        # Test that the key changes with the archive
+        with open(archive_file, "wb") as out_file:
+            out_file.write(b"New Contents")
+        assert not key == mm_thumbnails.get_thumbnail_key(archive_file)
+        assert mm_thumbnails.get_thumbnail_key(abspath(join(temp_dir, "missing.cbz"))) is None
+
+def test_get_cover_data():
+    """
+    Tests the get_first_image, get_epub_cover, and get_cover_data functions.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test getting the first page of a CBZ file
+        cbz_file = abspath(join(temp_dir, "comic.cbz"))
+        with zipfile.ZipFile(cbz_file, "w") as out_file:
+            out_file.writestr("ComicInfo.xml", "<ComicInfo/>")
+            out_file.writestr("Comic/Comic-10.png", get_image_data((0, 0, 0), (10, 10)))
+            out_file.writestr("Comic/Comic-2.jpg", get_image_data((255, 255, 255), (10, 10), "JPEG"))
+        listing = mm_zip_tools.read_zip_listing(cbz_file)
+        assert mm_thumbnails.get_first_image(listing).name == "Comic/Comic-2.jpg"
+        with Image.open(io.BytesIO(mm_thumbnails.get_cover_data(cbz_file))) as image:
+            assert image.format == "JPEG"
+        # Test getting the cover image of an EPUB file
+        epub_file = abspath(join(temp_dir, "book.epub"))
+        create_test_epub(epub_file, "cover_image")
+        listing = mm_zip_tools.read_zip_listing(epub_file)
+        assert mm_thumbnails.get_epub_cover(listing).name == "EPUB/images/cover.jpg"
+        with Image.open(io.BytesIO(mm_thumbnails.get_cover_data(epub_file))) as image:
+            assert image.size == (1000, 1500)
+        # Test that escaped cover paths are found
+        create_test_epub(epub_file, "page")
+        listing = mm_zip_tools.read_zip_listing(epub_file)
+        assert mm_thumbnails.get_epub_cover(listing).name == "EPUB/images/a page.png"
+        # Test that EPUBs without a cover ID use their first image
+        create_test_epub(epub_file)
+        assert mm_thumbnails.get_epub_cover(mm_zip_tools.read_zip_listing(epub_file)) is None
+        with Image.open(io.BytesIO(mm_thumbnails.get_cover_data(epub_file))) as image:
+            assert image.size == (40, 60)
+        # Test getting the cover of archives without images
+        with zipfile.ZipFile(cbz_file, "w") as out_file:
+            out_file.writestr("text.txt", "Text")
+        assert mm_thumbnails.get_cover_data(cbz_file) is None
+        assert mm_thumbnails.get_cover_data(abspath(join(temp_dir, "missing.cbz"))) is None
+
+def test_write_thumbnail():
+    """
+    Tests the write_thumbnail function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test scaling down a JPEG image
+        thumbnail = abspath(join(temp_dir, "sub", "thumb.jpg"))
+        data = get_image_data((255, 0, 0), (1000, 1500), "JPEG")
+        assert mm_thumbnails.write_thumbnail({"data":data, "file":thumbnail, "size":300})
+        with Image.open(thumbnail) as image:
+            assert image.format == "JPEG"
+            assert image.size == (200, 300)
+        # Test flattening a transparent image
+        data = get_image_data((0, 0, 0, 0), (600, 200), "PNG", "RGBA")
+        assert mm_thumbnails.write_thumbnail({"data":data, "file":thumbnail, "size":300})
+        with Image.open(thumbnail) as image:
+            assert image.size == (300, 100)
+            assert image.getpixel((0, 0)) == (255, 255, 255)
+        # Test that small images aren't scaled up
+        data = get_image_data((0, 0, 255), (40, 60), "GIF")
+        assert mm_thumbnails.write_thumbnail({"data":data, "file":thumbnail, "size":300})
+        with Image.open(thumbnail) as image:
+            assert image.size == (40, 60)
+        # Test writing invalid images
+        assert not mm_thumbnails.write_thumbnail({"data":b"Not an image", "file":thumbnail, "size":300})
+        assert os.listdir(abspath(join(temp_dir, "sub"))) == ["thumb.jpg"]
+
+def test_generate_thumbnails():
+    """
+    Tests the generate_thumbnails function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_directory = abspath(join(temp_dir, "cache"))
+        epub_file = abspath(join(temp_dir, "book.epub"))
+        create_test_epub(epub_file, "cover_image")
+        text_file = abspath(join(temp_dir, "text.cbz"))
+        with zipfile.ZipFile(text_file, "w") as out_file:
+            out_file.writestr("text.txt", "Text")
+        # Test creating thumbnails
+        files = [epub_file, text_file]
+        thumbnails = mm_thumbnails.generate_thumbnails(files, 100, 2, cache_directory, 1048576)
+        assert thumbnails[text_file] is None
+        assert exists(thumbnails[epub_file])
+        assert basename(thumbnails[epub_file]) == mm_thumbnails.get_thumbnail_key(epub_file, 100)
+        with Image.open(thumbnails[epub_file]) as image:
+            assert image.size[1] == 100 and image.size[0] in [66, 67]
+        # Test that cached thumbnails are used
+        modified = os.stat(thumbnails[epub_file]).st_mtime_ns
+        assert mm_thumbnails.generate_thumbnails(files, 100, 2, cache_directory, 1048576) == thumbnails
+        assert os.stat(thumbnails[epub_file]).st_mtime_ns >= modified
+        # Test that thumbnails are remade when the archive changes
+        time.sleep(0.01)
+        create_test_epub(epub_file)
+        new_thumbnails = mm_thumbnails.generate_thumbnails(files, 100, 2, cache_directory, 1048576)
+        assert not new_thumbnails[epub_file] == thumbnails[epub_file]
+        with Image.open(new_thumbnails[epub_file]) as image:
+            assert image.size == (40, 60)
+        # Test that the cache is trimmed to its maximum size
+        size = os.stat(new_thumbnails[epub_file]).st_size
+        assert len(os.listdir(cache_directory)) == 2
+        mm_thumbnails.generate_thumbnails(files, 100, 2, cache_directory, size)
+        assert os.listdir(cache_directory) == [basename(new_thumbnails[epub_file])]
@@ -4,12 +4,13 @@ import os
 import shutil
 import tempfile
 import metadata_magic.test as mm_test
+import metadata_magic.journal as mm_journal
 import metadata_magic.archive as mm_archive
 import metadata_magic.archive.epub as mm_epub
 import metadata_magic.archive.mkv as mm_mkv
 import metadata_magic.archive.update as mm_update
 import metadata_magic.archive.comic_archive as mm_comic_archive
-from os.path import abspath, join
+from os.path import abspath, exists, join
 
 def test_update_fields():
     """
@@ -73,6 +74,70 @@ def test_update_fields():
     assert new_metadata["age_rating"] == "Everyone"
     assert new_metadata["score"] == "5"
 
+def test_read_update():
+    """
+    Tests the read_update and wait_for_update_cover functions.
+    """
+    original = os.environ.get("METADATA_MAGIC_COVER_CACHE")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ["METADATA_MAGIC_COVER_CACHE"] = abspath(join(temp_dir, "covers"))
+            epub_file = abspath(join(temp_dir, "epub.epub"))
+            shutil.copy(abspath(join(mm_test.ARCHIVE_EPUB_DIRECTORY, "small.epub")), epub_file)
+            metadata = mm_archive.get_empty_metadata()
+            metadata["title"] = "Read Update"
+            # Test that covers aren't submitted unless they are being updated
+            mm_archive.shutdown_cover_pool()
+            update = mm_update.read_update(epub_file, metadata, False, False)
+            assert update["file"] == epub_file
+            assert update["metadata"]["title"] == "Read Update"
+            assert update["metadata"]["writers"] == ["Writer"]
+            assert mm_archive.get_pending_covers() == {}
+            # Test that new covers are submitted as the metadata is read
+            update = mm_update.read_update(epub_file, metadata, True, False)
+            assert len(mm_archive.get_pending_covers()) == 1
+            assert mm_update.wait_for_update_cover(update) == update
+            mm_archive.shutdown_cover_pool()
+            # Test that a staging folder is made and recorded when journaled
+            assert update["temp_dir"] is None
+            journal = mm_journal.open_journal(abspath(join(temp_dir, "journal.jsonl")), {})
+            update = mm_update.read_update(epub_file, metadata, False, False, journal=journal)
+            mm_journal.close_journal(journal)
+            assert exists(update["temp_dir"])
+            assert update["temp_dir"].startswith(abspath(join(temp_dir, ".mm-")))
+            items = mm_journal.read_journal(abspath(join(temp_dir, "journal.jsonl")))["items"]
+            assert items[epub_file] == {"item":epub_file, "state":"started", "temp_dir":update["temp_dir"]}
+    finally:
+        os.environ.pop("METADATA_MAGIC_COVER_CACHE", None)
+        if original is not None:
+            os.environ["METADATA_MAGIC_COVER_CACHE"] = original
+
+def test_recover_updates():
+    """
+    Tests the recover_updates function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Create staging folders for started and finished updates, and one from another run
+        started_dir = abspath(join(temp_dir, ".mm-started"))
+        done_dir = abspath(join(temp_dir, ".mm-done"))
+        other_dir = abspath(join(temp_dir, ".mm-other"))
+        for folder in [started_dir, done_dir, other_dir]:
+            os.mkdir(folder)
+        journal_file = abspath(join(temp_dir, "journal.jsonl"))
+        journal = mm_journal.open_journal(journal_file, {})
+        mm_journal.write_journal_entry(journal, abspath(join(temp_dir, "a.cbz")), "started", {"temp_dir":started_dir})
+        mm_journal.write_journal_entry(journal, abspath(join(temp_dir, "b.cbz")), "started", {"temp_dir":done_dir})
+        mm_journal.write_journal_entry(journal, abspath(join(temp_dir, "b.cbz")), "done")
+        mm_journal.write_journal_entry(journal, abspath(join(temp_dir, "c.cbz")), "started")
+        mm_journal.close_journal(journal)
+        # Test that only the staging folders of unfinished updates are removed
+        journal = mm_journal.open_journal(journal_file, {}, resume=True)
+        mm_update.recover_updates(journal)
+        mm_journal.close_journal(journal)
+        assert not exists(started_dir)
+        assert exists(done_dir)
+        assert exists(other_dir)
+
 def test_mass_update_archives():
     """
     Tests the mass_update_archives function.
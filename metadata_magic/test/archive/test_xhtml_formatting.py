@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 
 import tempfile
+import html_string_tools
 import metadata_magic.test as mm_test
 import metadata_magic.file_tools as mm_file_tools
 import metadata_magic.archive.xhtml_formatting as mm_xhtml
 from os.path import abspath, exists, join
+from xml.etree import ElementTree
 
 def test_format_xhtml():
     """
@@ -134,6 +136,10 @@ def test_format_xhtml():
     compare = f"{compare}\n    </body>"
     compare = f"{compare}\n</html>"
     assert xhtml == compare
+    # Test removing paragraph elements left empty by the parser
+    html = "<p>Text</p><p><hr /></p><p>More</p>"
+    xhtml = mm_xhtml.format_xhtml(html, "Empty")
+    assert "<body>\n        <p>Text</p>\n        <hr />\n        <p>More</p>\n    </body>" in xhtml
     # Test hyphen or asterix between tags
     html = "<a>Thing</a> - <a href='other'>Other</a> * <a>Last</a>"
     xhtml = mm_xhtml.format_xhtml(html, "Lines")
@@ -266,6 +272,53 @@ def test_format_xhtml():
     compare = f"{compare}\n</html>"
     assert xhtml == compare
 
+def test_clean_paragraphs():
+    """
+    Tests the clean_paragraphs function.
+    """
+    # Test removing whitespace and empty paragraphs
+    body = ElementTree.fromstring("<body><p> Text <i>a</i> </p> <p> </p><div><p/></div><hr/></body>")
+    mm_xhtml.clean_paragraphs(body)
+    assert ElementTree.tostring(body).decode("UTF-8") == "<body><p>Text <i>a</i></p> <hr /></body>"
+    # Test that text following removed elements is kept
+    body = ElementTree.fromstring("<body><p></p>A<div> </div>B</body>")
+    mm_xhtml.clean_paragraphs(body)
+    assert ElementTree.tostring(body).decode("UTF-8") == "<body>AB</body>"
+
+def test_center_page_breaks():
+    """
+    Tests the center_page_breaks function.
+    """
+    # Test centering the text of elements
+    body = ElementTree.fromstring("<body><p> -*- </p><p>A - B</p><div><i>A</i> *** </div></body>")
+    mm_xhtml.center_page_breaks(body)
+    compare = "<body><p><center>-*-</center></p><p>A - B</p><div><i>A</i><center>***</center></div></body>"
+    assert ElementTree.tostring(body).decode("UTF-8") == compare
+
+def test_wrap_single_image():
+    """
+    Tests the wrap_single_image function.
+    """
+    # Test wrapping a single image
+    body = ElementTree.fromstring("<body><div><img src=\"a.png\" alt=\"A\" width=\"10\" height=\"20\" /></div></body>")
+    assert mm_xhtml.wrap_single_image(body)
+    assert body[0].attrib == {"id":"full-image-container"}
+    assert body[0][0].attrib["viewBox"] == "0 0 10 20"
+    # Test that images alongside text are not wrapped
+    body = ElementTree.fromstring("<body><div>Text</div><div><img src=\"a.png\" width=\"10\" height=\"20\" /></div></body>")
+    assert not mm_xhtml.wrap_single_image(body)
+    body = ElementTree.fromstring("<body><div><img src=\"a.png\" /></div></body>")
+    assert not mm_xhtml.wrap_single_image(body)
+
+def test_is_valid_xml():
+    """
+    Tests the is_valid_xml function.
+    """
+    assert mm_xhtml.is_valid_xml(ElementTree.fromstring("<body><p class=\"a\">Text</p></body>"))
+    body = ElementTree.fromstring("<body><a>Text</a></body>")
+    body[0].attrib["\""] = ""
+    assert not mm_xhtml.is_valid_xml(body)
+
 def test_clean_html():
     """
     Tests the clean_html function
@@ -296,6 +349,46 @@ def test_clean_html():
     xml = mm_xhtml.clean_html(html_file, add_smart_quotes=True)
     assert xml == "<p>“This is text”</p><p>‘This is more text’</p>"
 
+def test_get_html_paragraphs():
+    """
+    Tests the get_html_paragraphs function.
+    """
+    # Test that the paragraphs match cleaning the whole file
+    for filename in ["basic.html", "badformat.html", "deviantart.htm", "unformatted.html"]:
+        html_file = abspath(join(mm_test.BASIC_HTML_DIRECTORY, filename))
+        paragraphs = list(mm_xhtml.get_html_paragraphs(html_file, True))
+        assert "".join(paragraphs) == mm_xhtml.clean_html(html_file, True)
+    # Test that the HTML is cut into paragraph elements
+    html_file = abspath(join(mm_test.BASIC_HTML_DIRECTORY, "badformat.html"))
+    paragraphs = list(mm_xhtml.get_html_paragraphs(html_file, False))
+    assert paragraphs == ["<p>This is all a <i>single</i> paragraph!</p>",
+            "<p>This is a separate paragraph.</p>", "<p>Badly <i>formatted</i> paragraph.</p>",
+            "<p>This should be <b>separate!</b></p>", "<p>This is fine as one</p>"]
+
+def test_get_text_paragraphs():
+    """
+    Tests the get_text_paragraphs function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        text_file = abspath(join(temp_dir, "text.txt"))
+        texts = ["\n  First line\nsame paragraph.\n\n\nSecond.\n \n",
+                "\tIndented paragraph\n  still going.\n\tNext indented.\n    Spaced out.\n",
+                "\"Quote starting.\"\nNew paragraph\n\"Another quote\"\n“Fancy”\nEnd",
+                "No breaks at all", "   \n\n  "]
+        for text in texts:
+            mm_file_tools.write_text_file(text_file, text)
+            compare = html_string_tools.text_to_paragraphs(text.strip(), contains_html=False)
+            # Test that the paragraphs match converting the whole text, no matter where blocks are cut
+            for block_size in [1, 2, 5, 1048576]:
+                paragraphs = list(mm_xhtml.get_text_paragraphs(text_file, False, block_size=block_size))
+                assert "".join(paragraphs) == compare
+        # Test that indented paragraphs are returned before the whole file is read
+        mm_file_tools.write_text_file(text_file, "\tParagraph one.\n\tParagraph two.\n" + ("\tMore text.\n" * 1000))
+        paragraphs = mm_xhtml.get_text_paragraphs(text_file, True, block_size=64)
+        assert next(paragraphs) == "<p>Paragraph one.</p>"
+        assert next(paragraphs) == "<p>Paragraph two.</p>"
+        assert len(list(paragraphs)) == 1000
+
 def test_image_to_xml():
     """
     Tests the image_to_xhtml function.
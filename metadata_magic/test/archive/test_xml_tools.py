@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import metadata_magic.archive.xml_tools as mm_xml_tools
+from xml.etree import ElementTree
+
+def test_escape_text():
+    """
+    Tests the escape_text function.
+    """
+    assert mm_xml_tools.escape_text("Normal text") == "Normal text"
+    assert mm_xml_tools.escape_text("<a> & \"b\"") == "&lt;a&gt; &amp; \"b\""
+
+def test_escape_attribute():
+    """
+    Tests the escape_attribute function.
+    """
+    assert mm_xml_tools.escape_attribute("Normal") == "Normal"
+    assert mm_xml_tools.escape_attribute("<a> & \"b\"\n") == "&lt;a&gt; &amp; &quot;b&quot;&#10;"
+
+def test_get_ascii():
+    """
+    Tests the get_ascii function.
+    """
+    assert mm_xml_tools.get_ascii("<a>Text</a>") == "<a>Text</a>"
+    assert mm_xml_tools.get_ascii("<a>★ünicode</a>") == "<a>&#9733;&#252;nicode</a>"
+
+def test_get_xml_string():
+    """
+    Tests the get_xml_string function.
+    """
+    # Test writing indented XML
+    base = ElementTree.fromstring("<base a=\"1\"><sub>Text &amp; more</sub><empty/><list><item>A</item></list></base>")
+    xml = mm_xml_tools.get_xml_string(base, "  ")
+    compare = "<base a=\"1\">"
+    compare = f"{compare}\n  <sub>Text &amp; more</sub>"
+    compare = f"{compare}\n  <empty />"
+    compare = f"{compare}\n  <list>"
+    compare = f"{compare}\n    <item>A</item>"
+    compare = f"{compare}\n  </list>"
+    compare = f"{compare}\n</base>"
+    assert xml == compare
+    # Test writing compact XML
+    assert mm_xml_tools.get_xml_string(base, None) == ElementTree.tostring(base).decode("UTF-8")
+    # Test that paragraphs and text between elements stay on one line
+    base = ElementTree.fromstring("<body><p>Some <i>text</i></p><a>A</a> - <a>B</a><div><b>C</b></div></body>")
+    xml = mm_xml_tools.get_xml_string(base, "    ")
+    compare = "<body>"
+    compare = f"{compare}\n    <p>Some <i>text</i></p>"
+    compare = f"{compare}\n    <a>A</a> - <a>B</a>"
+    compare = f"{compare}\n    <div>"
+    compare = f"{compare}\n        <b>C</b>"
+    compare = f"{compare}\n    </div>"
+    compare = f"{compare}\n</body>"
+    assert xml == compare
+    # Test writing namespaces and non-ASCII characters
+    base = ElementTree.Element("{http://www.w3.org/2000/svg}svg")
+    title = ElementTree.SubElement(base, "{http://www.w3.org/2000/svg}title")
+    title.text = "Tëst"
+    ElementTree.register_namespace("svgns", "http://www.w3.org/2000/svg")
+    xml = mm_xml_tools.get_xml_string(base, "    ")
+    compare = "<svgns:svg xmlns:svgns=\"http://www.w3.org/2000/svg\">"
+    compare = f"{compare}\n    <svgns:title>T&#235;st</svgns:title>"
+    compare = f"{compare}\n</svgns:svg>"
+    assert xml == compare
+    assert mm_xml_tools.get_xml_string(base, None) == ElementTree.tostring(base).decode("UTF-8")
+    # Test that nothing is returned if the private namespace function is missing
+    assert mm_xml_tools.get_namespaces(base) is not None
+    namespaces = ElementTree._namespaces
+    try:
+        del ElementTree._namespaces
+        assert mm_xml_tools.get_namespaces(base) is None
+    finally:
+        ElementTree._namespaces = namespaces
+    # Test falling back to the output of ElementTree.tostring
+    get_namespaces = mm_xml_tools.get_namespaces
+    try:
+        mm_xml_tools.get_namespaces = lambda element: None
+        assert mm_xml_tools.get_xml_string(base, "    ") == compare
+        assert mm_xml_tools.get_xml_string(base, None) == ElementTree.tostring(base).decode("UTF-8")
+    finally:
+        mm_xml_tools.get_namespaces = get_namespaces
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
+import os
+import tempfile
 import metadata_magic.config as mm_config
+import metadata_magic.file_tools as mm_file_tools
+from os.path import abspath, join
 
 def test_get_default_config_paths():
     """
@@ -17,3 +21,47 @@ def test_get_config():
     paths = ["/non/existant/file.json"]
     config = mm_config.get_config(paths)
     assert config["json_reader"]["title"]["keys"] == [["title"], ["info", "title"]]
+    assert config["json_reader"]["publisher"]["match"][0]["regex"].fullmatch("deviantart")
+    # Test that the same compiled config is returned while the file is unchanged
+    assert mm_config.get_config(paths) is config
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test that invalid config files are skipped
+        invalid_file = abspath(join(temp_dir, "invalid.json"))
+        mm_file_tools.write_json_file(invalid_file, {"json_reader":{"title":{"keys":"title"}}})
+        config = mm_config.get_config([invalid_file])
+        assert config is mm_config.get_config([])
+        # Test reading a valid config file
+        contents = mm_file_tools.read_json_file(mm_config.DEFAULT_CONFIG_FILE)
+        contents["json_reader"]["title"]["keys"] = [["name"]]
+        config_file = abspath(join(temp_dir, "config.json"))
+        mm_file_tools.write_json_file(config_file, contents)
+        config = mm_config.get_config([invalid_file, config_file])
+        assert config["json_reader"]["title"]["keys"] == [["name"]]
+        # Test that changed config files are read again
+        contents["json_reader"]["title"]["keys"] = [["other"], ["name"]]
+        mm_file_tools.write_json_file(config_file, contents)
+        stat = os.stat(config_file)
+        os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        config = mm_config.get_config([config_file])
+        assert config["json_reader"]["title"]["keys"] == [["other"], ["name"]]
+        # Test that unchanged config files are only read once
+        assert mm_config.get_config([config_file]) is config
+
+def test_validate_config():
+    """
+    Tests the validate_config function.
+    """
+    # Test validating the default config
+    config = mm_file_tools.read_json_file(mm_config.DEFAULT_CONFIG_FILE)
+    assert mm_config.validate_config(config) == []
+    # Test validating configs with problems
+    assert mm_config.validate_config({}) == ["json_reader is missing"]
+    config["json_reader"]["id"]["keys"] = [["id"], []]
+    config["json_reader"]["publisher"]["match"][0]["match"] = "(unclosed"
+    del config["json_reader"]["url"]
+    errors = mm_config.validate_config(config)
+    assert len(errors) == 4
+    assert errors[0].startswith("json_reader.id.keys must only contain non-empty lists of keys")
+    assert errors[1] == "json_reader.url.keys is missing"
+    assert errors[2].startswith("json_reader.publisher.match has an invalid pattern")
+    assert errors[3] == "json_reader.url.patterns is missing"
@@ -8,6 +8,31 @@ import metadata_magic.error as mm_error
 import metadata_magic.config as mm_config
 from os.path import abspath, basename, join
 
+def test_get_directory_scan():
+    """
+    Tests the get_directory_scan function.
+    """
+    # Test scanning a directory with JSON pairs
+    scan = mm_error.get_directory_scan(mm_test.PAIR_DIRECTORY)
+    assert len(scan["jsons"]) == 14
+    assert len(scan["media"]) == 15
+    assert len(scan["pairs"]) == 12
+    assert len(scan["archives"]) == 1
+    assert basename(scan["archives"][0]) == "A.A.mkv"
+    assert len(scan["json_directories"]) == 6
+    assert mm_test.PAIR_MISSING_DIRECTORY in scan["json_directories"]
+    # Test scanning a directory with archives
+    scan = mm_error.get_directory_scan(mm_test.ARCHIVE_CBZ_DIRECTORY)
+    assert scan["jsons"] == []
+    assert len(scan["archives"]) == 4
+    assert basename(scan["archives"][0]) == "basic.CBZ"
+    assert scan["json_directories"] == set()
+    # Test that archive metadata is only read once
+    metadata = mm_error.get_archive_metadata(scan, scan["archives"][0])
+    assert metadata["title"] == "Cómic"
+    assert mm_error.get_archive_metadata(scan, scan["archives"][0]) is metadata
+    assert list(scan["archive_metadata"].keys()) == [scan["archives"][0]]
+
 def test_find_long_descriptions():
     """
     Tests the find_long_descriptions function.
@@ -53,6 +78,10 @@ def test_find_missing_metadata():
     assert abspath(join(missing[1], os.pardir)) == mm_test.PAIR_MISSING_DIRECTORY
     # Test that directories with no jsons are not counted
     assert mm_error.find_missing_metadata(mm_test.BASIC_DIRECTORY) == []
+    # Test using an existing directory scan
+    scan = mm_error.get_directory_scan(mm_test.PAIR_DIRECTORY)
+    assert mm_error.find_missing_metadata(mm_test.PAIR_DIRECTORY, scan) == missing
+    assert len(mm_error.find_missing_media(mm_test.PAIR_DIRECTORY, scan)) == 2
 
 def test_find_missing_fields():
     """
@@ -120,3 +149,26 @@ def test_find_invalid_archives():
     assert len(missing) == 2
     assert basename(missing[0]) == "corrupt.epub"
     assert basename(missing[1]) == "corrupt.CBZ"
+
+def test_find_duplicates():
+    """
+    Tests the find_duplicates function.
+    """
+    original = os.environ.get("METADATA_MAGIC_HASH_CACHE")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ["METADATA_MAGIC_HASH_CACHE"] = abspath(join(temp_dir, "hashes.json"))
+            # Copy media under different names
+            media_dir = abspath(join(temp_dir, "media"))
+            shutil.copytree(mm_test.ARCHIVE_CBZ_DIRECTORY, media_dir)
+            sub_dir = abspath(join(media_dir, "sub"))
+            os.mkdir(sub_dir)
+            shutil.copy(abspath(join(media_dir, "basic.CBZ")), abspath(join(sub_dir, "renamed.cbz")))
+            # Test finding the duplicate media
+            duplicates = mm_error.find_duplicates(media_dir)
+            assert len(duplicates) == 1
+            assert [basename(file) for file in duplicates[0]] == ["basic.CBZ", "renamed.cbz"]
+    finally:
+        os.environ.pop("METADATA_MAGIC_HASH_CACHE")
+        if original is not None:
+            os.environ["METADATA_MAGIC_HASH_CACHE"] = original
@@ -3,6 +3,7 @@
 import os
 import shutil
 import tempfile
+import zipfile
 import metadata_magic.test as mm_test
 import metadata_magic.file_tools as mm_file_tools
 from os.path import abspath, basename, join
@@ -23,6 +24,27 @@ def test_read_text_file():
     # Test reading a non-text file
     assert mm_file_tools.read_text_file(mm_test.BASIC_DIRECTORY) is None
 
+def test_read_text_blocks():
+    """
+    Tests the read_text_blocks function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test reading a file in blocks, including characters split between blocks
+        text_file = abspath(join(temp_dir, "text.txt"))
+        with open(text_file, "wb") as out_file:
+            out_file.write("Ünicode tëxt.".encode("utf-8"))
+        blocks = list(mm_file_tools.read_text_blocks(text_file, block_size=2))
+        assert len(blocks) > 1
+        assert "".join(blocks) == "Ünicode tëxt."
+        # Test reading with a different encoding
+        text_file = abspath(join(mm_test.BASIC_DIRECTORY, "text", "latin1.txt"))
+        assert "".join(mm_file_tools.read_text_blocks(text_file, "latin_1")).strip() == "This is lätin1."
+        # Test reading with an invalid encoding
+        try:
+            list(mm_file_tools.read_text_blocks(text_file))
+            assert False
+        except UnicodeDecodeError: pass
+
 def test_write_text_file():
     """
     Tests the write_text_file function.
@@ -61,6 +83,45 @@ def test_read_json_file():
     assert mm_file_tools.read_json_file(json_file) == {}
     assert mm_file_tools.read_json_file(mm_test.BASIC_DIRECTORY) == {}
 
+def test_read_json_keys():
+    """
+    Tests the read_json_keys function.
+    """
+    projection = {"name":None, "internal":{"key":None}, "missing":None}
+    # Test reading projected keys from basic JSON files
+    json_directory = abspath(join(mm_test.BASIC_DIRECTORY, "json"))
+    for min_size in [0, 65536]:
+        json_file = abspath(join(json_directory, "unicode.json"))
+        json = mm_file_tools.read_json_keys(json_file, projection, min_size=min_size)
+        assert json == {"name":"vãlue", "internal":{"key":"another"}}
+        json_file = abspath(join(json_directory, "latin1.JSON"))
+        json = mm_file_tools.read_json_keys(json_file, {"new":None, "other":{"a":None}}, min_size=min_size)
+        assert json == {"new":"Títle"}
+    # Test skipping large values that aren't projected
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_file = abspath(join(temp_dir, "large.json"))
+        contents = {"comments":[{"text":"a \"}]{[ b", "n":i} for i in range(0, 5000)],
+                "thumbnail":"A" * 100000, "name":"Name", "internal":{"skip":[1, 2, 3], "key":[True, None, 1.5]}}
+        mm_file_tools.write_json_file(json_file, contents)
+        json = mm_file_tools.read_json_keys(json_file, projection, min_size=0)
+        assert json == {"name":"Name", "internal":{"key":[True, None, 1.5]}}
+        # Test skipping values nested too deeply to skip in one match
+        contents["comments"] = [[[[[[[[[[{"a":"]"}]]]]]]]]], {}]
+        mm_file_tools.write_json_file(json_file, contents)
+        json = mm_file_tools.read_json_keys(json_file, projection, min_size=0)
+        assert json == {"name":"Name", "internal":{"key":[True, None, 1.5]}}
+        # Test that values that can't be projected into are kept whole
+        contents["images"] = [{"url":"/image", "size":5}]
+        mm_file_tools.write_json_file(json_file, contents)
+        list_projection = {"images":{0:{"url":None}}, "name":{"first":None}}
+        for min_size in [0, 65536 * 1024]:
+            json = mm_file_tools.read_json_keys(json_file, list_projection, min_size=min_size)
+            assert json == {"images":[{"url":"/image", "size":5}], "name":"Name"}
+        # Test reading invalid JSON files
+        mm_file_tools.write_text_file(json_file, "{\"name\":\"Name\", \"comments\":[1, 2")
+        assert mm_file_tools.read_json_keys(json_file, projection, min_size=0) == {}
+        assert mm_file_tools.read_json_keys(abspath(join(temp_dir, "missing.json")), projection) == {}
+
 def test_write_json_file():
     """
     Tests the write_json_file function.
@@ -167,6 +228,36 @@ def test_extract_zip():
         assert files[6] == "folder-2"
         assert os.listdir(abspath(join(extract_dir, "folder"))) == ["outside.txt"]
         assert os.listdir(abspath(join(extract_dir, "folder-2"))) == ["internal.txt"]
+    # Test that members can't be extracted outside the extraction directory
+    with tempfile.TemporaryDirectory() as temp_dir:
+        unsafe_zip = abspath(join(temp_dir, "unsafe.zip"))
+        with zipfile.ZipFile(unsafe_zip, "w") as out_file:
+            out_file.writestr("../outside.txt", "Outside")
+            out_file.writestr("/absolute/file.txt", "Absolute")
+            out_file.writestr("inner/../../up.txt", "Up")
+        extract_dir = abspath(join(temp_dir, "extract"))
+        os.mkdir(extract_dir)
+        assert mm_file_tools.extract_zip(unsafe_zip, extract_dir)
+        assert sorted(os.listdir(temp_dir)) == ["extract", "unsafe.zip"]
+        assert sorted(os.listdir(extract_dir)) == ["absolute", "inner", "outside.txt"]
+        assert mm_file_tools.read_text_file(abspath(join(extract_dir, "outside.txt"))) == "Outside"
+        assert mm_file_tools.read_text_file(abspath(join(extract_dir, "inner", "up.txt"))) == "Up"
+    # Test extracting only the members within a prefix folder
+    zip_file = abspath(join(mm_test.BASIC_DIRECTORY, "archive.zip"))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        assert mm_file_tools.extract_zip(zip_file, temp_dir, create_folder=True, prefix="Internal")
+        assert os.listdir(temp_dir) == ["archive"]
+        archive_dir = abspath(join(temp_dir, "archive"))
+        assert sorted(os.listdir(archive_dir)) == ["Text1.txt", "Text2.txt"]
+        assert not mm_file_tools.extract_zip(zip_file, temp_dir, prefix="Non-existant")
+        assert os.listdir(temp_dir) == ["archive"]
+    # Test extracting only the members that match a filter
+    with tempfile.TemporaryDirectory() as temp_dir:
+        include = lambda path: path.endswith(".txt")
+        assert mm_file_tools.extract_zip(zip_file, temp_dir, include=include)
+        assert sorted(os.listdir(temp_dir)) == ["DELETE.txt", "Internal"]
+        internal_dir = abspath(join(temp_dir, "Internal"))
+        assert sorted(os.listdir(internal_dir)) == ["Text1.txt", "Text2.txt"]
     # Test if an invalid zip file is given
     with tempfile.TemporaryDirectory() as temp_dir:
         assert not mm_file_tools.extract_zip(non_zip_file, temp_dir)
@@ -334,3 +425,36 @@ def test_directory_contains():
     assert mm_file_tools.directory_contains(basic_directory, [".txt", ".png"])
     assert not mm_file_tools.directory_contains(basic_directory, ".png")
     assert not mm_file_tools.directory_contains(basic_directory, [".jpeg", ".png", ".pdf"])
+
+def test_get_staging_directory():
+    """
+    Tests the get_staging_directory function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test getting the directory of the file by default
+        sub_directory = abspath(join(temp_dir, "sub"))
+        os.mkdir(sub_directory)
+        file = abspath(join(sub_directory, "file.cbz"))
+        assert mm_file_tools.get_staging_directory(file) == sub_directory
+        # Test getting a scratch directory on the same device
+        assert mm_file_tools.get_staging_directory(file, temp_dir) == temp_dir
+        # Test getting the file directory if the scratch directory doesn't exist
+        scratch = abspath(join(temp_dir, "non-existant"))
+        assert mm_file_tools.get_staging_directory(file, scratch) == sub_directory
+
+def test_replace_file():
+    """
+    Tests the replace_file function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test replacing an existing file
+        file = abspath(join(temp_dir, "file.txt"))
+        new_file = abspath(join(temp_dir, "new.txt"))
+        mm_file_tools.write_text_file(file, "Old")
+        mm_file_tools.write_text_file(new_file, "New")
+        assert mm_file_tools.replace_file(new_file, file)
+        assert os.listdir(temp_dir) == ["file.txt"]
+        assert mm_file_tools.read_text_file(file) == "New"
+        # Test replacing with a file that doesn't exist
+        assert not mm_file_tools.replace_file(new_file, file)
+        assert mm_file_tools.read_text_file(file) == "New"
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import metadata_magic.hash_tools as mm_hash_tools
+from os.path import abspath, join
+
+def test_get_partial_hash():
+    """
+    Tests the get_partial_hash function.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test that small files are hashed in full
+        small_file = abspath(join(temp_dir, "small.bin"))
+        with open(small_file, "wb") as out_file:
+            out_file.write(b"Small file.")
+        size = os.stat(small_file).st_size
+        assert mm_hash_tools.get_partial_hash(small_file, size) == mm_hash_tools.get_full_hash(small_file)
+        # Test that only the first and last blocks of large files are hashed
+        block = mm_hash_tools.BLOCK_SIZE
+        first_file = abspath(join(temp_dir, "first.bin"))
+        second_file = abspath(join(temp_dir, "second.bin"))
+        with open(first_file, "wb") as out_file:
+            out_file.write(b"A" * block + b"B" * block + b"C" * block)
+        with open(second_file, "wb") as out_file:
+            out_file.write(b"A" * block + b"D" * block + b"C" * block)
+        size = block * 3
+        assert mm_hash_tools.get_partial_hash(first_file, size) == mm_hash_tools.get_partial_hash(second_file, size)
+        assert not mm_hash_tools.get_full_hash(first_file) == mm_hash_tools.get_full_hash(second_file)
+
+def test_find_duplicate_files():
+    """
+    Tests the find_duplicate_files function.
+    """
+    original = os.environ.get("METADATA_MAGIC_HASH_CACHE")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_file = abspath(join(temp_dir, "cache", "hashes.json"))
+            os.environ["METADATA_MAGIC_HASH_CACHE"] = cache_file
+            # Create files with matching sizes and partial contents
+            block = mm_hash_tools.BLOCK_SIZE
+            contents = {"a.bin":b"A" * block * 3, "b.bin":b"A" * block * 3, "c.bin":b"A" * block + b"B" + b"A" * (block * 2 - 1),
+                    "d.txt":b"Small", "e.txt":b"Small", "f.txt":b"Other", "g.txt":b"", "h.txt":b"", "i.bin":b"B" * block * 3}
+            files = []
+            for filename in sorted(contents):
+                files.append(abspath(join(temp_dir, filename)))
+                with open(files[-1], "wb") as out_file:
+                    out_file.write(contents[filename])
+            # Test finding duplicate files
+            duplicates = mm_hash_tools.find_duplicate_files(files, workers=2)
+            assert duplicates == [[files[0], files[1]], [files[3], files[4]]]
+            # Test that hashes were cached
+            hashes = mm_hash_tools.read_hash_cache()
+            assert len(hashes) == 7
+            key = mm_hash_tools.get_file_key(os.stat(files[0]))
+            assert hashes[key]["full"] == mm_hash_tools.get_full_hash(files[0])
+            assert "full" not in hashes[mm_hash_tools.get_file_key(os.stat(files[8]))]
+            key = mm_hash_tools.get_file_key(os.stat(files[2]))
+            assert hashes[key]["full"] == mm_hash_tools.get_full_hash(files[2])
+            # Test that cached hashes are used
+            hashes[key]["partial"] = hashes[mm_hash_tools.get_file_key(os.stat(files[0]))]["partial"]
+            hashes[key]["full"] = hashes[mm_hash_tools.get_file_key(os.stat(files[0]))]["full"]
+            mm_hash_tools.write_hash_cache(hashes)
+            duplicates = mm_hash_tools.find_duplicate_files(files)
+            assert duplicates == [[files[0], files[1], files[2]], [files[3], files[4]]]
+            # Test not using the cache
+            duplicates = mm_hash_tools.find_duplicate_files(files, use_cache=False)
+            assert duplicates == [[files[0], files[1]], [files[3], files[4]]]
+            # Test that an invalid cache is ignored
+            with open(cache_file, "w") as out_file:
+                out_file.write("Not JSON")
+            assert mm_hash_tools.read_hash_cache() == {}
+            duplicates = mm_hash_tools.find_duplicate_files(files)
+            assert duplicates == [[files[0], files[1]], [files[3], files[4]]]
+    finally:
+        os.environ.pop("METADATA_MAGIC_HASH_CACHE")
+        if original is not None:
+            os.environ["METADATA_MAGIC_HASH_CACHE"] = original
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import metadata_magic.journal as mm_journal
+from os.path import abspath, basename, exists, join
+
+def test_get_journal_file():
+    """
+    Tests the get_journal_file function.
+    """
+    old_journal = os.environ.get("METADATA_MAGIC_JOURNAL")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Test that journals are kept in the journal directory
+            os.environ["METADATA_MAGIC_JOURNAL"] = temp_dir
+            journal_file = mm_journal.get_journal_file("update", "/a/directory")
+            assert abspath(join(journal_file, os.pardir)) == abspath(temp_dir)
+            assert basename(journal_file).startswith("update-")
+            assert journal_file.endswith(".jsonl")
+            # Test that journals differ by command and directory
+            assert journal_file == mm_journal.get_journal_file("update", "/a/directory/")
+            assert not journal_file == mm_journal.get_journal_file("bulk-archive", "/a/directory")
+            assert not journal_file == mm_journal.get_journal_file("update", "/a/other")
+    finally:
+        if old_journal is None:
+            os.environ.pop("METADATA_MAGIC_JOURNAL", None)
+        else:
+            os.environ["METADATA_MAGIC_JOURNAL"] = old_journal
+
+def test_journal():
+    """
+    Tests the open_journal, write_journal_entry, sync_journal, read_journal, and close_journal functions.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test writing entries to a new journal
+        journal_file = abspath(join(temp_dir, "journals", "run.jsonl"))
+        journal = mm_journal.open_journal(journal_file, {"option":1})
+        assert journal["run"] == {"option":1}
+        assert journal["items"] == dict()
+        position = mm_journal.write_journal_entry(journal, "a", "started", {"archive":"a.cbz"})
+        mm_journal.sync_journal(journal, position)
+        assert journal["synced"] >= position
+        mm_journal.write_journal_entry(journal, "b", "started")
+        mm_journal.write_journal_entry(journal, "a", "done")
+        mm_journal.close_journal(journal)
+        # Test reading the journal with entries for each item merged
+        contents = mm_journal.read_journal(journal_file)
+        assert contents["run"] == {"option":1}
+        assert contents["items"]["a"] == {"item":"a", "state":"done", "archive":"a.cbz"}
+        assert contents["items"]["b"] == {"item":"b", "state":"started"}
+        # Test that a partly written last line is ignored
+        with open(journal_file, "a", encoding="UTF-8") as out_file:
+            out_file.write("{\"item\":\"c\", \"sta")
+        contents = mm_journal.read_journal(journal_file)
+        assert sorted(contents["items"]) == ["a", "b"]
+        # Test resuming the journal, keeping the original run info
+        journal = mm_journal.open_journal(journal_file, {"option":2}, resume=True)
+        assert journal["run"] == {"option":1}
+        assert journal["items"]["b"]["state"] == "started"
+        mm_journal.write_journal_entry(journal, "b", "done")
+        mm_journal.close_journal(journal)
+        contents = mm_journal.read_journal(journal_file)
+        assert contents["items"]["b"]["state"] == "done"
+        assert sorted(contents["items"]) == ["a", "b"]
+        # Test starting over without resuming
+        journal = mm_journal.open_journal(journal_file, {"option":2})
+        assert journal["run"] == {"option":2}
+        assert journal["items"] == dict()
+        # Test that unfinished items are carried over when starting over
+        mm_journal.write_journal_entry(journal, "c", "started", {"archive":"c.cbz"})
+        mm_journal.close_journal(journal)
+        journal = mm_journal.open_journal(journal_file, {"option":3})
+        assert journal["run"] == {"option":3}
+        assert journal["items"] == {"c":{"item":"c", "state":"started", "archive":"c.cbz"}}
+        mm_journal.close_journal(journal)
+        contents = mm_journal.read_journal(journal_file)
+        assert contents["run"] == {"option":3}
+        assert contents["items"] == {"c":{"item":"c", "state":"started", "archive":"c.cbz"}}
+        journal = mm_journal.open_journal(journal_file, {"option":3}, resume=True)
+        mm_journal.write_journal_entry(journal, "c", "done")
+        # Test that the journal is removed once the run is finished
+        mm_journal.close_journal(journal, finished=True)
+        assert not exists(journal_file)
+        # Test reading a missing journal
+        assert mm_journal.read_journal(journal_file) == {"run":None, "items":dict()}
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import copy
+import pickle
 import metadata_magic.test as mm_test
 import metadata_magic.config as mm_config
 import metadata_magic.file_tools as mm_file_tools
@@ -100,6 +102,82 @@ def test_load_metadata():
     assert metadata["writers"] is None
     assert metadata["original"] == {}
 
+def test_get_json_projection():
+    """
+    Tests the get_json_projection function.
+    """
+    config = mm_config.get_config([])
+    projection = mm_meta_reader.get_json_projection(config, ["title", "other", "original"])
+    assert config["json_reader"]["projection"] == mm_meta_reader.get_json_projection(config)
+    assert projection["title"] is None
+    assert projection["description"] is None
+    assert projection["other"] is None
+    assert "original" not in projection
+    for keys in config["json_reader"]["title"]["keys"] + config["json_reader"]["tags"]["keys"]:
+        value = projection
+        for key in keys:
+            value = value[key]
+            if value is None:
+                break
+        assert value is None
+    # Test that keylists that index into lists keep the whole list
+    config = copy.deepcopy(config)
+    config["json_reader"]["title"]["keys"] = [["images", 0, "title"], [0, "title"]]
+    projection = mm_meta_reader.get_json_projection(config)
+    assert projection["images"] is None
+    assert 0 not in projection
+
+def test_json_metadata():
+    """
+    Tests the JsonMetadata class and loading metadata without keeping the original JSON.
+    """
+    config = mm_config.get_config([])
+    json_file = abspath(join(mm_test.PAIR_DIRECTORY, "images", "bare.PNG.json"))
+    metadata = mm_meta_reader.load_metadata(json_file, config, "bare.png")
+    # Test that the record acts as a dictionary
+    contents = dict(metadata)
+    assert sorted(contents) == sorted(mm_meta_reader.METADATA_KEYS + ["original"])
+    assert len(metadata) == 13
+    assert metadata == contents
+    assert metadata.get("title") == "Émpty"
+    assert metadata.get("non-existant") is None
+    assert "tags" in metadata
+    assert not hasattr(metadata, "__dict__")
+    # Test adding and removing extra keys
+    metadata["other"] = 5
+    assert metadata["other"] == 5
+    assert len(metadata) == 14
+    del metadata["other"]
+    assert "other" not in metadata
+    try:
+        del metadata["title"]
+        assert 1 == 0
+    except KeyError: pass
+    # Test that the original JSON is left out until asked for once dropped
+    lean = mm_meta_reader.load_metadata(json_file, config, "bare.png", keep_original=False)
+    assert lean._original is None
+    assert "original" in lean
+    assert sorted(lean) == sorted(mm_meta_reader.METADATA_KEYS)
+    assert len(lean) == 12
+    assert lean == {key:value for key, value in contents.items() if not key == "original"}
+    assert lean["original"] == contents["original"]
+    assert mm_meta_reader.get_string_from_metadata(lean, "{title}") == "Émpty"
+    # Test loading only the needed keys with template keys
+    projected = mm_meta_reader.load_metadata(json_file, config, "bare.png", template_keys=["title", "unused"])
+    assert projected["original"] == contents["original"]
+    assert projected._original is None
+    assert projected.get_original_value("unused") == "Unused"
+    assert mm_meta_reader.get_string_from_metadata(projected, "{unused}") == "Unused"
+    # Test that the full original JSON is read again when it was only partly read
+    projected = mm_meta_reader.load_metadata(json_file, config, "bare.png", template_keys=[])
+    assert projected._projected == {"title":"Émpty"}
+    assert projected["original"] == contents["original"]
+    assert projected.get_original_value("unused") == "Unused"
+    assert projected == lean
+    # Test pickling the record
+    assert pickle.loads(pickle.dumps(lean)) == lean
+    assert pickle.loads(pickle.dumps(metadata)) == metadata
+
 def test_get_title():
     """
     Tests the get_title function.
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import time
+import random
+import multiprocessing
+import metadata_magic.pipeline as mm_pipeline
+
+def test_run_pipeline():
+    """
+    Tests the run_pipeline function.
+    """
+    # Test that items finishing out of order are passed to the callback in order
+    def slow_double(value:int) -> int:
+        time.sleep(random.random() * 0.01)
+        return value * 2
+    order = []
+    stages = [mm_pipeline.get_stage(slow_double), mm_pipeline.get_stage(lambda value: value + 1, workers=2)]
+    results = mm_pipeline.run_pipeline(list(range(0, 40)), stages, lambda item, result: order.append(item))
+    assert results == [(item * 2) + 1 for item in range(0, 40)]
+    assert order == list(range(0, 40))
+    # Test that exceptions become results and skip later stages
+    def check_value(value:int) -> int:
+        assert not value == 3
+        return value
+    called = []
+    stages = [mm_pipeline.get_stage(check_value), mm_pipeline.get_stage(lambda value: called.append(value) or value)]
+    results = mm_pipeline.run_pipeline([1, 2, 3, 4], stages)
+    assert results[:2] == [1, 2]
+    assert isinstance(results[2], AssertionError)
+    assert results[3] == 4
+    assert sorted(called) == [1, 2, 4]
+    # Test that returning False from the callback stops new items from starting
+    started = []
+    stages = [mm_pipeline.get_stage(lambda value: started.append(value) or value, workers=1)]
+    results = mm_pipeline.run_pipeline(list(range(0, 100)), stages, lambda item, result: not item == 2, max_pending=1)
+    assert results[:3] == [0, 1, 2]
+    assert results[3:] == [None] * 97
+    assert started == [0, 1, 2]
+    # Test running a stage in processes
+    stages = [mm_pipeline.get_stage(lambda value: -value), mm_pipeline.get_stage(abs, use_processes=True)]
+    assert mm_pipeline.run_pipeline([1, 2, 3], stages, cpu_workers=2) == [1, 2, 3]
+    # Test that worker processes are started before the thread stages run
+    stages = [mm_pipeline.get_stage(lambda value: len(multiprocessing.active_children()) >= 2),
+            mm_pipeline.get_stage(abs, use_processes=True)]
+    assert mm_pipeline.run_pipeline([1], stages, cpu_workers=2) == [True]
+    # Test running an empty pipeline
+    assert mm_pipeline.run_pipeline([], stages) == []
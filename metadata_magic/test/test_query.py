@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import metadata_magic.query as mm_query
+import metadata_magic.file_tools as mm_file_tools
+import metadata_magic.archive as mm_archive
+import metadata_magic.archive.comic_archive as mm_comic_archive
+from os.path import abspath, basename, join
+
+def create_test_cbz(directory:str, title:str, artists:list, tags:list, rating:str, date:str) -> str:
+    """
+    Creates a CBZ file with the given metadata for testing queries.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        mm_file_tools.write_text_file(abspath(join(temp_dir, "page.txt")), title)
+        metadata = mm_archive.get_empty_metadata()
+        metadata["title"] = title
+        metadata["artists"] = artists
+        metadata["tags"] = tags
+        metadata["age_rating"] = rating
+        metadata["date"] = date
+        cbz_file = mm_comic_archive.create_cbz(temp_dir, title, metadata)
+        return shutil.move(cbz_file, abspath(join(directory, basename(cbz_file))))
+
+def test_parse_query():
+    """
+    Tests the parse_query function.
+    """
+    # Test parsing terms joined with operators
+    assert mm_query.parse_query("tag:A") == ["term", "tag", "a"]
+    assert mm_query.parse_query("tag:A OR artist:\"Some Name\"") == ["or", ["term", "tag", "a"], ["term", "artist", "some name"]]
+    assert mm_query.parse_query("tag:A type:cbz") == ["and", ["term", "tag", "a"], ["term", "type", "cbz"]]
+    assert mm_query.parse_query("NOT (tag:a or thing) and date>=2020") == ["and",
+            ["not", ["or", ["term", "tag", "a"], ["term", None, "thing"]]], ["date", ">=", "2020"]]
+    # Test invalid queries
+    for query in ["(tag:a", "tag:a AND", "bad:field", "date>20", "tag:a )"]:
+        try:
+            mm_query.parse_query(query)
+            assert 1 == 0
+        except ValueError: pass
+
+def test_query_index():
+    """
+    Tests the refresh_index and run_query functions.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archive_directory = abspath(join(temp_dir, "archives"))
+        os.mkdir(archive_directory)
+        index_file = abspath(join(temp_dir, "index.json"))
+        first = create_test_cbz(archive_directory, "First", ["Artist A"], ["T", "Other"], "X18+", "2021-05-01")
+        second = create_test_cbz(archive_directory, "Second", ["Artist A"], ["T"], "Teen", "2019-01-01")
+        third = create_test_cbz(archive_directory, "Third", ["Artist B"], ["T"], "X18+", "2020-12-31")
+        # Test building the index and running queries
+        index = mm_query.refresh_index(archive_directory, index_file)
+        assert len(index["files"]) == 3
+        query = "rating:X18+ type:cbz artist:\"artist a\" tag:t date>2020"
+        assert mm_query.run_query(index, query) == [first]
+        assert mm_query.run_query(index, "tag:t AND date:2020") == [third]
+        assert mm_query.run_query(index, "date<2020-12-31") == [second]
+        assert mm_query.run_query(index, "date<=2020-12") == [second, third]
+        assert mm_query.run_query(index, "rating:teen OR artist:\"Artist B\"") == [second, third]
+        assert mm_query.run_query(index, "t AND NOT other") == [second, third]
+        assert mm_query.run_query(index, "type:epub") == []
+        # Test that the saved index is used
+        index = mm_query.read_index(index_file, archive_directory)
+        assert mm_query.run_query(index, "artist:\"artist a\"") == [first, second]
+        # Test refreshing the index after files change
+        os.remove(second)
+        metadata = mm_archive.get_info_from_archive(third)
+        metadata["tags"] = ["Changed"]
+        mm_archive.update_archive_info(third, metadata)
+        fourth = create_test_cbz(archive_directory, "Fourth", ["Artist A"], ["New"], "Everyone", None)
+        index = mm_query.refresh_index(archive_directory, index_file)
+        assert len(index["files"]) == 3
+        assert mm_query.run_query(index, "tag:t") == [first]
+        assert mm_query.run_query(index, "tag:changed OR tag:new") == [fourth, third]
+        assert mm_query.run_query(index, "artist:\"artist a\"") == [first, fourth]
+        assert mm_query.run_query(index, "date>2000") == [first, third]
+        assert len(index["postings"]["tag"]["other"]) == 1
+        assert "teen" not in index["postings"]["rating"]
+        # Test rebuilding the index from scratch
+        index = mm_query.refresh_index(archive_directory, index_file, rebuild=True)
+        assert mm_query.run_query(index, "tag:changed OR tag:new") == [fourth, third]
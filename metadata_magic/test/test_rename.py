@@ -106,6 +106,19 @@ def test_get_available_filename():
     # Test with invalid directory
     assert mm_rename.get_available_filename(".txt", "bare", "/non/existant/dir/") is None
 
+def test_get_unused_filename():
+    """
+    Tests the get_unused_filename function.
+    """
+    # Test getting a filename that isn't used
+    used = set(["name.txt", "pair.jpg", "pair-2.txt"])
+    assert mm_rename.get_unused_filename("a.txt", "Name?", set()) == "Name"
+    assert mm_rename.get_unused_filename("a.jpg", "Name", used) == "Name"
+    # Test getting a filename that is already used
+    assert mm_rename.get_unused_filename("a.TXT", "Name", used) == "Name-2"
+    assert mm_rename.get_unused_filename(["a.txt", "a.jpg"], "pair", used) == "pair-3"
+    assert mm_rename.get_unused_filename("a.txt", "páir", used, True) == "pair"
+
 def test_rename_file():
     """
     Tests the rename_file function.
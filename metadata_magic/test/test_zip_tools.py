@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import os
+import zipfile
+import tempfile
+import metadata_magic.test as mm_test
+import metadata_magic.zip_tools as mm_zip_tools
+from os.path import abspath, basename, join
+
+def test_read_zip_listing():
+    """
+    Tests the read_zip_listing and read_zip_listings functions.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test listing the members of a ZIP file
+        zip_file = abspath(join(temp_dir, "test.zip"))
+        with zipfile.ZipFile(zip_file, "w", compression=zipfile.ZIP_DEFLATED) as out_file:
+            out_file.writestr("mimetype", "text", compress_type=zipfile.ZIP_STORED)
+            out_file.writestr("folder/", "")
+            out_file.writestr("folder/Ünicode.txt", "Some text. " * 100)
+            out_file.comment = b"Comment"
+        listing = mm_zip_tools.read_zip_listing(zip_file)
+        assert listing["file"] == zip_file
+        assert listing["size"] == os.stat(zip_file).st_size
+        with zipfile.ZipFile(zip_file) as in_file:
+            infos = in_file.infolist()
+        assert [member.name for member in listing["members"]] == ["mimetype", "folder/", "folder/Ünicode.txt"]
+        for member, info in zip(listing["members"], infos):
+            assert member.size == info.file_size
+            assert member.compressed_size == info.compress_size
+            assert member.crc == info.CRC
+            assert member.offset == info.header_offset
+        # Test listing a ZIP file with data added to the start
+        offset_file = abspath(join(temp_dir, "offset.zip"))
+        with open(zip_file, "rb") as in_file, open(offset_file, "wb") as out_file:
+            out_file.write(b"Extra" * 10 + in_file.read())
+        listing = mm_zip_tools.read_zip_listing(offset_file)
+        assert listing["members"][2].offset == infos[2].header_offset + 50
+        assert mm_zip_tools.read_zip_member(listing, listing["members"][2]) == b"Some text. " * 100
+        # Test listing a ZIP64 file
+        zip64_file = abspath(join(temp_dir, "zip64.zip"))
+        with zipfile.ZipFile(zip64_file, "w") as out_file:
+            for i in range(0, 65600):
+                out_file.writestr(str(i), "")
+        assert len(mm_zip_tools.read_zip_listing(zip64_file)["members"]) == 65600
+        # Test listing invalid files
+        text_file = abspath(join(temp_dir, "text.zip"))
+        with open(text_file, "w", encoding="UTF-8") as out_file:
+            out_file.write("Not a ZIP file.")
+        assert mm_zip_tools.read_zip_listing(text_file) is None
+        assert mm_zip_tools.read_zip_listing(abspath(join(temp_dir, "missing.zip"))) is None
+        # Test listing a ZIP file with a name that isn't valid UTF-8
+        bad_name_file = abspath(join(temp_dir, "bad-name.zip"))
+        with zipfile.ZipFile(bad_name_file, "w") as out_file:
+            out_file.writestr("é.txt", "Text")
+        with open(bad_name_file, "rb") as in_file:
+            data = in_file.read()
+        with open(bad_name_file, "wb") as out_file:
+            out_file.write(data.replace("é".encode("utf-8"), b"\xff\xfe"))
+        assert mm_zip_tools.read_zip_listing(bad_name_file) is None
+        # Test listing many ZIP files at once
+        listings = mm_zip_tools.read_zip_listings([zip_file, text_file, offset_file, bad_name_file], workers=2)
+        assert listings[0] == mm_zip_tools.read_zip_listing(zip_file)
+        assert listings[1] is None
+        assert listings[2]["file"] == offset_file
+        assert listings[3] is None
+
+def test_find_zip_member():
+    """
+    Tests the get_listing_files and find_zip_member functions.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        zip_file = abspath(join(temp_dir, "test.zip"))
+        with zipfile.ZipFile(zip_file, "w") as out_file:
+            out_file.writestr("folder/", "")
+            out_file.writestr("content.opf", "A")
+            out_file.writestr("folder/image.PNG", "B")
+            out_file.writestr("folder/content.opf", "C")
+        listing = mm_zip_tools.read_zip_listing(zip_file)
+        # Test getting the file members
+        files = mm_zip_tools.get_listing_files(listing)
+        assert [member.name for member in files] == ["content.opf", "folder/image.PNG", "folder/content.opf"]
+        files = mm_zip_tools.get_listing_files(listing, [".png", ".jpg"])
+        assert [member.name for member in files] == ["folder/image.PNG"]
+        # Test finding members by name
+        assert mm_zip_tools.find_zip_member(listing, "content.opf").name == "content.opf"
+        assert mm_zip_tools.find_zip_member(listing, "content.opf", True).name == "folder/content.opf"
+        assert mm_zip_tools.find_zip_member(listing, "image.PNG") is None
+        assert mm_zip_tools.find_zip_member(listing, "image.PNG", True).name == "folder/image.PNG"
+
+def test_read_zip_member():
+    """
+    Tests the read_zip_member, extract_zip_member, and is_zip_valid functions.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Test reading stored and deflated members
+        zip_file = abspath(join(temp_dir, "test.zip"))
+        with zipfile.ZipFile(zip_file, "w") as out_file:
+            out_file.writestr("stored.txt", "Stored " * 50, compress_type=zipfile.ZIP_STORED)
+            out_file.writestr("sub/deflated.txt", "Deflated " * 50, compress_type=zipfile.ZIP_DEFLATED)
+            out_file.writestr("bzip.txt", "Bzip " * 50, compress_type=zipfile.ZIP_BZIP2)
+        listing = mm_zip_tools.read_zip_listing(zip_file)
+        assert mm_zip_tools.read_zip_member(listing, listing["members"][0]) == b"Stored " * 50
+        assert mm_zip_tools.read_zip_member(listing, listing["members"][1]) == b"Deflated " * 50
+        assert mm_zip_tools.read_zip_member(listing, listing["members"][2]) == b"Bzip " * 50
+        assert mm_zip_tools.is_zip_valid(listing)
+        # Test extracting a member
+        extracted = mm_zip_tools.extract_zip_member(listing, listing["members"][1], temp_dir)
+        assert basename(extracted) == "deflated.txt"
+        with open(extracted, "rb") as in_file:
+            assert in_file.read() == b"Deflated " * 50
+        # Test that corrupt members can't be read
+        with open(zip_file, "r+b") as out_file:
+            out_file.seek(listing["members"][0].offset + 50)
+            out_file.write(b"Corrupt")
+        assert mm_zip_tools.read_zip_member(listing, listing["members"][0]) is None
+        assert mm_zip_tools.extract_zip_member(listing, listing["members"][0], temp_dir) is None
+        assert not mm_zip_tools.is_zip_valid(listing)
+        assert not mm_zip_tools.is_zip_valid(None)
+    # Test checking the test archives
+    fine_file = abspath(join(mm_test.ARCHIVE_ERROR_DIRECTORY, "fine.cbz"))
+    assert mm_zip_tools.is_zip_valid(mm_zip_tools.read_zip_listing(fine_file))
+    corrupt_file = abspath(join(mm_test.ARCHIVE_ERROR_DIRECTORY, "internal", "corrupt.CBZ"))
+    assert not mm_zip_tools.is_zip_valid(mm_zip_tools.read_zip_listing(corrupt_file))
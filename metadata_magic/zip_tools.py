@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+import struct
+import zipfile
+import collections
+import concurrent.futures
+from os.path import abspath, basename, join
+from typing import List
+
+TAIL_SIZE = 131072
+END_RECORD = struct.Struct("<4s4H2LH")
+END_RECORD_64 = struct.Struct("<4sQ2H2L4Q")
+END_LOCATOR_64 = struct.Struct("<4sLQL")
+CENTRAL_RECORD = struct.Struct("<4s4B4HL2L5H2L")
+LOCAL_RECORD = struct.Struct("<4s2B4HL2L2H")
+ZipMember = collections.namedtuple("ZipMember", ["name", "size", "compressed_size", "crc", "offset", "method", "flags"])
+
+def get_zip64_values(extra:bytes, values:List[int]) -> List[int]:
+    """
+    Returns the sizes and offset of a central directory record, replacing any stored in its ZIP64 extra field.
+
+    :param extra: Extra field of the central directory record
+    :type extra: bytes, required
+    :param values: Size, compressed size, and header offset from the record itself
+    :type values: List[int], required
+    :return: Size, compressed size, and header offset of the member
+    :rtype: List[int]
+    """
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<2H", extra, position)
+        if header_id == 1:
+            field = position + 4
+            for i in range(0, len(values)):
+                if values[i] == 0xFFFFFFFF and field + 8 <= position + 4 + length:
+                    values[i] = struct.unpack_from("<Q", extra, field)[0]
+                    field += 8
+            break
+        position += 4 + length
+    return values
+
+def read_zip_listing(zip_path:str) -> dict:
+    """
+    Returns the members of a ZIP file, read only from its end of central directory record and central directory.
+    Both are usually read in a single read from the end of the file, without parsing any member data.
+
+    :param zip_path: Path of the ZIP file
+    :type zip_path: str, required
+    :return: Listing with "file", "size", and "members" keys, members as ZipMember tuples, None if the ZIP file couldn't be read
+    :rtype: dict
+    """
+    full_path = abspath(zip_path)
+    try:
+        with open(full_path, "rb") as in_file:
+            # Read the end of the file, where the central directory should be
+            file_size = os.fstat(in_file.fileno()).st_size
+            tail_start = max(file_size - TAIL_SIZE, 0)
+            in_file.seek(tail_start)
+            tail = in_file.read()
+            # Find the end of central directory record
+            end = tail.rfind(b"PK\x05\x06")
+            if end == -1 or end + END_RECORD.size > len(tail):
+                return None
+            record = END_RECORD.unpack_from(tail, end)
+            count, directory_size, directory_offset = record[4], record[5], record[6]
+            directory_end = tail_start + end
+            # Get the ZIP64 end of central directory record if needed
+            locator = end - END_LOCATOR_64.size
+            if locator >= 0 and tail[locator:locator + 4] == b"PK\x06\x07":
+                start = locator - END_RECORD_64.size
+                if start < 0 or not tail[start:start + 4] == b"PK\x06\x06":
+                    return None
+                record = END_RECORD_64.unpack_from(tail, start)
+                count, directory_size, directory_offset = record[7], record[8], record[9]
+                directory_end = tail_start + start
+            # Account for any data added to the start of the file
+            concat = directory_end - directory_size - directory_offset
+            directory_start = directory_end - directory_size
+            if concat < 0 or directory_start < 0:
+                return None
+            # Read the central directory, only reading again if it didn't fit in the tail
+            if directory_start >= tail_start:
+                directory = tail[directory_start - tail_start:directory_end - tail_start]
+            else:
+                in_file.seek(directory_start)
+                directory = in_file.read(directory_size)
+    except OSError: return None
+    # Read each central directory record
+    members = []
+    position = 0
+    while position + CENTRAL_RECORD.size <= len(directory):
+        record = CENTRAL_RECORD.unpack_from(directory, position)
+        if not record[0] == b"PK\x01\x02":
+            return None
+        position += CENTRAL_RECORD.size
+        name = directory[position:position + record[12]]
+        try:
+            name = name.decode("utf-8" if record[5] & 0x800 or name.isascii() else "cp437")
+        except UnicodeDecodeError: return None
+        size, compressed_size, offset = record[11], record[10], record[18]
+        if size == 0xFFFFFFFF or compressed_size == 0xFFFFFFFF or offset == 0xFFFFFFFF:
+            extra = directory[position + record[12]:position + record[12] + record[13]]
+            size, compressed_size, offset = get_zip64_values(extra, [size, compressed_size, offset])
+        position += record[12] + record[13] + record[14]
+        members.append(ZipMember(name, size, compressed_size, record[9], offset + concat, record[6], record[5]))
+    if not len(members) == count:
+        return None
+    return {"file":full_path, "size":file_size, "members":members}
+
+def read_zip_listings(zip_files:List[str], workers:int=None) -> List[dict]:
+    """
+    Returns the member listings of many ZIP files, read in parallel threads.
+
+    :param zip_files: Paths of the ZIP files
+    :type zip_files: List[str], required
+    :param workers: Number of threads to read files with, defaults to None
+    :type workers: int, optional
+    :return: Listing of each file as returned by read_zip_listing, in the same order as the given files
+    :rtype: List[dict]
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_zip_listing, zip_files))
+
+def get_listing_files(listing:dict, extensions:List[str]=None) -> List[ZipMember]:
+    """
+    Returns the file members of a ZIP listing, leaving out directories.
+
+    :param listing: ZIP listing, as returned by read_zip_listing
+    :type listing: dict, required
+    :param extensions: Only include files with these extensions, defaults to None
+    :type extensions: List[str], optional
+    :return: File members, in the order they appear in the ZIP file
+    :rtype: List[ZipMember]
+    """
+    if extensions is None:
+        return [member for member in listing["members"] if not member.name.endswith("/")]
+    extensions = tuple(extensions)
+    return [member for member in listing["members"] if member.name.lower().endswith(extensions)]
+
+def find_zip_member(listing:dict, filename:str, check_subdirectories:bool=False) -> ZipMember:
+    """
+    Returns the member of a ZIP listing with the given name.
+    Matches the same member as mm_file_tools.extract_file_from_zip, the last one if there are several.
+
+    :param listing: ZIP listing, as returned by read_zip_listing
+    :type listing: dict, required
+    :param filename: Name of the member within the ZIP file
+    :type filename: str, required
+    :param check_subdirectories: Whether to match members with the same filename in subdirectories, defaults to False
+    :type check_subdirectories: bool, optional
+    :return: Matching member, None if there isn't one
+    :rtype: ZipMember
+    """
+    found = None
+    for member in listing["members"]:
+        if member.name == filename or (check_subdirectories and basename(member.name) == filename):
+            found = member
+    return found
+
+def read_zip_member(listing:dict, member:ZipMember) -> bytes:
+    """
+    Returns the uncompressed contents of a member from a ZIP listing.
+    Stored and deflated members are read directly from their offset, without reading the central directory again.
+
+    :param listing: ZIP listing, as returned by read_zip_listing
+    :type listing: dict, required
+    :param member: Member to read
+    :type member: ZipMember, required
+    :return: Contents of the member, None if the member couldn't be read or is corrupt
+    :rtype: bytes
+    """
+    try:
+        # Use zipfile for anything other than plain stored or deflated members
+        if member.flags & 0x1 or member.method not in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]:
+            with zipfile.ZipFile(listing["file"], mode="r") as zfile:
+                return zfile.read(member.name)
+        with open(listing["file"], "rb") as in_file:
+            # Skip past the local header
+            in_file.seek(member.offset)
+            record = LOCAL_RECORD.unpack(in_file.read(LOCAL_RECORD.size))
+            if not record[0] == b"PK\x03\x04":
+                return None
+            in_file.seek(record[10] + record[11], os.SEEK_CUR)
+            data = in_file.read(member.compressed_size)
+        if member.method == zipfile.ZIP_DEFLATED:
+            data = zlib.decompressobj(-15).decompress(data)
+        if not len(data) == member.size or not zlib.crc32(data) == member.crc:
+            return None
+        return data
+    except (OSError, KeyError, RuntimeError, NotImplementedError, struct.error, zlib.error, zipfile.BadZipFile):
+        return None
+
+def is_zip_valid(listing:dict) -> bool:
+    """
+    Returns whether every member of a ZIP listing can be read and matches its checksum.
+
+    :param listing: ZIP listing, as returned by read_zip_listing
+    :type listing: dict, required
+    :return: Whether the ZIP file is valid
+    :rtype: bool
+    """
+    if listing is None:
+        return False
+    for member in get_listing_files(listing):
+        if read_zip_member(listing, member) is None:
+            return False
+    return True
+
+def extract_zip_member(listing:dict, member:ZipMember, extract_directory:str) -> str:
+    """
+    Extracts a single member from a ZIP listing into a given directory, replacing any file with the same name.
+
+    :param listing: ZIP listing, as returned by read_zip_listing
+    :type listing: dict, required
+    :param member: Member to extract
+    :type member: ZipMember, required
+    :param extract_directory: Directory in which to extract the member
+    :type extract_directory: str, required
+    :return: Path of the extracted file, None if the member couldn't be extracted
+    :rtype: str
+    """
+    data = read_zip_member(listing, member)
+    if data is None:
+        return None
+    new_file = abspath(join(extract_directory, basename(member.name)))
+    try:
+        with open(new_file, "wb") as out_file:
+            out_file.write(data)
+    except OSError: return None
+    return new_file
@@ -10,7 +10,9 @@ console_scripts = [
     "mm-update = metadata_magic.archive.update:main",
     "mm-error = metadata_magic.error:main",
     "mm-rename = metadata_magic.rename:main",
-    "mm-series = metadata_magic.archive.series:main"]
+    "mm-query = metadata_magic.query:main",
+    "mm-series = metadata_magic.archive.series:main",
+    "mm-thumbs = metadata_magic.archive.thumbnails:main"]
 
 with open("README.md", "r") as fh:
     long_description = fh.read()